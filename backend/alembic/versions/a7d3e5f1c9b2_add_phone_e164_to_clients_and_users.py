@@ -0,0 +1,115 @@
+"""Add canonical E.164 phone columns to clients and users for WhatsApp routing
+
+Revision ID: a7d3e5f1c9b2
+Revises: f3a9c2d7e1b4
+Create Date: 2026-10-17
+
+"""
+
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3e5f1c9b2'
+down_revision = 'f3a9c2d7e1b4'
+branch_labels = None
+depends_on = None
+
+
+BATCH_SIZE = 1000
+
+# tabela -> colunas de origem, em ordem de preferência
+PHONE_SOURCES = {
+    'clients': ('cellphone', 'phone'),
+    'users': ('phone',),
+}
+
+
+def _phone_to_e164(phone):
+    # Cópia congelada de app.utils.whatsapp_sanitizer.phone_to_e164
+    if not phone:
+        return None
+
+    phone = phone.split('@')[0].strip()
+    international = phone.startswith('+')
+    digits = re.sub(r'\D', '', phone)
+    if not international:
+        digits = digits.lstrip('0')
+
+    if digits.startswith('55') and len(digits) in (12, 13):
+        national = digits[2:]
+    elif international or len(digits) > 11:
+        return f"+{digits}" if 8 <= len(digits) <= 15 else None
+    else:
+        national = digits
+
+    if len(national) not in (10, 11) or national[0] == '0':
+        return None
+
+    area_code, number = national[:2], national[2:]
+    if len(number) == 8 and number[0] in '6789':
+        number = f"9{number}"
+
+    return f"+55{area_code}{number}"
+
+
+def _backfill(table_name, sources):
+    """Preenche phone_e164; em números repetidos na empresa, o registro mais antigo fica com ele"""
+    conn = op.get_bind()
+    table = sa.table(
+        table_name,
+        sa.column('id', sa.Integer),
+        sa.column('company_id', sa.Integer),
+        sa.column('phone_e164', sa.String),
+        *(sa.column(source, sa.String) for source in sources),
+    )
+
+    rows = conn.execute(
+        sa.select(table.c.id, table.c.company_id, *(table.c[source] for source in sources))
+        .where(sa.or_(*(table.c[source].isnot(None) for source in sources)))
+        .order_by(table.c.id)
+    ).fetchall()
+
+    taken = set()
+    updates = []
+    for row in rows:
+        phone = _phone_to_e164(next((row._mapping[s] for s in sources if row._mapping[s]), None))
+        if phone is None or (row.company_id, phone) in taken:
+            continue
+        taken.add((row.company_id, phone))
+        updates.append({'row_id': row.id, 'e164': phone})
+
+    statement = (
+        table.update()
+        .where(table.c.id == sa.bindparam('row_id'))
+        .values(phone_e164=sa.bindparam('e164'))
+    )
+    for start in range(0, len(updates), BATCH_SIZE):
+        conn.execute(statement, updates[start:start + BATCH_SIZE])
+
+
+def upgrade() -> None:
+    for table_name, sources in PHONE_SOURCES.items():
+        op.add_column(table_name, sa.Column('phone_e164', sa.String(length=16), nullable=True))
+        _backfill(table_name, sources)
+        op.create_unique_constraint(
+            f'uq_{table_name}_company_phone_e164', table_name, ['company_id', 'phone_e164']
+        )
+
+    # Remetente sem instância vinculada a uma empresa: busca só pelo número
+    op.create_index(op.f('ix_clients_phone_e164'), 'clients', ['phone_e164'], unique=False)
+    op.create_index(
+        op.f('ix_whatsapp_providers_instance_id'), 'whatsapp_providers', ['instance_id'], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_whatsapp_providers_instance_id'), table_name='whatsapp_providers')
+    op.drop_index(op.f('ix_clients_phone_e164'), table_name='clients')
+
+    for table_name in reversed(list(PHONE_SOURCES)):
+        op.drop_constraint(f'uq_{table_name}_company_phone_e164', table_name, type_='unique')
+        op.drop_column(table_name, 'phone_e164')
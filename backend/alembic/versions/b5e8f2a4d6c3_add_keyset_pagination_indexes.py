@@ -0,0 +1,37 @@
+"""Add composite (sort_key, id) indexes for keyset pagination of list endpoints
+
+Revision ID: b5e8f2a4d6c3
+Revises: a7d3e5f1c9b2
+Create Date: 2026-10-17
+
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e8f2a4d6c3'
+down_revision = 'a7d3e5f1c9b2'
+branch_labels = None
+depends_on = None
+
+
+# nome -> (tabela, colunas): mesma ordem do KeysetPage de cada endpoint
+KEYSET_INDEXES = {
+    'ix_clients_company_full_name_id': ('clients', ['company_id', 'full_name', 'id']),
+    'ix_commands_company_date_id': ('commands', ['company_id', 'date', 'id']),
+    'ix_commissions_company_created_at_id': ('commissions', ['company_id', 'created_at', 'id']),
+    'ix_financial_transactions_company_date_id': ('financial_transactions', ['company_id', 'date', 'id']),
+    'ix_companies_created_at_id': ('companies', ['created_at', 'id']),
+    'ix_users_created_at_id': ('users', ['created_at', 'id']),
+}
+
+
+def upgrade() -> None:
+    for name, (table, columns) in KEYSET_INDEXES.items():
+        op.create_index(name, table, columns, unique=False)
+
+
+def downgrade() -> None:
+    for name, (table, _) in reversed(list(KEYSET_INDEXES.items())):
+        op.drop_index(name, table_name=table)
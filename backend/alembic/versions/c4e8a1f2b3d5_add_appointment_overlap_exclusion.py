@@ -0,0 +1,76 @@
+"""Add exclusion constraint preventing overlapping appointments per professional
+
+Revision ID: c4e8a1f2b3d5
+Revises: bd1c950b16e6
+Create Date: 2026-10-17
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8a1f2b3d5'
+down_revision = 'bd1c950b16e6'
+branch_labels = None
+depends_on = None
+
+
+BLOCKING_STATUSES = "('PENDING', 'CONFIRMED', 'CHECKED_IN', 'IN_PROGRESS')"
+
+
+def upgrade() -> None:
+    op.add_column(
+        'appointments',
+        sa.Column('overlap_allowed', sa.Boolean(), nullable=False, server_default=sa.false())
+    )
+
+    op.create_index(
+        'ix_appointments_company_professional_start',
+        'appointments',
+        ['company_id', 'professional_id', 'start_time'],
+        unique=False
+    )
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+
+    # Sobreposições já existentes (encaixes antigos) impediriam a criação da
+    # constraint: ficam marcadas como encaixes permitidos.
+    op.execute(f"""
+        UPDATE appointments a
+        SET overlap_allowed = true
+        WHERE a.status IN {BLOCKING_STATUSES}
+          AND a.professional_id IS NOT NULL
+          AND a.end_time > a.start_time
+          AND EXISTS (
+              SELECT 1 FROM appointments b
+              WHERE b.id < a.id
+                AND b.professional_id = a.professional_id
+                AND b.status IN {BLOCKING_STATUSES}
+                AND b.end_time > b.start_time
+                AND b.start_time < a.end_time
+                AND b.end_time > a.start_time
+          )
+    """)
+
+    op.execute(f"""
+        ALTER TABLE appointments
+        ADD CONSTRAINT appointments_professional_no_overlap
+        EXCLUDE USING gist (
+            professional_id WITH =,
+            tsrange(start_time, end_time, '[)') WITH &&
+        )
+        WHERE (
+            professional_id IS NOT NULL
+            AND NOT overlap_allowed
+            AND end_time > start_time
+            AND status IN {BLOCKING_STATUSES}
+        )
+    """)
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE appointments DROP CONSTRAINT IF EXISTS appointments_professional_no_overlap")
+    op.drop_index('ix_appointments_company_professional_start', table_name='appointments')
+    op.drop_column('appointments', 'overlap_allowed')
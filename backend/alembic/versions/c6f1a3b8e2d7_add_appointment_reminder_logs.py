@@ -0,0 +1,53 @@
+"""Add appointment_reminder_logs sent-log for the reminder pipeline
+
+Revision ID: c6f1a3b8e2d7
+Revises: b5e8f2a4d6c3
+Create Date: 2026-10-17
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6f1a3b8e2d7'
+down_revision = 'b5e8f2a4d6c3'
+branch_labels = None
+depends_on = None
+
+
+LEGACY_FLAGS = {24: 'reminder_sent_24h', 2: 'reminder_sent_2h'}
+
+
+def upgrade() -> None:
+    op.create_table('appointment_reminder_logs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('company_id', sa.Integer(), nullable=False),
+    sa.Column('appointment_id', sa.Integer(), nullable=False),
+    sa.Column('hours_before', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['company_id'], ['companies.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['appointment_id'], ['appointments.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('appointment_id', 'hours_before', name='uq_appointment_reminder_logs_appointment_hours')
+    )
+    op.create_index(op.f('ix_appointment_reminder_logs_id'), 'appointment_reminder_logs', ['id'], unique=False)
+    op.create_index(op.f('ix_appointment_reminder_logs_company_id'), 'appointment_reminder_logs', ['company_id'], unique=False)
+
+    # Lembretes de 24h/2h já enviados (flags antigas) não são reenviados
+    for hours_before, flag in LEGACY_FLAGS.items():
+        op.execute(f"""
+            INSERT INTO appointment_reminder_logs (company_id, appointment_id, hours_before, created_at, updated_at)
+            SELECT company_id, id, {hours_before}, now(), now()
+            FROM appointments
+            WHERE {flag} IS TRUE
+              AND start_time >= now() - interval '1 day'
+        """)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_appointment_reminder_logs_company_id'), table_name='appointment_reminder_logs')
+    op.drop_index(op.f('ix_appointment_reminder_logs_id'), table_name='appointment_reminder_logs')
+    op.drop_table('appointment_reminder_logs')
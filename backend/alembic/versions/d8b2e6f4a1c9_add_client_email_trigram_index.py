@@ -0,0 +1,28 @@
+"""Add trigram index on lower(email) for partial client email search
+
+Revision ID: d8b2e6f4a1c9
+Revises: c6f1a3b8e2d7
+Create Date: 2026-10-17
+
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8b2e6f4a1c9'
+down_revision = 'c6f1a3b8e2d7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # LIKE '%termo%' em lower(email) (busca por parte do email, sem "@" no início)
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute(
+        "CREATE INDEX ix_clients_email_lower_trgm ON clients USING gin (lower(email) gin_trgm_ops)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_clients_email_lower_trgm', table_name='clients')
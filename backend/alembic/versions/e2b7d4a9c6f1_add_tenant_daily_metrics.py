@@ -0,0 +1,53 @@
+"""Add tenant_daily_metrics rollup table for the dashboard
+
+Revision ID: e2b7d4a9c6f1
+Revises: c4e8a1f2b3d5
+Create Date: 2026-10-17
+
+Backfill after upgrading:
+    reconcile_tenant_metrics.delay(days_back=365)
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b7d4a9c6f1'
+down_revision = 'c4e8a1f2b3d5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('tenant_daily_metrics',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('company_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('appointments_total', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('appointments_completed', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('appointments_cancelled', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('distinct_clients', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('revenue_transactions', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0'),
+    sa.Column('income_transactions', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('commands_total', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('commands_finished', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('revenue_commands', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0'),
+    sa.Column('payments_completed', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0'),
+    sa.Column('payments_pending', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0'),
+    sa.Column('rating_sum', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('rating_count', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['company_id'], ['companies.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('company_id', 'day', name='uq_tenant_daily_metrics_company_day')
+    )
+    op.create_index(op.f('ix_tenant_daily_metrics_id'), 'tenant_daily_metrics', ['id'], unique=False)
+    op.create_index(op.f('ix_tenant_daily_metrics_company_id'), 'tenant_daily_metrics', ['company_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_tenant_daily_metrics_company_id'), table_name='tenant_daily_metrics')
+    op.drop_index(op.f('ix_tenant_daily_metrics_id'), table_name='tenant_daily_metrics')
+    op.drop_table('tenant_daily_metrics')
@@ -0,0 +1,80 @@
+"""Add normalized client search columns with trigram and prefix indexes
+
+Revision ID: f3a9c2d7e1b4
+Revises: e2b7d4a9c6f1
+Create Date: 2026-10-17
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a9c2d7e1b4'
+down_revision = 'e2b7d4a9c6f1'
+branch_labels = None
+depends_on = None
+
+
+DIGIT_COLUMNS = (
+    ('phone_digits', 'phone'),
+    ('cellphone_digits', 'cellphone'),
+    ('cpf_digits', 'cpf'),
+)
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+
+    op.add_column('clients', sa.Column('search_name', sa.String(length=360), nullable=True))
+    for column, _ in DIGIT_COLUMNS:
+        op.add_column('clients', sa.Column(column, sa.String(length=20), nullable=True))
+
+    # unaccent() não é IMMUTABLE e não pode ir direto num índice de expressão:
+    # o valor normalizado fica materializado (mantido pelo modelo nas escritas).
+    digit_assignments = ",\n".join(
+        f"{column} = NULLIF(regexp_replace({source}, '\\D', '', 'g'), '')"
+        for column, source in DIGIT_COLUMNS
+    )
+    op.execute(f"""
+        UPDATE clients
+        SET search_name = NULLIF(
+                lower(trim(regexp_replace(unaccent(concat_ws(' ', full_name, nickname)), '\\s+', ' ', 'g'))),
+                ''
+            ),
+            {digit_assignments}
+    """)
+
+    # Trigramas: LIKE '%termo%' e ordenação por similarity() no nome
+    op.execute(
+        "CREATE INDEX ix_clients_search_name_trgm ON clients USING gin (search_name gin_trgm_ops)"
+    )
+
+    # Prefixo por empresa: LIKE 'termo%' em nome curto, telefones, CPF e email
+    op.execute(
+        "CREATE INDEX ix_clients_company_search_name_prefix "
+        "ON clients (company_id, search_name varchar_pattern_ops)"
+    )
+    for column, _ in DIGIT_COLUMNS:
+        op.execute(
+            f"CREATE INDEX ix_clients_company_{column} "
+            f"ON clients (company_id, {column} varchar_pattern_ops)"
+        )
+    op.execute(
+        "CREATE INDEX ix_clients_company_email_lower "
+        "ON clients (company_id, lower(email) varchar_pattern_ops)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_clients_company_email_lower', table_name='clients')
+    for column, _ in reversed(DIGIT_COLUMNS):
+        op.drop_index(f'ix_clients_company_{column}', table_name='clients')
+    op.drop_index('ix_clients_company_search_name_prefix', table_name='clients')
+    op.drop_index('ix_clients_search_name_trgm', table_name='clients')
+
+    for column, _ in reversed(DIGIT_COLUMNS):
+        op.drop_column('clients', column)
+    op.drop_column('clients', 'search_name')
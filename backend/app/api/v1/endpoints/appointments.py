@@ -4,11 +4,13 @@ Appointments Endpoints
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Query, Response
 
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, joinedload
 from datetime import datetime, timedelta
 import secrets
 
-from app.core.database import get_db
+from app.core.database import get_async_db, get_db
 from app.core.security import get_current_active_user, require_professional
 from app.core.config import settings
 from app.core.cache import get_cache, set_cache
@@ -27,6 +29,12 @@ from app.schemas.appointment import (
     PublicAppointmentCreate,
     AppointmentMoveRequest,
 )
+from app.services import availability_cache
+from app.services.appointment_conflicts import (
+    commit_appointment,
+    conflicts_query,
+    ensure_no_conflict,
+)
 from app.services.appointment_notifications import AppointmentNotificationService
 from app.services.notification_helper import NotificationHelper
 
@@ -252,25 +260,9 @@ async def create_public_appointment(
         return AppointmentResponse.model_validate(existing_appointment)
     
     # CORREÇÃO: Check for conflicts (only if professional is selected)
+    # On PostgreSQL the exclusion constraint rejects the INSERT itself
     if professional:
-        conflicts = db.query(Appointment).filter(
-            Appointment.company_id == company.id,
-            Appointment.professional_id == appointment_data.professional_id,
-            Appointment.status.in_([
-                AppointmentStatus.PENDING,
-                AppointmentStatus.CONFIRMED,
-                AppointmentStatus.CHECKED_IN,
-                AppointmentStatus.IN_PROGRESS
-            ]),
-            Appointment.start_time < end_time,
-            Appointment.end_time > start_time_local
-        ).first()
-        
-        if conflicts:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="Horário não disponível. Profissional já possui compromisso neste horário."
-            )
+        ensure_no_conflict(db, company.id, appointment_data.professional_id, start_time_local, end_time)
     
     # Generate check-in code
     check_in_code = secrets.token_urlsafe(8)
@@ -289,8 +281,10 @@ async def create_public_appointment(
     )
     
     db.add(appointment)
-    db.commit()
+    tickets = await availability_cache.begin_change(availability_cache.pending_snapshot(appointment))
+    commit_appointment(db)
     db.refresh(appointment)
+    await availability_cache.record_change(None, availability_cache.snapshot(appointment), tickets)
     
     # Send notifications
     try:
@@ -430,24 +424,9 @@ async def create_appointment(
     # CORREÇÃO: Check for conflicts (including CHECKED_IN and IN_PROGRESS)
     # Apenas verifica conflitos se force_overlap=False
     if not appointment_data.force_overlap:
-        conflicts = db.query(Appointment).filter(
-            Appointment.company_id == current_user.company_id,
-            Appointment.professional_id == appointment_data.professional_id,
-            Appointment.status.in_([
-                AppointmentStatus.PENDING,
-                AppointmentStatus.CONFIRMED,
-                AppointmentStatus.CHECKED_IN,
-                AppointmentStatus.IN_PROGRESS
-            ]),
-            Appointment.start_time < end_time,
-            Appointment.end_time > start_time_local
-        ).first()
-        
-        if conflicts:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="Horário não disponível. Profissional já possui compromisso neste horário."
-            )
+        ensure_no_conflict(
+            db, current_user.company_id, appointment_data.professional_id, start_time_local, end_time
+        )
     
     # Set client_id
     client_crm_id = appointment_data.client_id or None
@@ -467,11 +446,14 @@ async def create_appointment(
         client_notes=appointment_data.client_notes,
         internal_notes=appointment_data.internal_notes,
         check_in_code=check_in_code,
+        overlap_allowed=appointment_data.force_overlap,
     )
     
     db.add(appointment)
-    db.commit()
+    tickets = await availability_cache.begin_change(availability_cache.pending_snapshot(appointment))
+    commit_appointment(db)
     db.refresh(appointment)
+    await availability_cache.record_change(None, availability_cache.snapshot(appointment), tickets)
     
     # Enviar notificações de confirmação
     try:
@@ -559,28 +541,19 @@ async def reschedule_appointment(
         new_end_time = new_start_time_local + timedelta(minutes=service.duration_minutes)
     
     # Check for conflicts (excluding current appointment)
-    conflicts = db.query(Appointment).filter(
-        Appointment.company_id == current_user.company_id,
-        Appointment.professional_id == appointment.professional_id,
-        Appointment.id != appointment_id,  # Exclude current appointment
-        Appointment.status.in_([
-            AppointmentStatus.PENDING,
-            AppointmentStatus.CONFIRMED,
-            AppointmentStatus.CHECKED_IN,
-            AppointmentStatus.IN_PROGRESS
-        ]),
-        Appointment.start_time < new_end_time,
-        Appointment.end_time > new_start_time_local
-    ).first()
-    
-    if conflicts:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Horário não disponível. Profissional já possui compromisso neste horário."
-        )
+    ensure_no_conflict(
+        db,
+        current_user.company_id,
+        appointment.professional_id,
+        new_start_time_local,
+        new_end_time,
+        exclude_appointment_id=appointment_id,
+        status_code=status.HTTP_400_BAD_REQUEST
+    )
     
     # Update appointment times
     old_start_time = appointment.start_time
+    previous_occupancy = availability_cache.snapshot(appointment)
     appointment.start_time = new_start_time_local
     appointment.end_time = new_end_time
     
@@ -588,8 +561,10 @@ async def reschedule_appointment(
     if appointment.status == AppointmentStatus.CONFIRMED:
         appointment.status = AppointmentStatus.PENDING
     
-    db.commit()
+    tickets = await availability_cache.begin_change(previous_occupancy, availability_cache.pending_snapshot(appointment))
+    commit_appointment(db, status_code=status.HTTP_400_BAD_REQUEST)
     db.refresh(appointment)
+    await availability_cache.record_change(previous_occupancy, availability_cache.snapshot(appointment), tickets)
     
     # Send rescheduling notification
     try:
@@ -620,7 +595,7 @@ async def get_appointments_calendar(
     end_date: str,
     professional_id: int = None,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get appointments for calendar view (filtered by date range)
@@ -629,7 +604,7 @@ async def get_appointments_calendar(
     start_date_dt = _parse_datetime_query(start_date, 'start_date')
     end_date_dt = _parse_datetime_query(end_date, 'end_date')
 
-    query = db.query(Appointment).options(
+    query = select(Appointment).options(
         joinedload(Appointment.client_crm),
         joinedload(Appointment.professional),
         joinedload(Appointment.service),
@@ -651,7 +626,7 @@ async def get_appointments_calendar(
         query = query.filter(Appointment.professional_id == current_user.id)
     elif current_user.role == UserRole.CLIENT:
         from app.models.client import Client
-        client = db.query(Client).filter(Client.user_id == current_user.id).first()
+        client = await db.scalar(select(Client).filter(Client.user_id == current_user.id))
         if client:
             query = query.filter(Appointment.client_crm_id == client.id)
         else:
@@ -661,7 +636,7 @@ async def get_appointments_calendar(
     if professional_id:
         query = query.filter(Appointment.professional_id == professional_id)
     
-    appointments = query.order_by(Appointment.start_time).all()
+    appointments = (await db.scalars(query.order_by(Appointment.start_time))).all()
     
     return [AppointmentCalendarResponse.model_validate(apt) for apt in appointments]
 
@@ -673,24 +648,24 @@ async def check_appointment_conflicts(
     duration_minutes: int = 60,
     exclude_appointment_id: int = None,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Check if there are any conflicts for a given time slot
     Useful for real-time validation before creating/updating appointments
     """
     # Get company for timezone
-    company = db.query(Company).filter(Company.id == current_user.company_id).first()
+    company = await db.scalar(select(Company).filter(Company.id == current_user.company_id))
     
     # Apply company timezone
     start_time_local = apply_company_timezone(company, _parse_datetime_query(start_time, 'start_time'))
     end_time_local = start_time_local + timedelta(minutes=duration_minutes)
     
     # Get professional
-    professional = db.query(User).filter(
+    professional = await db.scalar(select(User).filter(
         User.id == professional_id,
         User.company_id == current_user.company_id
-    ).first()
+    ))
     
     if not professional:
         raise HTTPException(
@@ -718,25 +693,33 @@ async def check_appointment_conflicts(
             "message": e.detail
         }
     
-    # Check for appointment conflicts
-    query = db.query(Appointment).filter(
-        Appointment.company_id == current_user.company_id,
-        Appointment.professional_id == professional_id,
-        Appointment.status.in_([
-            AppointmentStatus.PENDING,
-            AppointmentStatus.CONFIRMED,
-            AppointmentStatus.CHECKED_IN,
-            AppointmentStatus.IN_PROGRESS
-        ]),
-        Appointment.start_time < end_time_local,
-        Appointment.end_time > start_time_local
-    )
+    # Fast path: occupancy bitmap (cached per professional/day) says the slot is free.
+    # This is advisory: writes outside the instrumented paths show up only after the
+    # cache TTL, and creating/updating the appointment re-checks in the DB
+    # (ensure_no_conflict + exclusion constraint). Excluding an appointment
+    # requires its exact interval, so that case goes to the DB.
+    if not exclude_appointment_id and await availability_cache.is_interval_free(
+        db, current_user.company_id, professional_id, start_time_local, end_time_local
+    ):
+        return {
+            "has_conflict": False,
+            "message": "Horário disponível"
+        }
     
+    # Check for appointment conflicts
     # Exclude specific appointment (useful for rescheduling)
-    if exclude_appointment_id:
-        query = query.filter(Appointment.id != exclude_appointment_id)
-    
-    conflicts = query.all()
+    conflicts = (await db.scalars(
+        conflicts_query(
+            current_user.company_id,
+            professional_id,
+            start_time_local,
+            end_time_local,
+            exclude_appointment_id=exclude_appointment_id
+        ).options(
+            joinedload(Appointment.service),
+            joinedload(Appointment.client_crm)
+        )
+    )).all()
     
     if conflicts:
         conflict_details = []
@@ -765,12 +748,12 @@ async def check_appointment_conflicts(
 async def get_appointment(
     appointment_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get a specific appointment by ID
     """
-    appointment = db.query(Appointment).options(
+    appointment = await db.scalar(select(Appointment).options(
         joinedload(Appointment.client_crm),
         joinedload(Appointment.professional),
         joinedload(Appointment.service),
@@ -778,7 +761,7 @@ async def get_appointment(
     ).filter(
         Appointment.id == appointment_id,
         Appointment.company_id == current_user.company_id
-    ).first()
+    ))
     
     if not appointment:
         raise HTTPException(
@@ -795,7 +778,7 @@ async def get_appointment(
             )
     elif current_user.role == UserRole.CLIENT:
         from app.models.client import Client
-        client = db.query(Client).filter(Client.user_id == current_user.id).first()
+        client = await db.scalar(select(Client).filter(Client.user_id == current_user.id))
         if not client or appointment.client_crm_id != client.id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -896,32 +879,25 @@ async def update_appointment(
         end_time = update_data.get("end_time", appointment.end_time)
         
         if professional_id and start_time and end_time:
-            conflicts = db.query(Appointment).filter(
-                Appointment.company_id == current_user.company_id,
-                Appointment.professional_id == professional_id,
-                Appointment.status.in_([
-                    AppointmentStatus.PENDING,
-                    AppointmentStatus.CONFIRMED,
-                    AppointmentStatus.CHECKED_IN,
-                    AppointmentStatus.IN_PROGRESS
-                ]),
-                Appointment.start_time < end_time,
-                Appointment.end_time > start_time,
-                Appointment.id != appointment_id  # Exclude current appointment
-            ).all()
-            
-            if conflicts:
-                raise HTTPException(
-                    status_code=status.HTTP_409_CONFLICT,
-                    detail="Profissional já possui compromisso neste horário"
-                )
+            ensure_no_conflict(
+                db,
+                current_user.company_id,
+                professional_id,
+                start_time,
+                end_time,
+                exclude_appointment_id=appointment_id,  # Exclude current appointment
+                detail="Profissional já possui compromisso neste horário"
+            )
     
     # Apply updates
+    previous_occupancy = availability_cache.snapshot(appointment)
     for field, value in update_data.items():
         setattr(appointment, field, value)
     
-    db.commit()
+    tickets = await availability_cache.begin_change(previous_occupancy, availability_cache.pending_snapshot(appointment))
+    commit_appointment(db, detail="Profissional já possui compromisso neste horário")
     db.refresh(appointment)
+    await availability_cache.record_change(previous_occupancy, availability_cache.snapshot(appointment), tickets)
     
     return AppointmentResponse.model_validate(appointment)
 
@@ -976,12 +952,15 @@ async def delete_appointment(
         )
     
     # Soft delete by marking as cancelled
+    previous_occupancy = availability_cache.snapshot(appointment)
     appointment.status = AppointmentStatus.CANCELLED
     appointment.cancelled_at = datetime.utcnow()
     appointment.cancelled_by = current_user.id
     appointment.cancellation_reason = "Agendamento deletado"
     
+    tickets = await availability_cache.begin_change(previous_occupancy)
     db.commit()
+    await availability_cache.record_change(previous_occupancy, None, tickets)
     
     return None
 
@@ -1056,33 +1035,29 @@ async def move_appointment(
     
     # Check conflicts (only if not a busy block)
     if appointment.service_id is not None:
-        conflicts = db.query(Appointment).filter(
-            Appointment.company_id == current_user.company_id,
-            Appointment.professional_id == professional_id,
-            Appointment.id != appointment_id,
-            Appointment.start_time < new_end_time,
-            Appointment.end_time > new_start_time,
-            Appointment.status.in_([
-                AppointmentStatus.PENDING,
-                AppointmentStatus.CONFIRMED,
-                AppointmentStatus.CHECKED_IN,
-                AppointmentStatus.IN_PROGRESS
-            ])
-        ).first()
-        
-        if conflicts:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="Conflito de horário com outro agendamento"
-            )
+        ensure_no_conflict(
+            db,
+            current_user.company_id,
+            professional_id,
+            new_start_time,
+            new_end_time,
+            exclude_appointment_id=appointment_id,
+            detail="Conflito de horário com outro agendamento"
+        )
+    else:
+        # Busy blocks can be dropped over other appointments
+        appointment.overlap_allowed = True
     
     # Update appointment
+    previous_occupancy = availability_cache.snapshot(appointment)
     appointment.start_time = new_start_time
     appointment.end_time = new_end_time
     appointment.professional_id = professional_id
     appointment.updated_at = datetime.utcnow()
     
-    db.commit()
+    tickets = await availability_cache.begin_change(previous_occupancy, availability_cache.pending_snapshot(appointment))
+    commit_appointment(db, detail="Conflito de horário com outro agendamento")
     db.refresh(appointment)
+    await availability_cache.record_change(previous_occupancy, availability_cache.snapshot(appointment), tickets)
     
     return appointment
\ No newline at end of file
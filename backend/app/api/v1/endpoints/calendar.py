@@ -4,10 +4,12 @@ Retorna professionals + appointments + busy_blocks em 1 chamada
 """
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 from datetime import datetime, timedelta
 
-from app.core.database import get_db
+from app.core.database import get_async_db
 from app.core.security import get_current_active_user
 from app.models.appointment import Appointment, AppointmentStatus
 from app.models.user import User, UserRole
@@ -28,7 +30,7 @@ router = APIRouter(redirect_slashes=False)
 async def get_calendar_day(
     date: str = Query(..., description="Date in YYYY-MM-DD format"),
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get all calendar data for a specific day in ONE call
@@ -50,16 +52,16 @@ async def get_calendar_day(
     end_of_day = target_date.replace(hour=23, minute=59, second=59, microsecond=999999)
     
     # 1. Get all active professionals
-    professionals_query = db.query(User).filter(
+    professionals_query = select(User).filter(
         User.company_id == current_user.company_id,
         User.role.in_([UserRole.PROFESSIONAL, UserRole.OWNER, UserRole.MANAGER]),
         User.is_active == True
     ).order_by(User.full_name)
     
-    professionals = professionals_query.all()
+    professionals = (await db.scalars(professionals_query)).all()
     
     # 2. Get all appointments for the day (including blocks)
-    appointments_query = db.query(Appointment).options(
+    appointments_query = select(Appointment).options(
         joinedload(Appointment.client_crm),
         joinedload(Appointment.professional),
         joinedload(Appointment.service)
@@ -77,7 +79,7 @@ async def get_calendar_day(
         ])
     ).order_by(Appointment.start_time)
     
-    all_appointments = appointments_query.all()
+    all_appointments = (await db.scalars(appointments_query)).all()
     
     # 3. Separate appointments from busy blocks
     calendar_appointments = []
@@ -15,6 +15,7 @@ from app.models.calendly_integration import (
     CalendlySyncLog
 )
 from app.services.calendly_service import get_calendly_service
+from app.services.webhook_ingestion import ingest_webhook
 from app.schemas.calendly import (
     CalendlyIntegrationResponse,
     CalendlyAuthResponse,
@@ -362,11 +363,11 @@ async def calendly_webhook(
         if not event_type:
             raise HTTPException(status_code=400, detail="Invalid webhook payload")
         
-        service = get_calendly_service(db)
-        result = await service.process_webhook_event(event_type, payload)
-        
-        return result
+        # Processamento assíncrono na fila "webhooks" (app.tasks.webhook_tasks)
+        return await ingest_webhook("calendly", payload)
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -2,19 +2,22 @@
 Clients Endpoints
 """
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.dependencies import get_db_with_tenant
+from app.core.dependencies import get_async_db_with_tenant
 from app.core.rbac import get_current_user_context, CurrentUserContext
 from app.core.security import require_manager
-from app.core.cache import get_cache, set_cache, delete_pattern
+from app.core.cache import get_cache, set_cache, namespaced_key, invalidate_namespace
+from app.core.pagination import KeysetPage, NEXT_CURSOR_HEADER
 from app.models.user import User
 from app.models.client import Client
 from app.schemas.client import (
-    ClientCreate, ClientUpdate, ClientResponse, ClientHistory
+    ClientCreate, ClientUpdate, ClientResponse, ClientHistory, ClientSearchResult
 )
+from app.services.client_search import search_clients, search_filter, search_ordering
+from app.utils.whatsapp_sanitizer import phone_to_e164
 
 router = APIRouter(
     redirect_slashes=False  # 🔥 DESATIVA REDIRECT AUTOMÁTICO - CORS FIX
@@ -26,7 +29,7 @@ router = APIRouter(
 async def create_client(
     client_data: ClientCreate,
     context: CurrentUserContext = Depends(get_current_user_context),
-    db: Session = Depends(get_db_with_tenant)
+    db: AsyncSession = Depends(get_async_db_with_tenant)
 ):
     """Create a new client"""
     # Verify company access (defesa em profundidade)
@@ -38,10 +41,10 @@ async def create_client(
     
     # ✅ CORREÇÃO: Check if email already exists (if provided)
     if client_data.email:
-        existing = db.query(Client).filter(
+        existing = await db.scalar(select(Client).filter(
             Client.email == client_data.email,
             Client.company_id == context.company_id
-        ).first()
+        ))
         if existing:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -49,25 +52,27 @@ async def create_client(
             )
     
     # ✅ CORREÇÃO: Check if phone already exists (if provided)
-    if client_data.phone:
-        existing_phone = db.query(Client).filter(
-            Client.phone == client_data.phone,
+    # Comparação pelo E.164 canônico: "(11) 98765-4321" e "5511987654321" são o mesmo número
+    phone_e164 = phone_to_e164(client_data.cellphone or client_data.phone)
+    if phone_e164:
+        existing_phone = await db.scalar(select(Client.id).filter(
+            Client.phone_e164 == phone_e164,
             Client.company_id == context.company_id
-        ).first()
+        ))
         if existing_phone:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Telefone {client_data.phone} já cadastrado para outro cliente"
+                detail=f"Telefone {client_data.cellphone or client_data.phone} já cadastrado para outro cliente"
             )
 
     client_dict = client_data.model_dump(exclude={'company_id'}, exclude_none=True)
     client = Client(**client_dict, company_id=context.company_id)
     db.add(client)
-    db.commit()
-    db.refresh(client)
+    await db.commit()
+    await db.refresh(client)
     
     # Invalidate cache
-    delete_pattern(f"clients:list:{context.company_id}:*")
+    await invalidate_namespace("clients", context.company_id)
     
     return ClientResponse.model_validate(client)
 
@@ -75,68 +80,98 @@ async def create_client(
 @router.get("", response_model=List[ClientResponse])
 @router.get("/", response_model=List[ClientResponse], include_in_schema=False)
 async def list_clients(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Cursor from X-Next-Cursor (replaces skip)"),
     search: Optional[str] = None,
     is_active: Optional[bool] = None,
     context: CurrentUserContext = Depends(get_current_user_context),
-    db: Session = Depends(get_db_with_tenant)
+    db: AsyncSession = Depends(get_async_db_with_tenant)
 ):
     """List clients (Cached for 2 minutes)"""
-    # Cache key
-    cache_key = f"clients:list:{context.company_id}:{skip}:{limit}:{search}:{is_active}"
+    # Cache key (namespace versionado da empresa)
+    cache_key = await namespaced_key("clients", context.company_id, "list", skip, limit, search, is_active)
+    first_page = skip == 0 and not cursor
     
-    # Try cache first (only for first page without search)
-    if skip == 0 and not search:
+    # Try cache first (only for first page)
+    if first_page:
         cached = await get_cache(cache_key)
-        if cached:
+        if isinstance(cached, dict):
+            items = cached.get("items") or []
             # ✅ CORREÇÃO: Retornar lista de ClientResponse do cache
-            if all(isinstance(item, dict) and item.get("company_id") == context.company_id for item in cached):
-                return [ClientResponse(**item) for item in cached]
+            if all(isinstance(item, dict) and item.get("company_id") == context.company_id for item in items):
+                if cached.get("next_cursor"):
+                    response.headers[NEXT_CURSOR_HEADER] = cached["next_cursor"]
+                return [ClientResponse(**item) for item in items]
     
     # Defesa em profundidade: filtrar explicitamente por company_id
-    query = db.query(Client).filter(Client.company_id == context.company_id)
-    
-    # Search filter
-    if search:
-        search_filter = or_(
-            Client.full_name.ilike(f"%{search}%"),
-            Client.email.ilike(f"%{search}%"),
-            Client.phone.ilike(f"%{search}%"),
-            Client.cellphone.ilike(f"%{search}%"),
-            Client.cpf.ilike(f"%{search}%")
-        )
-        query = query.filter(search_filter)
+    query = select(Client).filter(Client.company_id == context.company_id)
     
     # Active filter
     if is_active is not None:
         query = query.filter(Client.is_active == is_active)
     
-    clients = query.offset(skip).limit(limit).all()
+    # Search filter (colunas normalizadas e indexadas, ordenado por relevância, paginado por skip)
+    condition = search_filter(search)
+    if condition is not None:
+        query = query.filter(condition).order_by(*search_ordering(db, search))
+        clients = (await db.scalars(query.offset(skip).limit(limit))).all()
+    else:
+        # Keyset por (full_name, id): índice ix_clients_company_full_name_id
+        page = KeysetPage(Client.full_name, Client.id, cursor=cursor, limit=limit, skip=skip, descending=False)
+        clients = page.finish((await db.scalars(page.apply(query))).all(), response)
     
     # Convert to Pydantic models
     result = [ClientResponse.model_validate(client) for client in clients]
     
     # ✅ CORREÇÃO: Cache usando model_dump para serialização correta
-    # Cache result (only for first page without search)
-    if skip == 0 and not search:
-        cache_data = [r.model_dump() for r in result]
+    # Cache result (only for first page)
+    if first_page:
+        cache_data = {
+            "items": [r.model_dump() for r in result],
+            "next_cursor": response.headers.get(NEXT_CURSOR_HEADER),
+        }
         await set_cache(cache_key, cache_data, ttl=120)  # 2 minutes
     
     return result
 
 
+@router.get("/search", response_model=List[ClientSearchResult])
+async def search_clients_typeahead(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    include_inactive: bool = False,
+    context: CurrentUserContext = Depends(get_current_user_context),
+    db: AsyncSession = Depends(get_async_db_with_tenant)
+):
+    """Typeahead search by name, phone, CPF or email (Cached for 1 minute)"""
+    cache_key = await namespaced_key("clients", context.company_id, "search", q.strip().lower(), limit, include_inactive)
+    
+    cached = await get_cache(cache_key)
+    if cached is not None:
+        return [ClientSearchResult(**item) for item in cached]
+    
+    result = [
+        ClientSearchResult(**row)
+        for row in await search_clients(db, context.company_id, q, limit, include_inactive)
+    ]
+    await set_cache(cache_key, [r.model_dump() for r in result], ttl=60)
+    
+    return result
+
+
 @router.get("/{client_id}", response_model=ClientResponse)
 async def get_client(
     client_id: int,
     context: CurrentUserContext = Depends(get_current_user_context),
-    db: Session = Depends(get_db_with_tenant)
+    db: AsyncSession = Depends(get_async_db_with_tenant)
 ):
     """Get client by ID"""
-    client = db.query(Client).filter(
+    client = await db.scalar(select(Client).filter(
         Client.id == client_id,
         Client.company_id == context.company_id
-    ).first()
+    ))
     
     if not client:
         raise HTTPException(
@@ -152,13 +187,13 @@ async def update_client(
     client_id: int,
     client_data: ClientUpdate,
     context: CurrentUserContext = Depends(get_current_user_context),
-    db: Session = Depends(get_db_with_tenant)
+    db: AsyncSession = Depends(get_async_db_with_tenant)
 ):
     """Update client"""
-    client = db.query(Client).filter(
+    client = await db.scalar(select(Client).filter(
         Client.id == client_id,
         Client.company_id == context.company_id
-    ).first()
+    ))
     
     if not client:
         raise HTTPException(
@@ -170,11 +205,11 @@ async def update_client(
     for field, value in update_data.items():
         setattr(client, field, value)
     
-    db.commit()
-    db.refresh(client)
+    await db.commit()
+    await db.refresh(client)
     
     # Invalidate cache
-    delete_pattern(f"clients:list:{context.company_id}:*")
+    await invalidate_namespace("clients", context.company_id)
     
     return ClientResponse.model_validate(client)
 
@@ -183,13 +218,13 @@ async def update_client(
 async def delete_client(
     client_id: int,
     context: CurrentUserContext = Depends(get_current_user_context),
-    db: Session = Depends(get_db_with_tenant)
+    db: AsyncSession = Depends(get_async_db_with_tenant)
 ):
     """Delete client"""
-    client = db.query(Client).filter(
+    client = await db.scalar(select(Client).filter(
         Client.id == client_id,
         Client.company_id == context.company_id
-    ).first()
+    ))
     
     if not client:
         raise HTTPException(
@@ -197,11 +232,11 @@ async def delete_client(
             detail="Cliente não encontrado"
         )
     
-    db.delete(client)
-    db.commit()
+    await db.delete(client)
+    await db.commit()
     
     # Invalidate cache
-    delete_pattern(f"clients:list:{context.company_id}:*")
+    await invalidate_namespace("clients", context.company_id)
     
     return None
 
@@ -210,13 +245,13 @@ async def delete_client(
 async def get_client_history(
     client_id: int,
     context: CurrentUserContext = Depends(get_current_user_context),
-    db: Session = Depends(get_db_with_tenant)
+    db: AsyncSession = Depends(get_async_db_with_tenant)
 ):
     """Get complete client history"""
-    client = db.query(Client).filter(
+    client = await db.scalar(select(Client).filter(
         Client.id == client_id,
         Client.company_id == context.company_id
-    ).first()
+    ))
     
     if not client:
         raise HTTPException(
@@ -234,35 +269,35 @@ async def get_client_history(
     from app.models.whatsapp_marketing import WhatsAppCampaignLog
     
     # Use limit to avoid loading too much data
-    appointments = db.query(Appointment).filter(
+    appointments = (await db.scalars(select(Appointment).filter(
         Appointment.client_crm_id == client_id,
         Appointment.company_id == context.company_id
-    ).order_by(Appointment.start_time.desc()).limit(50).all()
+    ).order_by(Appointment.start_time.desc()).limit(50))).all()
     
-    commands = db.query(Command).filter(
+    commands = (await db.scalars(select(Command).filter(
         Command.client_crm_id == client_id,
         Command.company_id == context.company_id
-    ).order_by(Command.date.desc()).limit(50).all()
+    ).order_by(Command.date.desc()).limit(50))).all()
     
-    packages = db.query(Package).filter(
+    packages = (await db.scalars(select(Package).filter(
         Package.client_crm_id == client_id,
         Package.company_id == context.company_id
-    ).order_by(Package.created_at.desc()).limit(50).all()
+    ).order_by(Package.created_at.desc()).limit(50))).all()
     
-    evaluations = db.query(Evaluation).filter(
+    evaluations = (await db.scalars(select(Evaluation).filter(
         Evaluation.client_id == client_id,
         Evaluation.company_id == context.company_id
-    ).order_by(Evaluation.created_at.desc()).limit(50).all()
+    ).order_by(Evaluation.created_at.desc()).limit(50))).all()
     
-    anamneses = db.query(Anamnesis).filter(
+    anamneses = (await db.scalars(select(Anamnesis).filter(
         Anamnesis.client_crm_id == client_id,
         Anamnesis.company_id == context.company_id
-    ).order_by(Anamnesis.created_at.desc()).limit(50).all()
+    ).order_by(Anamnesis.created_at.desc()).limit(50))).all()
     
-    whatsapp_messages = db.query(WhatsAppCampaignLog).filter(
+    whatsapp_messages = (await db.scalars(select(WhatsAppCampaignLog).filter(
         WhatsAppCampaignLog.client_crm_id == client_id,
         WhatsAppCampaignLog.company_id == context.company_id
-    ).order_by(WhatsAppCampaignLog.sent_at.desc()).limit(50).all()
+    ).order_by(WhatsAppCampaignLog.sent_at.desc()).limit(50))).all()
     
     return ClientHistory(
         appointments=[{"id": a.id, "date": a.start_time, "status": a.status.value} for a in appointments],
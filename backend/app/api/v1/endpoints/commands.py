@@ -2,12 +2,13 @@
 Commands Endpoints
 """
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.orm import Session
 from datetime import datetime
 from decimal import Decimal
 
 from app.core.database import get_db
+from app.core.pagination import KeysetPage
 from app.core.security import get_current_active_user, require_manager
 from app.models.user import User
 from app.models.command import Command, CommandItem, CommandStatus, CommandItemType
@@ -148,8 +149,10 @@ async def create_command(
 @router.get("", response_model=List[CommandResponse])
 @router.get("/", response_model=List[CommandResponse], include_in_schema=False)
 async def list_commands(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Cursor from X-Next-Cursor (replaces skip)"),
     client_id: Optional[int] = None,
     professional_id: Optional[int] = None,
     status: Optional[CommandStatus] = None,
@@ -177,7 +180,9 @@ async def list_commands(
     if status:
         query = query.filter(Command.status == status)
     
-    commands = query.order_by(Command.date.desc()).offset(skip).limit(limit).all()
+    # Keyset por (date, id): índice ix_commands_company_date_id
+    page = KeysetPage(Command.date, Command.id, cursor=cursor, limit=limit, skip=skip)
+    commands = page.finish(page.apply(query).all(), response)
     return [CommandResponse.model_validate(cmd) for cmd in commands]
 
 
@@ -2,11 +2,12 @@
 Commissions Endpoints
 """
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.orm import Session
 from datetime import datetime, date
 
 from app.core.database import get_db
+from app.core.pagination import KeysetPage
 from app.core.security import get_current_active_user, require_manager
 from app.models.user import User
 from app.models.commission import Commission, CommissionStatus
@@ -28,8 +29,10 @@ router = APIRouter(
 @router.get("", response_model=List[CommissionResponse])
 @router.get("/", response_model=List[CommissionResponse], include_in_schema=False)
 async def list_commissions(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Cursor from X-Next-Cursor (replaces skip)"),
     professional_id: Optional[int] = None,
     status: Optional[CommissionStatus] = None,
     start_date: Optional[date] = None,
@@ -59,9 +62,9 @@ async def list_commissions(
     if end_date:
         query = query.filter(Commission.created_at <= datetime.combine(end_date, datetime.max.time()))
     
-    # Use index for ordering
-    commissions = query.order_by(Commission.created_at.desc()).offset(skip).limit(limit).all()
-    return commissions
+    # Keyset por (created_at, id): índice ix_commissions_company_created_at_id
+    page = KeysetPage(Commission.created_at, Commission.id, cursor=cursor, limit=limit, skip=skip)
+    return page.finish(page.apply(query).all(), response)
 
 
 @router.get("/summary", response_model=dict)
@@ -2,19 +2,21 @@
 Dashboard Endpoints - Analytics and Metrics
 """
 from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, extract
+from sqlalchemy import func, and_, extract, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 
-from app.core.database import get_db
+from app.core.database import get_async_db, with_own_session
 from app.core.security import get_current_active_user, require_manager
-from app.core.cache import get_cache, set_cache, delete_pattern
+from app.core.cache import get_or_compute
 from app.models.user import User, UserRole
 from app.models.appointment import Appointment, AppointmentStatus
-from app.models.payment import Payment, PaymentStatus
+from app.models.payment import Payment
 from app.models.service import Service
 from app.models.review import Review
 from app.models.command import Command, CommandStatus
+from app.services import occupancy_service
+from app.services.tenant_metrics import day_range_bounds, load_daily_metrics, sum_metrics
 # from app.models.service_category import ServiceCategory  # Model não existe ainda
 
 router = APIRouter(
@@ -26,222 +28,229 @@ router = APIRouter(
 async def get_dashboard_overview(
     start_date: datetime = Query(None),
     end_date: datetime = Query(None),
-    current_user: User = Depends(require_manager),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(require_manager)
 ):
     """
     Get dashboard overview with key metrics (Cached for 5 minutes)
+    
+    Reads the tenant_daily_metrics rollup (whole days from start_date to end_date).
     """
     # Cache key
     cache_key = f"dashboard:overview:{current_user.company_id}:{start_date}:{end_date}"
     
-    # Try cache first
-    cached = await get_cache(cache_key)
-    if cached:
-        return cached
-    
-    # Default to last 30 days if no dates provided
-    if not start_date:
-        start_date = datetime.utcnow() - timedelta(days=30)
-    if not end_date:
-        end_date = datetime.utcnow()
-    
-    # Total appointments
-    total_appointments = db.query(func.count(Appointment.id)).filter(
-        Appointment.company_id == current_user.company_id,
-        Appointment.created_at >= start_date,
-        Appointment.created_at <= end_date
-    ).scalar()
-    
-    # Completed appointments
-    completed_appointments = db.query(func.count(Appointment.id)).filter(
-        Appointment.company_id == current_user.company_id,
-        Appointment.status == AppointmentStatus.COMPLETED,
-        Appointment.created_at >= start_date,
-        Appointment.created_at <= end_date
-    ).scalar()
-    
-    # Cancelled appointments
-    cancelled_appointments = db.query(func.count(Appointment.id)).filter(
-        Appointment.company_id == current_user.company_id,
-        Appointment.status == AppointmentStatus.CANCELLED,
-        Appointment.created_at >= start_date,
-        Appointment.created_at <= end_date
-    ).scalar()
-    
-    # ✅ CORREÇÃO: Total revenue de FinancialTransactions E Commands finalizadas
-    from app.models.financial import FinancialTransaction, TransactionStatus
-    from app.models.command import Command, CommandStatus
-    
-    # Revenue de transações financeiras liquidadas
-    total_revenue_transactions = db.query(func.sum(FinancialTransaction.value)).filter(
-        FinancialTransaction.company_id == current_user.company_id,
-        FinancialTransaction.type == "income",
-        FinancialTransaction.status == "liquidated",
-        FinancialTransaction.date >= start_date,
-        FinancialTransaction.date <= end_date
-    ).scalar() or 0
-    
-    # Revenue de comandas finalizadas (caso não tenha transação)
-    total_revenue_commands = db.query(func.sum(Command.net_value)).filter(
-        Command.company_id == current_user.company_id,
-        Command.status == CommandStatus.FINISHED,
-        Command.date >= start_date,
-        Command.date <= end_date
-    ).scalar() or 0
-    
-    # Usar o maior valor (evitar duplicação se comanda já virou transação)
-    total_revenue = max(float(total_revenue_transactions), float(total_revenue_commands))
-    
-    # Pending payments
-    pending_payments = db.query(func.sum(Payment.amount)).filter(
-        Payment.company_id == current_user.company_id,
-        Payment.status == PaymentStatus.PENDING,
-        Payment.created_at >= start_date,
-        Payment.created_at <= end_date
-    ).scalar() or 0
-    
-    # Average rating
-    avg_rating = db.query(func.avg(Review.rating)).filter(
-        Review.company_id == current_user.company_id,
-        Review.created_at >= start_date,
-        Review.created_at <= end_date
-    ).scalar() or 0
-    
-    # Total clients
-    total_clients = db.query(func.count(func.distinct(Appointment.client_crm_id))).filter(
-        Appointment.company_id == current_user.company_id,
-        Appointment.created_at >= start_date,
-        Appointment.created_at <= end_date,
-        Appointment.client_crm_id.isnot(None)
-    ).scalar()
+    company_id = current_user.company_id
     
-    result = {
-        "period": {
-            "start_date": start_date.isoformat(),
-            "end_date": end_date.isoformat()
-        },
-        "appointments": {
-            "total": total_appointments,
-            "completed": completed_appointments,
-            "cancelled": cancelled_appointments,
-            "completion_rate": (completed_appointments / total_appointments * 100) if total_appointments > 0 else 0
-        },
-        "revenue": {
-            "total": float(total_revenue),
-            "pending": float(pending_payments),
-            "average_per_appointment": float(total_revenue / completed_appointments) if completed_appointments > 0 else 0
-        },
-        "clients": {
-            "total": total_clients
-        },
-        "satisfaction": {
-            "average_rating": float(avg_rating)
+    async def compute(db: AsyncSession):
+        nonlocal start_date, end_date
+        
+        # Default to last 30 days if no dates provided
+        if not start_date:
+            start_date = datetime.utcnow() - timedelta(days=30)
+        if not end_date:
+            end_date = datetime.utcnow()
+        
+        daily = await load_daily_metrics(db, company_id, start_date.date(), end_date.date())
+        totals = sum_metrics(daily.values())
+        
+        total_appointments = totals["appointments_total"]
+        completed_appointments = totals["appointments_completed"]
+        cancelled_appointments = totals["appointments_cancelled"]
+        
+        # Usar o maior valor (evitar duplicação se comanda já virou transação)
+        total_revenue = max(float(totals["revenue_transactions"]), float(totals["revenue_commands"]))
+        
+        pending_payments = totals["payments_pending"]
+        avg_rating = (totals["rating_sum"] / totals["rating_count"]) if totals["rating_count"] else 0
+        
+        # Clientes distintos no período não são somáveis a partir do rollup diário
+        period_start, period_end = day_range_bounds(start_date.date(), end_date.date())
+        total_clients = await db.scalar(select(func.count(func.distinct(Appointment.client_crm_id))).filter(
+            Appointment.company_id == company_id,
+            Appointment.created_at >= period_start,
+            Appointment.created_at < period_end,
+            Appointment.client_crm_id.isnot(None)
+        ))
+        
+        result = {
+            "period": {
+                "start_date": start_date.isoformat(),
+                "end_date": end_date.isoformat()
+            },
+            "appointments": {
+                "total": total_appointments,
+                "completed": completed_appointments,
+                "cancelled": cancelled_appointments,
+                "completion_rate": (completed_appointments / total_appointments * 100) if total_appointments > 0 else 0
+            },
+            "revenue": {
+                "total": float(total_revenue),
+                "pending": float(pending_payments),
+                "average_per_appointment": float(total_revenue / completed_appointments) if completed_appointments > 0 else 0
+            },
+            "clients": {
+                "total": total_clients
+            },
+            "satisfaction": {
+                "average_rating": float(avg_rating)
+            }
         }
-    }
-    
-    # Cache result for 5 minutes
-    await set_cache(cache_key, result, ttl=300)
+        
+        return result
     
-    return result
-
+    return await get_or_compute(cache_key, with_own_session(compute), ttl=300)
 
 @router.get("/top-services")
 async def get_top_services(
     limit: int = 10,
     start_date: datetime = Query(None),
     end_date: datetime = Query(None),
-    current_user: User = Depends(require_manager),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(require_manager)
 ):
     """
-    Get top services by number of appointments
+    Get top services by number of appointments (Cached for 5 minutes)
     """
-    if not start_date:
-        start_date = datetime.utcnow() - timedelta(days=30)
-    if not end_date:
-        end_date = datetime.utcnow()
+    cache_key = f"dashboard:top-services:{current_user.company_id}:{start_date}:{end_date}:{limit}"
     
-    top_services = db.query(
-        Service.id,
-        Service.name,
-        func.count(Appointment.id).label("appointment_count"),
-        func.sum(Payment.amount).label("total_revenue")
-    ).join(
-        Appointment, Appointment.service_id == Service.id
-    ).outerjoin(
-        Payment, Payment.appointment_id == Appointment.id
-    ).filter(
-        Service.company_id == current_user.company_id,
-        Appointment.created_at >= start_date,
-        Appointment.created_at <= end_date
-    ).group_by(
-        Service.id, Service.name
-    ).order_by(
-        func.count(Appointment.id).desc()
-    ).limit(limit).all()
+    company_id = current_user.company_id
     
-    return [
-        {
-            "service_id": service.id,
-            "service_name": service.name,
-            "appointment_count": service.appointment_count,
-            "total_revenue": float(service.total_revenue or 0)
-        }
-        for service in top_services
-    ]
-
+    async def compute(db: AsyncSession):
+        nonlocal start_date, end_date
+        
+        if not start_date:
+            start_date = datetime.utcnow() - timedelta(days=30)
+        if not end_date:
+            end_date = datetime.utcnow()
+        
+        period_filter = (
+            Appointment.company_id == company_id,
+            Appointment.created_at >= start_date,
+            Appointment.created_at <= end_date
+        )
+        
+        # Aggregate before joining: payments must not multiply appointment counts
+        appointment_counts = select(
+            Appointment.service_id,
+            func.count(Appointment.id).label("appointment_count")
+        ).filter(*period_filter).group_by(Appointment.service_id).subquery()
+        
+        revenue = select(
+            Appointment.service_id,
+            func.sum(Payment.amount).label("total_revenue")
+        ).join(
+            Payment, Payment.appointment_id == Appointment.id
+        ).filter(*period_filter).group_by(Appointment.service_id).subquery()
+        
+        top_services = (await db.execute(select(
+            Service.id,
+            Service.name,
+            appointment_counts.c.appointment_count,
+            revenue.c.total_revenue
+        ).join(
+            appointment_counts, appointment_counts.c.service_id == Service.id
+        ).outerjoin(
+            revenue, revenue.c.service_id == Service.id
+        ).filter(
+            Service.company_id == company_id
+        ).order_by(
+            appointment_counts.c.appointment_count.desc()
+        ).limit(limit))).all()
+        
+        result = [
+            {
+                "service_id": service.id,
+                "service_name": service.name,
+                "appointment_count": service.appointment_count,
+                "total_revenue": float(service.total_revenue or 0)
+            }
+            for service in top_services
+        ]
+        
+        return result
+    
+    return await get_or_compute(cache_key, with_own_session(compute), ttl=300)
 
 @router.get("/top-professionals")
 async def get_top_professionals(
     limit: int = 10,
     start_date: datetime = Query(None),
     end_date: datetime = Query(None),
-    current_user: User = Depends(require_manager),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(require_manager)
 ):
     """
-    Get top professionals by number of appointments and ratings
+    Get top professionals by number of appointments and ratings (Cached for 5 minutes)
     """
-    if not start_date:
-        start_date = datetime.utcnow() - timedelta(days=30)
-    if not end_date:
-        end_date = datetime.utcnow()
+    cache_key = f"dashboard:top-professionals:{current_user.company_id}:{start_date}:{end_date}:{limit}"
     
-    top_professionals = db.query(
-        User.id,
-        User.full_name,
-        func.count(Appointment.id).label("appointment_count"),
-        func.avg(Review.rating).label("average_rating"),
-        func.sum(Payment.amount).label("total_revenue")
-    ).join(
-        Appointment, Appointment.professional_id == User.id
-    ).outerjoin(
-        Review, Review.professional_id == User.id
-    ).outerjoin(
-        Payment, Payment.appointment_id == Appointment.id
-    ).filter(
-        User.company_id == current_user.company_id,
-        User.role == UserRole.PROFESSIONAL,
-        Appointment.created_at >= start_date,
-        Appointment.created_at <= end_date
-    ).group_by(
-        User.id, User.full_name
-    ).order_by(
-        func.count(Appointment.id).desc()
-    ).limit(limit).all()
+    company_id = current_user.company_id
     
-    return [
-        {
-            "professional_id": prof.id,
-            "professional_name": prof.full_name,
-            "appointment_count": prof.appointment_count,
-            "average_rating": float(prof.average_rating or 0),
-            "total_revenue": float(prof.total_revenue or 0)
-        }
-        for prof in top_professionals
-    ]
-
+    async def compute(db: AsyncSession):
+        nonlocal start_date, end_date
+        
+        if not start_date:
+            start_date = datetime.utcnow() - timedelta(days=30)
+        if not end_date:
+            end_date = datetime.utcnow()
+        
+        period_filter = (
+            Appointment.company_id == company_id,
+            Appointment.created_at >= start_date,
+            Appointment.created_at <= end_date
+        )
+        
+        # Aggregate each source separately: joining reviews and payments directly
+        # would multiply appointment counts and revenue
+        appointment_counts = select(
+            Appointment.professional_id,
+            func.count(Appointment.id).label("appointment_count")
+        ).filter(*period_filter).group_by(Appointment.professional_id).subquery()
+        
+        revenue = select(
+            Appointment.professional_id,
+            func.sum(Payment.amount).label("total_revenue")
+        ).join(
+            Payment, Payment.appointment_id == Appointment.id
+        ).filter(*period_filter).group_by(Appointment.professional_id).subquery()
+        
+        ratings = select(
+            Review.professional_id,
+            func.avg(Review.rating).label("average_rating")
+        ).filter(
+            Review.company_id == company_id
+        ).group_by(Review.professional_id).subquery()
+        
+        top_professionals = (await db.execute(select(
+            User.id,
+            User.full_name,
+            appointment_counts.c.appointment_count,
+            ratings.c.average_rating,
+            revenue.c.total_revenue
+        ).join(
+            appointment_counts, appointment_counts.c.professional_id == User.id
+        ).outerjoin(
+            ratings, ratings.c.professional_id == User.id
+        ).outerjoin(
+            revenue, revenue.c.professional_id == User.id
+        ).filter(
+            User.company_id == company_id,
+            User.role == UserRole.PROFESSIONAL
+        ).order_by(
+            appointment_counts.c.appointment_count.desc()
+        ).limit(limit))).all()
+        
+        result = [
+            {
+                "professional_id": prof.id,
+                "professional_name": prof.full_name,
+                "appointment_count": prof.appointment_count,
+                "average_rating": float(prof.average_rating or 0),
+                "total_revenue": float(prof.total_revenue or 0)
+            }
+            for prof in top_professionals
+        ]
+        
+        return result
+    
+    return await get_or_compute(cache_key, with_own_session(compute), ttl=300)
 
 @router.get("/revenue-chart")
 async def get_revenue_chart(
@@ -249,75 +258,54 @@ async def get_revenue_chart(
     start_date: datetime = Query(None),
     end_date: datetime = Query(None),
     current_user: User = Depends(require_manager),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Get revenue data for charts
+    Get revenue data for charts (completed payments per day, from the rollup)
     """
     if not start_date:
         start_date = datetime.utcnow() - timedelta(days=30)
     if not end_date:
         end_date = datetime.utcnow()
     
-    # This is a simplified version - in production, you'd use date_trunc or similar
-    revenue_data = db.query(
-        func.date(Payment.created_at).label("date"),
-        func.sum(Payment.amount).label("revenue")
-    ).filter(
-        Payment.company_id == current_user.company_id,
-        Payment.status == PaymentStatus.COMPLETED,
-        Payment.created_at >= start_date,
-        Payment.created_at <= end_date
-    ).group_by(
-        func.date(Payment.created_at)
-    ).order_by(
-        func.date(Payment.created_at)
-    ).all()
+    daily = await load_daily_metrics(db, current_user.company_id, start_date.date(), end_date.date())
     
     return [
         {
-            "date": data.date.isoformat(),
-            "revenue": float(data.revenue)
+            "date": day.isoformat(),
+            "revenue": float(daily[day].payments_completed)
         }
-        for data in revenue_data
+        for day in sorted(daily)
+        if daily[day].payments_completed
     ]
 
-
 @router.get("/occupancy-rate")
 async def get_occupancy_rate(
     start_date: datetime = Query(None),
     end_date: datetime = Query(None),
     current_user: User = Depends(require_manager),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Calculate occupancy rate (appointments vs available slots)
+    Calculate occupancy rate (booked minutes vs working capacity)
+    
+    Capacity per professional comes from business hours, working hours and
+    schedule overrides (same computation as /professional-occupancy).
     """
     if not start_date:
         start_date = datetime.utcnow()
     if not end_date:
         end_date = start_date + timedelta(days=7)
     
-    # Count total appointments
-    total_appointments = db.query(func.count(Appointment.id)).filter(
-        Appointment.company_id == current_user.company_id,
-        Appointment.start_time >= start_date,
-        Appointment.start_time <= end_date,
-        Appointment.status.in_([AppointmentStatus.PENDING, AppointmentStatus.CONFIRMED, AppointmentStatus.COMPLETED])
-    ).scalar()
-    
-    # Count professionals
-    total_professionals = db.query(func.count(User.id)).filter(
-        User.company_id == current_user.company_id,
-        User.role == UserRole.PROFESSIONAL,
-        User.is_active == True
-    ).scalar()
+    professionals = await occupancy_service.get_professional_occupancy(
+        db, current_user.company_id, start_date.date(), end_date.date()
+    )
     
-    # Calculate available slots (simplified: 8 hours * 60 min / 60 min slots = 8 slots per day per professional)
-    days = (end_date - start_date).days
-    available_slots = total_professionals * 8 * days
+    total_appointments = sum(p["appointments"] for p in professionals)
+    booked_hours = sum(p["booked_hours"] for p in professionals)
+    available_hours = sum(p["available_hours"] for p in professionals)
     
-    occupancy_rate = (total_appointments / available_slots * 100) if available_slots > 0 else 0
+    occupancy_rate = (booked_hours / available_hours * 100) if available_hours > 0 else 0
     
     return {
         "period": {
@@ -325,7 +313,9 @@ async def get_occupancy_rate(
             "end_date": end_date.isoformat()
         },
         "total_appointments": total_appointments,
-        "available_slots": available_slots,
+        "booked_hours": round(booked_hours, 2),
+        "available_hours": round(available_hours, 2),
+        "available_slots": round(available_hours, 2),  # compatibilidade: horas disponíveis
         "occupancy_rate": occupancy_rate
     }
 
@@ -334,7 +324,7 @@ async def get_occupancy_rate(
 async def get_daily_sales(
     target_date: datetime = Query(None),
     current_user: User = Depends(require_manager),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get sales for a specific day
@@ -342,49 +332,24 @@ async def get_daily_sales(
     if not target_date:
         target_date = datetime.utcnow()
     
-    # Start and end of the day
-    start_of_day = target_date.replace(hour=0, minute=0, second=0, microsecond=0)
-    end_of_day = target_date.replace(hour=23, minute=59, second=59, microsecond=999999)
-    
-    # Revenue from financial transactions
-    from app.models.financial import FinancialTransaction
+    day = target_date.date()
+    metrics = (await load_daily_metrics(db, current_user.company_id, day, day)).get(day)
+    totals = sum_metrics([metrics] if metrics else [])
     
-    daily_revenue = db.query(func.sum(FinancialTransaction.value)).filter(
-        FinancialTransaction.company_id == current_user.company_id,
-        FinancialTransaction.type == "income",
-        FinancialTransaction.status == "liquidated",
-        FinancialTransaction.date >= start_of_day,
-        FinancialTransaction.date <= end_of_day
-    ).scalar() or 0
-    
-    # Revenue from commands
-    daily_revenue_commands = db.query(func.sum(Command.net_value)).filter(
-        Command.company_id == current_user.company_id,
-        Command.status == CommandStatus.FINISHED,
-        Command.date >= start_of_day,
-        Command.date <= end_of_day
-    ).scalar() or 0
-    
-    total_daily_sales = max(float(daily_revenue), float(daily_revenue_commands))
+    total_daily_sales = max(float(totals["revenue_transactions"]), float(totals["revenue_commands"]))
     
     return {
-        "date": target_date.date().isoformat(),
+        "date": day.isoformat(),
         "total_sales": total_daily_sales,
-        "transactions_count": db.query(func.count(FinancialTransaction.id)).filter(
-            FinancialTransaction.company_id == current_user.company_id,
-            FinancialTransaction.type == "income",
-            FinancialTransaction.date >= start_of_day,
-            FinancialTransaction.date <= end_of_day
-        ).scalar()
+        "transactions_count": totals["income_transactions"]
     }
 
-
 @router.get("/commands-stats")
 async def get_commands_stats(
     start_date: datetime = Query(None),
     end_date: datetime = Query(None),
     current_user: User = Depends(require_manager),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get commands statistics with conversion rate
@@ -395,26 +360,26 @@ async def get_commands_stats(
         end_date = datetime.utcnow()
     
     # Total commands
-    total_commands = db.query(func.count(Command.id)).filter(
+    total_commands = await db.scalar(select(func.count(Command.id)).filter(
         Command.company_id == current_user.company_id,
         Command.date >= start_date,
         Command.date <= end_date
-    ).scalar()
+    ))
     
     # Finished commands
-    finished_commands = db.query(func.count(Command.id)).filter(
+    finished_commands = await db.scalar(select(func.count(Command.id)).filter(
         Command.company_id == current_user.company_id,
         Command.status == CommandStatus.FINISHED,
         Command.date >= start_date,
         Command.date <= end_date
-    ).scalar()
+    ))
     
     # Total appointments in period
-    total_appointments = db.query(func.count(Appointment.id)).filter(
+    total_appointments = await db.scalar(select(func.count(Appointment.id)).filter(
         Appointment.company_id == current_user.company_id,
         Appointment.created_at >= start_date,
         Appointment.created_at <= end_date
-    ).scalar()
+    ))
     
     # Conversion rate (comandas / agendamentos)
     conversion_rate = (total_commands / total_appointments * 100) if total_appointments > 0 else 0
@@ -426,12 +391,12 @@ async def get_commands_stats(
         },
         "total_commands": total_commands,
         "finished_commands": finished_commands,
-        "total_revenue": float(db.query(func.sum(Command.net_value)).filter(
+        "total_revenue": float(await db.scalar(select(func.sum(Command.net_value)).filter(
             Command.company_id == current_user.company_id,
             Command.status == CommandStatus.FINISHED,
             Command.date >= start_date,
             Command.date <= end_date
-        ).scalar() or 0),
+        )) or 0),
         "conversion_rate": conversion_rate
     }
 
@@ -441,7 +406,7 @@ async def get_appointments_by_status(
     start_date: datetime = Query(None),
     end_date: datetime = Query(None),
     current_user: User = Depends(require_manager),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get appointments grouped by status
@@ -451,14 +416,14 @@ async def get_appointments_by_status(
     if not end_date:
         end_date = datetime.utcnow()
     
-    appointments_by_status = db.query(
+    appointments_by_status = (await db.execute(select(
         Appointment.status,
         func.count(Appointment.id).label('count')
     ).filter(
         Appointment.company_id == current_user.company_id,
         Appointment.created_at >= start_date,
         Appointment.created_at <= end_date
-    ).group_by(Appointment.status).all()
+    ).group_by(Appointment.status))).all()
     
     total = sum([item.count for item in appointments_by_status])
     
@@ -480,7 +445,7 @@ async def get_average_ticket(
     start_date: datetime = Query(None),
     end_date: datetime = Query(None),
     current_user: User = Depends(require_manager),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get average ticket with comparison to previous period
@@ -493,19 +458,19 @@ async def get_average_ticket(
     # Current period
     from app.models.financial import FinancialTransaction
     
-    current_revenue = db.query(func.sum(Command.net_value)).filter(
+    current_revenue = await db.scalar(select(func.sum(Command.net_value)).filter(
         Command.company_id == current_user.company_id,
         Command.status == CommandStatus.FINISHED,
         Command.date >= start_date,
         Command.date <= end_date
-    ).scalar() or 0
+    )) or 0
     
-    current_appointments = db.query(func.count(Appointment.id)).filter(
+    current_appointments = await db.scalar(select(func.count(Appointment.id)).filter(
         Appointment.company_id == current_user.company_id,
         Appointment.status == AppointmentStatus.COMPLETED,
         Appointment.created_at >= start_date,
         Appointment.created_at <= end_date
-    ).scalar()
+    ))
     
     current_avg = float(current_revenue) / current_appointments if current_appointments > 0 else 0
     
@@ -514,19 +479,19 @@ async def get_average_ticket(
     prev_start = start_date - timedelta(days=period_duration)
     prev_end = start_date
     
-    prev_revenue = db.query(func.sum(Command.net_value)).filter(
+    prev_revenue = await db.scalar(select(func.sum(Command.net_value)).filter(
         Command.company_id == current_user.company_id,
         Command.status == CommandStatus.FINISHED,
         Command.date >= prev_start,
         Command.date < prev_end
-    ).scalar() or 0
+    )) or 0
     
-    prev_appointments = db.query(func.count(Appointment.id)).filter(
+    prev_appointments = await db.scalar(select(func.count(Appointment.id)).filter(
         Appointment.company_id == current_user.company_id,
         Appointment.status == AppointmentStatus.COMPLETED,
         Appointment.created_at >= prev_start,
         Appointment.created_at < prev_end
-    ).scalar()
+    ))
     
     prev_avg = float(prev_revenue) / prev_appointments if prev_appointments > 0 else 0
     
@@ -553,7 +518,7 @@ async def get_sales_by_category(
     start_date: datetime = Query(None),
     end_date: datetime = Query(None),
     current_user: User = Depends(require_manager),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get sales grouped by service category
@@ -571,7 +536,7 @@ async def get_sales_by_category(
     
     # Group by service directly since ServiceCategory doesn't exist
     try:
-        sales_by_service = db.query(
+        sales_by_service = (await db.execute(select(
             Service.name.label('category'),
             func.sum(Service.price).label('total')
         ).join(
@@ -581,7 +546,7 @@ async def get_sales_by_category(
             Appointment.status == AppointmentStatus.COMPLETED,
             Appointment.created_at >= start_date,
             Appointment.created_at <= end_date
-        ).group_by(Service.name).all()
+        ).group_by(Service.name))).all()
         
         total = sum([float(item.total or 0) for item in sales_by_service])
         
@@ -609,7 +574,7 @@ async def get_appointments_funnel(
     start_date: datetime = Query(None),
     end_date: datetime = Query(None),
     current_user: User = Depends(require_manager),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get appointments funnel: All -> Confirmed -> Billed
@@ -620,28 +585,28 @@ async def get_appointments_funnel(
         end_date = datetime.utcnow()
     
     # Total appointments
-    total_appointments = db.query(func.count(Appointment.id)).filter(
+    total_appointments = await db.scalar(select(func.count(Appointment.id)).filter(
         Appointment.company_id == current_user.company_id,
         Appointment.created_at >= start_date,
         Appointment.created_at <= end_date
-    ).scalar()
+    ))
     
     # Confirmed (confirmed + completed)
-    confirmed_appointments = db.query(func.count(Appointment.id)).filter(
+    confirmed_appointments = await db.scalar(select(func.count(Appointment.id)).filter(
         Appointment.company_id == current_user.company_id,
         Appointment.status.in_([AppointmentStatus.CONFIRMED, AppointmentStatus.COMPLETED]),
         Appointment.created_at >= start_date,
         Appointment.created_at <= end_date
-    ).scalar()
+    ))
     
     # Billed (completed appointments with commands)
     # Use completed appointments as billed since CommandItem.appointment_id doesn't exist
-    billed_appointments = db.query(func.count(Appointment.id)).filter(
+    billed_appointments = await db.scalar(select(func.count(Appointment.id)).filter(
         Appointment.company_id == current_user.company_id,
         Appointment.status == AppointmentStatus.COMPLETED,
         Appointment.created_at >= start_date,
         Appointment.created_at <= end_date
-    ).scalar()
+    ))
     
     return {
         "all": {
@@ -663,62 +628,36 @@ async def get_appointments_funnel(
 async def get_professional_occupancy(
     start_date: datetime = Query(None),
     end_date: datetime = Query(None),
-    current_user: User = Depends(require_manager),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(require_manager)
 ):
     """
-    Get occupancy rate per professional
+    Get occupancy rate per professional (Cached for 5 minutes)
+    
+    Capacity comes from business hours, working hours and schedule overrides;
+    all professionals are computed with a fixed number of queries.
     """
     if not start_date:
         start_date = datetime.utcnow() - timedelta(days=7)
     if not end_date:
         end_date = datetime.utcnow()
     
-    # Get all active professionals
-    professionals = db.query(User).filter(
-        User.company_id == current_user.company_id,
-        User.role == UserRole.PROFESSIONAL,
-        User.is_active == True
-    ).all()
+    start_day, end_day = start_date.date(), end_date.date()
+    cache_key = f"dashboard:professional-occupancy:{current_user.company_id}:{start_day}:{end_day}"
     
-    result = []
-    days = (end_date - start_date).days
-    
-    for prof in professionals:
-        # Count appointments for this professional
-        appointments = db.query(func.count(Appointment.id)).filter(
-            Appointment.company_id == current_user.company_id,
-            Appointment.professional_id == prof.id,
-            Appointment.start_time >= start_date,
-            Appointment.start_time <= end_date,
-            Appointment.status.in_([AppointmentStatus.CONFIRMED, AppointmentStatus.COMPLETED])
-        ).scalar()
-        
-        # Calculate available slots (8 hours * days)
-        available_slots = 8 * days
-        occupancy = (appointments / available_slots * 100) if available_slots > 0 else 0
-        
-        result.append({
-            "professional_id": prof.id,
-            "professional_name": prof.full_name,
-            "appointments": appointments,
-            "available_slots": available_slots,
-            "occupancy_rate": occupancy,
-            "status": "high" if occupancy >= 70 else "moderate" if occupancy >= 40 else "low"
-        })
-    
-    # Sort by occupancy rate
-    result.sort(key=lambda x: x["occupancy_rate"], reverse=True)
+    company_id = current_user.company_id
     
-    return result
-
+    return await get_or_compute(
+        cache_key,
+        with_own_session(lambda db: occupancy_service.get_professional_occupancy(db, company_id, start_day, end_day)),
+        ttl=300
+    )
 
 @router.get("/heatmap")
 async def get_appointments_heatmap(
     start_date: datetime = Query(None),
     end_date: datetime = Query(None),
     current_user: User = Depends(require_manager),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get appointments heatmap (day of week x hour)
@@ -729,7 +668,7 @@ async def get_appointments_heatmap(
         end_date = datetime.utcnow()
     
     # Get appointments grouped by day of week and hour
-    heatmap_data = db.query(
+    heatmap_data = (await db.execute(select(
         extract('dow', Appointment.start_time).label('day_of_week'),
         extract('hour', Appointment.start_time).label('hour'),
         func.count(Appointment.id).label('count')
@@ -737,7 +676,7 @@ async def get_appointments_heatmap(
         Appointment.company_id == current_user.company_id,
         Appointment.start_time >= start_date,
         Appointment.start_time <= end_date
-    ).group_by('day_of_week', 'hour').all()
+    ).group_by('day_of_week', 'hour'))).all()
     
     # Initialize heatmap matrix (7 days x 24 hours)
     heatmap = [[0 for _ in range(24)] for _ in range(7)]
@@ -760,7 +699,7 @@ async def get_appointments_heatmap(
 async def get_appointments_trend(
     days: int = Query(7, ge=1, le=90),
     current_user: User = Depends(require_manager),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get appointments trend over time (daily)
@@ -768,26 +707,18 @@ async def get_appointments_trend(
     end_date = datetime.utcnow()
     start_date = end_date - timedelta(days=days)
     
-    # Get daily appointments count
-    daily_data = db.query(
-        func.date(Appointment.created_at).label('date'),
-        func.count(Appointment.id).label('count')
-    ).filter(
-        Appointment.company_id == current_user.company_id,
-        Appointment.created_at >= start_date,
-        Appointment.created_at <= end_date
-    ).group_by(func.date(Appointment.created_at)).order_by('date').all()
+    daily = await load_daily_metrics(db, current_user.company_id, start_date.date(), end_date.date())
     
     # Fill missing dates with 0
-    date_dict = {item.date: item.count for item in daily_data}
     result = []
     current = start_date.date()
     
     while current <= end_date.date():
+        metrics = daily.get(current)
         result.append({
             "date": current.isoformat(),
             "label": current.strftime("%d/%m"),
-            "value": date_dict.get(current, 0)
+            "value": metrics.appointments_total if metrics else 0
         })
         current += timedelta(days=1)
     
@@ -800,43 +731,31 @@ async def get_appointments_trend(
         "data": result
     }
 
-
 @router.get("/revenue-trend")
 async def get_revenue_trend(
     days: int = Query(7, ge=1, le=90),
     current_user: User = Depends(require_manager),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Get revenue trend over time (daily)
+    Get revenue trend over time (daily, finished commands)
     """
     end_date = datetime.utcnow()
     start_date = end_date - timedelta(days=days)
     
-    # Get daily revenue from commands
-    daily_data = db.query(
-        func.date(Command.date).label('date'),
-        func.sum(Command.net_value).label('revenue'),
-        func.count(Command.id).label('count')
-    ).filter(
-        Command.company_id == current_user.company_id,
-        Command.status == CommandStatus.FINISHED,
-        Command.date >= start_date,
-        Command.date <= end_date
-    ).group_by(func.date(Command.date)).order_by('date').all()
+    daily = await load_daily_metrics(db, current_user.company_id, start_date.date(), end_date.date())
     
     # Fill missing dates with 0
-    date_dict = {item.date: {'revenue': float(item.revenue or 0), 'count': item.count} for item in daily_data}
     result = []
     current = start_date.date()
     
     while current <= end_date.date():
-        data = date_dict.get(current, {'revenue': 0, 'count': 0})
+        metrics = daily.get(current)
         result.append({
             "date": current.isoformat(),
             "label": current.strftime("%d/%m"),
-            "value": data['revenue'],
-            "count": data['count']
+            "value": float(metrics.revenue_commands) if metrics else 0,
+            "count": metrics.commands_finished if metrics else 0
         })
         current += timedelta(days=1)
     
@@ -849,12 +768,11 @@ async def get_revenue_trend(
         "data": result
     }
 
-
 @router.get("/commands-trend")
 async def get_commands_trend(
     days: int = Query(7, ge=1, le=90),
     current_user: User = Depends(require_manager),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get commands trend over time (daily)
@@ -862,26 +780,18 @@ async def get_commands_trend(
     end_date = datetime.utcnow()
     start_date = end_date - timedelta(days=days)
     
-    # Get daily commands count
-    daily_data = db.query(
-        func.date(Command.date).label('date'),
-        func.count(Command.id).label('count')
-    ).filter(
-        Command.company_id == current_user.company_id,
-        Command.date >= start_date,
-        Command.date <= end_date
-    ).group_by(func.date(Command.date)).order_by('date').all()
+    daily = await load_daily_metrics(db, current_user.company_id, start_date.date(), end_date.date())
     
     # Fill missing dates with 0
-    date_dict = {item.date: item.count for item in daily_data}
     result = []
     current = start_date.date()
     
     while current <= end_date.date():
+        metrics = daily.get(current)
         result.append({
             "date": current.isoformat(),
             "label": current.strftime("%d/%m"),
-            "value": date_dict.get(current, 0)
+            "value": metrics.commands_total if metrics else 0
         })
         current += timedelta(days=1)
     
@@ -894,74 +804,33 @@ async def get_commands_trend(
         "data": result
     }
 
-
 @router.get("/growth-metrics")
 async def get_growth_metrics(
     current_user: User = Depends(require_manager),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get growth metrics comparing current period vs previous period
     """
-    # Define periods (last 7 days vs previous 7 days)
-    current_end = datetime.utcnow()
-    current_start = current_end - timedelta(days=7)
-    previous_end = current_start
-    previous_start = previous_end - timedelta(days=7)
-    
-    # Current period metrics
-    current_appointments = db.query(func.count(Appointment.id)).filter(
-        Appointment.company_id == current_user.company_id,
-        Appointment.created_at >= current_start,
-        Appointment.created_at <= current_end
-    ).scalar() or 0
-    
-    current_revenue = db.query(func.sum(Command.net_value)).filter(
-        Command.company_id == current_user.company_id,
-        Command.status == CommandStatus.FINISHED,
-        Command.date >= current_start,
-        Command.date <= current_end
-    ).scalar() or 0
-    
-    current_commands = db.query(func.count(Command.id)).filter(
-        Command.company_id == current_user.company_id,
-        Command.date >= current_start,
-        Command.date <= current_end
-    ).scalar() or 0
-    
-    current_completed = db.query(func.count(Appointment.id)).filter(
-        Appointment.company_id == current_user.company_id,
-        Appointment.status == AppointmentStatus.COMPLETED,
-        Appointment.created_at >= current_start,
-        Appointment.created_at <= current_end
-    ).scalar() or 0
-    
-    # Previous period metrics
-    previous_appointments = db.query(func.count(Appointment.id)).filter(
-        Appointment.company_id == current_user.company_id,
-        Appointment.created_at >= previous_start,
-        Appointment.created_at < previous_end
-    ).scalar() or 0
-    
-    previous_revenue = db.query(func.sum(Command.net_value)).filter(
-        Command.company_id == current_user.company_id,
-        Command.status == CommandStatus.FINISHED,
-        Command.date >= previous_start,
-        Command.date < previous_end
-    ).scalar() or 0
-    
-    previous_commands = db.query(func.count(Command.id)).filter(
-        Command.company_id == current_user.company_id,
-        Command.date >= previous_start,
-        Command.date < previous_end
-    ).scalar() or 0
-    
-    previous_completed = db.query(func.count(Appointment.id)).filter(
-        Appointment.company_id == current_user.company_id,
-        Appointment.status == AppointmentStatus.COMPLETED,
-        Appointment.created_at >= previous_start,
-        Appointment.created_at < previous_end
-    ).scalar() or 0
+    # Define periods (last 7 days vs previous 7 days, today included)
+    today = datetime.utcnow().date()
+    current_start = today - timedelta(days=6)
+    previous_end = current_start - timedelta(days=1)
+    previous_start = previous_end - timedelta(days=6)
+    
+    daily = await load_daily_metrics(db, current_user.company_id, previous_start, today)
+    current = sum_metrics(row for day, row in daily.items() if day >= current_start)
+    previous = sum_metrics(row for day, row in daily.items() if day <= previous_end)
+    
+    current_appointments = current["appointments_total"]
+    current_revenue = current["revenue_commands"]
+    current_commands = current["commands_total"]
+    current_completed = current["appointments_completed"]
+    
+    previous_appointments = previous["appointments_total"]
+    previous_revenue = previous["revenue_commands"]
+    previous_commands = previous["commands_total"]
+    previous_completed = previous["appointments_completed"]
     
     # Calculate growth percentages
     def calc_growth(current, previous):
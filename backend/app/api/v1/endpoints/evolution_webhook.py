@@ -9,6 +9,7 @@ import logging
 
 from app.core.database import get_db
 from app.services.evolution_api_service import get_evolution_api_service
+from app.services.webhook_ingestion import ingest_webhook
 
 logger = logging.getLogger(__name__)
 
@@ -36,15 +37,13 @@ async def evolution_webhook(
         
         logger.info(f"Evolution webhook received: {event_type} from {instance}")
         
-        # Processar apenas eventos de mensagem
+        # Processar apenas eventos de mensagem (assíncrono, fila "webhooks")
         if event_type == "messages.upsert":
-            service = get_evolution_api_service(db)
-            result = service.process_webhook_message(payload)
+            result = await ingest_webhook("evolution", payload)
             
             return {
-                "status": "processed",
-                "event": event_type,
-                "result": result
+                **result,
+                "event": event_type
             }
         
         elif event_type == "messages.update":
@@ -97,14 +96,12 @@ async def evolution_webhook_instance(
         logger.info(f"Evolution webhook received for instance {instance_name}: {event_type}")
         
         if event_type == "messages.upsert":
-            service = get_evolution_api_service(db)
-            result = service.process_webhook_message(payload)
+            result = await ingest_webhook("evolution", payload)
             
             return {
-                "status": "processed",
+                **result,
                 "instance": instance_name,
-                "event": event_type,
-                "result": result
+                "event": event_type
             }
         
         return {
@@ -129,7 +126,7 @@ async def get_evolution_status(
     Verifica status da conexão com Evolution API
     """
     service = get_evolution_api_service(db)
-    status = service.check_connection()
+    status = await service.check_connection()
     
     return status
 
@@ -146,4 +143,8 @@ async def test_message(
     service = get_evolution_api_service(db)
     result = service.send_text_message(phone, message)
     
+    # Teste: espera o resultado real do envio enfileirado
+    if result.get("status") == "queued":
+        result = (await service.wait_pending())[0]
+    
     return result
@@ -2,13 +2,14 @@
 Financial Endpoints
 """
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.orm import Session
 from datetime import datetime, date
 from decimal import Decimal
 from sqlalchemy import func, case
 
 from app.core.database import get_db
+from app.core.pagination import KeysetPage
 from app.core.security import get_current_active_user, require_manager
 from app.models.user import User
 from app.models.financial import (
@@ -371,8 +372,10 @@ async def create_financial_transaction(
 
 @router.get("/transactions", response_model=List[FinancialTransactionResponse])
 async def list_financial_transactions(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Cursor from X-Next-Cursor (replaces skip)"),
     type: Optional[List[TransactionType]] = Query(None),
     status: Optional[List[TransactionStatus]] = Query(None),
     payment_method: Optional[List[str]] = Query(None),
@@ -412,8 +415,9 @@ async def list_financial_transactions(
         date_type=date_type,
     )
     
-    # Use index for ordering
-    transactions = query.order_by(FinancialTransaction.date.desc()).offset(skip).limit(limit).all()
+    # Keyset por (date, id): índice ix_financial_transactions_company_date_id
+    page = KeysetPage(FinancialTransaction.date, FinancialTransaction.id, cursor=cursor, limit=limit, skip=skip)
+    transactions = page.finish(page.apply(query).all(), response)
     return [FinancialTransactionResponse.model_validate(t) for t in transactions]
 
 
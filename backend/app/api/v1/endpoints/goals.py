@@ -4,95 +4,19 @@ Goals Endpoints
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
-from datetime import datetime, date
-from sqlalchemy import func
 
 from app.core.database import get_db
 from app.core.security import get_current_active_user, require_manager
 from app.models.user import User
 from app.models.goal import Goal, GoalType
 from app.schemas.goal import GoalCreate, GoalCreatePublic, GoalUpdate, GoalResponse
+from app.services.goal_progress import refresh_company_goals, refresh_goals
 
 router = APIRouter(
     redirect_slashes=False  # 🔥 DESATIVA REDIRECT AUTOMÁTICO - CORS FIX
 )
 
 
-def calculate_goal_progress(goal: Goal, db: Session) -> tuple:
-    """Calculate goal progress"""
-    from app.models.command import Command, CommandStatus
-    from app.models.financial import FinancialTransaction, TransactionType, TransactionStatus
-    
-    current_value = 0
-    
-    if goal.type == GoalType.REVENUE:
-        # Calculate revenue from finished commands
-        if goal.professional_id:
-            commands = db.query(Command).filter(
-                Command.company_id == goal.company_id,
-                Command.professional_id == goal.professional_id,
-                Command.status == CommandStatus.FINISHED,
-                Command.date >= goal.period_start,
-                Command.date <= goal.period_end
-            ).all()
-            current_value = sum(float(c.net_value) for c in commands)
-        else:
-            transactions = db.query(FinancialTransaction).filter(
-                FinancialTransaction.company_id == goal.company_id,
-                FinancialTransaction.type == TransactionType.INCOME,
-                FinancialTransaction.status == TransactionStatus.LIQUIDATED,
-                FinancialTransaction.date >= goal.period_start,
-                FinancialTransaction.date <= goal.period_end
-            ).all()
-            current_value = sum(float(t.value) for t in transactions)
-    
-    elif goal.type == GoalType.APPOINTMENTS:
-        from app.models.appointment import Appointment, AppointmentStatus
-        if goal.professional_id:
-            appointments = db.query(Appointment).filter(
-                Appointment.company_id == goal.company_id,
-                Appointment.professional_id == goal.professional_id,
-                Appointment.status == AppointmentStatus.COMPLETED,
-                Appointment.start_time >= goal.period_start,
-                Appointment.start_time <= goal.period_end
-            ).count()
-        else:
-            appointments = db.query(Appointment).filter(
-                Appointment.company_id == goal.company_id,
-                Appointment.status == AppointmentStatus.COMPLETED,
-                Appointment.start_time >= goal.period_start,
-                Appointment.start_time <= goal.period_end
-            ).count()
-        current_value = appointments
-    
-    elif goal.type == GoalType.PRODUCT_SALES:
-        from app.models.command import CommandItem, CommandItemType, CommandStatus
-        if goal.professional_id:
-            items = db.query(CommandItem).join(Command).filter(
-                Command.company_id == goal.company_id,
-                Command.professional_id == goal.professional_id,
-                Command.status == CommandStatus.FINISHED,
-                CommandItem.item_type == CommandItemType.PRODUCT,
-                Command.date >= goal.period_start,
-                Command.date <= goal.period_end
-            ).all()
-        else:
-            items = db.query(CommandItem).join(Command).filter(
-                Command.company_id == goal.company_id,
-                Command.status == CommandStatus.FINISHED,
-                CommandItem.item_type == CommandItemType.PRODUCT,
-                Command.date >= goal.period_start,
-                Command.date <= goal.period_end
-            ).all()
-        current_value = sum(item.quantity for item in items)
-    
-    progress_percentage = int((current_value / float(goal.target_value)) * 100) if goal.target_value > 0 else 0
-    if progress_percentage > 100:
-        progress_percentage = 100
-    
-    return current_value, progress_percentage
-
-
 @router.post("", response_model=GoalResponse, status_code=status.HTTP_201_CREATED)
 @router.post("/", response_model=GoalResponse, status_code=status.HTTP_201_CREATED, include_in_schema=False)
 async def create_goal(
@@ -110,9 +34,7 @@ async def create_goal(
     db.refresh(goal)
     
     # Calculate initial progress
-    current_value, progress = calculate_goal_progress(goal, db)
-    goal.current_value = current_value
-    goal.progress_percentage = progress
+    refresh_goals(db, [goal])
     db.commit()
     db.refresh(goal)
     
@@ -130,7 +52,7 @@ async def list_goals(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """List goals"""
+    """List goals (progress persisted on the goal, kept up to date by write paths)"""
     query = db.query(Goal).filter(Goal.company_id == current_user.company_id)
     
     if professional_id:
@@ -144,14 +66,6 @@ async def list_goals(
     
     goals = query.order_by(Goal.period_start.desc()).offset(skip).limit(limit).all()
     
-    # Update progress for all goals
-    for goal in goals:
-        current_value, progress = calculate_goal_progress(goal, db)
-        goal.current_value = current_value
-        goal.progress_percentage = progress
-    
-    db.commit()
-    
     return [GoalResponse.model_validate(g) for g in goals]
 
 
@@ -170,13 +84,6 @@ async def get_goal(
     if not goal:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
     
-    # Update progress
-    current_value, progress = calculate_goal_progress(goal, db)
-    goal.current_value = current_value
-    goal.progress_percentage = progress
-    db.commit()
-    db.refresh(goal)
-    
     return GoalResponse.model_validate(goal)
 
 
@@ -201,9 +108,7 @@ async def update_goal(
         setattr(goal, field, value)
     
     # Recalculate progress
-    current_value, progress = calculate_goal_progress(goal, db)
-    goal.current_value = current_value
-    goal.progress_percentage = progress
+    refresh_goals(db, [goal])
     
     db.commit()
     db.refresh(goal)
@@ -235,17 +140,13 @@ async def calculate_all_goals_progress(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Calculate progress for all active goals"""
+    """Calculate progress for all active goals (grouped queries, see app.services.goal_progress)"""
+    refresh_company_goals(db, current_user.company_id)
+    db.commit()
+    
     goals = db.query(Goal).filter(
         Goal.company_id == current_user.company_id,
         Goal.is_active == True
     ).all()
-    
-    for goal in goals:
-        current_value, progress = calculate_goal_progress(goal, db)
-        goal.current_value = current_value
-        goal.progress_percentage = progress
-    
-    db.commit()
     return goals
 
@@ -403,25 +403,20 @@ async def send_notification(
             queued_count=queued_count
         )
     
-    # Envio imediato via push
-    if request.channel.value == "push":
+    # Envio imediato via push (fan-out paralelo, restrito à empresa)
+    if request.channel.value == "push" and request.user_ids:
         push_service = PushNotificationService(db)
         
-        for user_id in request.user_ids:
-            try:
-                result = push_service.send_to_user(
-                    user_id=user_id,
-                    title=request.title,
-                    body=request.body,
-                    url=request.url,
-                    company_id=current_user.company_id
-                )
-                if result.get("success"):
-                    sent_count += 1
-                else:
-                    failed_count += 1
-            except Exception as e:
-                failed_count += 1
+        logs = push_service.send_to_company(
+            company_id=current_user.company_id,
+            user_ids=request.user_ids,
+            title=request.title,
+            body=request.body,
+            url=request.url,
+            notification_type="manual"
+        )
+        sent_count = sum(1 for log in logs if log.status == "sent")
+        failed_count = len(logs) - sent_count
     
     return SendNotificationResponse(
         success=sent_count > 0,
@@ -8,6 +8,7 @@ from datetime import datetime, timedelta
 
 from app.core.database import get_db
 from app.core.security import get_current_active_user, require_manager
+from app.core.cache import get_cache, set_cache, namespaced_key, invalidate_namespace
 from app.models.user import User
 from app.models.package import PredefinedPackage, Package, PackageStatus
 from app.models.client import Client
@@ -35,6 +36,9 @@ async def create_predefined_package(
     db.add(package)
     db.commit()
     db.refresh(package)
+    
+    # Invalidate cache
+    await invalidate_namespace("packages", current_user.company_id)
     return PredefinedPackageResponse.model_validate(package)
 
 
@@ -45,10 +49,8 @@ async def list_predefined_packages(
     db: Session = Depends(get_db)
 ):
     """List predefined packages (Cached for 5 minutes)"""
-    from app.core.cache import get_cache, set_cache
-    
-    # Cache key
-    cache_key = f"packages:predefined:{current_user.company_id}:{is_active}"
+    # Cache key (namespace versionado da empresa)
+    cache_key = await namespaced_key("packages", current_user.company_id, "predefined", is_active)
     
     # Try cache first
     cached = await get_cache(cache_key)
@@ -116,6 +118,9 @@ async def update_predefined_package(
     
     db.commit()
     db.refresh(package)
+    
+    # Invalidate cache
+    await invalidate_namespace("packages", current_user.company_id)
     return PredefinedPackageResponse.model_validate(package)
 
 
@@ -136,6 +141,9 @@ async def delete_predefined_package(
     
     db.delete(package)
     db.commit()
+    
+    # Invalidate cache
+    await invalidate_namespace("packages", current_user.company_id)
     return None
 
 
@@ -7,6 +7,7 @@ from sqlalchemy.orm import Session
 
 from app.core.database import get_db
 from app.core.security import get_current_active_user, require_manager
+from app.core.cache import get_cache, set_cache, namespaced_key, invalidate_namespace
 from app.models.user import User
 from app.models.product import Product, Brand, ProductCategory
 from app.schemas.product import (
@@ -214,7 +215,6 @@ async def create_product(
     db: Session = Depends(get_db)
 ):
     """Create a new product"""
-    from app.core.cache import delete_pattern
     from app.core.tenant_context import set_tenant_context
     
     # Set tenant context for RLS
@@ -244,7 +244,7 @@ async def create_product(
     db.refresh(product)
     
     # Invalidate cache
-    delete_pattern(f"products:list:{current_user.company_id}:*")
+    await invalidate_namespace("products", current_user.company_id)
     
     return ProductResponse.from_model(product)
 
@@ -262,11 +262,10 @@ async def list_products(
     db: Session = Depends(get_db)
 ):
     """List products (Cached for 2 minutes, optimized with eager loading)"""
-    from app.core.cache import get_cache, set_cache, delete_pattern
     from sqlalchemy.orm import joinedload
     
-    # Cache key
-    cache_key = f"products:list:{current_user.company_id}:{skip}:{limit}:{search}:{brand_id}:{category_id}:{is_active}"
+    # Cache key (namespace versionado da empresa)
+    cache_key = await namespaced_key("products", current_user.company_id, "list", skip, limit, search, brand_id, category_id, is_active)
     
     # Try cache first (only for first page without search)
     if skip == 0 and not search:
@@ -347,6 +346,9 @@ async def update_product(
     
     db.commit()
     db.refresh(product)
+    
+    # Invalidate cache
+    await invalidate_namespace("products", current_user.company_id)
     return ProductResponse.from_model(product)
 
 
@@ -367,6 +369,9 @@ async def delete_product(
     
     db.delete(product)
     db.commit()
+    
+    # Invalidate cache
+    await invalidate_namespace("products", current_user.company_id)
     return None
 
 
@@ -396,5 +401,8 @@ async def adjust_stock(
     
     db.commit()
     db.refresh(product)
+    
+    # Invalidate cache
+    await invalidate_namespace("products", current_user.company_id)
     return ProductResponse.from_model(product)
 
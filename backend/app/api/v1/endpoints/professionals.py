@@ -22,11 +22,8 @@ router = APIRouter(
 
 
 async def _invalidate_professionals_list_cache(company_id: int) -> None:
-    try:
-        from app.core.cache import delete_pattern
-        await delete_pattern(f"professionals:list:{company_id}:*")
-    except Exception:
-        return
+    from app.core.cache import invalidate_namespace
+    await invalidate_namespace("professionals", company_id)
 
 
 @router.get("/public", response_model=List[UserResponse])
@@ -240,10 +237,10 @@ async def list_professionals(
     """
     List all professionals from the same company (Cached for 5 minutes)
     """
-    from app.core.cache import get_cache, set_cache
+    from app.core.cache import get_cache, set_cache, namespaced_key
     
-    # Cache key
-    cache_key = f"professionals:list:{current_user.company_id}:{skip}:{limit}:{search}:{is_active}"
+    # Cache key (namespace versionado da empresa)
+    cache_key = await namespaced_key("professionals", current_user.company_id, "list", skip, limit, search, is_active)
     
     # Try cache first (only for first page without search)
     if skip == 0 and not search:
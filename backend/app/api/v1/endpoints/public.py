@@ -2,11 +2,12 @@
 Public API endpoints for online booking
 """
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
-from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Tuple
+from datetime import datetime, timedelta
 
-from app.core.database import get_db
+from app.core.database import get_async_db
 from app.models.company import Company
 from app.models.service import Service
 from app.models.user import User
@@ -16,22 +17,24 @@ from app.schemas.public import (
     ServiceItem,
     ProfessionalItem,
     AvailabilityResponse,
+    AvailabilityRangeResponse,
     CreatePublicAppointmentRequest,
     CreatePublicAppointmentResponse
 )
-# from app.services.availability_service import AvailabilityService
+from app.services import availability_cache
+from app.services.availability_service import MAX_RANGE_DAYS
 # from app.services.appointment_service import AppointmentService
 
 router = APIRouter()
 
 @router.get("/companies/{slug}", response_model=CompanyProfile)
-async def get_public_company(slug: str, db: Session = Depends(get_db)):
+async def get_public_company(slug: str, db: AsyncSession = Depends(get_async_db)):
     """Get company profile for public booking"""
-    company = db.query(Company).filter(
+    company = await db.scalar(select(Company).filter(
         Company.slug == slug,
         Company.is_active == True,
         Company.status == "active"
-    ).first()
+    ))
     
     if not company:
         raise HTTPException(status_code=404, detail="Empresa não encontrada")
@@ -51,13 +54,13 @@ async def get_public_company(slug: str, db: Session = Depends(get_db)):
 @router.get("/services", response_model=List[ServiceItem])
 async def get_public_services(
     companyId: int = Query(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get public services for a company"""
-    services = db.query(Service).filter(
+    services = (await db.scalars(select(Service).filter(
         Service.company_id == companyId,
         Service.is_active == True
-    ).all()
+    ))).all()
     
     return [
         ServiceItem(
@@ -74,14 +77,14 @@ async def get_public_services(
 @router.get("/professionals", response_model=List[ProfessionalItem])
 async def get_public_professionals(
     companyId: int = Query(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get public professionals for a company"""
-    professionals = db.query(User).filter(
+    professionals = (await db.scalars(select(User).filter(
         User.company_id == companyId,
         User.role == 'PROFESSIONAL',
         User.is_active == True
-    ).all()
+    ))).all()
     
     return [
         ProfessionalItem(
@@ -94,33 +97,108 @@ async def get_public_professionals(
         for prof in professionals
     ]
 
+async def _load_booking_context(
+    db: AsyncSession,
+    company_id: int,
+    service_id: int,
+    professional_id: int
+) -> Tuple[Company, Service, User]:
+    """Load and validate company, service and professional for availability queries"""
+    company = await db.scalar(select(Company).filter(
+        Company.id == company_id,
+        Company.is_active == True
+    ))
+    if not company:
+        raise HTTPException(status_code=404, detail="Empresa não encontrada")
+
+    service = await db.scalar(select(Service).filter(
+        Service.id == service_id,
+        Service.company_id == company_id,
+        Service.is_active == True
+    ))
+    if not service:
+        raise HTTPException(status_code=404, detail="Serviço não encontrado")
+
+    professional = await db.scalar(select(User).filter(
+        User.id == professional_id,
+        User.company_id == company_id,
+        User.is_active == True
+    ))
+    if not professional:
+        raise HTTPException(status_code=404, detail="Profissional não encontrado")
+
+    return company, service, professional
+
+
+def _parse_date(value: str):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+
+
 @router.get("/availability", response_model=AvailabilityResponse)
 async def get_public_availability(
     companyId: int = Query(...),
     serviceId: int = Query(...),
     professionalId: int = Query(...),
     date: str = Query(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get available time slots for booking"""
-    try:
-        selected_date = datetime.strptime(date, "%Y-%m-%d").date()
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
-    
-    # TODO: Implement availability service
-    # For now, return empty slots
+    selected_date = _parse_date(date)
+    company, service, professional = await _load_booking_context(db, companyId, serviceId, professionalId)
+
+    slots_by_day = await availability_cache.get_slots_for_range(
+        db, company, professional, service, selected_date, days=1
+    )
+    slots = slots_by_day[selected_date]
+
     return AvailabilityResponse(
         date=date,
-        available_slots=[],
+        slots=[slot.strftime("%H:%M") for slot in slots],
         professional_id=professionalId,
         service_id=serviceId
     )
 
+
+@router.get("/availability/range", response_model=AvailabilityRangeResponse)
+async def get_public_availability_range(
+    companyId: int = Query(...),
+    serviceId: int = Query(...),
+    professionalId: int = Query(...),
+    startDate: str = Query(..., description="First day (YYYY-MM-DD)"),
+    days: int = Query(7, ge=1, le=MAX_RANGE_DAYS, description="Number of days to return"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get available time slots for several consecutive days in one request"""
+    start_date = _parse_date(startDate)
+    company, service, professional = await _load_booking_context(db, companyId, serviceId, professionalId)
+
+    slots_by_day = await availability_cache.get_slots_for_range(
+        db, company, professional, service, start_date, days=days
+    )
+
+    return AvailabilityRangeResponse(
+        start_date=start_date.isoformat(),
+        end_date=(start_date + timedelta(days=days - 1)).isoformat(),
+        professional_id=professionalId,
+        service_id=serviceId,
+        days=[
+            AvailabilityResponse(
+                date=day.isoformat(),
+                slots=[slot.strftime("%H:%M") for slot in slots_by_day[day]],
+                professional_id=professionalId,
+                service_id=serviceId
+            )
+            for day in sorted(slots_by_day)
+        ]
+    )
+
 @router.post("/appointments", response_model=CreatePublicAppointmentResponse)
 async def create_public_appointment(
     request: CreatePublicAppointmentRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new appointment through public booking"""
     raise HTTPException(status_code=501, detail="Appointment creation not implemented yet")
@@ -2,21 +2,24 @@
 Reports Endpoints - Sistema completo de relatórios
 """
 from typing import List, Optional
+import json
 from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, case, extract
-from datetime import datetime, timedelta, date
+from sqlalchemy import func, case, extract
+from datetime import datetime, date
 from decimal import Decimal
 
-from app.core.database import get_db
+from app.core.database import get_async_db, get_db
 from app.core.security import get_current_active_user, require_manager
 from app.models.user import User
-from app.models.financial import FinancialTransaction, FinancialCategory
 from app.models.commission import Commission, CommissionStatus
 from app.models.command import Command, CommandStatus
 from app.models.purchase import Purchase
-from app.models.subscription_sale import SubscriptionSale, SubscriptionSaleStatus, SubscriptionSaleModel
 from app.models.client import Client
+from app.services import revenue_forecast
+from app.services.consolidated_report import ConsolidatedReport
 
 router = APIRouter(
     redirect_slashes=False
@@ -30,114 +33,14 @@ async def get_expenses_report(
     start_date: date = Query(...),
     end_date: date = Query(...),
     category_id: Optional[int] = None,
-    current_user: User = Depends(require_manager),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(require_manager)
 ):
     """
     Relatório completo de despesas
     Similar ao do Belasis
     """
-    # Total de despesas por categoria
-    expenses_by_category = db.query(
-        FinancialCategory.name.label('category'),
-        func.sum(FinancialTransaction.value).label('total'),
-        func.count(FinancialTransaction.id).label('count')
-    ).join(
-        FinancialTransaction,
-        FinancialTransaction.category_id == FinancialCategory.id
-    ).filter(
-        FinancialTransaction.company_id == current_user.company_id,
-        FinancialTransaction.type == "expense",
-        FinancialTransaction.date >= start_date,
-        FinancialTransaction.date <= end_date
-    ).group_by(FinancialCategory.name).all()
-    
-    # Total de despesas por origem
-    expenses_by_origin = db.query(
-        FinancialTransaction.origin.label('origin'),
-        func.sum(FinancialTransaction.value).label('total'),
-        func.count(FinancialTransaction.id).label('count')
-    ).filter(
-        FinancialTransaction.company_id == current_user.company_id,
-        FinancialTransaction.type == "expense",
-        FinancialTransaction.date >= start_date,
-        FinancialTransaction.date <= end_date
-    ).group_by(FinancialTransaction.origin).all()
-    
-    # Total geral
-    total_expenses = db.query(
-        func.sum(FinancialTransaction.value)
-    ).filter(
-        FinancialTransaction.company_id == current_user.company_id,
-        FinancialTransaction.type == "expense",
-        FinancialTransaction.date >= start_date,
-        FinancialTransaction.date <= end_date
-    ).scalar() or 0
-    
-    # Despesas por mês (para gráfico)
-    expenses_by_month = db.query(
-        func.to_char(FinancialTransaction.date, 'YYYY-MM').label('month'),
-        func.sum(FinancialTransaction.value).label('total')
-    ).filter(
-        FinancialTransaction.company_id == current_user.company_id,
-        FinancialTransaction.type == "expense",
-        FinancialTransaction.date >= start_date,
-        FinancialTransaction.date <= end_date
-    ).group_by(func.to_char(FinancialTransaction.date, 'YYYY-MM')).all()
-    
-    # Maiores despesas individuais
-    top_expenses = db.query(
-        FinancialTransaction
-    ).filter(
-        FinancialTransaction.company_id == current_user.company_id,
-        FinancialTransaction.type == "expense",
-        FinancialTransaction.date >= start_date,
-        FinancialTransaction.date <= end_date
-    ).order_by(FinancialTransaction.value.desc()).limit(10).all()
-    
-    return {
-        "period": {
-            "start_date": start_date.isoformat(),
-            "end_date": end_date.isoformat()
-        },
-        "total_expenses": float(total_expenses),
-        "by_category": [
-            {
-                "category": item.category or "Sem categoria",
-                "total": float(item.total or 0),
-                "count": item.count,
-                "percentage": (float(item.total or 0) / float(total_expenses) * 100) if total_expenses > 0 else 0
-            }
-            for item in expenses_by_category
-        ],
-        "by_origin": [
-            {
-                "origin": item.origin,
-                "total": float(item.total or 0),
-                "count": item.count,
-                "percentage": (float(item.total or 0) / float(total_expenses) * 100) if total_expenses > 0 else 0
-            }
-            for item in expenses_by_origin
-        ],
-        "by_month": [
-            {
-                "month": item.month,
-                "total": float(item.total or 0)
-            }
-            for item in expenses_by_month
-        ],
-        "top_expenses": [
-            {
-                "id": exp.id,
-                "description": exp.description,
-                "value": float(exp.value),
-                "date": exp.date.isoformat(),
-                "origin": exp.origin,
-                "category": exp.category.name if exp.category else None
-            }
-            for exp in top_expenses
-        ]
-    }
+    report = ConsolidatedReport(current_user.company_id, start_date, end_date)
+    return await report.section("expenses")
 
 
 # ========== RESULTADOS FINANCEIROS (DRE) ==========
@@ -146,147 +49,14 @@ async def get_expenses_report(
 async def get_financial_results(
     start_date: date = Query(...),
     end_date: date = Query(...),
-    current_user: User = Depends(require_manager),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(require_manager)
 ):
     """
     Relatório de Resultados Financeiros (DRE Simplificado)
     Similar ao do Belasis
     """
-    # ========== RECEITAS ==========
-    
-    # Receitas por origem
-    income_by_origin = db.query(
-        FinancialTransaction.origin,
-        func.sum(FinancialTransaction.value).label('total'),
-        func.sum(FinancialTransaction.net_value).label('net_total'),
-        func.count(FinancialTransaction.id).label('count')
-    ).filter(
-        FinancialTransaction.company_id == current_user.company_id,
-        FinancialTransaction.type == "income",
-        FinancialTransaction.date >= start_date,
-        FinancialTransaction.date <= end_date
-    ).group_by(FinancialTransaction.origin).all()
-    
-    total_income_gross = sum(float(item.total or 0) for item in income_by_origin)
-    total_income_net = sum(float(item.net_total or 0) for item in income_by_origin)
-    total_fees = total_income_gross - total_income_net
-    
-    # ========== DESPESAS ==========
-    
-    # Comissões
-    total_commissions = db.query(
-        func.sum(FinancialTransaction.value)
-    ).filter(
-        FinancialTransaction.company_id == current_user.company_id,
-        FinancialTransaction.origin == "commission",
-        FinancialTransaction.date >= start_date,
-        FinancialTransaction.date <= end_date
-    ).scalar() or 0
-    
-    # Compras
-    total_purchases = db.query(
-        func.sum(FinancialTransaction.value)
-    ).filter(
-        FinancialTransaction.company_id == current_user.company_id,
-        FinancialTransaction.origin == "purchase",
-        FinancialTransaction.date >= start_date,
-        FinancialTransaction.date <= end_date
-    ).scalar() or 0
-    
-    # Outras despesas
-    other_expenses = db.query(
-        func.sum(FinancialTransaction.value)
-    ).filter(
-        FinancialTransaction.company_id == current_user.company_id,
-        FinancialTransaction.type == "expense",
-        FinancialTransaction.origin.notin_(["commission", "purchase"]),
-        FinancialTransaction.date >= start_date,
-        FinancialTransaction.date <= end_date
-    ).scalar() or 0
-    
-    total_expenses = float(total_commissions or 0) + float(total_purchases or 0) + float(other_expenses or 0)
-    
-    # ========== CÁLCULOS ==========
-    
-    # Lucro Bruto = Receita Líquida - Comissões
-    gross_profit = total_income_net - float(total_commissions or 0)
-    
-    # Lucro Operacional = Lucro Bruto - Outras Despesas
-    operating_profit = gross_profit - float(total_purchases or 0) - float(other_expenses or 0)
-    
-    # Margem
-    gross_margin = (gross_profit / total_income_net * 100) if total_income_net > 0 else 0
-    operating_margin = (operating_profit / total_income_net * 100) if total_income_net > 0 else 0
-    
-    # ========== DRE POR MÊS ==========
-    
-    dre_by_month = db.query(
-        func.to_char(FinancialTransaction.date, 'YYYY-MM').label('month'),
-        func.sum(
-            case(
-                (FinancialTransaction.type == "income", FinancialTransaction.net_value),
-                else_=0
-            )
-        ).label('income'),
-        func.sum(
-            case(
-                (FinancialTransaction.type == "expense", FinancialTransaction.value),
-                else_=0
-            )
-        ).label('expense')
-    ).filter(
-        FinancialTransaction.company_id == current_user.company_id,
-        FinancialTransaction.date >= start_date,
-        FinancialTransaction.date <= end_date
-    ).group_by(func.to_char(FinancialTransaction.date, 'YYYY-MM')).all()
-    
-    return {
-        "period": {
-            "start_date": start_date.isoformat(),
-            "end_date": end_date.isoformat()
-        },
-        "dre": {
-            # Receitas
-            "receita_bruta": float(total_income_gross),
-            "taxas_gateway": float(total_fees),
-            "receita_liquida": float(total_income_net),
-            
-            # Custos Diretos
-            "comissoes": float(total_commissions or 0),
-            "lucro_bruto": float(gross_profit),
-            "margem_bruta": float(gross_margin),
-            
-            # Despesas Operacionais
-            "compras": float(total_purchases or 0),
-            "outras_despesas": float(other_expenses or 0),
-            "total_despesas_operacionais": float(total_purchases or 0) + float(other_expenses or 0),
-            
-            # Resultado
-            "lucro_operacional": float(operating_profit),
-            "margem_operacional": float(operating_margin),
-            "lucro_liquido": float(operating_profit)  # Simplificado (sem impostos por enquanto)
-        },
-        "income_by_origin": [
-            {
-                "origin": item.origin,
-                "gross": float(item.total or 0),
-                "net": float(item.net_total or 0),
-                "fees": float(item.total or 0) - float(item.net_total or 0),
-                "count": item.count
-            }
-            for item in income_by_origin
-        ],
-        "by_month": [
-            {
-                "month": item.month,
-                "income": float(item.income or 0),
-                "expense": float(item.expense or 0),
-                "profit": float(item.income or 0) - float(item.expense or 0)
-            }
-            for item in dre_by_month
-        ]
-    }
+    report = ConsolidatedReport(current_user.company_id, start_date, end_date)
+    return await report.section("financial_results")
 
 
 # ========== PROJEÇÃO DE FATURAMENTO ==========
@@ -295,103 +65,13 @@ async def get_financial_results(
 async def get_revenue_forecast(
     months_ahead: int = Query(3, ge=1, le=12),
     current_user: User = Depends(require_manager),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Projeção de Faturamento
-    Baseado em histórico + assinaturas + comandas em aberto
+    Baseado em histórico (tendência dos últimos 6 meses) + assinaturas + comandas em aberto
     """
-    today = datetime.now().date()
-    
-    # ========== HISTÓRICO (últimos 6 meses) ==========
-    
-    historical_months = []
-    for i in range(6):
-        month_start = (today.replace(day=1) - timedelta(days=i * 30)).replace(day=1)
-        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-        
-        month_revenue = db.query(
-            func.sum(FinancialTransaction.value)
-        ).filter(
-            FinancialTransaction.company_id == current_user.company_id,
-            FinancialTransaction.type == "income",
-            FinancialTransaction.date >= month_start,
-            FinancialTransaction.date <= month_end
-        ).scalar() or 0
-        
-        historical_months.append({
-            "month": month_start.strftime("%Y-%m"),
-            "revenue": float(month_revenue),
-            "type": "historical"
-        })
-    
-    historical_months.reverse()
-    
-    # Calcular média histórica
-    avg_historical = sum(m["revenue"] for m in historical_months) / len(historical_months) if historical_months else 0
-    
-    # ========== RECEITA RECORRENTE (MRR) ==========
-    
-    # Assinaturas ativas com JOIN no modelo para obter monthly_value
-    from sqlalchemy.sql import Numeric as SQLNumeric
-    
-    active_subscriptions = db.query(
-        func.count(SubscriptionSale.id).label('count'),
-        func.sum(SubscriptionSaleModel.monthly_value).label('mrr')
-    ).join(
-        SubscriptionSaleModel,
-        SubscriptionSaleModel.id == SubscriptionSale.model_id
-    ).filter(
-        SubscriptionSale.company_id == current_user.company_id,
-        SubscriptionSale.status == SubscriptionSaleStatus.ACTIVE
-    ).first()
-    
-    mrr = float(active_subscriptions.mrr or 0) if active_subscriptions and active_subscriptions.mrr else 0
-    subscription_count = active_subscriptions.count if active_subscriptions else 0
-    
-    # ========== COMANDAS EM ABERTO (A RECEBER) ==========
-    
-    commands_open = db.query(
-        func.sum(Command.total_value)
-    ).filter(
-        Command.company_id == current_user.company_id,
-        Command.status.in_(["OPEN", "IN_PROGRESS"])
-    ).scalar() or 0
-    
-    # ========== PROJEÇÃO ==========
-    
-    forecast_months = []
-    growth_rate = 1.05  # 5% de crescimento mensal (ajustar conforme histórico)
-    
-    base_revenue = avg_historical
-    
-    for i in range(1, months_ahead + 1):
-        forecast_date = (today.replace(day=1) + timedelta(days=i * 30)).replace(day=1)
-        
-        # Projeção = Média histórica * crescimento + MRR
-        projected_variable = base_revenue * (growth_rate ** i)
-        projected_recurring = mrr
-        projected_total = projected_variable + projected_recurring
-        
-        forecast_months.append({
-            "month": forecast_date.strftime("%Y-%m"),
-            "projected_variable": float(projected_variable),
-            "projected_recurring": float(projected_recurring),
-            "projected_total": float(projected_total),
-            "type": "forecast"
-        })
-    
-    return {
-        "historical": historical_months,
-        "forecast": forecast_months,
-        "metrics": {
-            "avg_historical_revenue": float(avg_historical),
-            "mrr": float(mrr),
-            "active_subscriptions": subscription_count,
-            "commands_open_value": float(commands_open or 0),
-            "growth_rate": float((growth_rate - 1) * 100)  # Em percentual
-        }
-    }
+    return await revenue_forecast.get_revenue_forecast(db, current_user.company_id, months_ahead)
 
 
 # ========== RELATÓRIO DE COMISSÕES ==========
@@ -476,54 +156,13 @@ async def get_commissions_report(
 async def get_by_service_report(
     start_date: date = Query(...),
     end_date: date = Query(...),
-    current_user: User = Depends(require_manager),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(require_manager)
 ):
     """
     Relatório de receita e performance por serviço
     """
-    from app.models.command import CommandItem
-    from app.models.service import Service
-    
-    results = db.query(
-        Service.id.label('service_id'),
-        Service.name.label('service_name'),
-        func.count(CommandItem.id).label('item_count'),
-        func.sum(CommandItem.final_value).label('total_revenue'),
-        func.avg(CommandItem.final_value).label('avg_value')
-    ).join(
-        CommandItem,
-        CommandItem.service_id == Service.id
-    ).join(
-        Command,
-        Command.id == CommandItem.command_id
-    ).filter(
-        Command.company_id == current_user.company_id,
-        Command.date >= start_date,
-        Command.date <= end_date,
-        Command.status == CommandStatus.FINISHED
-    ).group_by(Service.id, Service.name).order_by(func.sum(CommandItem.final_value).desc()).all()
-    
-    total_revenue = sum(float(r.total_revenue or 0) for r in results)
-    
-    return {
-        "period": {
-            "start_date": start_date.isoformat(),
-            "end_date": end_date.isoformat()
-        },
-        "total_revenue": float(total_revenue),
-        "services": [
-            {
-                "service_id": r.service_id,
-                "service_name": r.service_name,
-                "item_count": r.item_count,
-                "total_revenue": float(r.total_revenue or 0),
-                "avg_value": float(r.avg_value or 0),
-                "percentage": (float(r.total_revenue or 0) / total_revenue * 100) if total_revenue > 0 else 0
-            }
-            for r in results
-        ]
-    }
+    report = ConsolidatedReport(current_user.company_id, start_date, end_date)
+    return await report.section("by_service")
 
 
 # ========== RELATÓRIO POR PROFISSIONAL ==========
@@ -532,72 +171,13 @@ async def get_by_service_report(
 async def get_by_professional_report(
     start_date: date = Query(...),
     end_date: date = Query(...),
-    current_user: User = Depends(require_manager),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(require_manager)
 ):
     """
     Relatório de performance por profissional
     """
-    from app.models.review import Review
-    
-    results = db.query(
-        User.id.label('professional_id'),
-        User.full_name.label('professional_name'),
-        func.count(func.distinct(Command.id)).label('command_count'),
-        func.sum(Command.total_value).label('total_revenue'),
-        func.avg(Command.total_value).label('avg_ticket'),
-        func.avg(Review.rating).label('avg_rating')
-    ).join(
-        Command,
-        Command.professional_id == User.id
-    ).outerjoin(
-        Review,
-        and_(
-            Review.professional_id == User.id,
-            Review.created_at >= start_date,
-            Review.created_at <= end_date
-        )
-    ).filter(
-        Command.company_id == current_user.company_id,
-        Command.date >= start_date,
-        Command.date <= end_date,
-        Command.status == CommandStatus.FINISHED
-    ).group_by(User.id, User.full_name).order_by(func.sum(Command.total_value).desc()).all()
-    
-    # Buscar comissões de cada profissional
-    commissions_by_prof = db.query(
-        Commission.professional_id,
-        func.sum(Commission.commission_value).label('total_commission')
-    ).filter(
-        Commission.company_id == current_user.company_id,
-        Commission.created_at >= start_date,
-        Commission.created_at <= end_date
-    ).group_by(Commission.professional_id).all()
-    
-    commission_dict = {c.professional_id: float(c.total_commission or 0) for c in commissions_by_prof}
-    
-    total_revenue = sum(float(r.total_revenue or 0) for r in results)
-    
-    return {
-        "period": {
-            "start_date": start_date.isoformat(),
-            "end_date": end_date.isoformat()
-        },
-        "total_revenue": float(total_revenue),
-        "professionals": [
-            {
-                "professional_id": r.professional_id,
-                "professional_name": r.professional_name,
-                "command_count": r.command_count,
-                "total_revenue": float(r.total_revenue or 0),
-                "avg_ticket": float(r.avg_ticket or 0),
-                "total_commission": commission_dict.get(r.professional_id, 0),
-                "avg_rating": float(r.avg_rating or 0) if r.avg_rating else None,
-                "percentage": (float(r.total_revenue or 0) / total_revenue * 100) if total_revenue > 0 else 0
-            }
-            for r in results
-        ]
-    }
+    report = ConsolidatedReport(current_user.company_id, start_date, end_date)
+    return await report.section("by_professional")
 
 
 # ========== RELATÓRIO DE CLIENTES ==========
@@ -665,29 +245,25 @@ async def get_by_client_report(
 async def get_consolidated_report(
     start_date: date = Query(...),
     end_date: date = Query(...),
-    current_user: User = Depends(require_manager),
-    db: Session = Depends(get_db)
+    stream: bool = Query(False, description="Send each section as NDJSON as soon as it is ready"),
+    current_user: User = Depends(require_manager)
 ):
     """
     Relatório consolidado com todas as métricas principais
+
+    As seções rodam em paralelo, cada uma em sua própria conexão, sobre uma
+    única varredura das transações financeiras. Com stream=true cada seção é
+    enviada como uma linha NDJSON ({"section": ..., "data": ...}) ao terminar.
     """
-    # Buscar todos os relatórios em paralelo
-    expenses = await get_expenses_report(start_date, end_date, None, current_user, db)
-    financial_results = await get_financial_results(start_date, end_date, current_user, db)
-    forecast = await get_revenue_forecast(3, current_user, db)
-    by_service = await get_by_service_report(start_date, end_date, current_user, db)
-    by_professional = await get_by_professional_report(start_date, end_date, current_user, db)
-    
-    return {
-        "period": {
-            "start_date": start_date.isoformat(),
-            "end_date": end_date.isoformat()
-        },
-        "expenses": expenses,
-        "financial_results": financial_results,
-        "revenue_forecast": forecast,
-        "by_service": by_service,
-        "by_professional": by_professional,
-        "generated_at": datetime.now().isoformat()
-    }
+    report = ConsolidatedReport(current_user.company_id, start_date, end_date)
+
+    if not stream:
+        return await report.build()
+
+    async def sections():
+        yield json.dumps({"section": "period", "data": report.period()}) + "\n"
+        async for name, data in report.iter_sections():
+            yield json.dumps({"section": name, "data": data}, default=str) + "\n"
+        yield json.dumps({"section": "generated_at", "data": datetime.now().isoformat()}) + "\n"
 
+    return StreamingResponse(sections(), media_type="application/x-ndjson")
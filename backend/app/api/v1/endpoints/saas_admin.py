@@ -10,7 +10,7 @@ All endpoints require SaaS admin roles (SAAS_OWNER or SAAS_STAFF).
 These endpoints DO NOT filter by company_id (global access).
 """
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import func, desc, or_
 
@@ -18,6 +18,7 @@ from datetime import datetime, timedelta
 from decimal import Decimal
 
 from app.core.database import get_db
+from app.core.pagination import KeysetPage
 from app.core.rbac import (
     CurrentUserContext,
     require_saas_admin,
@@ -117,8 +118,10 @@ def _get_plan_aliases(plan: Plan) -> List[str]:
 
 @router.get("/companies", response_model=List[CompanyResponse])
 async def list_all_companies(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Cursor from X-Next-Cursor (replaces skip)"),
     search: Optional[str] = None,
     is_active: Optional[bool] = None,
     context: CurrentUserContext = Depends(require_saas_admin),
@@ -144,8 +147,9 @@ async def list_all_companies(
     if is_active is not None:
         query = query.filter(Company.is_active == is_active)
     
-    # Order by creation date (newest first)
-    companies = query.order_by(desc(Company.created_at)).offset(skip).limit(limit).all()
+    # Order by creation date (newest first), keyset por (created_at, id)
+    page = KeysetPage(Company.created_at, Company.id, cursor=cursor, limit=limit, skip=skip)
+    companies = page.finish(page.apply(query).all(), response)
     
     return [CompanyResponse.model_validate(c) for c in companies]
 
@@ -420,8 +424,10 @@ async def impersonate_company(
 
 @router.get("/users", response_model=List[UserResponse])
 async def list_all_users(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Cursor from X-Next-Cursor (replaces skip)"),
     company_id: Optional[int] = None,
     saas_role: Optional[str] = None,
     context: CurrentUserContext = Depends(require_saas_admin),
@@ -440,7 +446,8 @@ async def list_all_users(
     if saas_role:
         query = query.filter(User.saas_role == saas_role)
     
-    users = query.order_by(desc(User.created_at)).offset(skip).limit(limit).all()
+    page = KeysetPage(User.created_at, User.id, cursor=cursor, limit=limit, skip=skip)
+    users = page.finish(page.apply(query).all(), response)
     
     return [UserResponse.model_validate(u) for u in users]
 
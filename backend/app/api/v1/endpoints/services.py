@@ -9,6 +9,7 @@ from decimal import Decimal
 
 from app.core.database import get_db
 from app.core.security import get_current_active_user, require_manager
+from app.core.cache import get_cache, set_cache, namespaced_key, invalidate_namespace
 from app.models.service import Service, ServiceCategory
 from app.models.user import User
 from app.models.company import Company
@@ -188,7 +189,6 @@ async def create_service(
     """
     Create a service (Manager/Admin only)
     """
-    from app.core.cache import delete_pattern
     from app.core.tenant_context import set_tenant_context
     
     # Set tenant context for RLS
@@ -238,7 +238,7 @@ async def create_service(
     db.refresh(service)
     
     # Invalidate cache
-    delete_pattern(f"services:list:{current_user.company_id}:*")
+    await invalidate_namespace("services", current_user.company_id)
     
     return ServiceResponse.from_model(service)
 
@@ -256,15 +256,14 @@ async def list_services(
     """
     List services (Cached for 2 minutes, optimized with eager loading)
     """
-    from app.core.cache import get_cache, set_cache, delete_pattern
     from app.core.tenant_context import set_tenant_context
     
     # Set tenant context for RLS
     if current_user.company_id:
         set_tenant_context(db, current_user.company_id)
     
-    # Cache key
-    cache_key = f"services:list:{current_user.company_id}:{skip}:{limit}:{category_id}:{is_active}"
+    # Cache key (namespace versionado da empresa)
+    cache_key = await namespaced_key("services", current_user.company_id, "list", skip, limit, category_id, is_active)
     
     # Try cache first (only for first page without filters)
     if skip == 0 and category_id is None and is_active is None:
@@ -332,8 +331,6 @@ async def update_service(
     """
     Update service (Manager/Admin only)
     """
-    from app.core.cache import delete_pattern
-    
     service = db.query(Service).filter(
         Service.id == service_id,
         Service.company_id == current_user.company_id
@@ -353,7 +350,7 @@ async def update_service(
     db.refresh(service)
     
     # Invalidate cache
-    delete_pattern(f"services:list:{current_user.company_id}:*")
+    await invalidate_namespace("services", current_user.company_id)
     
     return ServiceResponse.from_model(service)
 
@@ -382,4 +379,7 @@ async def delete_service(
     service.is_active = False
     db.commit()
     
+    # Invalidate cache
+    await invalidate_namespace("services", current_user.company_id)
+    
     return None
@@ -4,14 +4,15 @@ Processa respostas e interações dos clientes via WhatsApp
 """
 from fastapi import APIRouter, Request, HTTPException, Depends
 from sqlalchemy.orm import Session
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import logging
 from datetime import datetime
 
 from app.core.database import get_db
 from app.models.appointment import Appointment, AppointmentStatus
-from app.models.client import Client
 from app.services.whatsapp_appointment_notifications import whatsapp_appointment_service
+from app.services.whatsapp_routing import company_id_for_instance, find_client_by_phone, next_appointment
+from app.services.webhook_ingestion import ingest_webhook
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -35,8 +36,9 @@ async def handle_whatsapp_webhook(
         event = data.get('event')
         
         # Processar diferentes tipos de eventos
+        # Mensagens recebidas vão para a fila "webhooks" (app.tasks.webhook_tasks)
         if event == 'messages.upsert':
-            return await handle_message_received(data, db)
+            return await ingest_webhook("whatsapp", data)
         
         elif event == 'messages.update':
             return await handle_message_update(data, db)
@@ -79,7 +81,7 @@ async def handle_message_received(data: Dict[str, Any], db: Session):
         # Processar mensagem de texto
         elif message_type == 'conversation' or message_type == 'extendedTextMessage':
             text = message_content.get('conversation') or message_content.get('extendedTextMessage', {}).get('text', '')
-            return await handle_text_message(text, from_number, db)
+            return await handle_text_message(text, from_number, db, instance=data.get('instance'))
         
         return {"status": "processed", "type": message_type}
         
@@ -177,11 +179,14 @@ async def handle_list_response(list_id: str, from_number: str, db: Session):
         return {"status": "error", "error": str(e)}
 
 
-async def handle_text_message(text: str, from_number: str, db: Session):
+async def handle_text_message(text: str, from_number: str, db: Session, instance: Optional[str] = None):
     """Processa mensagem de texto do cliente"""
     try:
         logger.info(f"Mensagem de texto recebida de {from_number}: {text}")
         
+        # Remetente -> cliente por igualdade no E.164, no escopo da empresa da instância
+        client = find_client_by_phone(db, from_number, company_id_for_instance(db, instance))
+        
         # Aqui você pode implementar lógica de NLP ou comandos simples
         text_lower = text.lower().strip()
         
@@ -196,14 +201,20 @@ async def handle_text_message(text: str, from_number: str, db: Session):
         
         elif 'cancelar' in text_lower:
             # Solicitar cancelamento
-            return {"status": "cancel_request", "action": "list_appointments"}
+            appointment = next_appointment(db, client) if client else None
+            return {
+                "status": "cancel_request",
+                "action": "list_appointments",
+                "client_id": client.id if client else None,
+                "appointment_id": appointment.id if appointment else None
+            }
         
         elif 'horário' in text_lower or 'horario' in text_lower:
             # Consultar horários
             return {"status": "time_request", "action": "send_available_times"}
         
         # Mensagem genérica
-        return {"status": "text_received", "text": text}
+        return {"status": "text_received", "text": text, "client_id": client.id if client else None}
         
     except Exception as e:
         logger.error(f"Erro ao processar texto: {e}")
@@ -1,10 +1,15 @@
 """
 API Key Authentication Middleware
+
+Read-only: the key projection comes from app.core.api_key_cache and usage is
+counted in Redis, flushed to APIKey by the flush_api_key_usage task.
 """
 from fastapi import Header, HTTPException, status, Depends
 from sqlalchemy.orm import Session
 from typing import Optional, Annotated
+import hashlib
 
+from app.core.api_key_cache import get_api_key_projection, record_usage
 from app.core.database import get_db
 from app.models.api_key import APIKey
 from app.models.company import Company
@@ -49,13 +54,10 @@ class APIKeyAuth:
             )
         
         # Hash the provided key
-        import hashlib
         key_hash = hashlib.sha256(x_api_key.encode()).hexdigest()
         
-        # Find API key in database
-        api_key = db.query(APIKey).filter(
-            APIKey.key_hash == key_hash
-        ).first()
+        # Find API key (local cache -> Redis -> database)
+        api_key = await get_api_key_projection(db, key_hash)
         
         if not api_key:
             raise HTTPException(
@@ -77,22 +79,17 @@ class APIKeyAuth:
                 detail=f"API Key does not have required scope: {self.required_scope}"
             )
         
-        # Get company
-        company = db.query(Company).filter(
-            Company.id == api_key.company_id
-        ).first()
-        
-        if not company or not company.is_active:
+        # Company active flag is part of the cached projection
+        if not api_key.company_active:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Company not found or inactive"
             )
         
-        # Update usage statistics
-        api_key.update_usage()
-        db.commit()
+        # Usage statistics: counted in Redis, flushed to the database in batches
+        record_usage(api_key.key_id)
         
-        return api_key, company
+        return api_key.to_models(db)
 
 
 # Convenience functions for common scopes
@@ -111,7 +108,7 @@ def require_api_key(scope: Optional[str] = None):
     return APIKeyAuth(required_scope=scope)
 
 
-def get_api_key_optional(
+async def get_api_key_optional(
     x_api_key: Annotated[Optional[str], Header()] = None,
     db: Session = Depends(get_db)
 ) -> Optional[tuple[APIKey, Company]]:
@@ -134,7 +131,7 @@ def get_api_key_optional(
         return None
     
     try:
-        return APIKeyAuth()(x_api_key=x_api_key, db=db)
+        return await APIKeyAuth()(x_api_key=x_api_key, db=db)
     except HTTPException:
         return None
 
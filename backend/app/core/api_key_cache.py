@@ -0,0 +1,365 @@
+"""
+API Key Cache - Autenticação por X-API-Key sem consulta nem escrita no banco
+
+APIKeyAuth precisa apenas de uma projeção pequena da chave (id, empresa,
+escopos, validade) e do flag is_active da empresa. Ela é mantida como em
+app.core.auth_cache:
+
+1. LRU em memória do processo (TTL curto), por hash da chave
+2. Redis (TTL maior): um MGET compartilhado entre workers
+3. Miss: PostgreSQL (APIKey + Company em uma consulta, no threadpool para não
+   bloquear o event loop), regravando os dois níveis
+
+Invalidação (eventos da Session após o commit, via app.core.post_commit):
+- Alterações em escopos, validade, is_active, hash (rotação) ou exclusão da chave
+- Mudança de is_active da empresa invalida todas as chaves dela
+
+Uso (usage_count, last_used_at): a autenticação só incrementa contadores no
+Redis, sem esperar a resposta; a task flush_api_key_usage grava os acumulados
+em APIKey em lote a cada minuto. Sem Redis o uso dessas requisições se perde
+(a autenticação continua funcionando).
+"""
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Set, Tuple
+import asyncio
+import json
+import logging
+import time
+
+from sqlalchemy import bindparam, func, inspect, select, update
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
+from starlette.concurrency import run_in_threadpool
+
+from app.core.cache import ProjectionLRU, get_redis, get_sync_redis
+from app.core.post_commit import register_post_commit
+from app.models.api_key import APIKey, scopes_allow
+from app.models.company import Company
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "auth:apikey"
+LOCAL_TTL = 10  # segundos
+LOCAL_MAX_ENTRIES = 10_000
+REDIS_TTL = 300  # segundos
+
+USAGE_COUNT_KEY = "apikey:usage:count"
+USAGE_LAST_USED_KEY = "apikey:usage:last_used"
+
+# Colunas de APIKey que fazem parte da projeção
+TRACKED_KEY_FIELDS = ("key_hash", "scopes", "is_active", "expires_at", "company_id", "user_id")
+
+_SESSION_INFO_KEY = "api_key_cache_invalidate"
+
+
+@dataclass(frozen=True)
+class APIKeyProjection:
+    """Dados da chave necessários para autenticar uma requisição"""
+    key_id: int
+    key_hash: str
+    company_id: int
+    user_id: Optional[int]
+    scopes: Optional[str]  # JSON, como em APIKey.scopes
+    is_active: bool
+    expires_at: Optional[str]  # ISO 8601 (UTC)
+    company_active: bool
+    loaded_at: float = 0.0
+
+    def is_valid(self) -> bool:
+        """Mesma regra de APIKey.is_valid"""
+        if not self.is_active:
+            return False
+        if self.expires_at and datetime.fromisoformat(self.expires_at) < datetime.utcnow():
+            return False
+        return True
+
+    def has_scope(self, required_scope: str) -> bool:
+        """Mesma regra de APIKey.has_scope"""
+        return scopes_allow(self.scopes, required_scope)
+
+    def to_models(self, db: Session) -> Tuple[APIKey, Company]:
+        """
+        APIKey e Company persistentes na sessão sem consulta ao banco.
+
+        As colunas da projeção já vêm carregadas; as demais são carregadas
+        sob demanda no primeiro acesso.
+        """
+        api_key = db.identity_map.get(identity_key(APIKey, self.key_id))
+        if api_key is None:
+            api_key = APIKey(
+                id=self.key_id,
+                key_hash=self.key_hash,
+                company_id=self.company_id,
+                user_id=self.user_id,
+                scopes=self.scopes,
+                is_active=self.is_active,
+                expires_at=datetime.fromisoformat(self.expires_at) if self.expires_at else None,
+            )
+            make_transient_to_detached(api_key)
+            api_key = db.merge(api_key, load=False)
+
+        company = db.identity_map.get(identity_key(Company, self.company_id))
+        if company is None:
+            company = Company(id=self.company_id, is_active=self.company_active)
+            make_transient_to_detached(company)
+            company = db.merge(company, load=False)
+
+        return api_key, company
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, raw: str) -> "APIKeyProjection":
+        return cls(**json.loads(raw))
+
+
+def _key(key_hash: str) -> str:
+    return f"{KEY_PREFIX}:{key_hash}"
+
+
+def _invalidated_key(key_hash: str) -> str:
+    return f"{KEY_PREFIX}:{key_hash}:inv"
+
+
+_local = ProjectionLRU(LOCAL_MAX_ENTRIES, LOCAL_TTL, key_attr="key_hash")
+
+
+# ========== LEITURA ==========
+
+def _load_from_db(db: Session, key_hash: str) -> Optional[APIKeyProjection]:
+    started = time.time()
+    row = db.query(APIKey, Company.is_active).outerjoin(
+        Company, Company.id == APIKey.company_id
+    ).filter(APIKey.key_hash == key_hash).first()
+    if row is None:
+        return None
+
+    api_key, company_active = row
+    return APIKeyProjection(
+        key_id=api_key.id,
+        key_hash=api_key.key_hash,
+        company_id=api_key.company_id,
+        user_id=api_key.user_id,
+        scopes=api_key.scopes,
+        is_active=bool(api_key.is_active),
+        expires_at=api_key.expires_at.isoformat() if api_key.expires_at else None,
+        company_active=bool(company_active),
+        loaded_at=started,
+    )
+
+
+async def get_api_key_projection(db: Session, key_hash: str) -> Optional[APIKeyProjection]:
+    """
+    Projeção da chave pelo hash (None se a chave não existe).
+
+    Ordem: LRU local -> Redis (um MGET) -> banco.
+    """
+    projection = _local.get(key_hash)
+    if projection is not None:
+        return projection
+
+    redis = await get_redis()
+    if redis is not None:
+        try:
+            raw, invalidated_at = await redis.mget(_key(key_hash), _invalidated_key(key_hash))
+            if raw:
+                projection = APIKeyProjection.from_json(raw)
+                if invalidated_at is None or projection.loaded_at >= float(invalidated_at):
+                    _local.put(projection)
+                    return projection
+        except Exception as e:
+            logger.error(f"❌ Erro ao ler cache de API key: {e}")
+
+    projection = await run_in_threadpool(_load_from_db, db, key_hash)
+    if projection is None:
+        return None
+
+    if redis is not None:
+        try:
+            await redis.setex(_key(key_hash), REDIS_TTL, projection.to_json())
+        except Exception as e:
+            logger.error(f"❌ Erro ao gravar cache de API key: {e}")
+
+    _local.put(projection)
+    return projection
+
+
+# ========== USO ==========
+
+_pending_tasks: Set[asyncio.Task] = set()
+
+
+async def _increment_usage(key_id: int, used_at: float) -> None:
+    redis = await get_redis()
+    if redis is None:
+        return
+
+    try:
+        pipe = redis.pipeline(transaction=False)
+        pipe.hincrby(USAGE_COUNT_KEY, key_id, 1)
+        pipe.hset(USAGE_LAST_USED_KEY, key_id, repr(used_at))
+        await pipe.execute()
+    except Exception as e:
+        logger.debug(f"Uso da API key {key_id} não registrado: {e}")
+
+
+def record_usage(key_id: int) -> None:
+    """Conta uma requisição da chave no Redis sem bloquear a autenticação"""
+    task = asyncio.get_running_loop().create_task(_increment_usage(key_id, time.time()))
+    _pending_tasks.add(task)
+    task.add_done_callback(_pending_tasks.discard)
+
+
+def _pop_usage(redis) -> Tuple[Dict[str, str], Dict[str, str]]:
+    pipe = redis.pipeline(transaction=True)
+    pipe.hgetall(USAGE_COUNT_KEY)
+    pipe.hgetall(USAGE_LAST_USED_KEY)
+    pipe.delete(USAGE_COUNT_KEY, USAGE_LAST_USED_KEY)
+    counts, last_used, _ = pipe.execute()
+    return counts or {}, last_used or {}
+
+
+def _restore_usage(redis, counts: Dict[str, str], last_used: Dict[str, str]) -> None:
+    pipe = redis.pipeline(transaction=False)
+    for key_id, count in counts.items():
+        pipe.hincrby(USAGE_COUNT_KEY, key_id, int(count))
+    for key_id, used_at in last_used.items():
+        pipe.hsetnx(USAGE_LAST_USED_KEY, key_id, used_at)
+    pipe.execute()
+
+
+def flush_usage(db: Session) -> int:
+    """
+    Grava em APIKey o uso acumulado no Redis (um UPDATE em lote).
+
+    Os contadores são retirados do Redis atomicamente; se a gravação falhar,
+    voltam para o próximo flush. Retorna quantas chaves foram atualizadas.
+    """
+    redis = get_sync_redis()
+    if redis is None:
+        return 0
+
+    try:
+        counts, last_used = _pop_usage(redis)
+    except Exception as e:
+        logger.error(f"❌ Erro ao ler uso de API keys no Redis: {e}")
+        return 0
+
+    if not counts:
+        return 0
+
+    table = APIKey.__table__
+    statement = update(table).where(table.c.id == bindparam("key_id")).values(
+        usage_count=func.coalesce(table.c.usage_count, 0) + bindparam("uses"),
+        # Chave sem last_used no lote (ex.: restaurada só com a contagem) mantém o valor atual
+        last_used_at=func.coalesce(bindparam("used_at"), table.c.last_used_at),
+    )
+    rows = [
+        {
+            "key_id": int(key_id),
+            "uses": int(count),
+            "used_at": datetime.utcfromtimestamp(float(last_used[key_id])) if key_id in last_used else None,
+        }
+        for key_id, count in counts.items()
+    ]
+
+    try:
+        db.execute(statement, rows)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"❌ Erro ao gravar uso de {len(rows)} API key(s): {e}")
+        try:
+            _restore_usage(redis, counts, last_used)
+        except Exception as restore_error:
+            logger.error(f"❌ Uso de API keys perdido: {restore_error}")
+        return 0
+
+    return len(rows)
+
+
+# ========== INVALIDAÇÃO ==========
+
+async def _invalidate_remote(key_hashes: Iterable[str], reset_key_ids: Iterable[int] = ()) -> None:
+    key_hashes, reset_key_ids = list(key_hashes), list(reset_key_ids)
+    redis = await get_redis()
+    if redis is None:
+        return
+
+    now = time.time()
+    try:
+        pipe = redis.pipeline(transaction=False)
+        for key_hash in key_hashes:
+            pipe.setex(_invalidated_key(key_hash), REDIS_TTL, repr(now))
+            pipe.delete(_key(key_hash))
+        if reset_key_ids:
+            pipe.hdel(USAGE_COUNT_KEY, *reset_key_ids)
+            pipe.hdel(USAGE_LAST_USED_KEY, *reset_key_ids)
+        await pipe.execute()
+    except Exception as e:
+        logger.error(f"❌ Erro ao invalidar cache de {len(key_hashes)} API key(s): {e}")
+
+
+def _invalidate_remote_sync(key_hashes: Iterable[str], reset_key_ids: Iterable[int] = ()) -> None:
+    """Invalidação no Redis fora do event loop (threadpool, Celery, scripts)"""
+    key_hashes, reset_key_ids = list(key_hashes), list(reset_key_ids)
+    redis = get_sync_redis()
+    if redis is None:
+        return
+
+    try:
+        now = time.time()
+        pipe = redis.pipeline(transaction=False)
+        for key_hash in key_hashes:
+            pipe.setex(_invalidated_key(key_hash), REDIS_TTL, repr(now))
+            pipe.delete(_key(key_hash))
+        if reset_key_ids:
+            pipe.hdel(USAGE_COUNT_KEY, *reset_key_ids)
+            pipe.hdel(USAGE_LAST_USED_KEY, *reset_key_ids)
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"❌ Erro ao invalidar cache de {len(key_hashes)} API key(s): {e}")
+
+
+def _forget_local(key_hashes: Iterable[str], reset_key_ids: Iterable[int] = ()) -> None:
+    for key_hash in key_hashes:
+        _local.pop(key_hash)
+
+
+def _changed_keys(session: Session) -> Tuple[Set[str], Set[int]]:
+    key_hashes: Set[str] = set()
+    reset_key_ids: Set[int] = set()
+    company_ids: Set[int] = set()
+
+    for obj in session.dirty:
+        state = inspect(obj)
+        if isinstance(obj, APIKey):
+            if any(state.attrs[name].history.has_changes() for name in TRACKED_KEY_FIELDS):
+                key_hashes.add(obj.key_hash)
+                # Rotação: o hash antigo também sai do cache
+                key_hashes.update(state.attrs.key_hash.history.deleted or ())
+            if state.attrs.usage_count.history.has_changes():
+                reset_key_ids.add(obj.id)
+        elif isinstance(obj, Company) and state.attrs.is_active.history.has_changes():
+            company_ids.add(obj.id)
+
+    for obj in session.deleted:
+        if isinstance(obj, APIKey):
+            key_hashes.add(obj.key_hash)
+        elif isinstance(obj, Company):
+            company_ids.add(obj.id)
+
+    if company_ids:
+        key_hashes.update(session.execute(
+            select(APIKey.key_hash).where(APIKey.company_id.in_(company_ids))
+        ).scalars())
+
+    key_hashes.discard(None)
+    return key_hashes, reset_key_ids
+
+
+register_post_commit(
+    _SESSION_INFO_KEY, _changed_keys, _invalidate_remote, _invalidate_remote_sync, apply_local=_forget_local
+)
@@ -1,13 +1,96 @@
 """
 Audit Helper - Facilita o registro de ações administrativas
+
+Os eventos não são gravados na transação de quem chama (nem fazem commit do
+trabalho pendente dela):
+
+- Assíncrono (padrão): XADD no stream Redis AUDIT_STREAM_KEY; a task
+  flush_audit_log insere os eventos em lote em audit_logs. O stream é lido por
+  consumer group e o XACK só acontece depois do commit: entrega
+  at-least-once (eventos de um flusher que caiu são reclamados depois de
+  AUDIT_CLAIM_IDLE_MS; em caso de falha no meio, um evento pode ser gravado
+  duas vezes, nunca perdido)
+- Síncrono (durable=True, sem Redis ou com o stream acima de
+  AUDIT_STREAM_MAX_PENDING): grava em sessão própria antes de retornar.
+  O limite do stream funciona como backpressure: enquanto o flusher estiver
+  atrasado, quem registra eventos paga a escrita
 """
-from typing import Optional, Dict, Any
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
+import json
+import logging
+import os
+import socket
+import time
+
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from fastapi import Request
 
+from app.core.cache import get_sync_redis
+from app.core.config import settings
+from app.core.database import SessionLocal
 from app.models.audit_log import AuditLog, CRITICAL_ACTIONS
 from app.core.rbac import CurrentUserContext
 
+logger = logging.getLogger(__name__)
+
+AUDIT_STREAM_KEY = "audit:events"
+AUDIT_CONSUMER_GROUP = "audit-writers"
+AUDIT_CLAIM_IDLE_MS = 5 * 60 * 1000  # Evento entregue a um flusher e não confirmado
+BACKPRESSURE_SECONDS = 5  # Depois de ver o stream cheio, grava na hora por este tempo
+
+# Ações gravadas sempre na hora (a resposta só sai com o registro durável)
+DURABLE_ACTIONS = {"delete_company", "impersonate_company", "promote_user_saas"}
+
+_backpressure_until = 0.0
+
+
+def _event_row(audit: AuditLog) -> Dict[str, Any]:
+    """Colunas do AuditLog para inserção em lote"""
+    return {
+        column.name: getattr(audit, column.key)
+        for column in AuditLog.__table__.columns
+        if column.name != "id"
+    }
+
+
+def _write_now(rows: List[Dict[str, Any]]) -> None:
+    """Insere os eventos em sessão própria (não toca na transação de quem chamou)"""
+    db = SessionLocal()
+    try:
+        db.execute(insert(AuditLog.__table__), rows)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _enqueue(row: Dict[str, Any]) -> bool:
+    """XADD no stream; False se o evento precisa ser gravado na hora"""
+    global _backpressure_until
+
+    if not settings.AUDIT_ASYNC_ENABLED or time.monotonic() < _backpressure_until:
+        return False
+
+    redis = get_sync_redis()
+    if redis is None:
+        return False
+
+    try:
+        pipe = redis.pipeline(transaction=False)
+        pipe.xlen(AUDIT_STREAM_KEY)
+        pipe.xadd(AUDIT_STREAM_KEY, {"event": json.dumps(row, default=str)})
+        pending, _ = pipe.execute()
+    except Exception as e:
+        logger.warning(f"⚠️ Redis indisponível para o audit log, gravando na hora: {e}")
+        return False
+
+    if pending >= settings.AUDIT_STREAM_MAX_PENDING:
+        # Este evento já está no stream; os próximos são gravados na hora
+        _backpressure_until = time.monotonic() + BACKPRESSURE_SECONDS
+        logger.warning(f"⚠️ Stream do audit log com {pending} eventos pendentes: gravando na hora")
+    return True
+
 
 def log_action(
     db: Session,
@@ -19,13 +102,14 @@ def log_action(
     resource_name: Optional[str] = None,
     details: Optional[Dict[str, Any]] = None,
     status: str = "success",
-    error_message: Optional[str] = None
+    error_message: Optional[str] = None,
+    durable: Optional[bool] = None
 ) -> AuditLog:
     """
     Registra uma ação administrativa no audit log.
     
     Args:
-        db: Sessão do banco de dados
+        db: Sessão do banco de dados (não é usada para gravar nem recebe commit)
         action: Ação realizada (ex: "delete_company")
         resource_type: Tipo do recurso (ex: "company")
         context: Contexto do usuário atual
@@ -35,9 +119,10 @@ def log_action(
         details: Detalhes adicionais da ação
         status: Status da ação (success, failed, partial)
         error_message: Mensagem de erro se falhou
+        durable: Gravar antes de retornar (padrão: ações em DURABLE_ACTIONS)
     
     Returns:
-        AuditLog criado
+        AuditLog registrado (sem id quando enfileirado)
     """
     # Extrair informações do request
     ip_address = None
@@ -69,16 +154,101 @@ def log_action(
         user_agent=user_agent,
         request_id=request_id,
         status=status,
-        error_message=error_message
+        error_message=error_message,
+        created_at=datetime.utcnow()
     )
     
-    db.add(audit)
-    db.commit()
-    db.refresh(audit)
+    if durable is None:
+        durable = action in DURABLE_ACTIONS
+    
+    row = _event_row(audit)
+    if durable or not _enqueue(row):
+        _write_now([row])
     
     return audit
 
 
+# ========== FLUSH (task flush_audit_log) ==========
+
+def _consumer_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _ensure_group(redis) -> None:
+    try:
+        redis.xgroup_create(AUDIT_STREAM_KEY, AUDIT_CONSUMER_GROUP, id="0", mkstream=True)
+    except Exception as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def _parse_entries(entries) -> Tuple[List[str], List[Dict[str, Any]]]:
+    ids: List[str] = []
+    rows: List[Dict[str, Any]] = []
+
+    for entry_id, fields in entries or []:
+        ids.append(entry_id)
+        if not fields:
+            continue  # Removido do stream depois de entregue
+        try:
+            row = json.loads(fields["event"])
+            row["created_at"] = datetime.fromisoformat(row["created_at"])
+            rows.append(row)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"❌ Evento de audit log inválido descartado ({entry_id}): {e}")
+
+    return ids, rows
+
+
+def flush_audit_events(batch_size: Optional[int] = None) -> int:
+    """
+    Insere em lote os eventos do stream em audit_logs.
+    
+    Primeiro reclama os eventos entregues a flushers que não confirmaram,
+    depois lê os novos. Retorna quantos eventos foram gravados.
+    """
+    batch_size = batch_size or settings.AUDIT_FLUSH_BATCH_SIZE
+    redis = get_sync_redis()
+    if redis is None:
+        return 0
+
+    consumer = _consumer_name()
+    try:
+        _ensure_group(redis)
+        claimed = redis.xautoclaim(
+            AUDIT_STREAM_KEY, AUDIT_CONSUMER_GROUP, consumer,
+            min_idle_time=AUDIT_CLAIM_IDLE_MS, start_id="0-0", count=batch_size
+        )
+        entries = list(claimed[1]) if claimed else []
+        if len(entries) < batch_size:
+            response = redis.xreadgroup(
+                AUDIT_CONSUMER_GROUP, consumer, {AUDIT_STREAM_KEY: ">"}, count=batch_size - len(entries)
+            )
+            for _, stream_entries in response or []:
+                entries.extend(stream_entries)
+    except Exception as e:
+        logger.error(f"❌ Erro ao ler stream do audit log: {e}")
+        return 0
+
+    ids, rows = _parse_entries(entries)
+    if not ids:
+        return 0
+
+    if rows:
+        # Falha aqui: sem XACK, os eventos voltam por xautoclaim
+        _write_now(rows)
+
+    try:
+        pipe = redis.pipeline(transaction=False)
+        pipe.xack(AUDIT_STREAM_KEY, AUDIT_CONSUMER_GROUP, *ids)
+        pipe.xdel(AUDIT_STREAM_KEY, *ids)
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"❌ Erro ao confirmar {len(ids)} evento(s) do audit log (serão regravados): {e}")
+
+    return len(rows)
+
+
 def log_impersonation(
     db: Session,
     context: CurrentUserContext,
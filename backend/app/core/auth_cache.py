@@ -0,0 +1,270 @@
+"""
+Auth Cache - Projeção de autenticação em cache (LRU local + Redis)
+
+get_current_user e get_current_user_context precisam apenas de uma projeção
+pequena do usuário (id, email, is_active, role, company_id e os papéis em
+CompanyUser). Ela é mantida em dois níveis:
+
+1. LRU em memória do processo (TTL curto): zero round trips
+2. Redis (TTL maior): um MGET compartilhado entre workers
+3. Miss: PostgreSQL (User + CompanyUser), regravando os dois níveis
+
+Invalidação:
+- Alterações em User (is_active, role, company_id, email, saas_role) e em
+  CompanyUser são detectadas por eventos da Session e invalidadas após o commit
+  (app.core.post_commit)
+- blacklist_all_user_tokens grava o instante de revogação; tokens com iat
+  anterior são rejeitados mesmo com a projeção em cache
+- Um marcador de invalidação no Redis descarta projeções carregadas antes
+  dele (evita que uma leitura concorrente regrave dados antigos)
+
+Outros workers podem manter a projeção no LRU local por até LOCAL_TTL segundos.
+"""
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, Optional, Set
+import json
+import logging
+import time
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
+
+from app.core.cache import ProjectionLRU, get_redis, get_sync_redis
+from app.core.post_commit import register_post_commit
+from app.models.company_user import CompanyUser
+from app.models.user import User, UserRole
+from app.services.token_blacklist import USER_REVOKED_TTL, user_revoked_key
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "auth:user"
+LOCAL_TTL = 10  # segundos
+LOCAL_MAX_ENTRIES = 10_000
+REDIS_TTL = 120  # segundos
+
+# Colunas de User que fazem parte da projeção
+TRACKED_USER_FIELDS = ("is_active", "role", "company_id", "email", "saas_role")
+
+_SESSION_INFO_KEY = "auth_cache_invalidate"
+
+
+@dataclass(frozen=True)
+class AuthProjection:
+    """Dados do usuário necessários para autenticar uma requisição"""
+    user_id: int
+    email: str
+    is_active: bool
+    role: Optional[str]
+    saas_role: Optional[str]
+    company_id: Optional[int]
+    company_roles: Dict[int, str] = field(default_factory=dict)
+    revoked_at: Optional[int] = None
+    loaded_at: float = 0.0
+
+    def is_token_revoked(self, token_iat: Optional[int]) -> bool:
+        """Token emitido antes de blacklist_all_user_tokens é inválido"""
+        if self.revoked_at is None:
+            return False
+        return token_iat is None or int(token_iat) < self.revoked_at
+
+    def to_user(self, db: Session) -> User:
+        """
+        User persistente na sessão sem consulta ao banco.
+
+        As colunas da projeção já vêm carregadas; as demais são carregadas sob
+        demanda no primeiro acesso, e alterações são persistidas normalmente.
+        """
+        existing = db.identity_map.get(identity_key(User, self.user_id))
+        if existing is not None:
+            return existing
+
+        user = User(
+            id=self.user_id,
+            email=self.email,
+            is_active=self.is_active,
+            role=UserRole(self.role) if self.role else None,
+            saas_role=self.saas_role,
+            company_id=self.company_id,
+        )
+        make_transient_to_detached(user)
+        return db.merge(user, load=False)
+
+    def to_json(self) -> str:
+        data = asdict(self)
+        data.pop("revoked_at")  # vem da chave de revogação do token_blacklist
+        return json.dumps(data)
+
+    @classmethod
+    def from_json(cls, raw: str, revoked_at: Optional[int]) -> "AuthProjection":
+        data = json.loads(raw)
+        data["company_roles"] = {int(k): v for k, v in data.get("company_roles", {}).items()}
+        return cls(**data, revoked_at=revoked_at)
+
+
+def _key(user_id: int) -> str:
+    return f"{KEY_PREFIX}:{user_id}"
+
+
+def _invalidated_key(user_id: int) -> str:
+    return f"{KEY_PREFIX}:{user_id}:inv"
+
+
+# ========== LRU LOCAL ==========
+
+_local = ProjectionLRU(LOCAL_MAX_ENTRIES, LOCAL_TTL)
+
+
+# ========== LEITURA ==========
+
+def _load_from_db(db: Session, user_id: int, revoked_at: Optional[int]) -> Optional[AuthProjection]:
+    started = time.time()
+    user = db.get(User, user_id)
+    if user is None:
+        return None
+
+    memberships = db.query(CompanyUser.company_id, CompanyUser.role).filter(
+        CompanyUser.user_id == user_id
+    ).all()
+
+    return AuthProjection(
+        user_id=user.id,
+        email=user.email,
+        is_active=bool(user.is_active),
+        role=user.role.value if isinstance(user.role, UserRole) else user.role,
+        saas_role=user.saas_role,
+        company_id=user.company_id,
+        company_roles={
+            company_id: getattr(role, "value", role)
+            for company_id, role in memberships
+        },
+        revoked_at=revoked_at,
+        loaded_at=started,
+    )
+
+
+async def get_auth_projection(db: Session, user_id: int) -> Optional[AuthProjection]:
+    """
+    Projeção de autenticação do usuário (None se o usuário não existe).
+
+    Ordem: LRU local -> Redis (um MGET) -> banco.
+    """
+    projection = _local.get(user_id)
+    if projection is not None:
+        return projection
+
+    revoked_at: Optional[int] = None
+    redis = await get_redis()
+    if redis is not None:
+        try:
+            raw, invalidated_at, revoked = await redis.mget(
+                _key(user_id), _invalidated_key(user_id), user_revoked_key(user_id)
+            )
+            revoked_at = int(revoked) if revoked else None
+            if raw:
+                projection = AuthProjection.from_json(raw, revoked_at)
+                if invalidated_at is None or projection.loaded_at >= float(invalidated_at):
+                    _local.put(projection)
+                    return projection
+        except Exception as e:
+            logger.error(f"❌ Erro ao ler auth cache do usuário {user_id}: {e}")
+
+    projection = _load_from_db(db, user_id, revoked_at)
+    if projection is None:
+        return None
+
+    if redis is not None:
+        try:
+            await redis.setex(_key(user_id), REDIS_TTL, projection.to_json())
+        except Exception as e:
+            logger.error(f"❌ Erro ao gravar auth cache do usuário {user_id}: {e}")
+
+    _local.put(projection)
+    return projection
+
+
+# ========== INVALIDAÇÃO ==========
+
+async def invalidate_user(user_id: int, revoked_at: Optional[int] = None) -> None:
+    """
+    Descarta a projeção do usuário nos dois níveis.
+
+    Args:
+        user_id: ID do usuário
+        revoked_at: Se informado, tokens emitidos antes desse instante
+            (epoch em segundos) passam a ser rejeitados
+    """
+    await _invalidate_remote([user_id], revoked_at)
+
+
+def _forget_local(user_ids: Iterable[int]) -> None:
+    for user_id in user_ids:
+        _local.pop(user_id)
+
+
+async def _invalidate_remote(user_ids: Iterable[int], revoked_at: Optional[int] = None) -> None:
+    user_ids = list(user_ids)
+    _forget_local(user_ids)
+
+    redis = await get_redis()
+    if redis is None:
+        return
+
+    now = time.time()
+    try:
+        pipe = redis.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.setex(_invalidated_key(user_id), REDIS_TTL, repr(now))
+            pipe.delete(_key(user_id))
+            if revoked_at is not None:
+                pipe.setex(user_revoked_key(user_id), USER_REVOKED_TTL, str(int(revoked_at)))
+        await pipe.execute()
+    except Exception as e:
+        logger.error(f"❌ Erro ao invalidar auth cache {user_ids}: {e}")
+
+
+def _invalidate_remote_sync(user_ids: Iterable[int]) -> None:
+    """Invalidação no Redis fora do event loop (threadpool, Celery, scripts)"""
+    redis = get_sync_redis()
+    if redis is None:
+        return
+
+    try:
+        now = time.time()
+        pipe = redis.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.setex(_invalidated_key(user_id), REDIS_TTL, repr(now))
+            pipe.delete(_key(user_id))
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"❌ Erro ao invalidar auth cache {list(user_ids)}: {e}")
+
+
+def _changed_user_ids(session: Session) -> Set[int]:
+    user_ids: Set[int] = set()
+
+    for obj in session.dirty:
+        if isinstance(obj, User):
+            state = inspect(obj)
+            if any(state.attrs[name].history.has_changes() for name in TRACKED_USER_FIELDS):
+                user_ids.add(obj.id)
+        elif isinstance(obj, CompanyUser):
+            user_ids.add(obj.user_id)
+
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            user_ids.add(obj.id)
+        elif isinstance(obj, CompanyUser):
+            user_ids.add(obj.user_id)
+
+    for obj in session.new:
+        if isinstance(obj, CompanyUser):
+            user_ids.add(obj.user_id)
+
+    user_ids.discard(None)
+    return user_ids
+
+
+register_post_commit(
+    _SESSION_INFO_KEY, _changed_user_ids, _invalidate_remote, _invalidate_remote_sync, apply_local=_forget_local
+)
@@ -4,19 +4,31 @@ Redis caching utilities for FastAPI
 import json
 import hashlib
 import asyncio
-from typing import Any, Optional, Callable
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Dict, Optional, Callable, Set, Tuple
 from functools import wraps
 import redis.asyncio as aioredis
 from fastapi import Request
 import logging
 
 from app.core.config import settings
+from app.core.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
 # Redis client (singleton)
 _redis_client: Optional[aioredis.Redis] = None
 
+# Sync Redis client for code running outside the event loop (Session events, Celery)
+_sync_redis_client = None
+
+# In-process tier (per worker) in front of Redis
+LOCAL_TTL = 5  # seconds; bounds cross-worker staleness after delete_cache
+LOCAL_MAX_ENTRIES = 5_000
+REFRESH_LOCK_TTL = 30  # seconds; one worker revalidates a stale get_or_compute key
+
 
 async def get_redis() -> aioredis.Redis:
     """Get Redis client instance with optimized connection pool"""
@@ -56,6 +68,26 @@ async def get_redis() -> aioredis.Redis:
     return _redis_client
 
 
+def get_sync_redis():
+    """Get sync Redis client (short timeouts: callers must tolerate failures)"""
+    global _sync_redis_client
+    
+    if _sync_redis_client is None:
+        try:
+            import redis as redis_sync
+            _sync_redis_client = redis_sync.Redis.from_url(
+                settings.REDIS_URL,
+                decode_responses=True,
+                socket_timeout=2,
+                socket_connect_timeout=2,
+            )
+        except Exception as e:
+            logger.error(f"❌ Erro ao conectar ao Redis (sync): {e}")
+            _sync_redis_client = None
+    
+    return _sync_redis_client
+
+
 async def close_redis():
     """Close Redis connection"""
     global _redis_client
@@ -66,6 +98,102 @@ async def close_redis():
         logger.info("Redis connection closed")
 
 
+class LocalCache:
+    """
+    Bounded LRU with per-entry expiry (one per worker process)
+
+    Values are the decoded JSON shared between requests: callers must treat
+    cached values as read-only.
+    """
+
+    def __init__(self, max_entries: int = LOCAL_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def put(self, key: str, value: Any, ttl: float) -> None:
+        if ttl <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def pop(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class ProjectionLRU:
+    """
+    Thread-safe LRU with TTL for auth projections, keyed by an attribute
+
+    Shared by auth_cache and api_key_cache: entries are read from the FastAPI
+    threadpool as well as from the event loop.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, key_attr: str = "user_id"):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.key_attr = key_attr
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, projection = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return projection
+
+    def put(self, projection: Any) -> None:
+        key = getattr(projection, self.key_attr)
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, projection)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Any) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+local_cache = LocalCache()
+
+# Per-key single-flight: key -> future of the computation in progress in this worker
+_inflight: Dict[str, "asyncio.Future"] = {}
+
+
+def _metric_name(key: str) -> str:
+    # Primeiros dois segmentos ("dashboard:overview") para não explodir a cardinalidade
+    return ":".join(key.split(":", 2)[:2])
+
+
 def cache_key_builder(
     func_name: str,
     args: tuple = (),
@@ -114,6 +242,11 @@ async def get_cache(key: str) -> Optional[Any]:
     Returns:
         Cached value or None if not found
     """
+    found, value = local_cache.get(key)
+    if found:
+        metrics.record_cache_lookup(_metric_name(key), "local_hit")
+        return value
+    
     max_retries = 3
     for attempt in range(max_retries):
         try:
@@ -123,7 +256,11 @@ async def get_cache(key: str) -> Optional[Any]:
             
             value = await redis.get(key)
             if value:
-                return json.loads(value)
+                decoded = json.loads(value)
+                local_cache.put(key, decoded, LOCAL_TTL)
+                metrics.record_cache_lookup(_metric_name(key), "redis_hit")
+                return decoded
+            metrics.record_cache_lookup(_metric_name(key), "miss")
             return None
         except (ConnectionError, TimeoutError) as e:
             if attempt < max_retries - 1:
@@ -150,6 +287,10 @@ async def set_cache(key: str, value: Any, ttl: int = 300) -> bool:
     Returns:
         True if successful, False otherwise
     """
+    serialized = json.dumps(value, default=str)
+    # Cópia decodificada: o chamador pode alterar `value` depois
+    local_cache.put(key, json.loads(serialized), min(LOCAL_TTL, ttl))
+    
     max_retries = 3
     for attempt in range(max_retries):
         try:
@@ -157,7 +298,6 @@ async def set_cache(key: str, value: Any, ttl: int = 300) -> bool:
             if redis is None:
                 return False
             
-            serialized = json.dumps(value, default=str)
             await redis.setex(key, ttl, serialized)
             return True
         except (ConnectionError, TimeoutError) as e:
@@ -183,6 +323,7 @@ async def delete_cache(key: str) -> bool:
     Returns:
         True if successful, False otherwise
     """
+    local_cache.pop(key)
     try:
         redis = await get_redis()
         if redis is None:
@@ -213,6 +354,7 @@ async def delete_pattern(pattern: str) -> int:
         keys = []
         async for key in redis.scan_iter(match=pattern):
             keys.append(key)
+            local_cache.pop(key)
         
         if keys:
             return await redis.delete(*keys)
@@ -222,6 +364,239 @@ async def delete_pattern(pattern: str) -> int:
         return 0
 
 
+async def _read_entry(redis, key: str) -> Optional[Dict[str, Any]]:
+    try:
+        raw = await redis.get(key)
+        return json.loads(raw) if raw else None
+    except Exception as e:
+        logger.error(f"❌ Erro ao buscar cache {key}: {e}")
+        return None
+
+
+async def _compute_and_store(
+    key: str,
+    compute: Callable[[], Awaitable[Any]],
+    ttl: int,
+    stale_ttl: int,
+) -> Any:
+    started = time.perf_counter()
+    try:
+        value = await compute()
+        serialized = json.dumps(value, default=str)
+        value = json.loads(serialized)
+        
+        local_cache.put(key, value, min(LOCAL_TTL, ttl))
+        redis = await get_redis()
+        if redis is not None:
+            try:
+                envelope = json.dumps({"fresh_until": time.time() + ttl, "value": value})
+                await redis.setex(key, ttl + stale_ttl, envelope)
+                await redis.delete(f"{key}:refresh")
+            except Exception as e:
+                logger.error(f"❌ Erro ao salvar cache {key}: {e}")
+    except BaseException:
+        metrics.record_cache_recompute(_metric_name(key), "error", time.perf_counter() - started)
+        raise
+    
+    metrics.record_cache_recompute(_metric_name(key), "success", time.perf_counter() - started)
+    return value
+
+
+async def _recompute(
+    key: str,
+    compute: Callable[[], Awaitable[Any]],
+    ttl: int,
+    stale_ttl: int,
+) -> Any:
+    """
+    Run compute once per key in this worker; concurrent callers await the same result
+    
+    If the caller running compute is cancelled (client disconnected), the
+    waiters do not inherit its CancelledError: one of them takes over.
+    """
+    while True:
+        future = _inflight.get(key)
+        if future is None:
+            break
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                raise  # Este chamador foi cancelado
+            # O dono foi cancelado: o primeiro a acordar assume o cálculo
+    
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        value = await _compute_and_store(key, compute, ttl, stale_ttl)
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except BaseException as e:
+        future.set_exception(e)
+        # Evita "Future exception was never retrieved" quando ninguém mais aguarda
+        future.exception()
+        raise
+    else:
+        future.set_result(value)
+        return value
+    finally:
+        if _inflight.get(key) is future:
+            del _inflight[key]
+
+
+_refresh_tasks: Set[asyncio.Task] = set()
+
+
+def _schedule_refresh(
+    key: str,
+    compute: Callable[[], Awaitable[Any]],
+    ttl: int,
+    stale_ttl: int,
+) -> None:
+    async def refresh():
+        try:
+            await _recompute(key, compute, ttl, stale_ttl)
+        except Exception as e:
+            # O lock de refresh expira em REFRESH_LOCK_TTL e outra requisição tenta de novo
+            logger.warning(f"⚠️ Falha ao recalcular {key} em background: {e}")
+    
+    task = asyncio.get_running_loop().create_task(refresh())
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
+
+
+async def get_or_compute(
+    key: str,
+    compute: Callable[[], Awaitable[Any]],
+    ttl: int = 300,
+    stale_ttl: Optional[int] = None,
+) -> Any:
+    """
+    Read-through cache with single-flight and stale-while-revalidate
+    
+    1. Worker LRU (LOCAL_TTL): no round trip
+    2. Redis: value is fresh for `ttl` seconds and servable as stale for
+       `stale_ttl` more
+    3. Stale: every request (any worker) gets the stale value immediately; the
+       one that wins the Redis refresh lock recomputes in a background task
+    4. Missing: only one coroutine per worker runs `compute`; the others await it
+    
+    `compute` may outlive the request that triggered it (background refresh), so
+    it must not use request-scoped resources such as the request's DB session.
+    
+    Keys written here use an envelope format: read them only through get_or_compute.
+    
+    Example:
+        result = await get_or_compute(cache_key, lambda: build_overview(company_id), ttl=300)
+    """
+    stale_ttl = ttl if stale_ttl is None else stale_ttl
+    name = _metric_name(key)
+    
+    found, value = local_cache.get(key)
+    if found:
+        metrics.record_cache_lookup(name, "local_hit")
+        return value
+    
+    redis = await get_redis()
+    entry = await _read_entry(redis, key) if redis is not None else None
+    
+    if entry is not None:
+        remaining = entry["fresh_until"] - time.time()
+        if remaining > 0:
+            local_cache.put(key, entry["value"], min(LOCAL_TTL, remaining))
+            metrics.record_cache_lookup(name, "redis_hit")
+            return entry["value"]
+        
+        # Stale: só quem obtiver o lock recalcula; os demais servem o valor antigo
+        try:
+            acquired = key not in _inflight and await redis.set(
+                f"{key}:refresh", "1", nx=True, ex=REFRESH_LOCK_TTL
+            )
+        except Exception:
+            acquired = key not in _inflight
+        if not acquired:
+            metrics.record_cache_lookup(name, "stale")
+            return entry["value"]
+        
+        metrics.record_cache_lookup(name, "expired")
+        _schedule_refresh(key, compute, ttl, stale_ttl)
+        return entry["value"]
+    
+    metrics.record_cache_lookup(name, "miss")
+    return await _recompute(key, compute, ttl, stale_ttl)
+
+
+def namespace_generation_key(resource: str, scope: Any) -> str:
+    """Redis key holding the generation counter of a (resource, scope) namespace"""
+    return f"ns:{resource}:{scope}"
+
+
+async def get_namespace_generation(resource: str, scope: Any) -> int:
+    """
+    Current generation of a namespace (0 until the first invalidation)
+
+    Kept in the worker LRU for LOCAL_TTL, so building a key does not cost a
+    Redis round trip per request; invalidations from other workers are seen
+    within that bound, the same one that applies to cached values.
+
+    Args:
+        resource: Resource name (e.g., "clients")
+        scope: Namespace owner, usually the company_id
+    """
+    key = namespace_generation_key(resource, scope)
+    found, generation = local_cache.get(key)
+    if found:
+        return generation
+
+    try:
+        redis = await get_redis()
+        if redis is None:
+            return 0
+
+        generation = int(await redis.get(key) or 0)
+        local_cache.put(key, generation, LOCAL_TTL)
+        return generation
+    except Exception as e:
+        logger.error(f"❌ Erro ao buscar geração do namespace {resource}:{scope}: {e}")
+        return 0
+
+
+async def namespaced_key(resource: str, scope: Any, *parts: Any) -> str:
+    """
+    Build a cache key inside the current generation of a namespace
+
+    Example:
+        key = await namespaced_key("clients", company_id, "list", skip, limit)
+        # -> "clients:42:v3:list:0:100"
+    """
+    generation = await get_namespace_generation(resource, scope)
+    return ":".join([resource, str(scope), f"v{generation}", *(str(part) for part in parts)])
+
+
+async def invalidate_namespace(resource: str, scope: Any) -> int:
+    """
+    Invalidate every key of a namespace with a single INCR
+
+    Keys from older generations are no longer read and expire by their own TTL.
+
+    Returns:
+        New generation (0 if Redis is unavailable)
+    """
+    try:
+        redis = await get_redis()
+        if redis is None:
+            return 0
+
+        key = namespace_generation_key(resource, scope)
+        generation = await redis.incr(key)
+        local_cache.put(key, generation, LOCAL_TTL)
+        return generation
+    except Exception as e:
+        logger.error(f"❌ Erro ao invalidar namespace {resource}:{scope}: {e}")
+        return 0
+
+
 def cached(ttl: int = 300, prefix: str = "cache"):
     """
     Decorator to cache function results
@@ -290,8 +665,8 @@ def cache_by_user(ttl: int = 300, prefix: str = "user_cache"):
                 # Se não houver user_id, executar sem cache
                 return await func(*args, **kwargs)
             
-            # Construir cache key com user_id
-            cache_key = f"{prefix}:user:{user_id}:{func.__name__}"
+            # Construir cache key no namespace do usuário
+            cache_key = await namespaced_key(prefix, f"user:{user_id}", func.__name__)
             
             # Adicionar outros argumentos ao key
             if len(args) > 1 or kwargs:
@@ -325,7 +700,6 @@ async def invalidate_user_cache(user_id: int, prefix: str = "user_cache"):
         user_id: User ID
         prefix: Cache key prefix
     """
-    pattern = f"{prefix}:user:{user_id}:*"
-    deleted = await delete_pattern(pattern)
-    logger.info(f"🗑️ Invalidated {deleted} cache entries for user {user_id}")
-    return deleted
+    generation = await invalidate_namespace(prefix, f"user:{user_id}")
+    logger.info(f"🗑️ Invalidated cache namespace for user {user_id} (generation {generation})")
+    return generation
@@ -5,11 +5,14 @@ Redis = otimização (nunca fonte primária)
 """
 from typing import Optional, Any
 import json
+import math
 import redis
 from datetime import timedelta
 
 from app.core.config import settings
 from app.core.database import get_db
+from app.core.cache import namespace_generation_key
+from app.core.rate_limiting import TOKEN_BUCKET_SCRIPT
 
 
 class CacheService:
@@ -66,18 +69,49 @@ class CacheService:
         except Exception:
             return False
     
-    def invalidate_pattern(self, pattern: str) -> int:
-        """Invalida múltiplas chaves por padrão"""
+    def invalidate_pattern(self, pattern: str, batch_size: int = 500) -> int:
+        """
+        Invalida múltiplas chaves por padrão
+        
+        Usa SCAN incremental (KEYS bloqueia o Redis em keyspaces grandes).
+        Para caches por empresa/recurso prefira namespace_key + invalidate_namespace.
+        """
         if not self.redis_client:
             return 0
             
+        deleted = 0
         try:
-            keys = self.redis_client.keys(pattern)
-            if keys:
-                return self.redis_client.delete(*keys)
+            batch = []
+            for key in self.redis_client.scan_iter(match=pattern, count=batch_size):
+                batch.append(key)
+                if len(batch) >= batch_size:
+                    deleted += self.redis_client.delete(*batch)
+                    batch = []
+            if batch:
+                deleted += self.redis_client.delete(*batch)
         except Exception:
             pass
-        return 0
+        return deleted
+    
+    def namespace_key(self, resource: str, scope: Any, *parts: Any) -> str:
+        """Chave dentro da geração atual do namespace (mesmo formato de app.core.cache.namespaced_key)"""
+        generation = 0
+        if self.redis_client:
+            try:
+                generation = int(self.redis_client.get(namespace_generation_key(resource, scope)) or 0)
+            except Exception:
+                generation = 0
+        return ":".join([resource, str(scope), f"v{generation}", *(str(part) for part in parts)])
+    
+    def invalidate_namespace(self, resource: str, scope: Any) -> int:
+        """Invalida todas as chaves do namespace com um único INCR"""
+        if not self.redis_client:
+            return 0
+            
+        try:
+            return self.redis_client.incr(namespace_generation_key(resource, scope))
+        except Exception:
+            return 0
 
 
 class SubscriptionCache:
@@ -138,20 +172,16 @@ class SubscriptionCache:
         cache_key = f"subscription:{subscription_id}"
         self.cache.delete(cache_key)
         
-        # Invalidar caches relacionados
-        patterns = [
-            f"subscriptions:customer:*",
-            f"subscription_limits:{subscription_id}:*",
-            f"subscription_features:{subscription_id}:*"
-        ]
+        # Invalidar caches relacionados (namespaces versionados: um INCR cada)
+        for resource in ("subscription_limits", "subscription_features"):
+            self.cache.invalidate_namespace(resource, subscription_id)
         
-        for pattern in patterns:
-            self.cache.invalidate_pattern(pattern)
+        self.cache.invalidate_pattern("subscriptions:customer:*")
 
 
 class RateLimitCache:
     """
-    Rate limiting com Redis
+    Rate limiting com Redis (token bucket atômico, mesmo script do RateLimitMiddleware)
     Se Redis falhar = permite request (fail-open)
     """
     
@@ -177,17 +207,13 @@ class RateLimitCache:
             return True, {"remaining": limit, "reset_time": 0}
         
         try:
-            current = self.cache.redis_client.incr(key)
-            if current == 1:
-                # Primeiro request = set TTL
-                self.cache.redis_client.expire(key, window)
-            
-            remaining = max(0, limit - current)
-            allowed = current <= limit
+            # Verificação e débito em um único script: sem corrida entre INCR e EXPIRE
+            script = self.cache.redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+            allowed, remaining, _, reset_ms = script(keys=[key], args=[limit, window])
             
-            return allowed, {
-                "remaining": remaining,
-                "reset_time": self.cache.redis_client.ttl(key)
+            return bool(allowed), {
+                "remaining": max(0, int(remaining)),
+                "reset_time": math.ceil(int(reset_ms) / 1000)
             }
             
         except Exception:
@@ -162,6 +162,12 @@ class Settings(BaseSettings):
     WHATSAPP_API_TOKEN: Optional[str] = None
     WHATSAPP_PHONE_NUMBER: Optional[str] = None
     WHATSAPP_INSTANCE_NAME: Optional[str] = None  # Nome da instância Evolution API
+    WHATSAPP_SEND_CONCURRENCY: int = 20  # Envios simultâneos por processo
+    WHATSAPP_SEND_RATE_PER_SECOND: float = 5.0  # Por instância
+    WHATSAPP_SEND_BURST: int = 10
+    WHATSAPP_SEND_MAX_RETRIES: int = 3
+    WHATSAPP_SEND_TIMEOUT: float = 15.0  # segundos
+    WHATSAPP_SEND_QUEUE_SIZE: int = 5000  # Acima disso novos envios são recusados
     
     # Web Push Notifications (VAPID)
     VAPID_PUBLIC_KEY: Optional[str] = None
@@ -193,8 +199,14 @@ class Settings(BaseSettings):
     COOKIE_SECURE: bool = False
     COOKIE_SAME_SITE: str = "lax"
     
-    # Rate Limiting
-    RATE_LIMIT_PER_MINUTE: int = 60
+    # Rate Limiting (app.core.rate_limiting; quotas por plano em app.core.plans)
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_PER_MINUTE: int = 60  # Requisições anônimas, por IP
+    RATE_LIMIT_AUTH_PER_MINUTE: int = 10  # Login/cadastro/recuperação de senha, por IP
+    RATE_LIMIT_PUBLIC_PER_MINUTE: int = 60  # Booking público, por IP (além da quota da empresa)
+    # Proxies (IPs/CIDRs) cujo X-Forwarded-For identifica o cliente real: o nginx
+    # dos composes fica na rede Docker, então as faixas privadas são confiáveis
+    TRUSTED_PROXIES: str = "127.0.0.1,::1,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16"
     
     # Celery
     CELERY_BROKER_URL: Optional[str] = None
@@ -225,6 +237,18 @@ class Settings(BaseSettings):
     # Sentry
     SENTRY_DSN: Optional[str] = None
     
+    # Query profiler (N+1 e queries lentas por requisição)
+    QUERY_PROFILER_ALWAYS_ON: bool = False  # dev/staging: perfila todas as requisições
+    QUERY_PROFILER_TOKEN: Optional[str] = None  # Em produção, header X-Query-Profile precisa ter este valor
+    QUERY_PROFILER_N_PLUS_ONE_THRESHOLD: int = 5  # Mesma query repetida N vezes = suspeita de N+1
+    QUERY_PROFILER_SLOW_MS: float = 100.0
+    QUERY_PROFILER_TOP_SLOW: int = 5
+    
+    # Audit log (app.core.audit)
+    AUDIT_ASYNC_ENABLED: bool = True  # False: cada evento é gravado na hora
+    AUDIT_STREAM_MAX_PENDING: int = 10000  # Acima disso os eventos são gravados na hora (backpressure)
+    AUDIT_FLUSH_BATCH_SIZE: int = 1000
+    
     # Analytics
     GOOGLE_ANALYTICS_ID: Optional[str] = None
     
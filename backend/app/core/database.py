@@ -2,20 +2,99 @@
 Database configuration and session management
 """
 from sqlalchemy import create_engine, event, pool
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from typing import Generator
+from typing import AsyncGenerator, Awaitable, Callable, Generator, Optional, TypeVar
 import logging
+import time
 
 from app.core.config import settings
+from app.core.metrics import metrics, query_type
+from app.core.query_profiler import record_statement
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+
+# ========== INSTRUMENTAÇÃO (PROMETHEUS) ==========
+
+class InstrumentedQueuePool(pool.QueuePool):
+    """QueuePool que mede o tempo para obter conexão (pool esgotado vira latência visível)"""
+    
+    metrics_name = "sync"
+    
+    def _do_get(self):
+        start_time = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.record_pool_checkout_wait(self.metrics_name, time.perf_counter() - start_time)
+
+
+class InstrumentedAsyncQueuePool(pool.AsyncAdaptedQueuePool):
+    """Equivalente de InstrumentedQueuePool para o engine async"""
+    
+    metrics_name = "async"
+    
+    def _do_get(self):
+        start_time = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.record_pool_checkout_wait(self.metrics_name, time.perf_counter() - start_time)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_start_time = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_time = getattr(context, "_metrics_start_time", None)
+    if start_time is None:
+        return
+    duration = time.perf_counter() - start_time
+    rowcount = getattr(cursor, "rowcount", None)
+    metrics.record_db_query(
+        query_type(statement),
+        duration,
+        rowcount if isinstance(rowcount, int) and rowcount >= 0 else None
+    )
+    record_statement(statement, duration)
+
+
+def instrument_engine(sync_engine, pool_name: str) -> None:
+    """
+    Registra latência/linhas por statement e o estado do pool no Prometheus
+    (e alimenta o query profiler da requisição, se ativo).
+    
+    Para AsyncEngine, passar `async_engine.sync_engine`.
+    """
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    
+    engine_pool = sync_engine.pool
+    if not isinstance(engine_pool, pool.QueuePool):
+        return
+    
+    def update_pool_gauges(*args):
+        metrics.set_pool_connections(
+            pool_name,
+            checked_out=engine_pool.checkedout(),
+            idle=engine_pool.checkedin(),
+            overflow=engine_pool.overflow()
+        )
+    
+    event.listen(sync_engine, "checkout", update_pool_gauges)
+    event.listen(sync_engine, "checkin", update_pool_gauges)
+
 # Create SQLAlchemy engine with optimized pool settings
 engine = create_engine(
     settings.DATABASE_URL,
     # Connection pooling (otimizado para produção)
-    poolclass=pool.QueuePool,
+    poolclass=InstrumentedQueuePool,
     pool_pre_ping=True,  # Verify connections before using (previne erros de conexão perdida)
     pool_size=20,  # Pool mínimo de conexões (aumentado de 10)
     max_overflow=40,  # Pool máximo de conexões extras (aumentado de 20)
@@ -45,6 +124,8 @@ if settings.DEBUG:
     def receive_checkin(dbapi_conn, connection_record):
         logger.debug("🔒 Conexão devolvida ao pool")
 
+instrument_engine(engine, InstrumentedQueuePool.metrics_name)
+
 # Create SessionLocal class
 SessionLocal = sessionmaker(
     autocommit=False,
@@ -57,6 +138,99 @@ SessionLocal = sessionmaker(
 Base = declarative_base()
 
 
+# ========== ASYNC ENGINE ==========
+# Endpoints `async def` com AsyncSession não bloqueiam o event loop durante as
+# queries: o worker atende outras requisições enquanto o PostgreSQL responde.
+
+_ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def get_async_database_url(url: str) -> str:
+    """Converte a DATABASE_URL síncrona para o driver async equivalente"""
+    scheme, separator, rest = url.partition("://")
+    return f"{_ASYNC_DRIVERS.get(scheme, scheme)}{separator}{rest}"
+
+
+_async_engine: Optional[AsyncEngine] = None
+_async_session_factory: Optional[async_sessionmaker] = None
+
+
+def get_async_engine() -> AsyncEngine:
+    """
+    Async engine (asyncpg), criado no primeiro uso.
+    
+    Mesmo dimensionamento de pool do engine síncrono; os dois pools coexistem
+    enquanto os routers são migrados.
+    """
+    global _async_engine
+    
+    if _async_engine is None:
+        async_url = get_async_database_url(settings.DATABASE_URL)
+        is_postgres = async_url.startswith("postgresql+asyncpg")
+        _async_engine = create_async_engine(
+            async_url,
+            poolclass=InstrumentedAsyncQueuePool,
+            pool_pre_ping=True,
+            pool_size=20,
+            max_overflow=40,
+            pool_recycle=3600,
+            pool_timeout=30,
+            echo=settings.DEBUG,
+            connect_args={
+                "timeout": 10,
+                "server_settings": {
+                    "application_name": "agendamento_saas_async",
+                    "statement_timeout": "30000"  # 30 segundos timeout para queries
+                }
+            } if is_postgres else {}
+        )
+        instrument_engine(_async_engine.sync_engine, InstrumentedAsyncQueuePool.metrics_name)
+        logger.info("✅ Async engine criado")
+    
+    return _async_engine
+
+
+def AsyncSessionLocal() -> AsyncSession:
+    """Cria uma AsyncSession (equivalente async de SessionLocal)"""
+    global _async_session_factory
+    
+    if _async_session_factory is None:
+        _async_session_factory = async_sessionmaker(
+            bind=get_async_engine(),
+            autoflush=False,
+            expire_on_commit=False  # Obrigatório em async: evita lazy load após commit
+        )
+    return _async_session_factory()
+
+
+def with_own_session(build: Callable[[AsyncSession], Awaitable[T]]) -> Callable[[], Awaitable[T]]:
+    """
+    Envolve `build(db)` em uma AsyncSession própria, aberta e fechada a cada chamada.
+
+    Para cálculos que podem terminar depois da requisição (ex.: refresh em
+    background do get_or_compute), que não podem usar a sessão da requisição.
+    """
+    async def run() -> T:
+        async with AsyncSessionLocal() as db:
+            return await build(db)
+    return run
+
+
+async def dispose_async_engine() -> None:
+    """Fecha as conexões do pool async (shutdown da aplicação)"""
+    global _async_engine, _async_session_factory
+    
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+        _async_session_factory = None
+
+
 # Dependency to get DB session
 def get_db() -> Generator:
     """
@@ -72,6 +246,18 @@ def get_db() -> Generator:
         db.close()
 
 
+# Dependency to get async DB session
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Dependency function to get an async database session.
+    
+    Async counterpart of get_db() for public endpoints. Relationships are not
+    lazy loaded with AsyncSession: use selectinload/joinedload in the query.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 # Enhanced get_db with automatic tenant context
 def get_db_with_context(current_user=None) -> Generator:
     """
@@ -80,13 +266,13 @@ def get_db_with_context(current_user=None) -> Generator:
     Sets app.current_company_id for PostgreSQL Row Level Security policies.
     This should be used in authenticated endpoints.
     """
-    from app.core.tenant_context import set_tenant_context
+    from app.core.tenant_context import bind_tenant_context
     
     db = SessionLocal()
     try:
         # Set tenant context if user has company_id
         if current_user and hasattr(current_user, 'company_id') and current_user.company_id:
-            set_tenant_context(db, current_user.company_id)
+            bind_tenant_context(db, current_user.company_id)
             logger.debug(f"🔒 Tenant context set for user {current_user.id}: company_id={current_user.company_id}")
         
         yield db
@@ -1,12 +1,13 @@
 """
 FastAPI dependencies for tenant context, authentication, and observability
 """
-from typing import Generator, Optional
+from typing import AsyncGenerator, Generator, Optional
 from fastapi import Depends, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.core.database import SessionLocal
-from app.core.tenant_context import set_tenant_context, validate_tenant_context
+from app.core.database import AsyncSessionLocal, SessionLocal
+from app.core.tenant_context import bind_tenant_context
 from app.core.rbac import get_current_user_context, CurrentUserContext
 from app.models.user import User
 from app.core.security import get_current_user
@@ -29,8 +30,9 @@ def get_db_with_tenant(
     tenant isolation. It automatically:
     1. Creates a database session
     2. Extracts company_id from the authenticated user
-    3. Sets the PostgreSQL session variable for RLS
-    4. Validates the context after setting
+    3. Binds it to the session; the PostgreSQL variable for RLS is set with
+       set_config(..., true) when the first transaction begins, and validated
+       from the value set_config returns (no extra round trip)
     
     Usage:
         @router.get("/clients")
@@ -50,7 +52,7 @@ def get_db_with_tenant(
         SQLAlchemy session with tenant context set
         
     Raises:
-        HTTPException: If user has no company_id or context validation fails
+        HTTPException: If user has no company_id
     """
     from fastapi import HTTPException, status
     
@@ -70,15 +72,8 @@ def get_db_with_tenant(
                 detail="User is not associated with any company"
             )
         
-        # Set tenant context for RLS
-        set_tenant_context(db, company_id)
-        
-        # Validate context was set correctly (defensive programming)
-        if not validate_tenant_context(db, company_id):
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to set tenant context"
-            )
+        # Tenant context for RLS, applied lazily in the first transaction
+        bind_tenant_context(db, company_id)
         
         # Attach metadata to request state for observability
         request.state.company_id = company_id
@@ -102,6 +97,57 @@ def get_db_with_tenant(
         db.close()
 
 
+async def get_async_db_with_tenant(
+    request: Request,
+    context: CurrentUserContext = Depends(get_current_user_context)
+) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Async counterpart of get_db_with_tenant().
+    
+    Yields an AsyncSession (asyncpg) with the RLS tenant context set, so that
+    `async def` endpoints await their queries instead of blocking the event loop.
+    
+    Usage:
+        @router.get("/clients")
+        async def list_clients(
+            db: AsyncSession = Depends(get_async_db_with_tenant),
+            context: CurrentUserContext = Depends(get_current_user_context)
+        ):
+            result = await db.execute(select(Client))
+            return result.scalars().all()
+    
+    Raises:
+        HTTPException: If user has no company_id
+    """
+    from fastapi import HTTPException, status
+    
+    company_id = context.company_id
+    
+    if not company_id:
+        logger.error(
+            f"❌ User {context.user_id} ({context.email}) has no company_id. "
+            "Cannot set tenant context."
+        )
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="User is not associated with any company"
+        )
+    
+    async with AsyncSessionLocal() as db:
+        bind_tenant_context(db, company_id)
+        
+        # Attach metadata to request state for observability
+        request.state.company_id = company_id
+        request.state.user_id = context.user_id
+        
+        logger.debug(
+            f"🔒 Async session initialized with tenant context: "
+            f"user_id={context.user_id}, company_id={company_id}"
+        )
+        
+        yield db
+
+
 def get_db_with_api_key_tenant(scope: Optional[str] = None):
     """Factory dependency: Get DB session with tenant context set from API Key.
 
@@ -126,12 +172,7 @@ def get_db_with_api_key_tenant(scope: Optional[str] = None):
                     detail="API Key is not associated with any company"
                 )
 
-            set_tenant_context(db, company_id)
-            if not validate_tenant_context(db, company_id):
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="Failed to set tenant context"
-                )
+            bind_tenant_context(db, company_id)
 
             request.state.company_id = company_id
             request.state.api_key_id = api_key.id
@@ -175,12 +216,7 @@ def get_db_with_api_key_tenant_context(scope: Optional[str] = None):
                     detail="API Key is not associated with any company"
                 )
 
-            set_tenant_context(db, company_id)
-            if not validate_tenant_context(db, company_id):
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="Failed to set tenant context"
-                )
+            bind_tenant_context(db, company_id)
 
             request.state.company_id = company_id
             request.state.api_key_id = api_key.id
@@ -217,7 +253,7 @@ def get_db_legacy(current_user: User = Depends(get_current_user)) -> Generator[S
     
     try:
         if current_user.company_id:
-            set_tenant_context(db, current_user.company_id)
+            bind_tenant_context(db, current_user.company_id)
             logger.debug(f"🔒 Legacy session: company_id={current_user.company_id}")
         else:
             logger.warning(f"⚠️ Legacy session without company_id for user {current_user.id}")
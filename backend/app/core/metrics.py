@@ -1,8 +1,18 @@
 """
 Prometheus metrics for monitoring and observability
+
+Instrumentation wired into the app:
+- PrometheusMiddleware (pure ASGI): latency/status per route template and
+  database statements per request
+- Cursor hooks on the engines (app.core.database.instrument_engine):
+  per-statement latency and rows
+- Instrumented pools: checkout wait and connections by state
 """
+from contextvars import ContextVar
+from typing import Optional
 from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
 from fastapi import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 import time
 
 # HTTP Metrics
@@ -32,6 +42,46 @@ db_query_duration_seconds = Histogram(
     buckets=[0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0]
 )
 
+db_query_rows = Histogram(
+    'db_query_rows',
+    'Rows returned or affected per database statement',
+    ['query_type'],
+    buckets=[0, 1, 10, 100, 1000, 10000]
+)
+
+db_pool_connections = Gauge(
+    'db_pool_connections',
+    'Pooled database connections by state (checked_out, idle, overflow)',
+    ['pool', 'state']
+)
+
+db_pool_checkout_wait_seconds = Histogram(
+    'db_pool_checkout_wait_seconds',
+    'Time to obtain a connection from the pool (includes opening new ones)',
+    ['pool'],
+    buckets=[0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0]
+)
+
+http_request_db_queries = Histogram(
+    'http_request_db_queries',
+    'Database statements executed per HTTP request',
+    ['method', 'endpoint'],
+    buckets=[0, 1, 2, 5, 10, 20, 50, 100, 200]
+)
+
+http_request_db_duration_seconds = Histogram(
+    'http_request_db_duration_seconds',
+    'Time spent in database statements per HTTP request',
+    ['method', 'endpoint'],
+    buckets=[0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0]
+)
+
+# Statement types used as the query_type label (anything else is "OTHER")
+QUERY_TYPES = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+# Route label for requests that matched no route (404s, static mounts)
+UNMATCHED_ROUTE = "unmatched"
+
 # Tenant/Business Metrics
 tenant_appointments_created_total = Counter(
     'tenant_appointments_created_total',
@@ -59,6 +109,33 @@ celery_task_duration_seconds = Histogram(
     buckets=[0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0]
 )
 
+# Cache Metrics
+cache_lookups_total = Counter(
+    'cache_lookups_total',
+    'Cache lookups by outcome (local_hit, redis_hit, stale, expired, miss)',
+    ['cache', 'result']
+)
+
+cache_recomputes_total = Counter(
+    'cache_recomputes_total',
+    'Cached values recomputed after a miss or expiry',
+    ['cache', 'status']
+)
+
+cache_recompute_duration_seconds = Histogram(
+    'cache_recompute_duration_seconds',
+    'Time spent recomputing a cached value',
+    ['cache'],
+    buckets=[0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0]
+)
+
+# Rate Limiting Metrics
+rate_limit_rejections_total = Counter(
+    'rate_limit_rejections_total',
+    'Requests rejected by the rate limiter',
+    ['bucket']
+)
+
 # RabbitMQ/Queue Metrics
 queue_size = Gauge(
     'queue_size',
@@ -81,6 +158,27 @@ def metrics_endpoint():
     return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
+class RequestDBStats:
+    """Database statements executed while serving the current request"""
+    
+    __slots__ = ("queries", "duration")
+    
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+
+
+# Set by PrometheusMiddleware; the cursor hooks add to it (also from sync
+# endpoints, since the threadpool runs them in a copy of the request context)
+request_db_stats: ContextVar[Optional[RequestDBStats]] = ContextVar("request_db_stats", default=None)
+
+
+def query_type(statement: str) -> str:
+    """Bounded label for a SQL statement (first keyword)"""
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return keyword if keyword in QUERY_TYPES else "OTHER"
+
+
 class MetricsCollector:
     """
     Helper class to collect and record metrics throughout the application.
@@ -93,9 +191,34 @@ class MetricsCollector:
         http_request_duration_seconds.labels(method=method, endpoint=endpoint).observe(duration)
     
     @staticmethod
-    def record_db_query(query_type: str, duration: float):
-        """Record database query metrics"""
+    def record_db_query(query_type: str, duration: float, rows: Optional[int] = None):
+        """Record database query metrics (and add to the current request's totals)"""
         db_query_duration_seconds.labels(query_type=query_type).observe(duration)
+        if rows is not None and rows >= 0:
+            db_query_rows.labels(query_type=query_type).observe(rows)
+        
+        stats = request_db_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.duration += duration
+    
+    @staticmethod
+    def record_request_db_usage(method: str, endpoint: str, stats: RequestDBStats):
+        """Record database statements and time spent for one HTTP request"""
+        http_request_db_queries.labels(method=method, endpoint=endpoint).observe(stats.queries)
+        http_request_db_duration_seconds.labels(method=method, endpoint=endpoint).observe(stats.duration)
+    
+    @staticmethod
+    def record_pool_checkout_wait(pool: str, duration: float):
+        """Record time spent obtaining a pooled connection"""
+        db_pool_checkout_wait_seconds.labels(pool=pool).observe(duration)
+    
+    @staticmethod
+    def set_pool_connections(pool: str, checked_out: int, idle: int, overflow: int):
+        """Set pooled connection gauges"""
+        db_pool_connections.labels(pool=pool, state="checked_out").set(checked_out)
+        db_pool_connections.labels(pool=pool, state="idle").set(idle)
+        db_pool_connections.labels(pool=pool, state="overflow").set(max(overflow, 0))
     
     @staticmethod
     def record_appointment_created(company_id: int):
@@ -113,6 +236,22 @@ class MetricsCollector:
         """Set the number of active users for a tenant"""
         tenant_active_users.labels(company_id=str(company_id)).set(count)
     
+    @staticmethod
+    def record_cache_lookup(cache: str, result: str):
+        """Record a cache lookup outcome"""
+        cache_lookups_total.labels(cache=cache, result=result).inc()
+    
+    @staticmethod
+    def record_cache_recompute(cache: str, status: str, duration: float):
+        """Record a cache recomputation"""
+        cache_recomputes_total.labels(cache=cache, status=status).inc()
+        cache_recompute_duration_seconds.labels(cache=cache).observe(duration)
+    
+    @staticmethod
+    def record_rate_limit_rejection(bucket: str):
+        """Record a request rejected by the rate limiter"""
+        rate_limit_rejections_total.labels(bucket=bucket).inc()
+    
     @staticmethod
     def set_queue_size(queue_name: str, size: int):
         """Set the current queue size"""
@@ -121,3 +260,41 @@ class MetricsCollector:
 
 # Global metrics collector instance
 metrics = MetricsCollector()
+
+
+class PrometheusMiddleware:
+    """
+    Pure ASGI middleware recording latency, status and database usage per request.
+    
+    The endpoint label is the matched route template (/clients/{client_id}),
+    never the raw path, so label cardinality stays bounded.
+    """
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        start_time = time.perf_counter()
+        stats = RequestDBStats()
+        token = request_db_stats.set(stats)
+        status_code = 500
+        
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_db_stats.reset(token)
+            route = scope.get("route")
+            endpoint = getattr(route, "path_format", None) or UNMATCHED_ROUTE
+            method = scope["method"]
+            metrics.record_http_request(method, endpoint, status_code, time.perf_counter() - start_time)
+            metrics.record_request_db_usage(method, endpoint, stats)
@@ -0,0 +1,112 @@
+"""
+Keyset (cursor) pagination
+
+Paginação por cursor opaco sobre (sort_key, id): a próxima página filtra
+`(sort_key, id) < (último sort_key, último id)` em vez de usar OFFSET, então
+a página N custa o mesmo que a primeira (com índice composto correspondente)
+e inserções concorrentes não deslocam os resultados.
+
+Uso nos endpoints de listagem, em paralelo ao skip/limit existente:
+
+    page = KeysetPage(Command.date, Command.id, cursor=cursor, limit=limit, skip=skip)
+    commands = page.finish(page.apply(query).all(), response)
+
+O cursor da próxima página vai no header X-Next-Cursor.
+"""
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response, status
+from sqlalchemy import tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _encode_value(value: Any) -> List[Any]:
+    if isinstance(value, datetime):
+        return ["dt", value.isoformat()]
+    if isinstance(value, date):
+        return ["d", value.isoformat()]
+    return ["v", value]
+
+
+def _decode_value(item: Sequence[Any]) -> Any:
+    kind, value = item
+    if kind == "dt":
+        return datetime.fromisoformat(value)
+    if kind == "d":
+        return date.fromisoformat(value)
+    return value
+
+
+def encode_cursor(sort_value: Any, row_id: int) -> str:
+    """Cursor opaco (base64 url-safe) para a posição (sort_value, row_id)"""
+    payload = json.dumps([_encode_value(sort_value), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, int]:
+    """Posição (sort_value, row_id) do cursor; 400 se o cursor for inválido"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_item, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(row_id, int):
+            raise ValueError(row_id)
+        return _decode_value(sort_item), row_id
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor de paginação inválido"
+        )
+
+
+class KeysetPage:
+    """Uma página ordenada por (sort_column, id_column), por cursor ou por skip"""
+
+    def __init__(
+        self,
+        sort_column,
+        id_column,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+        skip: int = 0,
+        descending: bool = True,
+    ):
+        self.sort_column = sort_column
+        self.id_column = id_column
+        self.limit = limit
+        self.skip = skip
+        self.descending = descending
+        self.position = decode_cursor(cursor) if cursor else None
+
+    def order_by(self) -> List[Any]:
+        if self.descending:
+            return [self.sort_column.desc(), self.id_column.desc()]
+        return [self.sort_column.asc(), self.id_column.asc()]
+
+    def apply(self, query):
+        """Filtro do cursor, ordenação e limite (+1 para saber se há próxima página)"""
+        if self.position is not None:
+            key = tuple_(self.sort_column, self.id_column)
+            query = query.filter(key < tuple_(*self.position) if self.descending else key > tuple_(*self.position))
+        query = query.order_by(*self.order_by())
+        if self.position is None and self.skip:
+            query = query.offset(self.skip)
+        return query.limit(self.limit + 1)
+
+    def finish(self, rows: Sequence[Any], response: Optional[Response] = None) -> List[Any]:
+        """Descarta a linha extra e publica o cursor da próxima página no header"""
+        rows = list(rows)
+        if len(rows) <= self.limit:
+            return rows
+
+        rows = rows[:self.limit]
+        if response is not None:
+            last = rows[-1]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+                getattr(last, self.sort_column.key), getattr(last, self.id_column.key)
+            )
+        return rows
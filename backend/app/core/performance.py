@@ -5,7 +5,7 @@ from functools import wraps
 from typing import Callable, Any
 from sqlalchemy.orm import Session, Query
 from sqlalchemy.orm import joinedload, selectinload
-from app.core.cache import get_cache, set_cache, delete_cache_pattern
+from app.core.cache import get_cache, set_cache, namespaced_key, invalidate_namespace
 
 
 def cache_list_result(
@@ -20,7 +20,7 @@ def cache_list_result(
     
     Args:
         expire: Cache expiration in seconds (default 2 minutes)
-        key_prefix: Prefix for cache key
+        key_prefix: Cache namespace (resource name shared with invalidate_cache_pattern)
         invalidate_on_create: Invalidate cache on create operations
         invalidate_on_update: Invalidate cache on update operations
         invalidate_on_delete: Invalidate cache on delete operations
@@ -40,11 +40,9 @@ def cache_list_result(
             if not current_user:
                 return await func(*args, **kwargs)
             
-            # Generate cache key
+            # Generate cache key inside the company's versioned namespace
             cache_key_parts = [
-                key_prefix,
                 func.__name__,
-                str(current_user.company_id),
                 str(kwargs.get('skip', 0)),
                 str(kwargs.get('limit', 100)),
             ]
@@ -54,7 +52,7 @@ def cache_list_result(
                 if key in kwargs and kwargs[key] is not None:
                     cache_key_parts.append(f"{key}:{kwargs[key]}")
             
-            cache_key = ":".join(cache_key_parts)
+            cache_key = await namespaced_key(key_prefix, current_user.company_id, *cache_key_parts)
             
             # Try cache first (only for first page without search)
             if kwargs.get('skip', 0) == 0 and not kwargs.get('search'):
@@ -107,12 +105,15 @@ def optimize_query_with_relationships(
     return query
 
 
-def invalidate_cache_pattern(pattern: str):
+def invalidate_cache_pattern(resource: str):
     """
-    Decorator to invalidate cache pattern after mutations
+    Decorator to invalidate a cache namespace after mutations
+    
+    Bumps the company's generation for the resource (single INCR), so every
+    key cached by cache_list_result(key_prefix=resource) stops being read.
     
     Args:
-        pattern: Cache key pattern to invalidate (e.g., "clients:list:{company_id}:*")
+        resource: Cache namespace to invalidate (e.g., "clients")
     """
     def decorator(func: Callable) -> Callable:
         @wraps(func)
@@ -129,9 +130,7 @@ def invalidate_cache_pattern(pattern: str):
                         break
             
             if current_user:
-                # Replace {company_id} placeholder in pattern
-                cache_pattern = pattern.replace('{company_id}', str(current_user.company_id))
-                delete_cache_pattern(cache_pattern)
+                await invalidate_namespace(resource, current_user.company_id)
             
             return result
         return wrapper
@@ -7,7 +7,7 @@ Planos oficiais:
 - PREMIUM: R$ 249/mês (10 profissionais, 2 unidades)
 - SCALE: R$ 399-499/mês (ilimitado)
 """
-from typing import Dict, List
+from typing import Dict, List, Optional
 from app.models.company import Company
 
 # Define which features each plan includes
@@ -96,6 +96,17 @@ PLAN_FEATURES: Dict[str, List[str]] = {
     ],
 }
 
+# Requisições por minuto por plano (app.core.rate_limiting)
+# - api: requisições autenticadas, somando todos os usuários e API keys da empresa
+# - api_key: cada API key da empresa
+# - public: booking público da empresa, somando todos os visitantes
+PLAN_RATE_LIMITS: Dict[str, Dict[str, int]] = {
+    "ESSENCIAL": {"api": 300, "api_key": 60, "public": 120},
+    "PRO": {"api": 600, "api_key": 120, "public": 300},
+    "PREMIUM": {"api": 1200, "api_key": 300, "public": 600},
+    "SCALE": {"api": 3000, "api_key": 1000, "public": 1500},
+}
+
 # Feature to plan mapping (for quick lookup)
 # IMPORTANTE: Manter sincronizado com services/plan_service.py
 FEATURE_PLANS: Dict[str, str] = {
@@ -193,3 +204,19 @@ def get_plan_features(plan: str) -> List[str]:
         plan_upper = "ESSENCIAL"
     return PLAN_FEATURES.get(plan_upper, PLAN_FEATURES["ESSENCIAL"])
 
+
+
+def get_plan_rate_limits(plan: Optional[str]) -> Dict[str, int]:
+    """
+    Get requests-per-minute quotas for a plan
+    
+    Args:
+        plan: Plan name (None or unknown -> ESSENCIAL)
+        
+    Returns:
+        Dict with the "api", "api_key" and "public" quotas
+    """
+    plan_upper = (plan or "ESSENCIAL").upper()
+    if plan_upper == "BASIC":
+        plan_upper = "ESSENCIAL"
+    return PLAN_RATE_LIMITS.get(plan_upper, PLAN_RATE_LIMITS["ESSENCIAL"])
@@ -0,0 +1,107 @@
+"""
+Post-commit hooks - Efeitos colaterais disparados só depois do commit
+
+Caches e rollups que dependem de escritas no banco seguem o mesmo ciclo nos
+eventos da Session:
+1. after_flush: coleta o que mudou (ids, dias, hashes) em session.info
+2. after_commit: aplica a coleta - dentro de um event loop agenda a versão
+   assíncrona (sem bloquear o loop no cliente Redis síncrono); fora dele
+   (threadpool, Celery, scripts) aplica a versão síncrona na hora
+3. after_rollback: descarta a coleta
+
+    register_post_commit("meu_cache_invalidate", _changed_ids, _invalidate_remote, _invalidate_sync)
+
+`collect` devolve um conjunto (ou uma tupla de conjuntos) com as mudanças do
+flush; flushes da mesma transação são acumulados por união. Com uma tupla, as
+funções de aplicação recebem cada conjunto como um argumento.
+"""
+from typing import Any, Awaitable, Callable, Optional, Set
+import asyncio
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+_pending_tasks: Set[asyncio.Task] = set()
+
+
+def _is_empty(changes: Any) -> bool:
+    if isinstance(changes, tuple):
+        return not any(changes)
+    return not changes
+
+
+def _merge(pending: Any, changes: Any) -> None:
+    if isinstance(changes, tuple):
+        for target, items in zip(pending, changes):
+            target.update(items)
+    else:
+        pending.update(changes)
+
+
+def _arguments(pending: Any) -> tuple:
+    return pending if isinstance(pending, tuple) else (pending,)
+
+
+def _schedule(
+    pending: Any,
+    apply_async: Callable[..., Awaitable[None]],
+    apply_sync: Callable[..., None],
+    apply_local: Optional[Callable[..., None]],
+) -> None:
+    args = _arguments(pending)
+    if apply_local is not None:
+        apply_local(*args)
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
+    if loop is None:
+        apply_sync(*args)
+        return
+
+    task = loop.create_task(apply_async(*args))
+    _pending_tasks.add(task)
+    task.add_done_callback(_pending_tasks.discard)
+
+
+def register_post_commit(
+    info_key: str,
+    collect: Callable[[Session], Any],
+    apply_async: Callable[..., Awaitable[None]],
+    apply_sync: Callable[..., None],
+    apply_local: Optional[Callable[..., None]] = None,
+) -> None:
+    """
+    Registra os eventos da Session para um efeito pós-commit.
+
+    Args:
+        info_key: Chave da coleta em session.info (única por chamador)
+        collect: Mudanças do flush (conjunto ou tupla de conjuntos)
+        apply_async: Aplicação dentro do event loop (agendada com create_task)
+        apply_sync: Aplicação fora do event loop
+        apply_local: Executada na hora em ambos os casos (ex.: cache em memória)
+    """
+
+    def collect_after_flush(session, flush_context):
+        changes = collect(session)
+        if _is_empty(changes):
+            return
+        if isinstance(changes, tuple):
+            pending = session.info.setdefault(info_key, tuple(set() for _ in changes))
+        else:
+            pending = session.info.setdefault(info_key, set())
+        _merge(pending, changes)
+
+    def apply_after_commit(session):
+        pending = session.info.pop(info_key, None)
+        if pending is not None and not _is_empty(pending):
+            _schedule(pending, apply_async, apply_sync, apply_local)
+
+    def discard_after_rollback(session):
+        session.info.pop(info_key, None)
+
+    event.listen(Session, "after_flush", collect_after_flush)
+    event.listen(Session, "after_commit", apply_after_commit)
+    event.listen(Session, "after_rollback", discard_after_rollback)
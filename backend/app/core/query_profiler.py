@@ -0,0 +1,167 @@
+"""
+Query profiler - Detector de N+1 e queries lentas por requisição
+
+Quando ativo para uma requisição, os hooks de cursor do engine
+(app.core.database) registram cada statement aqui. Ao final:
+- Statements iguais a menos dos parâmetros (fingerprint) repetidos
+  QUERY_PROFILER_N_PLUS_ONE_THRESHOLD vezes ou mais são sinalizados como N+1
+- Os QUERY_PROFILER_TOP_SLOW statements mais lentos acima de
+  QUERY_PROFILER_SLOW_MS são registrados com o endpoint
+
+Ativação:
+- QUERY_PROFILER_ALWAYS_ON=true (dev/staging): todas as requisições
+- Header `X-Query-Profile`: qualquer valor fora de produção; em produção só
+  com o valor de QUERY_PROFILER_TOKEN (sem token configurado fica desligado)
+
+Requisições perfiladas recebem os headers X-Query-Count, X-Query-Time-Ms e
+X-Query-N-Plus-One (fingerprints repetidos).
+"""
+import hmac
+import logging
+import re
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "x-query-profile"
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|\$\d+|:\w+|\?")
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*\?\s*,?)+\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(statement: str) -> str:
+    """SQL sem literais/parâmetros: mesma query com ids diferentes = mesmo fingerprint"""
+    sql = _STRING_LITERAL.sub("?", statement)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _IN_LIST.sub("IN (?)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+@dataclass
+class QueryProfile:
+    """Statements executados durante uma requisição perfilada"""
+    endpoint: str = ""
+    count: int = 0
+    duration: float = 0.0
+    repeated: Dict[str, int] = field(default_factory=dict)
+    statements: List[Tuple[float, str]] = field(default_factory=list)
+
+    def record(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        key = fingerprint(statement)
+        self.repeated[key] = self.repeated.get(key, 0) + 1
+        self.statements.append((duration, statement))
+
+    def n_plus_one(self, threshold: Optional[int] = None) -> List[Tuple[str, int]]:
+        """Fingerprints repetidos >= threshold vezes, do mais repetido ao menos"""
+        threshold = threshold or settings.QUERY_PROFILER_N_PLUS_ONE_THRESHOLD
+        suspects = [(sql, count) for sql, count in self.repeated.items() if count >= threshold]
+        return sorted(suspects, key=lambda item: item[1], reverse=True)
+
+    def slowest(self, limit: Optional[int] = None, min_ms: Optional[float] = None) -> List[Tuple[float, str]]:
+        """Statements mais lentos acima de min_ms (duração em segundos, SQL)"""
+        limit = limit or settings.QUERY_PROFILER_TOP_SLOW
+        min_seconds = (settings.QUERY_PROFILER_SLOW_MS if min_ms is None else min_ms) / 1000
+        slow = [item for item in self.statements if item[0] >= min_seconds]
+        return sorted(slow, key=lambda item: item[0], reverse=True)[:limit]
+
+
+_current_profile: ContextVar[Optional[QueryProfile]] = ContextVar("query_profile", default=None)
+
+
+def get_current_profile() -> Optional[QueryProfile]:
+    return _current_profile.get()
+
+
+def record_statement(statement: str, duration: float) -> None:
+    """Chamado pelos hooks de cursor; sem perfil ativo não faz nada"""
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.record(statement, duration)
+
+
+def should_profile(header_value: Optional[str]) -> bool:
+    """Decide se a requisição é perfilada (ver docstring do módulo)"""
+    if settings.QUERY_PROFILER_ALWAYS_ON:
+        return True
+    if not header_value:
+        return False
+    if settings.ENVIRONMENT != "production":
+        return True
+    token = settings.QUERY_PROFILER_TOKEN
+    return bool(token) and hmac.compare_digest(header_value, token)
+
+
+def report_profile(profile: QueryProfile, method: str) -> None:
+    """Registra no log os N+1 suspeitos e as queries lentas da requisição"""
+    for sql, count in profile.n_plus_one():
+        logger.warning(
+            f"⚠️ Possível N+1 em {method} {profile.endpoint}: {count}x {sql[:300]}",
+            extra={"endpoint": profile.endpoint, "query_count": profile.count, "repetitions": count}
+        )
+
+    for duration, sql in profile.slowest():
+        logger.warning(
+            f"⚠️ Query lenta em {method} {profile.endpoint} ({duration * 1000:.1f}ms): {sql[:300]}",
+            extra={"endpoint": profile.endpoint, "duration_ms": round(duration * 1000, 1)}
+        )
+
+    logger.info(
+        f"Query profile {method} {profile.endpoint}: {profile.count} queries em {profile.duration * 1000:.1f}ms",
+        extra={"endpoint": profile.endpoint, "query_count": profile.count}
+    )
+
+
+class QueryProfilerMiddleware:
+    """Pure ASGI middleware que ativa o QueryProfile nas requisições selecionadas"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        header_value = None
+        for name, value in scope.get("headers") or []:
+            if name == PROFILE_HEADER.encode():
+                header_value = value.decode("latin-1")
+                break
+
+        if not should_profile(header_value):
+            await self.app(scope, receive, send)
+            return
+
+        profile = QueryProfile(endpoint=scope.get("path", ""))
+        token = _current_profile.set(profile)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                route = scope.get("route")
+                profile.endpoint = getattr(route, "path_format", None) or profile.endpoint
+                headers = list(message.get("headers") or [])
+                headers.append((b"x-query-count", str(profile.count).encode()))
+                headers.append((b"x-query-time-ms", f"{profile.duration * 1000:.1f}".encode()))
+                headers.append((b"x-query-n-plus-one", str(len(profile.n_plus_one())).encode()))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_profile.reset(token)
+            route = scope.get("route")
+            profile.endpoint = getattr(route, "path_format", None) or profile.endpoint
+            report_profile(profile, scope["method"])
@@ -1,75 +1,468 @@
 """
-Advanced Rate Limiting by User and IP
+Distributed Rate Limiting by Plan, User and IP
+
+Every /api/ request takes one token from one or more token buckets stored in
+Redis. A single Lua script refills, checks and debits all buckets of the
+request atomically, using the Redis clock, so every uvicorn worker and
+container shares the same counters (no INCR/EXPIRE race, no per-process
+memory:// storage multiplying the limits).
+
+Buckets:
+- auth: POST /auth/* (login, register, password recovery) per IP; token
+  refresh, change-password and logout are left to the other buckets
+- public_ip + public: public booking per IP, plus the company's aggregate
+  quota from its plan
+- api_key + api: per API key, plus the company's aggregate quota
+- api: JWT requests, aggregated per company (user for tokens without company)
+- anonymous: everything else per IP (provider webhooks are exempt)
+
+The per-company aggregate keeps a bursting tenant from using up the backend
+capacity of everyone else. Responses carry X-RateLimit-Limit/Remaining/Reset
+for the bucket closest to running out; 429 responses carry Retry-After.
+
+Behind the nginx of the deploy composes the peer address is the proxy's, so the
+client IP comes from X-Forwarded-For when the peer is in TRUSTED_PROXIES.
+
+Without Redis (or on a Redis error) requests pass through (fail-open), as in
+RateLimitCache.
 """
-from fastapi import Request, HTTPException, status
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from typing import Optional
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional, Tuple, Union
+from urllib.parse import parse_qs
+import hashlib
+import ipaddress
+import json
 import logging
+import math
+
+from fastapi import Request, HTTPException, status
+from jose import JWTError, jwt
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.api_key_cache import get_api_key_projection
+from app.core.cache import LocalCache, get_redis
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.metrics import metrics
+from app.core.plans import get_plan_rate_limits
+from app.models.company import Company
 
 logger = logging.getLogger(__name__)
 
+KEY_PREFIX = "ratelimit"
+API_PREFIX = "/api/"
+AUTH_PREFIX = "/api/v1/auth/"
+PUBLIC_PREFIX = "/api/v1/public/"
+PUBLIC_COMPANY_PREFIX = "/api/v1/public/companies/"
 
-def get_user_identifier(request: Request) -> str:
+# Empresa -> plano, por worker; mudança de plano vale em até 1 minuto
+PLAN_CACHE_TTL = 60  # segundos
+_plan_cache = LocalCache(max_entries=10_000)
+
+# Hashes de API keys inexistentes, por worker: chaves inventadas não chegam ao
+# banco a cada requisição (a autenticação em si continua validando a chave)
+UNKNOWN_API_KEY_TTL = 30  # segundos
+_unknown_api_keys = LocalCache(max_entries=10_000)
+
+# POST /auth/* fora do bucket de força bruta: renovação de token e troca de
+# senha já exigem credencial válida e contam nos buckets comuns
+AUTH_EXEMPT_SUFFIXES = ("/logout", "/refresh", "/refresh/json", "/change-password")
+
+# Token bucket com N buckets: só debita se todos tiverem token (tudo ou nada).
+# KEYS[i] = bucket; ARGV[2i-1] = capacidade; ARGV[2i] = janela (s) para encher.
+# Retorno: allowed, e por bucket: restantes, ms até 1 token, ms até encher
+TOKEN_BUCKET_SCRIPT = """
+redis.replicate_commands()
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local allowed = 1
+local tokens = {}
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i - 1])
+    local rate = capacity / tonumber(ARGV[2 * i])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local available = tonumber(state[1]) or capacity
+    local elapsed = math.max(0, now - (tonumber(state[2]) or now))
+    tokens[i] = math.min(capacity, available + elapsed * rate)
+    if tokens[i] < 1 then
+        allowed = 0
+    end
+end
+local result = {allowed}
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i - 1])
+    local window = tonumber(ARGV[2 * i])
+    local rate = capacity / window
+    if allowed == 1 then
+        tokens[i] = tokens[i] - 1
+    end
+    redis.call('HSET', key, 'tokens', tostring(tokens[i]), 'ts', tostring(now))
+    redis.call('EXPIRE', key, math.ceil(window) + 1)
+    table.insert(result, math.floor(tokens[i]))
+    table.insert(result, math.ceil(math.max(0, 1 - tokens[i]) / rate * 1000))
+    table.insert(result, math.ceil((capacity - tokens[i]) / rate * 1000))
+end
+return result
+"""
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """`limit` requests per `window` seconds (bursts up to `limit`)"""
+    limit: int
+    window: int = 60
+
+
+@dataclass(frozen=True)
+class RateLimitResult:
+    """Outcome for the most restrictive bucket of the request"""
+    allowed: bool
+    bucket: str
+    limit: int
+    remaining: int
+    reset_after: int  # seconds until the bucket is full again
+    retry_after: int  # seconds until a token is available (0 when allowed)
+
+    def headers(self) -> List[Tuple[str, str]]:
+        headers = [
+            ("X-RateLimit-Limit", str(self.limit)),
+            ("X-RateLimit-Remaining", str(self.remaining)),
+            ("X-RateLimit-Reset", str(self.reset_after)),
+        ]
+        if not self.allowed:
+            headers.append(("Retry-After", str(self.retry_after)))
+        return headers
+
+
+# (nome do bucket, identificador, limite)
+Bucket = Tuple[str, str, RateLimit]
+
+
+def _bucket_key(name: str, identifier: str) -> str:
+    return f"{KEY_PREFIX}:{name}:{identifier}"
+
+
+def parse_script_result(buckets: List[Bucket], raw: List[int]) -> RateLimitResult:
+    """Pick the bucket that denied the request, or the one closest to running out"""
+    allowed = bool(int(raw[0]))
+    results = []
+    for index, (name, _, rate_limit) in enumerate(buckets):
+        remaining, retry_ms, reset_ms = (int(value) for value in raw[1 + 3 * index:4 + 3 * index])
+        results.append(RateLimitResult(
+            allowed=allowed,
+            bucket=name,
+            limit=rate_limit.limit,
+            remaining=max(remaining, 0),
+            reset_after=math.ceil(reset_ms / 1000),
+            retry_after=0 if allowed else max(math.ceil(retry_ms / 1000), 1),
+        ))
+
+    if allowed:
+        return min(results, key=lambda result: (result.remaining, result.limit))
+    return max(results, key=lambda result: result.retry_after)
+
+
+async def hit(buckets: List[Bucket]) -> Optional[RateLimitResult]:
     """
-    Get user identifier for rate limiting
-    Priority: user_id > API key > IP address
-    
+    Take one token from every bucket, atomically
+
     Args:
-        request: FastAPI request object
-        
+        buckets: (name, identifier, RateLimit) tuples
+
     Returns:
-        Unique identifier string for rate limiting
+        Result for the most restrictive bucket, or None when Redis is unavailable
     """
-    # 1. Tentar obter user_id do token JWT
-    user = getattr(request.state, "user", None)
-    if user and hasattr(user, "id"):
-        return f"user:{user.id}"
-    
-    # 2. Tentar obter API key dos headers
-    api_key = request.headers.get("X-API-Key")
+    if not buckets:
+        return None
+
+    redis = await get_redis()
+    if redis is None:
+        return None
+
+    keys = [_bucket_key(name, identifier) for name, identifier, _ in buckets]
+    args = []
+    for _, _, rate_limit in buckets:
+        args.extend([rate_limit.limit, rate_limit.window])
+
+    try:
+        # register_script usa EVALSHA e recarrega o script se o Redis não o tiver
+        raw = await redis.register_script(TOKEN_BUCKET_SCRIPT)(keys=keys, args=args)
+    except Exception as e:
+        logger.error(f"❌ Erro no rate limit (Redis): {e}")
+        return None
+
+    return parse_script_result(buckets, raw)
+
+
+# ========== IDENTIFICAÇÃO ==========
+
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+@lru_cache(maxsize=4)
+def _trusted_networks(value: str) -> Tuple[IPNetwork, ...]:
+    networks = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(item, strict=False))
+        except ValueError:
+            logger.warning(f"⚠️ TRUSTED_PROXIES ignorado (inválido): {item}")
+    return tuple(networks)
+
+
+def _is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in _trusted_networks(settings.TRUSTED_PROXIES))
+
+
+def _client_ip(scope: Scope) -> str:
+    """
+    Client address: the peer, or the X-Forwarded-For hop right before the
+    trusted proxies when the peer is one of them
+
+    Entries are read from right to left, so a client cannot spoof its address
+    by sending its own X-Forwarded-For (the proxy appends the real peer).
+    """
+    client = scope.get("client")
+    peer = client[0] if client else "unknown"
+    if not _is_trusted_proxy(peer):
+        return peer
+
+    forwarded = Headers(scope=scope).get("x-forwarded-for")
+    if not forwarded:
+        return peer
+
+    hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not _is_trusted_proxy(hop):
+            return hop
+    return hops[0] if hops else peer
+
+
+def _load_company(company_id: Optional[int], slug: Optional[str]) -> Optional[Tuple[int, str]]:
+    db = SessionLocal()
+    try:
+        query = db.query(Company.id, Company.subscription_plan)
+        if company_id is not None:
+            query = query.filter(Company.id == company_id)
+        else:
+            query = query.filter(Company.slug == slug)
+        row = query.first()
+        return (row.id, row.subscription_plan or "ESSENCIAL") if row else None
+    finally:
+        db.close()
+
+
+async def resolve_company_plan(
+    company_id: Optional[int] = None,
+    slug: Optional[str] = None
+) -> Optional[Tuple[int, str]]:
+    """
+    (company_id, plan) by id or slug, cached per worker for PLAN_CACHE_TTL
+
+    Unknown companies are cached too, so made-up ids do not reach the database
+    on every request.
+    """
+    cache_key = f"id:{company_id}" if company_id is not None else f"slug:{slug}"
+    found, company = _plan_cache.get(cache_key)
+    if found:
+        return company
+
+    try:
+        company = await run_in_threadpool(_load_company, company_id, slug)
+    except Exception as e:
+        logger.error(f"❌ Erro ao carregar plano da empresa para rate limit: {e}")
+        return None
+
+    _plan_cache.put(cache_key, company, PLAN_CACHE_TTL)
+    return company
+
+
+def _plan_limit(plan: Optional[str], bucket: str) -> RateLimit:
+    return RateLimit(get_plan_rate_limits(plan)[bucket])
+
+
+def _public_company(scope: Scope) -> Tuple[Optional[int], Optional[str]]:
+    path = scope["path"]
+    if path.startswith(PUBLIC_COMPANY_PREFIX):
+        slug = path[len(PUBLIC_COMPANY_PREFIX):].strip("/")
+        return None, slug or None
+
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    value = (query.get("companyId") or query.get("company_id") or [None])[0]
+    return (int(value), None) if value and value.isdigit() else (None, None)
+
+
+def _bearer_payload(headers: Headers) -> Optional[dict]:
+    authorization = headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return None  # Token inválido: get_current_user responde 401; aqui conta como anônimo
+
+
+async def resolve_buckets(scope: Scope) -> List[Bucket]:
+    """
+    Buckets charged for this request (empty = not rate limited)
+
+    Args:
+        scope: ASGI HTTP scope
+
+    Returns:
+        List of (name, identifier, RateLimit)
+    """
+    path = scope["path"]
+    method = scope["method"]
+    if method == "OPTIONS" or not path.startswith(API_PREFIX):
+        return []
+
+    ip = _client_ip(scope)
+
+    if path.startswith(AUTH_PREFIX):
+        if method == "POST" and not path.rstrip("/").endswith(AUTH_EXEMPT_SUFFIXES):
+            return [("auth", ip, RateLimit(settings.RATE_LIMIT_AUTH_PER_MINUTE))]
+
+    if path.startswith(PUBLIC_PREFIX):
+        buckets = [("public_ip", ip, RateLimit(settings.RATE_LIMIT_PUBLIC_PER_MINUTE))]
+        company_id, slug = _public_company(scope)
+        if company_id is not None or slug:
+            company = await resolve_company_plan(company_id=company_id, slug=slug)
+            if company is not None:
+                buckets.append(("public", str(company[0]), _plan_limit(company[1], "public")))
+        return buckets
+
+    headers = Headers(scope=scope)
+
+    api_key = headers.get("x-api-key")
     if api_key:
-        return f"apikey:{api_key}"
-    
-    # 3. Fallback para IP address
-    return f"ip:{get_remote_address(request)}"
+        key_hash = hashlib.sha256(api_key.encode()).hexdigest()
+        projection = None
+        if not _unknown_api_keys.get(key_hash)[0]:
+            db = SessionLocal()
+            try:
+                projection = await get_api_key_projection(db, key_hash)
+                if projection is None:
+                    _unknown_api_keys.put(key_hash, True, UNKNOWN_API_KEY_TTL)
+            except Exception as e:
+                logger.error(f"❌ Erro ao carregar API key para rate limit: {e}")
+            finally:
+                await run_in_threadpool(db.close)
+        if projection is not None:
+            company = await resolve_company_plan(company_id=projection.company_id)
+            plan = company[1] if company else None
+            return [
+                ("api_key", str(projection.key_id), _plan_limit(plan, "api_key")),
+                ("api", str(projection.company_id), _plan_limit(plan, "api")),
+            ]
+
+    payload = _bearer_payload(headers)
+    if payload and payload.get("sub"):
+        company_id = payload.get("company_id")
+        if isinstance(company_id, int):
+            company = await resolve_company_plan(company_id=company_id)
+            return [("api", str(company_id), _plan_limit(company[1] if company else None, "api"))]
+        # Token sem empresa (SaaS admin): quota própria do usuário
+        return [("user", str(payload["sub"]), _plan_limit(None, "api"))]
 
+    if "/webhook" in path:
+        return []  # Provedores externos (pagamentos, WhatsApp, Calendly) reenviam e validam assinatura
 
-def get_user_or_ip(request: Request) -> str:
+    return [("anonymous", ip, RateLimit(settings.RATE_LIMIT_PER_MINUTE))]
+
+
+# ========== MIDDLEWARE ==========
+
+def _rejection_body() -> bytes:
+    # Mesmo formato do antigo handler de RateLimitExceeded (slowapi)
+    return json.dumps({
+        "error": "RATE_LIMITED",
+        "message": "Limite de requisições excedido",
+    }).encode()
+
+
+class RateLimitMiddleware:
     """
-    Wrapper para compatibilidade com SlowAPI
+    Pure ASGI middleware enforcing the distributed rate limits.
+
+    Must be registered before CORSMiddleware (i.e. inside it), so 429
+    responses still carry the CORS headers.
     """
-    return get_user_identifier(request)
 
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not settings.RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        result = await hit(await resolve_buckets(scope))
+        if result is None:
+            await self.app(scope, receive, send)
+            return
 
-# Criar limiter com identificador por usuário
-limiter = Limiter(
-    key_func=get_user_or_ip,
-    default_limits=["1000/hour", "100/minute"],
-    storage_uri="memory://",  # Usar Redis em produção
-    strategy="fixed-window",
-)
+        headers = [(name.lower().encode(), value.encode()) for name, value in result.headers()]
 
+        if not result.allowed:
+            metrics.record_rate_limit_rejection(result.bucket)
+            logger.warning(f"⚠️ Rate limit excedido: bucket={result.bucket} path={scope['path']}")
+            body = _rejection_body()
+            await send({
+                "type": "http.response.start",
+                "status": status.HTTP_429_TOO_MANY_REQUESTS,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ] + headers,
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
 
-# Rate limits específicos por tipo de endpoint
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + headers
+            await send(message)
 
-# Autenticação (mais restritivo)
-AUTH_RATE_LIMIT = "5/minute"
+        await self.app(scope, receive, send_wrapper)
 
-# APIs públicas (sem autenticação)
-PUBLIC_RATE_LIMIT = "20/minute"
 
-# APIs autenticadas (por usuário)
-USER_RATE_LIMIT = "100/minute"
+# ========== HELPERS ==========
+
+def get_user_identifier(request: Request) -> str:
+    """
+    Get user identifier for rate limiting
+    Priority: user_id > API key > IP address
+
+    Args:
+        request: FastAPI request object
 
-# APIs administrativas
-ADMIN_RATE_LIMIT = "200/minute"
+    Returns:
+        Unique identifier string for rate limiting
+    """
+    # 1. Tentar obter user_id do token JWT
+    user = getattr(request.state, "user", None)
+    if user and hasattr(user, "id"):
+        return f"user:{user.id}"
 
-# Upload de arquivos
-UPLOAD_RATE_LIMIT = "10/hour"
+    # 2. Tentar obter API key dos headers (hash: a chave não vai para o Redis)
+    api_key = request.headers.get("X-API-Key")
+    if api_key:
+        return f"apikey:{hashlib.sha256(api_key.encode()).hexdigest()[:16]}"
 
-# Exportação de relatórios
-EXPORT_RATE_LIMIT = "20/hour"
+    # 3. Fallback para IP address
+    return f"ip:{request.client.host if request.client else 'unknown'}"
 
 
 async def check_rate_limit_exceeded(
@@ -79,22 +472,22 @@ async def check_rate_limit_exceeded(
 ) -> bool:
     """
     Check if rate limit is exceeded for current user/IP
-    
+
+    Takes a token from a bucket of its own (per path and identifier), on top
+    of the buckets charged by RateLimitMiddleware.
+
     Args:
         request: FastAPI request
         max_requests: Maximum requests allowed
         window_seconds: Time window in seconds
-        
+
     Returns:
-        True if limit exceeded, False otherwise
+        True if limit exceeded, False otherwise (also when Redis is unavailable)
     """
     try:
-        identifier = get_user_identifier(request)
-        
-        # TODO: Implementar com Redis para produção
-        # Por enquanto, retorna False (sem limite)
-        
-        return False
+        identifier = f"{request.url.path}:{get_user_identifier(request)}"
+        result = await hit([("custom", identifier, RateLimit(max_requests, window_seconds))])
+        return result is not None and not result.allowed
     except Exception as e:
         logger.error(f"Erro ao verificar rate limit: {e}")
         return False
@@ -106,7 +499,7 @@ def rate_limit_exceeded_handler(request: Request, exc: Exception):
     """
     identifier = get_user_identifier(request)
     logger.warning(f"⚠️ Rate limit excedido para: {identifier}")
-    
+
     raise HTTPException(
         status_code=status.HTTP_429_TOO_MANY_REQUESTS,
         detail={
@@ -116,4 +509,3 @@ def rate_limit_exceeded_handler(request: Request, exc: Exception):
         },
         headers={"Retry-After": "60"}
     )
-
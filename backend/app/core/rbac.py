@@ -16,9 +16,9 @@ from fastapi import Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
 from app.core.database import get_db
-from app.core.security import get_current_user, decode_token, oauth2_scheme
+from app.core.security import get_current_user, decode_token, oauth2_scheme, raise_if_token_revoked
+from app.core import auth_cache
 from app.models.user import User
-from app.models.company_user import CompanyUser
 from app.core.roles import SaaSRole, CompanyRole
 
 
@@ -78,6 +78,9 @@ async def get_current_user_context(
     - scope: "saas" or "company"
     
     Returns CurrentUserContext with all extracted information.
+    
+    User and CompanyUser data come from the auth cache (app.core.auth_cache),
+    so a warm cache resolves the context without database queries.
     """
     try:
         payload = decode_token(token)
@@ -90,8 +93,11 @@ async def get_current_user_context(
                 headers={"WWW-Authenticate": "Bearer"},
             )
         
-        # Get user from database
-        user = db.query(User).filter(User.id == user_id).first()
+        # Get user projection (local LRU -> Redis -> database)
+        try:
+            user = await auth_cache.get_auth_projection(db, int(user_id))
+        except ValueError:
+            user = None
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -99,6 +105,8 @@ async def get_current_user_context(
                 headers={"WWW-Authenticate": "Bearer"},
             )
         
+        raise_if_token_revoked(user, payload)
+        
         if not user.is_active:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -130,13 +138,10 @@ async def get_current_user_context(
         
         # If company_id is in token but not company_role, try to get from CompanyUser
         if company_id and not company_role:
-            company_user = db.query(CompanyUser).filter(
-                CompanyUser.user_id == user.id,
-                CompanyUser.company_id == company_id
-            ).first()
-            if company_user:
+            membership_role = user.company_roles.get(int(company_id))
+            if membership_role:
                 try:
-                    company_role = CompanyRole(company_user.role)
+                    company_role = CompanyRole(membership_role)
                 except ValueError:
                     # Fallback to COMPANY_OWNER if role doesn't match enum
                     company_role = CompanyRole.COMPANY_OWNER
@@ -146,7 +151,7 @@ async def get_current_user_context(
             company_id = user.company_id
         
         return CurrentUserContext(
-            user_id=user.id,
+            user_id=user.user_id,
             email=user.email,
             saas_role=saas_role,
             company_role=company_role,
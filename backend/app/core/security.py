@@ -10,6 +10,7 @@ from fastapi.security import OAuth2PasswordBearer
 from fastapi import Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
+from app.core import auth_cache
 from app.core.config import settings
 from app.core.database import get_db
 from app.models.user import User
@@ -177,11 +178,27 @@ def decode_token(token: str) -> dict:
         )
 
 
+def raise_if_token_revoked(projection, payload: dict) -> None:
+    """Reject tokens issued before blacklist_all_user_tokens() for this user"""
+    if projection.is_token_revoked(payload.get("iat")):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token revogado. Faça login novamente.",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
 ) -> User:
-    """Get current authenticated user"""
+    """
+    Get current authenticated user
+    
+    Tokens with a numeric sub are resolved through the auth cache
+    (app.core.auth_cache) without touching the database; the returned User
+    is attached to `db` and lazily loads any column outside the projection.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Não foi possível validar as credenciais",
@@ -195,14 +212,27 @@ async def get_current_user(
         raise credentials_exception
     
     # Check if sub is email (string) or user_id (int)
-    if "@" in sub:  # Email
+    if "@" in sub:  # Email (legacy tokens, not cached)
         user = db.query(User).filter(User.email == sub).first()
     else:  # User ID
         try:
             user_id = int(sub)
-            user = db.query(User).filter(User.id == user_id).first()
         except ValueError:
-            user = None
+            raise credentials_exception
+        
+        projection = await auth_cache.get_auth_projection(db, user_id)
+        if projection is None:
+            raise credentials_exception
+        
+        raise_if_token_revoked(projection, payload)
+        
+        if not projection.is_active:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Usuário inativo"
+            )
+        
+        return projection.to_user(db)
     
     if user is None:
         raise credentials_exception
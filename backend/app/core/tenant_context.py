@@ -5,12 +5,77 @@ This module provides automatic tenant context injection for all database session
 enabling PostgreSQL Row Level Security policies to filter data by company_id.
 """
 import logging
-from typing import Optional
+from typing import Optional, Union
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import event, text
 
 logger = logging.getLogger(__name__)
 
+# Key in Session.info holding the company_id applied by the after_begin hook
+TENANT_INFO_KEY = "tenant_company_id"
+
+# Dialects with set_config(); RLS only exists on PostgreSQL
+TENANT_CONTEXT_DIALECTS = {"postgresql"}
+
+_SET_LOCAL_TENANT_SQL = text("SELECT set_config('app.current_company_id', :company_id, true)")
+
+
+def _validate_company_id(company_id) -> None:
+    if not isinstance(company_id, int) or company_id <= 0:
+        raise ValueError(f"Invalid company_id: {company_id}. Must be a positive integer.")
+
+
+def bind_tenant_context(db: Union[Session, AsyncSession], company_id: int) -> None:
+    """
+    Bind a tenant to the session without touching the database.
+    
+    The context is applied lazily by the after_begin hook below, inside each
+    transaction the session opens, with set_config(..., true). That means:
+    1. No round trip until the endpoint runs its first real query
+    2. The setting is transaction-local, so it never leaks to the next user
+       of a pooled connection
+    3. It is re-applied automatically after every commit/rollback
+    
+    Args:
+        db: SQLAlchemy session (sync or async)
+        company_id: Company ID to set as context
+        
+    Raises:
+        ValueError: If company_id is invalid
+    """
+    _validate_company_id(company_id)
+    
+    sync_session = getattr(db, "sync_session", db)
+    sync_session.info[TENANT_INFO_KEY] = company_id
+    
+    # A transaction that is already open will not fire after_begin again
+    if isinstance(db, Session) and db.in_transaction() and db.get_bind().dialect.name in TENANT_CONTEXT_DIALECTS:
+        _apply_tenant_context(db.connection(), company_id)
+    
+    logger.debug(f"Tenant context bound: company_id={company_id}")
+
+
+def _apply_tenant_context(connection, company_id: int) -> None:
+    # set_config() returns the stored value: validated in the same round trip
+    stored = connection.execute(_SET_LOCAL_TENANT_SQL, {"company_id": str(company_id)}).scalar()
+    if stored != str(company_id):
+        logger.error(f"❌ Tenant context mismatch! Expected: {company_id}, Got: {stored}")
+        raise RuntimeError("Failed to set tenant context")
+
+
+@event.listens_for(Session, "after_begin")
+def _set_tenant_context_on_begin(session, transaction, connection):
+    company_id = session.info.get(TENANT_INFO_KEY)
+    if company_id is None or connection.dialect.name not in TENANT_CONTEXT_DIALECTS:
+        return
+    
+    try:
+        _apply_tenant_context(connection, company_id)
+    except Exception as e:
+        logger.error(f"❌ Failed to set tenant context for company_id={company_id}: {e}")
+        raise
+
 
 def set_tenant_context(db: Session, company_id: Optional[int]) -> None:
     """
@@ -28,12 +93,12 @@ def set_tenant_context(db: Session, company_id: Optional[int]) -> None:
     """
     if company_id is None:
         # Clear tenant context - use with caution!
+        db.info.pop(TENANT_INFO_KEY, None)
         logger.warning("⚠️ Clearing tenant context - this should only happen in specific admin operations")
         db.execute(text("SET LOCAL app.current_company_id = ''"))
         return
     
-    if not isinstance(company_id, int) or company_id <= 0:
-        raise ValueError(f"Invalid company_id: {company_id}. Must be a positive integer.")
+    _validate_company_id(company_id)
     
     try:
         # Set the session-level variable that RLS policies will read
@@ -78,6 +143,7 @@ def clear_tenant_context(db: Session) -> None:
         db: SQLAlchemy session
     """
     logger.warning("⚠️ Clearing tenant context")
+    db.info.pop(TENANT_INFO_KEY, None)
     db.execute(text("SET LOCAL app.current_company_id = ''"))
 
 
@@ -7,18 +7,18 @@ from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
 import sentry_sdk
 from sentry_sdk.integrations.fastapi import FastApiIntegration
 from sentry_sdk.integrations.sqlalchemy import SqlalchemyIntegration
 
 from app.core.config import settings
-from app.core.database import engine, Base
+from app.core.database import engine, Base, dispose_async_engine
 from app.api.v1.api import api_router
 from app.core.observability import ObservabilityMiddleware, setup_json_logging, configure_sentry
-from app.core.metrics import metrics_endpoint
+from app.core.metrics import PrometheusMiddleware, metrics_endpoint
+from app.core.query_profiler import QueryProfilerMiddleware
+from app.core.rate_limiting import RateLimitMiddleware
+from app.services.whatsapp_sender import shutdown_whatsapp_sender
 
 # Configure observability (logging and monitoring)
 if settings.ENVIRONMENT == "production":
@@ -37,13 +37,6 @@ except Exception:
     # If Sentry initialization fails, continue without it
     pass
 
-# Initialize rate limiter with generous defaults
-limiter = Limiter(
-    key_func=get_remote_address,
-    default_limits=["1000/hour", "200/minute"],  # Generous limits for normal use
-    storage_uri="memory://",
-)
-
 # Create FastAPI app
 app = FastAPI(
     title=settings.APP_NAME,
@@ -55,27 +48,9 @@ app = FastAPI(
     redirect_slashes=False,
 )
 
-# Add rate limiter to app state
-app.state.limiter = limiter
-@app.exception_handler(RateLimitExceeded)
-async def rate_limit_exception_handler(request: Request, exc: RateLimitExceeded):
-    origin = request.headers.get("origin")
-
-    response = JSONResponse(
-        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-        content={
-            "error": "RATE_LIMITED",
-            "message": "Limite de requisições excedido",
-        },
-    )
-
-    if origin:
-        response.headers["Access-Control-Allow-Origin"] = origin
-        response.headers["Access-Control-Allow-Credentials"] = "true"
-        response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
-        response.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization, X-Requested-With"
-
-    return response
+# Distributed rate limiting (Redis, quotas per plan). Registered before CORS so
+# CORSMiddleware wraps it and 429 responses still carry the CORS headers
+app.add_middleware(RateLimitMiddleware)
 
 # CORS Middleware - Configured for maximum compatibility with credentials
 cors_origins = settings.get_cors_origins()
@@ -111,6 +86,11 @@ if cors_origins == ["*"] or not filtered_origins:
             expose_headers=[
                 "Content-Length",
                 "Content-Type",
+                "X-Next-Cursor",
+                "X-RateLimit-Limit",
+                "X-RateLimit-Remaining",
+                "X-RateLimit-Reset",
+                "Retry-After",
             ],
             max_age=300,  # Shorter cache for development
         )
@@ -133,7 +113,7 @@ if cors_origins == ["*"] or not filtered_origins:
                 "X-Requested-With",
                 "Accept",
             ],
-            expose_headers=["Content-Length", "Content-Type"],
+            expose_headers=["Content-Length", "Content-Type", "X-Next-Cursor", "X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset", "Retry-After"],
             max_age=86400,  # 24 hours cache for production
         )
         print("🔒 CORS: Production fallback - using hardcoded safe origins")
@@ -157,6 +137,11 @@ else:
             "Content-Length",
             "Content-Type",
             "X-Total-Count",
+            "X-Next-Cursor",
+            "X-RateLimit-Limit",
+            "X-RateLimit-Remaining",
+            "X-RateLimit-Reset",
+            "Retry-After",
         ],
         "max_age": 3600,
     }
@@ -173,6 +158,12 @@ app.add_middleware(GZipMiddleware, minimum_size=1000)
 # Observability Middleware for request tracking and structured logging
 app.add_middleware(ObservabilityMiddleware)
 
+# Prometheus: latência por rota (template) e queries por requisição
+app.add_middleware(PrometheusMiddleware)
+
+# Query profiler: N+1 e queries lentas (header X-Query-Profile ou QUERY_PROFILER_ALWAYS_ON)
+app.add_middleware(QueryProfilerMiddleware)
+
 # Security Headers Middleware
 @app.middleware("http")
 async def add_security_headers(request: Request, call_next):
@@ -343,6 +334,11 @@ async def shutdown_event():
             app.state.scheduler.shutdown()
         except:
             pass
+    
+    # Drenar envios de WhatsApp ainda na fila
+    shutdown_whatsapp_sender(timeout=10)
+    
+    await dispose_async_engine()
 
 
 # Health check endpoint
@@ -60,6 +60,9 @@ from app.models.company_configurations import (
     CompanyDetails, CompanyFinancialSettings, CompanyNotificationSettings,
     CompanyThemeSettings, CompanyAdminSettings
 )
+from app.models.company_scheduling_settings import SchedulingSettings
+from app.models.tenant_daily_metrics import TenantDailyMetrics
+from app.models.appointment_reminder_log import AppointmentReminderLog
 
 __all__ = [
     "Company",
@@ -166,4 +169,9 @@ __all__ = [
     "CompanyNotificationSettings",
     "CompanyThemeSettings",
     "CompanyAdminSettings",
+    "SchedulingSettings",
+    # Dashboard rollup
+    "TenantDailyMetrics",
+    # Reminder pipeline
+    "AppointmentReminderLog",
 ]
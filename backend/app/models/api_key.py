@@ -4,11 +4,42 @@ API Key Model - For external API authentication
 from sqlalchemy import Column, String, Integer, Boolean, DateTime, ForeignKey, Text
 from sqlalchemy.orm import relationship
 from datetime import datetime, timedelta
+import json
 import secrets
 
 from app.models.base import BaseModel
 
 
+def scopes_allow(scopes: str, required_scope: str) -> bool:
+    """
+    Check a JSON scope list against a required scope
+    
+    Accepts "*", the exact scope or a resource wildcard (ex: "appointments:*").
+    """
+    if not scopes:
+        return False
+    
+    try:
+        scopes_list = json.loads(scopes)
+        
+        # Check for wildcard
+        if "*" in scopes_list:
+            return True
+        
+        # Check for exact match
+        if required_scope in scopes_list:
+            return True
+        
+        # Check for wildcard pattern (ex: "appointments:*")
+        resource = required_scope.split(":")[0]
+        if f"{resource}:*" in scopes_list:
+            return True
+        
+        return False
+    except:
+        return False
+
+
 class APIKey(BaseModel):
     """
     API Key model for external integrations
@@ -91,29 +122,7 @@ class APIKey(BaseModel):
     
     def has_scope(self, required_scope: str) -> bool:
         """Check if API key has required scope"""
-        if not self.scopes:
-            return False
-        
-        import json
-        try:
-            scopes_list = json.loads(self.scopes)
-            
-            # Check for wildcard
-            if "*" in scopes_list:
-                return True
-            
-            # Check for exact match
-            if required_scope in scopes_list:
-                return True
-            
-            # Check for wildcard pattern (ex: "appointments:*")
-            resource = required_scope.split(":")[0]
-            if f"{resource}:*" in scopes_list:
-                return True
-            
-            return False
-        except:
-            return False
+        return scopes_allow(self.scopes, required_scope)
     
     def __repr__(self):
         return f"<APIKey {self.name} ({self.key_prefix}...) company_id={self.company_id}>"
@@ -1,7 +1,7 @@
 """
 Appointment Model
 """
-from sqlalchemy import Column, String, Integer, ForeignKey, Text, Boolean, DateTime, Enum as SQLEnum
+from sqlalchemy import Column, String, Integer, ForeignKey, Text, Boolean, DateTime, Index, Enum as SQLEnum, false
 from sqlalchemy.orm import relationship
 import enum
 
@@ -23,6 +23,12 @@ class Appointment(BaseModel):
     """Appointment model"""
     
     __tablename__ = "appointments"
+    __table_args__ = (
+        # Overlap lookups: company + professional + time range
+        Index('ix_appointments_company_professional_start', 'company_id', 'professional_id', 'start_time'),
+        # PostgreSQL also enforces appointments_professional_no_overlap
+        # (EXCLUDE USING gist on professional_id + tsrange), see migration c4e8a1f2b3d5
+    )
     
     # Tenant
     company_id = Column(Integer, ForeignKey("companies.id", ondelete="CASCADE"), nullable=False, index=True)
@@ -39,6 +45,7 @@ class Appointment(BaseModel):
     
     # Status
     status = Column(SQLEnum(AppointmentStatus), default=AppointmentStatus.PENDING, nullable=False, index=True)
+    overlap_allowed = Column(Boolean, default=False, server_default=false(), nullable=False)  # Encaixe: ignora a constraint de sobreposição
     
     # Notes
     client_notes = Column(Text, nullable=True)  # Notes from client
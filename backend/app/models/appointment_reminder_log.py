@@ -0,0 +1,29 @@
+"""
+Appointment Reminder Log Model - Lembretes já enviados por agendamento
+"""
+from sqlalchemy import Column, Integer, ForeignKey, UniqueConstraint
+
+from app.models.base import BaseModel
+
+
+class AppointmentReminderLog(BaseModel):
+    """
+    One row per (appointment, reminder_hours_before) reminder sent.
+
+    Replaces the reminder_sent_24h/2h flags for arbitrary hour values from
+    SchedulingSettings.reminder_hours_before. The row is inserted before
+    sending (claim), so concurrent workers never send the same reminder twice.
+    """
+
+    __tablename__ = "appointment_reminder_logs"
+
+    __table_args__ = (
+        UniqueConstraint('appointment_id', 'hours_before', name='uq_appointment_reminder_logs_appointment_hours'),
+    )
+
+    company_id = Column(Integer, ForeignKey("companies.id", ondelete="CASCADE"), nullable=False, index=True)
+    appointment_id = Column(Integer, ForeignKey("appointments.id", ondelete="CASCADE"), nullable=False)
+    hours_before = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return f"<AppointmentReminderLog appointment={self.appointment_id} hours={self.hours_before}>"
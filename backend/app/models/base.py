@@ -2,10 +2,11 @@
 Base model with common fields
 """
 from datetime import datetime
-from sqlalchemy import Column, Integer, DateTime
+from sqlalchemy import Column, Integer, DateTime, inspect, select
 from sqlalchemy.ext.declarative import declared_attr
 
 from app.core.database import Base
+from app.utils.whatsapp_sanitizer import phone_to_e164
 
 
 class BaseModel(Base):
@@ -21,3 +22,27 @@ class BaseModel(Base):
     def __tablename__(cls):
         """Generate table name from class name"""
         return cls.__name__.lower()
+
+
+def sync_phone_e164(connection, target, *sources: str) -> None:
+    """
+    Atualiza target.phone_e164 a partir do primeiro telefone preenchido em `sources`.
+    
+    (company_id, phone_e164) é único: se outro registro da empresa já tem o
+    número, este fica sem phone_e164 (o primeiro cadastro continua sendo o
+    destino das mensagens recebidas) em vez de a escrita falhar.
+    """
+    state = inspect(target)
+    if state.persistent and not any(state.attrs[source].history.has_changes() for source in sources):
+        return
+    
+    phone = phone_to_e164(next((getattr(target, source) for source in sources if getattr(target, source)), None))
+    if phone is not None:
+        table = type(target).__table__
+        query = select(table.c.id).where(table.c.company_id == target.company_id, table.c.phone_e164 == phone)
+        if target.id is not None:
+            query = query.where(table.c.id != target.id)
+        if connection.scalar(query.limit(1)) is not None:
+            phone = None
+    
+    target.phone_e164 = phone
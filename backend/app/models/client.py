@@ -1,16 +1,22 @@
 """
 Client Model - Clientes do sistema (separado de Users)
 """
-from sqlalchemy import Column, String, Integer, ForeignKey, Text, Boolean, Numeric, Date, JSON
+from sqlalchemy import Column, String, Integer, ForeignKey, Text, Boolean, Numeric, Date, JSON, Index, UniqueConstraint, event
 from sqlalchemy.orm import relationship
 
-from app.models.base import BaseModel
+from app.models.base import BaseModel, sync_phone_e164
+from app.utils.search_normalizer import normalize_search_text, only_digits
 
 
 class Client(BaseModel):
     """Client model - Clientes das empresas"""
     
     __tablename__ = "clients"
+    __table_args__ = (
+        UniqueConstraint('company_id', 'phone_e164', name='uq_clients_company_phone_e164'),
+        # Keyset pagination (app.core.pagination)
+        Index('ix_clients_company_full_name_id', 'company_id', 'full_name', 'id'),
+    )
     
     # Tenant
     company_id = Column(Integer, ForeignKey("companies.id", ondelete="CASCADE"), nullable=False, index=True)
@@ -24,6 +30,7 @@ class Client(BaseModel):
     email = Column(String(255), nullable=True, index=True)
     phone = Column(String(20), nullable=True, index=True)
     cellphone = Column(String(20), nullable=True, index=True)
+    phone_e164 = Column(String(16), nullable=True, index=True)  # Canônico (celular ou telefone), mantido por sync_phone_e164
     
     # Personal Data
     date_of_birth = Column(Date, nullable=True)
@@ -52,6 +59,12 @@ class Client(BaseModel):
     # Notes
     notes = Column(Text, nullable=True)
     
+    # Search (derivados, mantidos por normalize_search_columns)
+    search_name = Column(String(360), nullable=True)  # nome + apelido sem acento, minúsculo (índice trigram)
+    phone_digits = Column(String(20), nullable=True)
+    cellphone_digits = Column(String(20), nullable=True)
+    cpf_digits = Column(String(20), nullable=True)
+    
     # Relationships
     company = relationship("Company", back_populates="clients")
     user = relationship("User", back_populates="client_crm", uselist=False)  # Ponte para usuario com login
@@ -69,3 +82,13 @@ class Client(BaseModel):
     def __repr__(self):
         return f"<Client {self.full_name}>"
 
+
+@event.listens_for(Client, 'before_insert')
+@event.listens_for(Client, 'before_update')
+def normalize_search_columns(mapper, connection, target):
+    """Keep the normalized search columns in sync with name, phones and CPF"""
+    target.search_name = normalize_search_text(" ".join(filter(None, [target.full_name, target.nickname])))
+    target.phone_digits = only_digits(target.phone)
+    target.cellphone_digits = only_digits(target.cellphone)
+    target.cpf_digits = only_digits(target.cpf)
+    sync_phone_e164(connection, target, 'cellphone', 'phone')
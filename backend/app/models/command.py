@@ -1,7 +1,7 @@
 """
 Command Model - Comandas (Atendimentos/Vendas)
 """
-from sqlalchemy import Column, String, Integer, ForeignKey, Text, Boolean, Numeric, DateTime, Enum as SQLEnum, JSON
+from sqlalchemy import Column, String, Integer, ForeignKey, Text, Boolean, Numeric, DateTime, Index, Enum as SQLEnum, JSON
 from sqlalchemy.orm import relationship
 import enum
 
@@ -27,6 +27,10 @@ class Command(BaseModel):
     """Command model - Comandas de atendimento"""
     
     __tablename__ = "commands"
+    __table_args__ = (
+        # Keyset pagination (app.core.pagination)
+        Index('ix_commands_company_date_id', 'company_id', 'date', 'id'),
+    )
     
     # Tenant
     company_id = Column(Integer, ForeignKey("companies.id", ondelete="CASCADE"), nullable=False, index=True)
@@ -1,7 +1,7 @@
 """
 Commission Model - Comissões
 """
-from sqlalchemy import Column, String, Integer, ForeignKey, Text, Boolean, Numeric, DateTime, Enum as SQLEnum
+from sqlalchemy import Column, String, Integer, ForeignKey, Text, Boolean, Numeric, DateTime, Index, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 import enum
 
@@ -19,6 +19,10 @@ class Commission(BaseModel):
     """Commission model - Comissões de profissionais"""
     
     __tablename__ = "commissions"
+    __table_args__ = (
+        # Keyset pagination (app.core.pagination)
+        Index('ix_commissions_company_created_at_id', 'company_id', 'created_at', 'id'),
+    )
     
     company_id = Column(Integer, ForeignKey("companies.id", ondelete="CASCADE"), nullable=False, index=True)
     command_id = Column(Integer, ForeignKey("commands.id", ondelete="CASCADE"), nullable=False, index=True)
@@ -1,7 +1,7 @@
 """
 Company (Tenant) Model - Multi-tenant support
 """
-from sqlalchemy import Column, String, Boolean, Text, JSON, DateTime, Integer, ForeignKey, event
+from sqlalchemy import Column, String, Boolean, Text, JSON, DateTime, Integer, ForeignKey, Index, event
 from sqlalchemy.orm import relationship
 from unidecode import unidecode
 import re
@@ -28,6 +28,10 @@ class Company(BaseModel):
     """Company/Tenant model for multi-tenant architecture"""
     
     __tablename__ = "companies"
+    __table_args__ = (
+        # Keyset pagination (app.core.pagination)
+        Index('ix_companies_created_at_id', 'created_at', 'id'),
+    )
     
     # Basic Information
     name = Column(String(255), nullable=False, index=True)
@@ -148,7 +152,7 @@ class Company(BaseModel):
     notification_settings = relationship("CompanyNotificationSettings", back_populates="company", uselist=False, cascade="all, delete-orphan")
     theme_settings = relationship("CompanyThemeSettings", back_populates="company", uselist=False, cascade="all, delete-orphan")
     admin_settings = relationship("CompanyAdminSettings", back_populates="company", uselist=False, cascade="all, delete-orphan")
-    # scheduling_settings = relationship("SchedulingSettings", back_populates="company", uselist=False, cascade="all, delete-orphan")  # TODO: Implement when SchedulingSettings exists
+    scheduling_settings = relationship("SchedulingSettings", back_populates="company", uselist=False, cascade="all, delete-orphan")
     
     def __init__(self, **kwargs):
         """Initialize company with auto-generated slug"""
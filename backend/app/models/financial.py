@@ -1,7 +1,7 @@
 """
 Financial Models - Sistema Financeiro Completo
 """
-from sqlalchemy import Column, String, Integer, ForeignKey, Text, Boolean, Numeric, DateTime, Enum as SQLEnum, JSON
+from sqlalchemy import Column, String, Integer, ForeignKey, Text, Boolean, Numeric, DateTime, Index, Enum as SQLEnum, JSON
 from sqlalchemy.orm import relationship
 import enum
 
@@ -97,6 +97,10 @@ class FinancialTransaction(BaseModel):
     """Financial Transaction model - Transações financeiras"""
     
     __tablename__ = "financial_transactions"
+    __table_args__ = (
+        # Keyset pagination (app.core.pagination)
+        Index('ix_financial_transactions_company_date_id', 'company_id', 'date', 'id'),
+    )
     
     company_id = Column(Integer, ForeignKey("companies.id", ondelete="CASCADE"), nullable=False, index=True)
     account_id = Column(Integer, ForeignKey("financial_accounts.id", ondelete="SET NULL"), nullable=True)
@@ -0,0 +1,51 @@
+"""
+Tenant Daily Metrics Model - Per-company, per-day rollup backing the dashboard
+"""
+from sqlalchemy import Column, Integer, ForeignKey, Date, Numeric, UniqueConstraint
+
+from app.models.base import BaseModel
+
+
+class TenantDailyMetrics(BaseModel):
+    """
+    Daily aggregates per company, recomputed by app.services.tenant_metrics.
+
+    Each column uses the same date the dashboard groups by:
+    appointments/payments/reviews by created_at, commands and financial
+    transactions by their own `date`.
+    """
+
+    __tablename__ = "tenant_daily_metrics"
+
+    __table_args__ = (
+        UniqueConstraint('company_id', 'day', name='uq_tenant_daily_metrics_company_day'),
+    )
+
+    company_id = Column(Integer, ForeignKey("companies.id", ondelete="CASCADE"), nullable=False, index=True)
+    day = Column(Date, nullable=False)
+
+    # Appointments (by created_at)
+    appointments_total = Column(Integer, nullable=False, default=0)
+    appointments_completed = Column(Integer, nullable=False, default=0)
+    appointments_cancelled = Column(Integer, nullable=False, default=0)
+    distinct_clients = Column(Integer, nullable=False, default=0)  # Clientes distintos no dia
+
+    # Financial transactions (income)
+    revenue_transactions = Column(Numeric(12, 2), nullable=False, default=0)  # Receitas liquidadas
+    income_transactions = Column(Integer, nullable=False, default=0)  # Receitas (qualquer status)
+
+    # Commands
+    commands_total = Column(Integer, nullable=False, default=0)
+    commands_finished = Column(Integer, nullable=False, default=0)
+    revenue_commands = Column(Numeric(12, 2), nullable=False, default=0)  # net_value das finalizadas
+
+    # Payments (by created_at)
+    payments_completed = Column(Numeric(12, 2), nullable=False, default=0)
+    payments_pending = Column(Numeric(12, 2), nullable=False, default=0)
+
+    # Reviews
+    rating_sum = Column(Integer, nullable=False, default=0)
+    rating_count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<TenantDailyMetrics company={self.company_id} day={self.day}>"
@@ -1,11 +1,11 @@
 """
 User Model with Role-based Access Control
 """
-from sqlalchemy import Column, String, Boolean, Integer, ForeignKey, Text, JSON, Enum as SQLEnum
+from sqlalchemy import Column, String, Boolean, Integer, ForeignKey, Text, JSON, Enum as SQLEnum, Index, UniqueConstraint, event
 from sqlalchemy.orm import relationship
 import enum
 
-from app.models.base import BaseModel
+from app.models.base import BaseModel, sync_phone_e164
 
 
 class UserRole(str, enum.Enum):
@@ -44,6 +44,11 @@ class User(BaseModel):
     """User model with multi-tenant support"""
     
     __tablename__ = "users"
+    __table_args__ = (
+        UniqueConstraint('company_id', 'phone_e164', name='uq_users_company_phone_e164'),
+        # Keyset pagination (app.core.pagination)
+        Index('ix_users_created_at_id', 'created_at', 'id'),
+    )
     
     # Company (Tenant) relationship
     # NOTE: company_id is nullable for SaaS admins who don't belong to a specific company
@@ -54,6 +59,7 @@ class User(BaseModel):
     password_hash = Column(String(255), nullable=False)
     full_name = Column(String(255), nullable=False)
     phone = Column(String(20), nullable=True)
+    phone_e164 = Column(String(16), nullable=True)  # Canônico, mantido por sync_phone_e164
     cpf_cnpj = Column(String(20), nullable=True)  # CPF or CNPJ for professionals
     
     # Roles - Two-Layer Architecture
@@ -128,3 +134,10 @@ class User(BaseModel):
     
     def __repr__(self):
         return f"<User {self.email} ({self.role})>"
+
+
+@event.listens_for(User, 'before_insert')
+@event.listens_for(User, 'before_update')
+def normalize_phone(mapper, connection, target):
+    """Keep phone_e164 in sync with phone"""
+    sync_phone_e164(connection, target, 'phone')
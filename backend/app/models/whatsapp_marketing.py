@@ -51,7 +51,7 @@ class WhatsAppProvider(BaseModel):
     api_url = Column(String(500), nullable=False)
     api_key = Column(String(255), nullable=True)
     api_secret = Column(String(255), nullable=True)
-    instance_id = Column(String(255), nullable=True)
+    instance_id = Column(String(255), nullable=True, index=True)  # Roteamento dos webhooks por instância
     
     # Status
     is_active = Column(Boolean, default=False)
@@ -117,6 +117,19 @@ class ClientResponse(ClientBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+class ClientSearchResult(BaseModel):
+    """Schema for client typeahead results (small projection)"""
+    id: int
+    full_name: str
+    nickname: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    cellphone: Optional[str] = None
+    is_active: Optional[bool] = True
+    
+    model_config = ConfigDict(from_attributes=True)
+
+
 class ClientHistory(BaseModel):
     """Schema for client history"""
     appointments: List[dict] = []
@@ -32,7 +32,16 @@ class ProfessionalItem(BaseModel):
 
 class AvailabilityResponse(BaseModel):
     date: str
-    slots: List[str]
+    slots: List[str]  # HH:MM
+    professional_id: Optional[int] = None
+    service_id: Optional[int] = None
+
+class AvailabilityRangeResponse(BaseModel):
+    start_date: str
+    end_date: str
+    professional_id: int
+    service_id: int
+    days: List[AvailabilityResponse]
 
 class CustomerData(BaseModel):
     name: str
@@ -0,0 +1,132 @@
+"""
+Appointment Conflicts - Caminho único de detecção de sobreposição
+
+No PostgreSQL a sobreposição é rejeitada pela própria escrita através da
+constraint appointments_professional_no_overlap (EXCLUDE USING gist sobre
+professional_id + tsrange(start_time, end_time)), o que:
+1. Elimina a consulta prévia de conflito (um round trip a menos)
+2. Continua correto com reservas concorrentes (sem corrida entre check e insert)
+
+A constraint não cobre linhas com overlap_allowed (encaixes forçados, blocos
+de horário movidos e sobreposições legadas marcadas pela migration): novas
+escritas por cima delas continuam barradas pelo check prévio, restrito a
+essas linhas.
+
+Em bancos sem a constraint (SQLite nos testes, ambientes sem a migration)
+o check prévio com consulta cobre todos os agendamentos.
+"""
+from datetime import datetime
+from typing import Optional
+import logging
+
+from fastapi import HTTPException, status
+from sqlalchemy import Select, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.appointment import Appointment
+from app.services.availability_service import BLOCKING_STATUSES
+
+logger = logging.getLogger(__name__)
+
+OVERLAP_CONSTRAINT = "appointments_professional_no_overlap"
+EXCLUSION_VIOLATION = "23P01"
+
+CONFLICT_DETAIL = "Horário não disponível. Profissional já possui compromisso neste horário."
+
+# Resultado da verificação da constraint (uma consulta ao catálogo por processo)
+_constraint_enforced: Optional[bool] = None
+
+
+def has_overlap_constraint(db: Session) -> bool:
+    """Indica se o banco aplica a exclusion constraint de sobreposição"""
+    global _constraint_enforced
+
+    if _constraint_enforced is None:
+        if db.get_bind().dialect.name != "postgresql":
+            _constraint_enforced = False
+        else:
+            try:
+                _constraint_enforced = db.execute(
+                    text("SELECT 1 FROM pg_constraint WHERE conname = :name"),
+                    {"name": OVERLAP_CONSTRAINT}
+                ).first() is not None
+            except Exception as e:
+                logger.warning(f"⚠️ Não foi possível verificar {OVERLAP_CONSTRAINT}: {e}")
+                return False
+        if not _constraint_enforced:
+            logger.info(f"ℹ️ {OVERLAP_CONSTRAINT} ausente: conflitos verificados por consulta")
+
+    return _constraint_enforced
+
+
+def conflicts_query(
+    company_id: int,
+    professional_id: int,
+    start_time: datetime,
+    end_time: datetime,
+    exclude_appointment_id: Optional[int] = None,
+) -> Select:
+    """
+    Agendamentos ativos do profissional que se sobrepõem ao intervalo.
+    
+    Retorna um select() executável tanto em Session quanto em AsyncSession.
+    """
+    query = select(Appointment).filter(
+        Appointment.company_id == company_id,
+        Appointment.professional_id == professional_id,
+        Appointment.status.in_(BLOCKING_STATUSES),
+        Appointment.start_time < end_time,
+        Appointment.end_time > start_time,
+    )
+    if exclude_appointment_id:
+        query = query.filter(Appointment.id != exclude_appointment_id)
+    return query
+
+
+def ensure_no_conflict(
+    db: Session,
+    company_id: int,
+    professional_id: int,
+    start_time: datetime,
+    end_time: datetime,
+    exclude_appointment_id: Optional[int] = None,
+    status_code: int = status.HTTP_409_CONFLICT,
+    detail: str = CONFLICT_DETAIL,
+) -> None:
+    """
+    Check prévio de conflito. Com a constraint, só consulta as linhas que ela
+    não cobre (overlap_allowed); as demais são rejeitadas em commit_appointment().
+    """
+    query = conflicts_query(company_id, professional_id, start_time, end_time, exclude_appointment_id)
+    if has_overlap_constraint(db):
+        query = query.filter(Appointment.overlap_allowed == True)
+
+    conflict = db.scalar(query.limit(1))
+    if conflict:
+        raise HTTPException(status_code=status_code, detail=detail)
+
+
+def is_overlap_violation(error: IntegrityError) -> bool:
+    """Verifica se o IntegrityError veio da exclusion constraint de sobreposição"""
+    orig = getattr(error, "orig", None)
+    if getattr(orig, "pgcode", None) != EXCLUSION_VIOLATION:
+        return False
+    diag = getattr(orig, "diag", None)
+    constraint_name = getattr(diag, "constraint_name", None)
+    return constraint_name in (None, OVERLAP_CONSTRAINT)
+
+
+def commit_appointment(
+    db: Session,
+    status_code: int = status.HTTP_409_CONFLICT,
+    detail: str = CONFLICT_DETAIL,
+) -> None:
+    """Commit que converte violação de sobreposição em HTTPException"""
+    try:
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        if is_overlap_violation(e):
+            raise HTTPException(status_code=status_code, detail=detail)
+        raise
@@ -0,0 +1,467 @@
+"""
+Availability Cache - Ocupação por profissional/dia no Redis
+
+Cada (empresa, profissional, dia) tem uma chave com 288 contadores u8, um por
+tick de 5 minutos. Contadores (em vez de bits simples) permitem remover um
+agendamento sem liberar ticks ainda ocupados por outro sobreposto (encaixes
+com force_overlap, bloqueios).
+
+Fluxo:
+1. Leitura: um pipeline devolve o bitmask de todos os dias pedidos
+2. Miss: AvailabilityService carrega os dias faltantes em uma consulta e a
+   ocupação é gravada com compare-and-set sobre um contador de versão, para
+   não sobrescrever alterações feitas durante a consulta
+3. Escrita em duas fases, para não aplicar duas vezes um delta que uma
+   reconstrução concorrente já leu do banco:
+   - begin_change(), ANTES do commit: avança a versão dos dias tocados e
+     guarda essa versão como ticket
+   - record_change(), DEPOIS do commit: aplica +1/-1 nos ticks do intervalo
+     (script Lua atômico) se a ocupação em cache foi montada antes do
+     ticket; se foi montada depois (pode já conter a escrita), descarta o
+     dia para recálculo. Dias ausentes do cache não são criados
+   - begin_change_sync()/record_change_sync(): as mesmas fases com o cliente
+     Redis síncrono, para escritas feitas em workers Celery
+
+As funções aceitam Session ou AsyncSession; com AsyncSession as consultas do
+AvailabilityService rodam via run_sync, sem bloquear o event loop.
+
+PostgreSQL continua sendo a fonte da verdade: se o Redis estiver indisponível
+tudo cai no cálculo direto no banco, e o TTL limita divergências de escritas
+feitas fora dos caminhos instrumentados (endpoints de agendamento, WhatsApp e
+Calendly). Por isso a ocupação em cache é uma indicação: quem grava confirma
+no banco (ensure_no_conflict e a exclusion constraint).
+"""
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+import logging
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.cache import get_redis, get_sync_redis
+from app.models.appointment import Appointment
+from app.models.company import Company
+from app.models.service import Service
+from app.models.user import User
+from app.services.availability_service import (
+    AvailabilityService,
+    BLOCKING_STATUSES,
+    DEFAULT_SLOT_STEP_MINUTES,
+    MAX_RANGE_DAYS,
+    TICKS_PER_DAY,
+    counters_to_mask,
+    days_touched,
+    mask_is_free,
+    tick_counters,
+    tick_range,
+)
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "availability:occ"
+OCCUPANCY_TTL = 15 * 60  # 15 minutos
+VERSION_TTL = 2 * OCCUPANCY_TTL
+
+# Leitura em blocos de 32 bits (4 contadores por GET) -> 72 operações por dia
+_READ_CHUNK_BITS = 32
+_READ_OPS = TICKS_PER_DAY * 8 // _READ_CHUNK_BITS
+
+# KEYS: [ocupação, versão, versão de montagem] | ARGV: [versão esperada, bytes, ttl]
+_STORE_SCRIPT = """
+local current = redis.call('GET', KEYS[2]) or ''
+if current ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', tonumber(ARGV[3]))
+redis.call('SET', KEYS[3], ARGV[1], 'EX', tonumber(ARGV[3]))
+return 1
+"""
+
+# KEYS: [ocupação, versão, versão de montagem]
+# ARGV: [delta, primeiro tick, último tick (exclusivo), ttl versão, ticket de begin_change]
+_PATCH_SCRIPT = """
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], tonumber(ARGV[4]))
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+local built = tonumber(redis.call('GET', KEYS[3]) or '0') or 0
+local ticket = tonumber(ARGV[5])
+if ticket == nil or built >= ticket then
+    redis.call('DEL', KEYS[1], KEYS[3])
+    return -1
+end
+local ops = {'OVERFLOW', 'SAT'}
+for i = tonumber(ARGV[2]), tonumber(ARGV[3]) - 1 do
+    ops[#ops + 1] = 'INCRBY'
+    ops[#ops + 1] = 'u8'
+    ops[#ops + 1] = '#' .. i
+    ops[#ops + 1] = ARGV[1]
+end
+redis.call('BITFIELD', KEYS[1], unpack(ops))
+return 1
+"""
+
+
+class OccupancySnapshot(NamedTuple):
+    """Intervalo que um agendamento ocupa na agenda do profissional"""
+    company_id: int
+    professional_id: int
+    start_time: datetime
+    end_time: datetime
+
+
+def snapshot(appointment: Appointment) -> Optional[OccupancySnapshot]:
+    """Estado de ocupação de um agendamento (None se não bloqueia a agenda)"""
+    if (
+        appointment is None
+        or not appointment.professional_id
+        or appointment.status not in BLOCKING_STATUSES
+        or not appointment.start_time
+        or not appointment.end_time
+    ):
+        return None
+    return OccupancySnapshot(
+        appointment.company_id,
+        appointment.professional_id,
+        appointment.start_time,
+        appointment.end_time,
+    )
+
+
+async def _run_sync(db: Union[Session, AsyncSession], fn: Callable[[Session], Any]) -> Any:
+    """Executa fn com uma Session síncrona (via run_sync quando db é AsyncSession)"""
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn)
+    return fn(db)
+
+
+def _key(company_id: int, professional_id: int, day: date) -> str:
+    return f"{KEY_PREFIX}:{company_id}:{professional_id}:{day.isoformat()}"
+
+
+def _version_key(company_id: int, professional_id: int, day: date) -> str:
+    return f"{_key(company_id, professional_id, day)}:v"
+
+
+def _built_key(company_id: int, professional_id: int, day: date) -> str:
+    return f"{_key(company_id, professional_id, day)}:b"
+
+
+def _chunks_to_mask(chunks: Sequence[int]) -> int:
+    """Converte os blocos u32 do BITFIELD (big-endian) em bitmask por tick"""
+    mask = 0
+    for chunk_index, chunk in enumerate(chunks):
+        if not chunk:
+            continue
+        for byte_index, count in enumerate(int(chunk).to_bytes(4, "big")):
+            if count:
+                mask |= 1 << (chunk_index * 4 + byte_index)
+    return mask
+
+
+# ========== LEITURA / GRAVAÇÃO ==========
+
+async def read_days(
+    company_id: int,
+    professional_id: int,
+    days: Sequence[date],
+) -> Tuple[Dict[date, int], Dict[date, str]]:
+    """
+    Bitmasks em cache e versões atuais dos dias pedidos (um round trip).
+
+    Returns:
+        (masks, versions) - masks contém apenas os dias presentes no cache
+    """
+    redis = await get_redis()
+    if redis is None or not days:
+        return {}, {}
+
+    try:
+        pipe = redis.pipeline(transaction=False)
+        for day in days:
+            key = _key(company_id, professional_id, day)
+            pipe.exists(key)
+            pipe.execute_command(
+                "BITFIELD", key,
+                *[arg for i in range(_READ_OPS) for arg in ("GET", f"u{_READ_CHUNK_BITS}", f"#{i}")]
+            )
+            pipe.get(_version_key(company_id, professional_id, day))
+        results = await pipe.execute()
+    except Exception as e:
+        logger.error(f"❌ Erro ao ler ocupação do cache: {e}")
+        return {}, {}
+
+    masks: Dict[date, int] = {}
+    versions: Dict[date, str] = {}
+    for index, day in enumerate(days):
+        exists, chunks, version = results[index * 3:index * 3 + 3]
+        versions[day] = version or ""
+        if exists:
+            masks[day] = _chunks_to_mask(chunks)
+    return masks, versions
+
+
+async def store_days(
+    company_id: int,
+    professional_id: int,
+    counters_by_day: Dict[date, bytes],
+    versions: Dict[date, str],
+) -> None:
+    """Grava a ocupação calculada no banco se nenhuma escrita ocorreu nesse meio tempo"""
+    redis = await get_redis()
+    if redis is None or not counters_by_day:
+        return
+
+    try:
+        script = redis.register_script(_STORE_SCRIPT)
+        for day, counters in counters_by_day.items():
+            await script(
+                keys=[
+                    _key(company_id, professional_id, day),
+                    _version_key(company_id, professional_id, day),
+                    _built_key(company_id, professional_id, day),
+                ],
+                args=[versions.get(day, ""), bytes(counters), OCCUPANCY_TTL],
+            )
+    except Exception as e:
+        logger.error(f"❌ Erro ao gravar ocupação no cache: {e}")
+
+
+def _patch_calls(occupancy: OccupancySnapshot, delta: int, tickets: Dict[str, int]):
+    """(chave, KEYS, ARGV) do _PATCH_SCRIPT para cada dia do intervalo"""
+    for day in days_touched(occupancy.start_time, occupancy.end_time):
+        ticks = tick_range(day, occupancy.start_time, occupancy.end_time)
+        if ticks is None:
+            continue
+        key = _key(occupancy.company_id, occupancy.professional_id, day)
+        keys = [
+            key,
+            _version_key(occupancy.company_id, occupancy.professional_id, day),
+            _built_key(occupancy.company_id, occupancy.professional_id, day),
+        ]
+        # Sem ticket (dia fora do begin_change) o script descarta o dia
+        yield key, keys, [delta, ticks[0], ticks[1], VERSION_TTL, tickets.get(key, "")]
+
+
+async def _apply(occupancy: OccupancySnapshot, delta: int, tickets: Dict[str, int]) -> None:
+    redis = await get_redis()
+    if redis is None:
+        return
+
+    script = redis.register_script(_PATCH_SCRIPT)
+    for key, keys, args in _patch_calls(occupancy, delta, tickets):
+        try:
+            await script(keys=keys, args=args)
+        except Exception as e:
+            # Sem o patch o dia ficaria incorreto: descarta para forçar recálculo
+            logger.error(f"❌ Erro ao atualizar ocupação {key}: {e}")
+            try:
+                await redis.delete(key, keys[2])
+            except Exception:
+                pass
+
+
+def _apply_sync(occupancy: OccupancySnapshot, delta: int, tickets: Dict[str, int]) -> None:
+    redis = get_sync_redis()
+    if redis is None:
+        return
+
+    script = redis.register_script(_PATCH_SCRIPT)
+    for key, keys, args in _patch_calls(occupancy, delta, tickets):
+        try:
+            script(keys=keys, args=args)
+        except Exception as e:
+            logger.error(f"❌ Erro ao atualizar ocupação {key}: {e}")
+            try:
+                redis.delete(key, keys[2])
+            except Exception:
+                pass
+
+
+def _version_keys(occupancies: Sequence[Optional[OccupancySnapshot]]) -> Dict[str, str]:
+    """Chave de ocupação -> chave de versão dos dias tocados pelos intervalos"""
+    keys: Dict[str, str] = {}
+    for occupancy in occupancies:
+        if occupancy is None:
+            continue
+        for day in days_touched(occupancy.start_time, occupancy.end_time):
+            key = _key(occupancy.company_id, occupancy.professional_id, day)
+            keys[key] = _version_key(occupancy.company_id, occupancy.professional_id, day)
+    return keys
+
+
+async def begin_change(*occupancies: Optional[OccupancySnapshot]) -> Dict[str, int]:
+    """
+    Primeira fase da escrita: chamar ANTES do commit com os intervalos que a
+    escrita pode alterar (estado anterior e o novo).
+
+    Avança a versão dos dias tocados: reconstruções que leram a versão antiga
+    não gravam, e as montadas a partir daqui são descartadas em record_change.
+
+    Returns:
+        Tickets (chave de ocupação -> versão) para record_change
+    """
+    keys = _version_keys(occupancies)
+    redis = await get_redis()
+    if redis is None or not keys:
+        return {}
+
+    try:
+        pipe = redis.pipeline(transaction=False)
+        for version_key in keys.values():
+            pipe.incr(version_key)
+            pipe.expire(version_key, VERSION_TTL)
+        results = await pipe.execute()
+    except Exception as e:
+        logger.error(f"❌ Erro ao iniciar alteração de ocupação: {e}")
+        return {}
+
+    return {key: int(results[index * 2]) for index, key in enumerate(keys)}
+
+
+def begin_change_sync(*occupancies: Optional[OccupancySnapshot]) -> Dict[str, int]:
+    """begin_change() para código síncrono (tasks Celery, webhooks processados em worker)"""
+    keys = _version_keys(occupancies)
+    redis = get_sync_redis()
+    if redis is None or not keys:
+        return {}
+
+    try:
+        pipe = redis.pipeline(transaction=False)
+        for version_key in keys.values():
+            pipe.incr(version_key)
+            pipe.expire(version_key, VERSION_TTL)
+        results = pipe.execute()
+    except Exception as e:
+        logger.error(f"❌ Erro ao iniciar alteração de ocupação: {e}")
+        return {}
+
+    return {key: int(results[index * 2]) for index, key in enumerate(keys)}
+
+
+def pending_snapshot(appointment: Appointment) -> Optional[OccupancySnapshot]:
+    """
+    snapshot() de um agendamento ainda não gravado: o status default
+    (PENDING) só é atribuído no flush, então status vazio conta como ativo.
+    """
+    if appointment is not None and appointment.status is None:
+        if not appointment.professional_id or not appointment.start_time or not appointment.end_time:
+            return None
+        return OccupancySnapshot(
+            appointment.company_id,
+            appointment.professional_id,
+            appointment.start_time,
+            appointment.end_time,
+        )
+    return snapshot(appointment)
+
+
+async def record_change(
+    before: Optional[OccupancySnapshot],
+    after: Optional[OccupancySnapshot],
+    tickets: Optional[Dict[str, int]] = None,
+) -> None:
+    """
+    Segunda fase: aplica no cache a diferença de ocupação de um agendamento.
+
+    Chamar DEPOIS do commit, com snapshot() do estado anterior e do atual e
+    os tickets de begin_change(); dias sem ticket são descartados do cache.
+    """
+    if before == after:
+        return
+    tickets = tickets or {}
+    if before is not None:
+        await _apply(before, -1, tickets)
+    if after is not None:
+        await _apply(after, 1, tickets)
+
+
+def record_change_sync(
+    before: Optional[OccupancySnapshot],
+    after: Optional[OccupancySnapshot],
+    tickets: Optional[Dict[str, int]] = None,
+) -> None:
+    """record_change() para código síncrono, com os tickets de begin_change_sync()"""
+    if before == after:
+        return
+    tickets = tickets or {}
+    if before is not None:
+        _apply_sync(before, -1, tickets)
+    if after is not None:
+        _apply_sync(after, 1, tickets)
+
+
+# ========== CONSULTAS ==========
+
+async def load_occupancy(
+    db: Union[Session, AsyncSession],
+    company_id: int,
+    professional_id: int,
+    days: Sequence[date],
+) -> Dict[date, int]:
+    """Bitmask de ocupação dos dias pedidos, preenchendo o cache nos misses"""
+    masks, versions = await read_days(company_id, professional_id, days)
+    missing = [day for day in days if day not in masks]
+    if not missing:
+        return masks
+
+    busy_by_day = await _run_sync(
+        db, lambda session: AvailabilityService(session).load_busy_by_day(company_id, professional_id, missing)
+    )
+    counters_by_day = {day: tick_counters(day, busy_by_day[day]) for day in missing}
+    await store_days(company_id, professional_id, counters_by_day, versions)
+
+    for day, counters in counters_by_day.items():
+        masks[day] = counters_to_mask(counters)
+    return masks
+
+
+async def get_slots_for_range(
+    db: Union[Session, AsyncSession],
+    company: Company,
+    professional: User,
+    service: Service,
+    start_date: date,
+    days: int = 1,
+    step_minutes: int = DEFAULT_SLOT_STEP_MINUTES,
+) -> Dict[date, List[datetime]]:
+    """Versão com cache de AvailabilityService.get_slots_for_range"""
+    days = max(1, min(days, MAX_RANGE_DAYS))
+    dates = [start_date + timedelta(days=offset) for offset in range(days)]
+    occupancy = await load_occupancy(db, company.id, professional.id, dates)
+    return await _run_sync(
+        db,
+        lambda session: AvailabilityService(session).get_slots_for_range(
+            company,
+            professional,
+            service,
+            start_date,
+            days=days,
+            step_minutes=step_minutes,
+            occupancy=occupancy,
+        )
+    )
+
+
+async def is_interval_free(
+    db: Union[Session, AsyncSession],
+    company_id: int,
+    professional_id: int,
+    start_time: datetime,
+    end_time: datetime,
+) -> bool:
+    """
+    Verifica se [start_time, end_time) está livre usando os bitmasks.
+
+    O arredondamento para ticks é conservador em relação ao cache, mas uma
+    escrita fora dos caminhos instrumentados só aparece após o OCCUPANCY_TTL:
+    True é uma indicação (a gravação do agendamento confirma no banco);
+    False pede a consulta no banco (para obter os detalhes).
+    """
+    day_list = days_touched(start_time, end_time)
+    occupancy = await load_occupancy(db, company_id, professional_id, day_list)
+    return all(
+        mask_is_free(occupancy.get(day, 0), day, start_time, end_time)
+        for day in day_list
+    )
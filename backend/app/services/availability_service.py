@@ -0,0 +1,579 @@
+"""
+Availability Service - Motor de disponibilidade de horários
+
+Calcula os horários livres de um profissional para um serviço a partir de:
+1. Horário de funcionamento da empresa (Company.business_hours)
+2. Expediente do profissional (User.working_hours)
+3. Exceções de agenda (ProfessionalScheduleOverride)
+4. Duração do serviço (Service.duration_minutes)
+5. Agendamentos e bloqueios existentes (Appointment)
+
+Os agendamentos do período são buscados em UMA consulta (o intervalo inteiro,
+seja um dia ou uma semana) e os horários livres são obtidos com uma varredura
+sobre intervalos ordenados, sem consulta por horário candidato. Quando a
+ocupação do dia já está em cache (availability_cache), cada candidato custa
+uma operação AND sobre o bitmask de ticks de 5 minutos.
+
+Todos os horários são "naive" no fuso da empresa, o mesmo formato gravado em
+Appointment.start_time/end_time (ver apply_company_timezone em appointments.py).
+"""
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import json
+import logging
+
+from sqlalchemy.orm import Session
+
+from app.models.appointment import Appointment, AppointmentStatus
+from app.models.company import Company
+from app.models.professional_schedule_override import ProfessionalScheduleOverride
+from app.models.service import Service
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+Interval = Tuple[datetime, datetime]
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# Status que ocupam a agenda do profissional (mesmo critério dos checks de conflito)
+BLOCKING_STATUSES = [
+    AppointmentStatus.PENDING,
+    AppointmentStatus.CONFIRMED,
+    AppointmentStatus.CHECKED_IN,
+    AppointmentStatus.IN_PROGRESS,
+]
+
+# Expediente usado quando nem empresa nem profissional configuraram horários
+DEFAULT_DAY_HOURS = ("08:00", "18:00")
+
+DEFAULT_SLOT_STEP_MINUTES = 15
+MAX_RANGE_DAYS = 31
+
+# Grade de ocupação: 288 ticks de 5 minutos por dia
+TICK_MINUTES = 5
+TICKS_PER_DAY = 24 * 60 // TICK_MINUTES
+
+
+# ========== HELPERS DE HORÁRIO ==========
+
+def _parse_hhmm(value: Any) -> Optional[time]:
+    """Converte "HH:MM" (ou datetime.time) em time; retorna None se inválido"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, time):
+        return value
+    try:
+        hours, minutes = str(value).split(":")[:2]
+        return time(int(hours), int(minutes))
+    except (ValueError, TypeError):
+        return None
+
+
+def _parse_week_days(value: Any) -> List[str]:
+    """
+    Normaliza ProfessionalScheduleOverride.week_days.
+
+    A coluna é String e pode conter JSON ('["monday"]'), literal de array do
+    PostgreSQL ('{monday,tuesday}') ou já vir como lista.
+    """
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(day).strip().lower() for day in value]
+    try:
+        parsed = json.loads(value)
+        if isinstance(parsed, list):
+            return [str(day).strip().lower() for day in parsed]
+    except (ValueError, TypeError):
+        pass
+    return [day.strip().strip('"').lower() for day in str(value).strip("{}[]").split(",") if day.strip()]
+
+
+def _day_hours(hours_config: Optional[Dict[str, Any]], weekday: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+    """
+    Retorna (configurado, horário do dia).
+
+    configurado=False significa "sem restrição" (JSON não configurado).
+    horário None com configurado=True significa dia fechado.
+    """
+    if not hours_config:
+        return False, None
+
+    hours = hours_config.get(weekday)
+    if not hours or hours.get("closed") or hours.get("enabled") is False:
+        return True, None
+    return True, hours
+
+
+def _window(target_date: date, start: Optional[time], end: Optional[time]) -> Optional[Interval]:
+    if start is None or end is None or end <= start:
+        return None
+    return datetime.combine(target_date, start), datetime.combine(target_date, end)
+
+
+def _break_interval(target_date: date, hours: Dict[str, Any]) -> Optional[Interval]:
+    """Intervalo de pausa do expediente (aceita snake_case e camelCase do frontend)"""
+    start = _parse_hhmm(hours.get("break_start") or hours.get("breakStart"))
+    end = _parse_hhmm(hours.get("break_end") or hours.get("breakEnd"))
+    return _window(target_date, start, end)
+
+
+def _override_for_date(
+    overrides: Sequence[ProfessionalScheduleOverride],
+    target_date: date
+) -> Optional[ProfessionalScheduleOverride]:
+    """Exceção ativa mais recente que cobre a data e o dia da semana"""
+    weekday = WEEKDAYS[target_date.weekday()]
+    matching = [
+        override for override in overrides
+        if override.is_active
+        and override.start_date <= target_date <= override.end_date
+        and weekday in _parse_week_days(override.week_days)
+    ]
+    if not matching:
+        return None
+    return max(matching, key=lambda override: override.id or 0)
+
+
+def working_windows_for_day(
+    target_date: date,
+    business_hours: Optional[Dict[str, Any]],
+    working_hours: Optional[Dict[str, Any]],
+    overrides: Sequence[ProfessionalScheduleOverride] = (),
+) -> Tuple[List[Interval], List[Interval]]:
+    """
+    Calcula as janelas de trabalho e as pausas de um profissional em uma data.
+
+    Returns:
+        (janelas, pausas) - janelas é vazia quando o profissional não atende no dia
+    """
+    weekday = WEEKDAYS[target_date.weekday()]
+    breaks: List[Interval] = []
+
+    # Empresa
+    company_configured, company_hours = _day_hours(business_hours, weekday)
+    if company_configured and company_hours is None:
+        return [], []
+
+    # Profissional: exceção tem prioridade sobre o expediente regular
+    override = _override_for_date(overrides, target_date)
+    if override is not None:
+        if override.start_time is None or override.end_time is None:
+            return [], []
+        professional_window = _window(target_date, override.start_time, override.end_time)
+        pause = _window(target_date, override.break_start_time, override.break_end_time)
+        if pause:
+            breaks.append(pause)
+    else:
+        professional_configured, professional_hours = _day_hours(working_hours, weekday)
+        if professional_configured and professional_hours is None:
+            return [], []
+        professional_window = None
+        if professional_hours:
+            professional_window = _window(
+                target_date,
+                _parse_hhmm(professional_hours.get("start", "00:00")),
+                _parse_hhmm(professional_hours.get("end", "23:59")),
+            )
+            if professional_window is None:
+                return [], []
+            pause = _break_interval(target_date, professional_hours)
+            if pause:
+                breaks.append(pause)
+
+    company_window = None
+    if company_hours:
+        company_window = _window(
+            target_date,
+            _parse_hhmm(company_hours.get("start", "00:00")),
+            _parse_hhmm(company_hours.get("end", "23:59")),
+        )
+        if company_window is None:
+            return [], []
+        pause = _break_interval(target_date, company_hours)
+        if pause:
+            breaks.append(pause)
+
+    if company_window is None and professional_window is None:
+        default_window = _window(target_date, _parse_hhmm(DEFAULT_DAY_HOURS[0]), _parse_hhmm(DEFAULT_DAY_HOURS[1]))
+        return [default_window], breaks
+
+    windows = [w for w in (company_window, professional_window) if w is not None]
+    start = max(w[0] for w in windows)
+    end = min(w[1] for w in windows)
+    if end <= start:
+        return [], []
+    return [(start, end)], breaks
+
+
+def working_minutes_for_day(
+    target_date: date,
+    business_hours: Optional[Dict[str, Any]],
+    working_hours: Optional[Dict[str, Any]],
+    overrides: Sequence[ProfessionalScheduleOverride] = (),
+) -> int:
+    """Minutos de atendimento do profissional na data (janelas menos pausas)"""
+    windows, breaks = working_windows_for_day(target_date, business_hours, working_hours, overrides)
+    minutes = 0
+    for window_start, window_end in windows:
+        minutes += (window_end - window_start) // timedelta(minutes=1)
+        for pause_start, pause_end in merge_intervals(breaks):
+            overlap = min(pause_end, window_end) - max(pause_start, window_start)
+            if overlap > timedelta(0):
+                minutes -= overlap // timedelta(minutes=1)
+    return minutes
+
+
+# ========== VARREDURA DE INTERVALOS ==========
+
+def merge_intervals(intervals: Iterable[Interval]) -> List[Interval]:
+    """Ordena e funde intervalos sobrepostos ou adjacentes"""
+    merged: List[Interval] = []
+    for start, end in sorted(i for i in intervals if i[1] > i[0]):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def compute_free_slots(
+    windows: Sequence[Interval],
+    busy: Sequence[Interval],
+    duration_minutes: int,
+    step_minutes: int = DEFAULT_SLOT_STEP_MINUTES,
+    not_before: Optional[datetime] = None,
+) -> List[datetime]:
+    """
+    Gera os inícios de horários livres em que cabe um serviço de duration_minutes.
+
+    Os candidatos seguem uma grade de step_minutes ancorada no início de cada
+    janela (09:00, 09:15, ...). busy deve estar ordenado e fundido
+    (merge_intervals); cada janela localiza o primeiro bloco relevante por
+    busca binária e percorre os blocos seguintes uma única vez.
+    """
+    if duration_minutes <= 0 or step_minutes <= 0:
+        return []
+
+    duration = timedelta(minutes=duration_minutes)
+    step = timedelta(minutes=step_minutes)
+    busy_ends = [end for _, end in busy]
+    slots: List[datetime] = []
+
+    for window_start, window_end in windows:
+        index = bisect_right(busy_ends, window_start)
+        gap_start = window_start
+
+        while gap_start < window_end:
+            if index < len(busy) and busy[index][0] < window_end:
+                gap_end = min(busy[index][0], window_end)
+                next_start = busy[index][1]
+                index += 1
+            else:
+                gap_end = window_end
+                next_start = window_end
+
+            lower = max(gap_start, not_before) if not_before else gap_start
+            if lower < gap_end:
+                # Primeiro ponto da grade >= lower
+                offset = lower - window_start
+                steps = -(-offset // step)
+                candidate = window_start + steps * step
+                while candidate + duration <= gap_end:
+                    slots.append(candidate)
+                    candidate += step
+
+            gap_start = max(gap_start, next_start)
+
+    return slots
+
+
+# ========== GRADE DE OCUPAÇÃO (TICKS DE 5 MINUTOS) ==========
+
+def tick_range(day: date, start: datetime, end: datetime) -> Optional[Tuple[int, int]]:
+    """
+    Ticks [primeiro, último) ocupados por um intervalo dentro de `day`.
+
+    Arredonda de forma conservadora (início para baixo, fim para cima) e
+    recorta o intervalo ao dia; retorna None se não houver interseção.
+    """
+    day_start = datetime.combine(day, time.min)
+    day_end = day_start + timedelta(days=1)
+    start = max(start, day_start)
+    end = min(end, day_end)
+    if end <= start:
+        return None
+    tick = timedelta(minutes=TICK_MINUTES)
+    first = (start - day_start) // tick
+    last = -(-(end - day_start) // tick)
+    return first, min(last, TICKS_PER_DAY)
+
+
+def days_touched(start: datetime, end: datetime) -> List[date]:
+    """Datas tocadas por um intervalo (agendamentos que cruzam a meia-noite)"""
+    if end <= start:
+        return []
+    last_day = (end - timedelta(microseconds=1)).date()
+    days = []
+    current = start.date()
+    while current <= last_day:
+        days.append(current)
+        current += timedelta(days=1)
+    return days
+
+
+def tick_counters(day: date, intervals: Iterable[Interval]) -> bytearray:
+    """Contador de ocupação por tick (suporta sobreposições, ex.: encaixes)"""
+    counters = bytearray(TICKS_PER_DAY)
+    for start, end in intervals:
+        ticks = tick_range(day, start, end)
+        if ticks is None:
+            continue
+        for index in range(*ticks):
+            if counters[index] < 255:
+                counters[index] += 1
+    return counters
+
+
+def counters_to_mask(counters: Sequence[int]) -> int:
+    """Bitmask de ocupação: bit i ligado se o tick i tem ao menos um agendamento"""
+    mask = 0
+    for index, count in enumerate(counters):
+        if count:
+            mask |= 1 << index
+    return mask
+
+
+def intervals_to_mask(day: date, intervals: Iterable[Interval]) -> int:
+    mask = 0
+    for start, end in intervals:
+        ticks = tick_range(day, start, end)
+        if ticks is not None:
+            mask |= ((1 << (ticks[1] - ticks[0])) - 1) << ticks[0]
+    return mask
+
+
+def mask_is_free(mask: int, day: date, start: datetime, end: datetime) -> bool:
+    """Verifica se [start, end) não toca nenhum tick ocupado do dia"""
+    ticks = tick_range(day, start, end)
+    if ticks is None:
+        return True
+    span = ((1 << (ticks[1] - ticks[0])) - 1) << ticks[0]
+    return mask & span == 0
+
+
+def compute_free_slots_from_mask(
+    day: date,
+    windows: Sequence[Interval],
+    mask: int,
+    duration_minutes: int,
+    step_minutes: int = DEFAULT_SLOT_STEP_MINUTES,
+    not_before: Optional[datetime] = None,
+) -> List[datetime]:
+    """
+    Mesma grade de compute_free_slots, mas cada candidato é testado com uma
+    única operação AND sobre o bitmask do dia (O(horários), sem intervalos).
+    """
+    if duration_minutes <= 0 or step_minutes <= 0:
+        return []
+
+    duration = timedelta(minutes=duration_minutes)
+    step = timedelta(minutes=step_minutes)
+    slots: List[datetime] = []
+
+    for window_start, window_end in windows:
+        candidate = window_start
+        if not_before and candidate < not_before:
+            steps = -(-(not_before - window_start) // step)
+            candidate = window_start + steps * step
+        while candidate + duration <= window_end:
+            if mask_is_free(mask, day, candidate, candidate + duration):
+                slots.append(candidate)
+            candidate += step
+
+    return slots
+
+
+# ========== SERVIÇO ==========
+
+def company_now(company: Company) -> datetime:
+    """Agora no fuso da empresa, naive (mesmo formato dos agendamentos)"""
+    try:
+        from zoneinfo import ZoneInfo
+        return datetime.now(ZoneInfo(company.timezone or "America/Sao_Paulo")).replace(tzinfo=None)
+    except Exception:
+        return datetime.now()
+
+
+class AvailabilityService:
+    """Calcula horários livres de um profissional"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def load_busy_by_day(
+        self,
+        company_id: int,
+        professional_id: int,
+        dates: Sequence[date],
+    ) -> Dict[date, List[Interval]]:
+        """
+        Agendamentos e bloqueios agrupados por data.
+
+        Uma única consulta cobre do primeiro ao último dia pedido.
+        """
+        busy_by_day: Dict[date, List[Interval]] = {day: [] for day in dates}
+        if not dates:
+            return busy_by_day
+
+        range_start = datetime.combine(min(dates), time.min)
+        range_end = datetime.combine(max(dates) + timedelta(days=1), time.min)
+
+        rows = self.db.query(Appointment.start_time, Appointment.end_time).filter(
+            Appointment.company_id == company_id,
+            Appointment.professional_id == professional_id,
+            Appointment.status.in_(BLOCKING_STATUSES),
+            Appointment.start_time < range_end,
+            Appointment.end_time > range_start,
+        ).all()
+
+        for row in rows:
+            for day in days_touched(row.start_time, row.end_time):
+                if day in busy_by_day:
+                    busy_by_day[day].append((row.start_time, row.end_time))
+
+        return busy_by_day
+
+    def _load_overrides(
+        self,
+        company_id: int,
+        professional_id: int,
+        start_date: date,
+        end_date: date,
+    ) -> List[ProfessionalScheduleOverride]:
+        return self.db.query(ProfessionalScheduleOverride).filter(
+            ProfessionalScheduleOverride.company_id == company_id,
+            ProfessionalScheduleOverride.professional_id == professional_id,
+            ProfessionalScheduleOverride.is_active == True,
+            ProfessionalScheduleOverride.start_date <= end_date,
+            ProfessionalScheduleOverride.end_date >= start_date,
+        ).all()
+
+    def get_slots_for_range(
+        self,
+        company: Company,
+        professional: User,
+        service: Service,
+        start_date: date,
+        days: int = 1,
+        step_minutes: int = DEFAULT_SLOT_STEP_MINUTES,
+        not_before: Optional[datetime] = None,
+        occupancy: Optional[Dict[date, int]] = None,
+    ) -> Dict[date, List[datetime]]:
+        """
+        Horários livres para `days` dias a partir de start_date.
+
+        `occupancy` traz bitmasks já conhecidos (ver availability_cache); os
+        dias sem bitmask são resolvidos com uma única consulta de agendamentos.
+        """
+        days = max(1, min(days, MAX_RANGE_DAYS))
+        dates = [start_date + timedelta(days=offset) for offset in range(days)]
+        occupancy = occupancy or {}
+
+        if not_before is None:
+            not_before = company_now(company)
+
+        missing = [day for day in dates if day not in occupancy]
+        busy_by_day = self.load_busy_by_day(company.id, professional.id, missing)
+        overrides = self._load_overrides(company.id, professional.id, dates[0], dates[-1])
+
+        duration = service.duration_minutes or 60
+        result: Dict[date, List[datetime]] = {}
+
+        for target_date in dates:
+            windows, breaks = working_windows_for_day(
+                target_date,
+                company.business_hours,
+                professional.working_hours,
+                overrides,
+            )
+            if not windows:
+                result[target_date] = []
+                continue
+
+            if target_date in occupancy:
+                result[target_date] = compute_free_slots_from_mask(
+                    target_date,
+                    windows,
+                    occupancy[target_date] | intervals_to_mask(target_date, breaks),
+                    duration,
+                    step_minutes=step_minutes,
+                    not_before=not_before,
+                )
+            else:
+                result[target_date] = compute_free_slots(
+                    windows,
+                    merge_intervals(busy_by_day[target_date] + breaks),
+                    duration,
+                    step_minutes=step_minutes,
+                    not_before=not_before,
+                )
+
+        return result
+
+    def get_slots_for_day(
+        self,
+        company: Company,
+        professional: User,
+        service: Service,
+        target_date: date,
+        step_minutes: int = DEFAULT_SLOT_STEP_MINUTES,
+    ) -> List[datetime]:
+        """Horários livres em uma data"""
+        return self.get_slots_for_range(
+            company, professional, service, target_date, days=1, step_minutes=step_minutes
+        )[target_date]
+
+
+def get_available_slots(
+    db: Session,
+    company_id: int,
+    professional_id: int,
+    service_id: Optional[int],
+    days_ahead: int = 7,
+    start_date: Optional[date] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Horários livres dos próximos dias no formato usado pelo WhatsApp
+    ([{"datetime": datetime, "formatted": "dd/mm/YYYY HH:MM"}]).
+    """
+    company = db.query(Company).filter(Company.id == company_id).first()
+    professional = db.query(User).filter(
+        User.id == professional_id,
+        User.company_id == company_id
+    ).first()
+    service = None
+    if service_id:
+        service = db.query(Service).filter(
+            Service.id == service_id,
+            Service.company_id == company_id
+        ).first()
+
+    if not company or not professional or not service:
+        return []
+
+    if start_date is None:
+        start_date = company_now(company).date()
+
+    slots_by_day = AvailabilityService(db).get_slots_for_range(
+        company, professional, service, start_date, days=days_ahead
+    )
+
+    return [
+        {"datetime": slot, "formatted": slot.strftime("%d/%m/%Y %H:%M")}
+        for day in sorted(slots_by_day)
+        for slot in slots_by_day[day]
+    ]
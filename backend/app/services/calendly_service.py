@@ -8,6 +8,7 @@ import hmac
 import hashlib
 from typing import Optional, Dict, List, Any, Tuple
 from datetime import datetime, timedelta, timezone
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 import httpx
 
@@ -23,6 +24,8 @@ from app.models.service import Service
 from app.models.client import Client
 from app.core.config import settings
 from app.core.database import SessionLocal
+from app.services import availability_cache
+from app.services.appointment_conflicts import is_overlap_violation
 
 logger = logging.getLogger(__name__)
 
@@ -325,7 +328,7 @@ class CalendlyService:
         if not integration.can_sync():
             return {"error": "Integration cannot sync"}
         
-        results = {"created": 0, "updated": 0, "errors": 0}
+        results = {"created": 0, "updated": 0, "conflicts": 0, "errors": 0}
         
         # Buscar eventos agendados
         config = integration.sync_config or {}
@@ -354,6 +357,8 @@ class CalendlyService:
                     results["created"] += 1
                 elif result == "updated":
                     results["updated"] += 1
+                elif result == "conflict":
+                    results["conflicts"] += 1
             except Exception as e:
                 logger.error(f"Error processing Calendly event: {e}")
                 results["errors"] += 1
@@ -419,12 +424,14 @@ class CalendlyService:
             ).first()
             
             if appointment:
+                previous_occupancy = availability_cache.snapshot(appointment)
                 appointment.start_time = start_time
                 appointment.end_time = end_time
                 if service_id:
                     appointment.service_id = service_id
                 
-                self.db.commit()
+                if not self._commit_appointment(event_uri, appointment, previous_occupancy):
+                    return "conflict"
                 return "updated"
         
         # Criar novo agendamento
@@ -439,7 +446,8 @@ class CalendlyService:
             client_notes=f"Agendado via Calendly\nEvento: {event_data.get('name')}\nInvitee: {invitee.get('name')} ({invitee.get('email')})"
         )
         self.db.add(appointment)
-        self.db.commit()
+        if not self._commit_appointment(event_uri, appointment):
+            return "conflict"
         
         # Log da sincronização
         sync_log = CalendlySyncLog(
@@ -457,6 +465,33 @@ class CalendlyService:
         
         return "created"
     
+    def _commit_appointment(
+        self,
+        event_uri: Optional[str],
+        appointment: Appointment,
+        previous_occupancy: Optional[availability_cache.OccupancySnapshot] = None
+    ) -> bool:
+        """
+        Commit do agendamento vindo do Calendly. Sobreposição com outro
+        compromisso do profissional (exclusion constraint) não derruba o
+        webhook/sync: o evento é registrado no log e ignorado.
+
+        A ocupação em cache (availability_cache) acompanha a escrita.
+        """
+        tickets = availability_cache.begin_change_sync(
+            previous_occupancy, availability_cache.pending_snapshot(appointment)
+        )
+        try:
+            self.db.commit()
+        except IntegrityError as e:
+            self.db.rollback()
+            if not is_overlap_violation(e):
+                raise
+            logger.warning(f"⚠️ Evento Calendly ignorado por conflito de horário: {event_uri}")
+            return False
+        availability_cache.record_change_sync(previous_occupancy, availability_cache.snapshot(appointment), tickets)
+        return True
+    
     async def _get_or_create_client(
         self, 
         integration: CalendlyIntegration, 
@@ -610,6 +645,7 @@ class CalendlyService:
             ).first()
             
             if appointment:
+                previous_occupancy = availability_cache.snapshot(appointment)
                 appointment.status = AppointmentStatus.CANCELLED
                 appointment.internal_notes = (appointment.internal_notes or "") + f"\nCancelado via Calendly em {datetime.utcnow()}"
                 
@@ -623,7 +659,9 @@ class CalendlyService:
                     calendly_event_uri=event_uri
                 )
                 self.db.add(cancel_log)
+                tickets = availability_cache.begin_change_sync(previous_occupancy)
                 self.db.commit()
+                availability_cache.record_change_sync(previous_occupancy, None, tickets)
                 
                 return {"status": "success", "action": "cancelled", "appointment_id": appointment.id}
         
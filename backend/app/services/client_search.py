@@ -0,0 +1,99 @@
+"""
+Client Search - Busca de clientes para listagem e typeahead da recepção
+
+- Nome: coluna search_name (sem acento, minúscula) com índice de trigramas
+  no PostgreSQL; termos curtos usam prefixo do nome ou de suas palavras
+- Telefone, celular e CPF: prefixo sobre as colunas só com dígitos
+- Email: substring de lower(email) com índice de trigramas no PostgreSQL;
+  termos de nome com 3+ caracteres também procuram no email
+- Ranking: prefixo do nome primeiro, depois similarity() (PostgreSQL) e nome
+"""
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import case, false, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.client import Client
+from app.utils.search_normalizer import normalize_search_text, only_digits
+
+# Abaixo disso o índice de trigramas não ajuda: o nome é buscado por prefixo
+MIN_TRIGRAM_LENGTH = 3
+
+# Colunas devolvidas pelo typeahead (projeção enxuta, sem carregar o modelo)
+TYPEAHEAD_COLUMNS = (
+    Client.id,
+    Client.full_name,
+    Client.nickname,
+    Client.email,
+    Client.phone,
+    Client.cellphone,
+    Client.is_active,
+)
+
+
+def _is_digit_term(term: str) -> bool:
+    # "(11) 98765-4321" e "123.456.789-00" são buscas por número, "Ana 2" não
+    return only_digits(term) is not None and not any(char.isalpha() for char in term)
+
+
+def search_filter(term: str):
+    """Condição WHERE para o termo digitado (None se o termo for vazio)"""
+    term = (term or "").strip()
+    if not term:
+        return None
+
+    email = func.lower(Client.email).contains(term.lower(), autoescape=True)
+    if "@" in term:
+        return email
+
+    if _is_digit_term(term):
+        digits = only_digits(term)
+        return or_(
+            Client.cellphone_digits.startswith(digits),
+            Client.phone_digits.startswith(digits),
+            Client.cpf_digits.startswith(digits),
+        )
+
+    name = normalize_search_text(term)
+    if name is None:
+        # Só marcas de acentuação (ex.: "\u0301"): nada a procurar no nome
+        return false()
+    if len(name) < MIN_TRIGRAM_LENGTH:
+        # Início do nome ou de qualquer palavra dele ("um" encontra "cliente um")
+        return or_(
+            Client.search_name.startswith(name, autoescape=True),
+            Client.search_name.contains(f" {name}", autoescape=True),
+        )
+    return or_(Client.search_name.contains(name, autoescape=True), email)
+
+
+def search_ordering(db: AsyncSession, term: str) -> List[Any]:
+    """Ordenação por relevância do termo (prefixo do nome, similaridade, nome)"""
+    name = normalize_search_text(term)
+    if not name or "@" in term or _is_digit_term(term):
+        return [Client.full_name, Client.id]
+
+    ordering = [case((Client.search_name.startswith(name, autoescape=True), 0), else_=1)]
+    if db.get_bind().dialect.name == "postgresql":
+        ordering.append(func.similarity(Client.search_name, name).desc())
+    return ordering + [Client.full_name, Client.id]
+
+
+async def search_clients(
+    db: AsyncSession,
+    company_id: int,
+    term: str,
+    limit: int = 10,
+    include_inactive: bool = False,
+) -> List[Dict[str, Any]]:
+    """Typeahead: até `limit` clientes da empresa, mais relevantes primeiro"""
+    condition: Optional[Any] = search_filter(term)
+    if condition is None:
+        return []
+
+    query = select(*TYPEAHEAD_COLUMNS).filter(Client.company_id == company_id, condition)
+    if not include_inactive:
+        query = query.filter(Client.is_active.is_(True))
+
+    rows = (await db.execute(query.order_by(*search_ordering(db, term)).limit(limit))).all()
+    return [dict(row._mapping) for row in rows]
@@ -17,6 +17,7 @@ from sqlalchemy.orm import Session
 
 from app.models.user import User, UserRole
 from app.models.client import Client
+from app.utils.whatsapp_sanitizer import phone_to_e164
 
 
 def get_or_create_client_for_user(
@@ -72,10 +73,12 @@ def get_or_create_client_for_user(
             return by_email
     
     # 4. Buscar client com mesmo telefone (se telefone existir)
-    if user.phone:
+    # (phone_e164 só é preenchido no flush; usuário recém-criado ainda não tem)
+    phone_e164 = user.phone_e164 or phone_to_e164(user.phone)
+    if phone_e164:
         by_phone = db.query(Client).filter(
             Client.company_id == user.company_id,
-            Client.cellphone == user.phone,
+            Client.phone_e164 == phone_e164,
             Client.user_id.is_(None)  # Ainda nao vinculado
         ).first()
         
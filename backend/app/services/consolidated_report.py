@@ -0,0 +1,430 @@
+"""
+Consolidated Report - Motor do relatório consolidado (/reports/consolidated)
+
+Cada seção roda em sua própria AsyncSession (conexão separada do pool) e as
+seções executam concorrentemente; o tempo total passa a ser o da seção mais
+lenta, e com streaming cada seção é enviada assim que termina.
+
+Varreduras compartilhadas:
+- Uma única passada agrupada sobre FinancialTransaction (dia, tipo, origem,
+  categoria) no período alimenta despesas e DRE
+- A projeção de faturamento vem do serviço revenue_forecast (em cache até a
+  próxima escrita financeira)
+- As demais seções (maiores despesas, por serviço, por profissional) fazem
+  uma consulta cada
+
+As mesmas seções servem os endpoints avulsos de /reports (despesas, DRE, por
+serviço, por profissional) via ConsolidatedReport.section().
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+from app.core.database import AsyncSessionLocal
+from app.core.tenant_context import bind_tenant_context
+from app.models.command import Command, CommandItem, CommandStatus
+from app.models.commission import Commission
+from app.models.financial import FinancialCategory, FinancialTransaction
+from app.models.review import Review
+from app.models.service import Service
+from app.models.user import User
+from app.services import revenue_forecast
+
+logger = logging.getLogger(__name__)
+
+# Ordem das seções no documento final
+SECTIONS = ("expenses", "financial_results", "revenue_forecast", "by_service", "by_professional")
+
+
+def _float(value: Any) -> float:
+    return float(value or 0)
+
+
+def _as_date(value: Any) -> date:
+    # func.date() devolve date no PostgreSQL e string no SQLite
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+@dataclass
+class _Bucket:
+    """Linha da varredura agrupada de transações"""
+    day: date
+    type: str
+    origin: Optional[str]
+    category: Optional[str]
+    total: Decimal
+    net_total: Decimal
+    count: int
+
+
+class ConsolidatedReport:
+    """Relatório consolidado de uma empresa em [start_date, end_date] (dias inteiros)"""
+
+    def __init__(self, company_id: int, start_date: date, end_date: date, months_ahead: int = 3):
+        self.company_id = company_id
+        self.start_date = start_date
+        self.end_date = end_date
+        self.months_ahead = months_ahead
+
+        self._scan: Optional[asyncio.Task] = None
+
+    # ========== EXECUÇÃO ==========
+
+    async def _in_session(self, fn: Callable[[AsyncSession], Awaitable[Any]]) -> Any:
+        async with AsyncSessionLocal() as db:
+            bind_tenant_context(db, self.company_id)
+            return await fn(db)
+
+    def _transactions_scan(self) -> "asyncio.Task[List[_Bucket]]":
+        # Compartilhada entre despesas e DRE: criada uma única vez
+        if self._scan is None:
+            self._scan = asyncio.ensure_future(self._in_session(self._load_transaction_buckets))
+        return self._scan
+
+    def _section_builders(self) -> Dict[str, Callable[[], Awaitable[Any]]]:
+        return {
+            "expenses": self._expenses,
+            "financial_results": self._financial_results,
+            "revenue_forecast": lambda: self._in_session(
+                lambda db: revenue_forecast.get_revenue_forecast(db, self.company_id, self.months_ahead)
+            ),
+            "by_service": lambda: self._in_session(self._by_service),
+            "by_professional": lambda: self._in_session(self._by_professional),
+        }
+
+    async def section(self, name: str) -> Any:
+        """Uma única seção, no mesmo formato do documento consolidado"""
+        try:
+            return await self._section_builders()[name]()
+        finally:
+            if self._scan is not None:
+                self._scan.cancel()
+
+    async def iter_sections(self) -> AsyncIterator[Tuple[str, Any]]:
+        """(seção, dados) na ordem em que as seções terminam"""
+        tasks = [
+            asyncio.ensure_future(_named(name, build()))
+            for name, build in self._section_builders().items()
+        ]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+        finally:
+            for task in tasks:
+                task.cancel()
+            if self._scan is not None:
+                self._scan.cancel()
+
+    async def build(self) -> Dict[str, Any]:
+        """Documento completo, no mesmo formato de antes"""
+        sections = {name: data async for name, data in self.iter_sections()}
+        return {
+            "period": self.period(),
+            **{name: sections[name] for name in SECTIONS},
+            "generated_at": datetime.now().isoformat()
+        }
+
+    def period(self) -> Dict[str, str]:
+        return {
+            "start_date": self.start_date.isoformat(),
+            "end_date": self.end_date.isoformat()
+        }
+
+    # ========== VARREDURA DE TRANSAÇÕES ==========
+
+    async def _load_transaction_buckets(self, db: AsyncSession) -> List[_Bucket]:
+        day = func.date(FinancialTransaction.date)
+        rows = (await db.execute(select(
+            day.label("day"),
+            FinancialTransaction.type,
+            FinancialTransaction.origin,
+            FinancialCategory.name.label("category"),
+            func.sum(FinancialTransaction.value).label("total"),
+            func.sum(FinancialTransaction.net_value).label("net_total"),
+            func.count(FinancialTransaction.id).label("count")
+        ).outerjoin(
+            FinancialCategory, FinancialCategory.id == FinancialTransaction.category_id
+        ).filter(
+            FinancialTransaction.company_id == self.company_id,
+            FinancialTransaction.date >= datetime.combine(self.start_date, time.min),
+            FinancialTransaction.date < datetime.combine(self.end_date + timedelta(days=1), time.min)
+        ).group_by(
+            day, FinancialTransaction.type, FinancialTransaction.origin, FinancialCategory.name
+        ))).all()
+
+        return [
+            _Bucket(
+                day=_as_date(row.day),
+                type=row.type,
+                origin=row.origin,
+                category=row.category,
+                total=row.total or Decimal(0),
+                net_total=row.net_total or Decimal(0),
+                count=row.count,
+            )
+            for row in rows
+        ]
+
+    # ========== SEÇÕES ==========
+
+    async def _expenses(self) -> Dict[str, Any]:
+        top_expenses_task = asyncio.ensure_future(self._in_session(self._top_expenses))
+        expenses = [b for b in await self._transactions_scan() if b.type == "expense"]
+
+        total_expenses = sum(_float(b.total) for b in expenses)
+
+        def grouped(key: Callable[[_Bucket], Any]) -> Dict[Any, List[float]]:
+            groups: Dict[Any, List[float]] = defaultdict(lambda: [0.0, 0])
+            for bucket in expenses:
+                group = groups[key(bucket)]
+                group[0] += _float(bucket.total)
+                group[1] += bucket.count
+            return groups
+
+        def percentage(total: float) -> float:
+            return (total / total_expenses * 100) if total_expenses > 0 else 0
+
+        by_category = grouped(lambda b: b.category)
+        by_origin = grouped(lambda b: b.origin)
+        by_month = grouped(lambda b: b.day.strftime("%Y-%m"))
+
+        return {
+            "period": self.period(),
+            "total_expenses": float(total_expenses),
+            "by_category": [
+                {"category": category, "total": total, "count": count, "percentage": percentage(total)}
+                for category, (total, count) in by_category.items()
+                if category is not None
+            ],
+            "by_origin": [
+                {"origin": origin, "total": total, "count": count, "percentage": percentage(total)}
+                for origin, (total, count) in by_origin.items()
+            ],
+            "by_month": [
+                {"month": month, "total": total}
+                for month, (total, _) in sorted(by_month.items())
+            ],
+            "top_expenses": await top_expenses_task
+        }
+
+    async def _top_expenses(self, db: AsyncSession) -> List[Dict[str, Any]]:
+        top_expenses = (await db.scalars(select(FinancialTransaction).options(
+            joinedload(FinancialTransaction.category)
+        ).filter(
+            FinancialTransaction.company_id == self.company_id,
+            FinancialTransaction.type == "expense",
+            FinancialTransaction.date >= datetime.combine(self.start_date, time.min),
+            FinancialTransaction.date < datetime.combine(self.end_date + timedelta(days=1), time.min)
+        ).order_by(FinancialTransaction.value.desc()).limit(10))).all()
+
+        return [
+            {
+                "id": exp.id,
+                "description": exp.description,
+                "value": float(exp.value),
+                "date": exp.date.isoformat(),
+                "origin": exp.origin,
+                "category": exp.category.name if exp.category else None
+            }
+            for exp in top_expenses
+        ]
+
+    async def _financial_results(self) -> Dict[str, Any]:
+        buckets = await self._transactions_scan()
+
+        income_by_origin: Dict[Optional[str], List[float]] = defaultdict(lambda: [0.0, 0.0, 0])
+        total_commissions = total_purchases = other_expenses = 0.0
+        by_month: Dict[str, List[float]] = defaultdict(lambda: [0.0, 0.0])
+
+        for bucket in buckets:
+            month = by_month[bucket.day.strftime("%Y-%m")]
+            if bucket.type == "income":
+                item = income_by_origin[bucket.origin]
+                item[0] += _float(bucket.total)
+                item[1] += _float(bucket.net_total)
+                item[2] += bucket.count
+                month[0] += _float(bucket.net_total)
+            elif bucket.type == "expense":
+                month[1] += _float(bucket.total)
+                # Mesma semântica de origin NOT IN (...) no SQL: origem nula não entra
+                if bucket.origin is not None and bucket.origin not in ("commission", "purchase"):
+                    other_expenses += _float(bucket.total)
+
+            # Comissões e compras contam por origem, como no relatório de DRE
+            if bucket.origin == "commission":
+                total_commissions += _float(bucket.total)
+            elif bucket.origin == "purchase":
+                total_purchases += _float(bucket.total)
+
+        total_income_gross = sum(item[0] for item in income_by_origin.values())
+        total_income_net = sum(item[1] for item in income_by_origin.values())
+        total_fees = total_income_gross - total_income_net
+
+        gross_profit = total_income_net - total_commissions
+        operating_profit = gross_profit - total_purchases - other_expenses
+        gross_margin = (gross_profit / total_income_net * 100) if total_income_net > 0 else 0
+        operating_margin = (operating_profit / total_income_net * 100) if total_income_net > 0 else 0
+
+        return {
+            "period": self.period(),
+            "dre": {
+                "receita_bruta": float(total_income_gross),
+                "taxas_gateway": float(total_fees),
+                "receita_liquida": float(total_income_net),
+                "comissoes": float(total_commissions),
+                "lucro_bruto": float(gross_profit),
+                "margem_bruta": float(gross_margin),
+                "compras": float(total_purchases),
+                "outras_despesas": float(other_expenses),
+                "total_despesas_operacionais": float(total_purchases + other_expenses),
+                "lucro_operacional": float(operating_profit),
+                "margem_operacional": float(operating_margin),
+                "lucro_liquido": float(operating_profit)
+            },
+            "income_by_origin": [
+                {
+                    "origin": origin,
+                    "gross": gross,
+                    "net": net,
+                    "fees": gross - net,
+                    "count": count
+                }
+                for origin, (gross, net, count) in income_by_origin.items()
+            ],
+            "by_month": [
+                {
+                    "month": month,
+                    "income": income,
+                    "expense": expense,
+                    "profit": income - expense
+                }
+                for month, (income, expense) in sorted(by_month.items())
+            ]
+        }
+
+    def _commands_in_period(self):
+        return (
+            Command.company_id == self.company_id,
+            Command.date >= datetime.combine(self.start_date, time.min),
+            Command.date < datetime.combine(self.end_date + timedelta(days=1), time.min),
+            Command.status == CommandStatus.FINISHED
+        )
+
+    async def _by_service(self, db: AsyncSession) -> Dict[str, Any]:
+        # CommandItem não tem coluna final_value; o valor do item é total_value
+        results = (await db.execute(select(
+            Service.id.label("service_id"),
+            Service.name.label("service_name"),
+            func.count(CommandItem.id).label("item_count"),
+            func.sum(CommandItem.total_value).label("total_revenue"),
+            func.avg(CommandItem.total_value).label("avg_value")
+        ).join(
+            CommandItem, CommandItem.service_id == Service.id
+        ).join(
+            Command, Command.id == CommandItem.command_id
+        ).filter(
+            *self._commands_in_period()
+        ).group_by(Service.id, Service.name).order_by(func.sum(CommandItem.total_value).desc()))).all()
+
+        total_revenue = sum(_float(r.total_revenue) for r in results)
+
+        return {
+            "period": self.period(),
+            "total_revenue": float(total_revenue),
+            "services": [
+                {
+                    "service_id": r.service_id,
+                    "service_name": r.service_name,
+                    "item_count": r.item_count,
+                    "total_revenue": _float(r.total_revenue),
+                    "avg_value": _float(r.avg_value),
+                    "percentage": (_float(r.total_revenue) / total_revenue * 100) if total_revenue > 0 else 0
+                }
+                for r in results
+            ]
+        }
+
+    async def _by_professional(self, db: AsyncSession) -> Dict[str, Any]:
+        period_start = datetime.combine(self.start_date, time.min)
+        period_end = datetime.combine(self.end_date + timedelta(days=1), time.min)
+
+        # Avaliações e comissões agregadas à parte para não multiplicar o faturamento
+        ratings = select(
+            Review.professional_id,
+            func.avg(Review.rating).label("avg_rating")
+        ).filter(
+            Review.company_id == self.company_id,
+            Review.created_at >= period_start,
+            Review.created_at < period_end
+        ).group_by(Review.professional_id).subquery()
+
+        commissions = select(
+            Commission.professional_id,
+            func.sum(Commission.commission_value).label("total_commission")
+        ).filter(
+            Commission.company_id == self.company_id,
+            Commission.created_at >= period_start,
+            Commission.created_at < period_end
+        ).group_by(Commission.professional_id).subquery()
+
+        commands = select(
+            Command.professional_id,
+            func.count(Command.id).label("command_count"),
+            func.sum(Command.total_value).label("total_revenue"),
+            func.avg(Command.total_value).label("avg_ticket")
+        ).filter(
+            *self._commands_in_period()
+        ).group_by(Command.professional_id).subquery()
+
+        results = (await db.execute(select(
+            User.id.label("professional_id"),
+            User.full_name.label("professional_name"),
+            commands.c.command_count,
+            commands.c.total_revenue,
+            commands.c.avg_ticket,
+            ratings.c.avg_rating,
+            commissions.c.total_commission
+        ).join(
+            commands, commands.c.professional_id == User.id
+        ).outerjoin(
+            ratings, ratings.c.professional_id == User.id
+        ).outerjoin(
+            commissions, commissions.c.professional_id == User.id
+        ).order_by(commands.c.total_revenue.desc()))).all()
+
+        total_revenue = sum(_float(r.total_revenue) for r in results)
+
+        return {
+            "period": self.period(),
+            "total_revenue": float(total_revenue),
+            "professionals": [
+                {
+                    "professional_id": r.professional_id,
+                    "professional_name": r.professional_name,
+                    "command_count": r.command_count,
+                    "total_revenue": _float(r.total_revenue),
+                    "avg_ticket": _float(r.avg_ticket),
+                    "total_commission": _float(r.total_commission),
+                    "avg_rating": float(r.avg_rating) if r.avg_rating else None,
+                    "percentage": (_float(r.total_revenue) / total_revenue * 100) if total_revenue > 0 else 0
+                }
+                for r in results
+            ]
+        }
+
+
+
+async def _named(name: str, coroutine: Awaitable[Any]) -> Tuple[str, Any]:
+    return name, await coroutine
@@ -2,15 +2,17 @@
 Evolution API Service - Integração completa com WhatsApp
 Confirmação, reagendamento e cancelamento de agendamentos via WhatsApp
 """
+import asyncio
 import json
 import logging
 import hashlib
 import hmac
-from typing import Optional, Dict, List, Any, Tuple
+from concurrent.futures import Future
+from typing import Callable, Optional, Dict, List, Any, Tuple
 from datetime import datetime, timedelta
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-import httpx
-import requests
 
 from app.models.appointment import Appointment, AppointmentStatus
 from app.models.user import User
@@ -19,9 +21,23 @@ from app.models.client import Client
 from app.models.company import Company
 from app.core.config import settings
 from app.core.database import SessionLocal
+from app.services import availability_cache
+from app.services.appointment_conflicts import ensure_no_conflict, is_overlap_violation
+from app.services.whatsapp_routing import company_id_for_instance, find_client_by_phone, next_appointment
+from app.services.whatsapp_sender import OutboundMessage, get_whatsapp_sender
 
 logger = logging.getLogger(__name__)
 
+# Recebe o resultado final do envio; roda na thread do WhatsAppSender
+DeliveryCallback = Callable[[Dict[str, Any]], None]
+
+
+def _run_delivery_callback(callback: DeliveryCallback, future: Future) -> None:
+    try:
+        callback(future.result())
+    except Exception as e:
+        logger.error(f"❌ Erro ao finalizar envio WhatsApp: {e}")
+
 
 class EvolutionAPIService:
     """
@@ -34,13 +50,8 @@ class EvolutionAPIService:
         self.instance_name = instance_name or settings.WHATSAPP_INSTANCE_NAME or "default"
         self.api_url = (api_url or settings.WHATSAPP_API_URL or "").rstrip('/')
         self.api_key = api_key or settings.WHATSAPP_API_TOKEN
-    
-    def _get_headers(self) -> Dict[str, str]:
-        """Headers para requisições à Evolution API"""
-        return {
-            "Content-Type": "application/json",
-            "apikey": self.api_key
-        }
+        # Envios enfileirados por esta instância do serviço (ver wait_pending)
+        self.pending: List[Future] = []
     
     def _format_phone(self, phone: str) -> str:
         """Formata número de telefone para padrão WhatsApp"""
@@ -59,51 +70,76 @@ class EvolutionAPIService:
     # =========================================================================
     # Métodos de Envio de Mensagens
     # =========================================================================
+    # Os envios vão para a fila do WhatsAppSender (pool HTTP por instância,
+    # limite de taxa e retry) e retornam na hora com status "queued"; o
+    # resultado real fica em self.pending para quem precisar esperar, e
+    # on_done (log, marcação do agendamento) roda quando ele chega.
     
-    def send_text_message(self, phone: str, message: str) -> Dict[str, Any]:
+    def _message(
+        self,
+        path: str,
+        payload: Optional[Dict[str, Any]] = None,
+        method: str = "POST",
+        fallback: Optional[OutboundMessage] = None
+    ) -> OutboundMessage:
+        return OutboundMessage(
+            api_url=self.api_url,
+            api_key=self.api_key,
+            instance=self.instance_name,
+            path=path,
+            payload=payload,
+            method=method,
+            fallback=fallback
+        )
+    
+    def _text_payload(self, phone: str, message: str) -> OutboundMessage:
+        return self._message(
+            f"/message/sendText/{self.instance_name}",
+            {"number": self._format_phone(phone), "text": message}
+        )
+    
+    def _dispatch(self, message: OutboundMessage, on_done: Optional[DeliveryCallback] = None) -> Dict[str, Any]:
+        """
+        Enfileira o envio sem esperar a resposta da Evolution API
+        
+        "queued" não significa entregue: quem depende do resultado usa
+        on_done (sem self.db, que pertence à requisição/task chamadora).
+        """
+        if not self.api_url:
+            return {"success": False, "status": "error", "error": "Evolution API não configurada"}
+        
+        future = get_whatsapp_sender().submit(message)
+        self.pending.append(future)
+        if on_done is not None:
+            future.add_done_callback(lambda done: _run_delivery_callback(on_done, done))
+        if future.done():
+            # Recusado na entrada (fila cheia)
+            return future.result()
+        return {"success": True, "status": "queued"}
+    
+    async def wait_pending(self) -> List[Dict[str, Any]]:
+        """Resultados dos envios enfileirados por este serviço, na ordem de envio"""
+        pending, self.pending = self.pending, []
+        return list(await asyncio.gather(*(asyncio.wrap_future(future) for future in pending)))
+    
+    def send_text_message(
+        self,
+        phone: str,
+        message: str,
+        on_done: Optional[DeliveryCallback] = None
+    ) -> Dict[str, Any]:
         """
         Envia mensagem de texto simples
         """
-        phone = self._format_phone(phone)
-        
-        endpoint = f"{self.api_url}/message/sendText/{self.instance_name}"
-        
-        payload = {
-            "number": phone,
-            "text": message
-        }
+        return self._dispatch(self._text_payload(phone, message), on_done)
+    
+    def send_text_messages(self, messages: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """
+        Envia um lote de mensagens de texto [(telefone, texto), ...]
         
-        try:
-            response = requests.post(
-                endpoint,
-                json=payload,
-                headers=self._get_headers(),
-                timeout=30
-            )
-            
-            if response.status_code in [200, 201]:
-                data = response.json()
-                return {
-                    "success": True,
-                    "message_id": data.get("key", {}).get("id"),
-                    "status": "sent",
-                    "response": data
-                }
-            else:
-                logger.error(f"Evolution API error: {response.status_code} - {response.text}")
-                return {
-                    "success": False,
-                    "status": "failed",
-                    "error": f"HTTP {response.status_code}: {response.text}"
-                }
-                
-        except Exception as e:
-            logger.error(f"Error sending message: {e}")
-            return {
-                "success": False,
-                "status": "error",
-                "error": str(e)
-            }
+        Os envios saem em paralelo, respeitando o limite de taxa da instância.
+        """
+        return [self.send_text_message(phone, message) for phone, message in messages]
     
     def send_button_message(
         self, 
@@ -111,7 +147,8 @@ class EvolutionAPIService:
         title: str, 
         description: str, 
         buttons: List[Dict[str, str]],
-        footer: str = None
+        footer: str = None,
+        on_done: Optional[DeliveryCallback] = None
     ) -> Dict[str, Any]:
         """
         Envia mensagem com botões interativos
@@ -122,13 +159,10 @@ class EvolutionAPIService:
             description: Descrição/corpo da mensagem
             buttons: Lista de botões [{"buttonId": "id", "buttonText": {"displayText": "Texto"}}]
             footer: Rodapé opcional
+            on_done: Chamado com o resultado final do envio
         """
-        phone = self._format_phone(phone)
-        
-        endpoint = f"{self.api_url}/message/sendButtons/{self.instance_name}"
-        
         payload = {
-            "number": phone,
+            "number": self._format_phone(phone),
             "title": title,
             "description": description,
             "buttons": buttons
@@ -137,30 +171,12 @@ class EvolutionAPIService:
         if footer:
             payload["footer"] = footer
         
-        try:
-            response = requests.post(
-                endpoint,
-                json=payload,
-                headers=self._get_headers(),
-                timeout=30
-            )
-            
-            if response.status_code in [200, 201]:
-                data = response.json()
-                return {
-                    "success": True,
-                    "message_id": data.get("key", {}).get("id"),
-                    "status": "sent",
-                    "response": data
-                }
-            else:
-                # Fallback para mensagem de texto se botões não suportados
-                logger.warning(f"Buttons not supported, falling back to text message")
-                return self._send_confirmation_text_fallback(phone, title, description, buttons)
-                
-        except Exception as e:
-            logger.error(f"Error sending button message: {e}")
-            return self._send_confirmation_text_fallback(phone, title, description, buttons)
+        # Fallback para mensagem de texto se botões não suportados
+        fallback = self._text_payload(phone, self._confirmation_fallback_text(title, description, buttons))
+        return self._dispatch(
+            self._message(f"/message/sendButtons/{self.instance_name}", payload, fallback=fallback),
+            on_done
+        )
     
     def send_list_message(
         self,
@@ -169,7 +185,8 @@ class EvolutionAPIService:
         description: str,
         button_text: str,
         sections: List[Dict[str, Any]],
-        footer: str = None
+        footer: str = None,
+        fallback_text: str = None
     ) -> Dict[str, Any]:
         """
         Envia mensagem com lista de opções
@@ -181,13 +198,10 @@ class EvolutionAPIService:
             button_text: Texto do botão para abrir lista
             sections: Seções com opções
             footer: Rodapé opcional
+            fallback_text: Texto enviado se a instância recusar listas
         """
-        phone = self._format_phone(phone)
-        
-        endpoint = f"{self.api_url}/message/sendList/{self.instance_name}"
-        
         payload = {
-            "number": phone,
+            "number": self._format_phone(phone),
             "title": title,
             "description": description,
             "buttonText": button_text,
@@ -197,58 +211,39 @@ class EvolutionAPIService:
         if footer:
             payload["footer"] = footer
         
-        try:
-            response = requests.post(
-                endpoint,
-                json=payload,
-                headers=self._get_headers(),
-                timeout=30
-            )
-            
-            if response.status_code in [200, 201]:
-                data = response.json()
-                return {
-                    "success": True,
-                    "message_id": data.get("key", {}).get("id"),
-                    "status": "sent",
-                    "response": data
-                }
-            else:
-                logger.error(f"List message error: {response.status_code}")
-                return {
-                    "success": False,
-                    "status": "failed",
-                    "error": f"HTTP {response.status_code}"
-                }
-                
-        except Exception as e:
-            logger.error(f"Error sending list message: {e}")
-            return {"success": False, "status": "error", "error": str(e)}
+        fallback = self._text_payload(phone, fallback_text) if fallback_text else None
+        return self._dispatch(
+            self._message(f"/message/sendList/{self.instance_name}", payload, fallback=fallback)
+        )
     
-    def _send_confirmation_text_fallback(
+    def _confirmation_fallback_text(
         self, 
-        phone: str, 
         title: str, 
         description: str, 
         buttons: List[Dict]
-    ) -> Dict[str, Any]:
-        """Fallback para texto quando botões não são suportados"""
+    ) -> str:
+        """Texto usado quando botões não são suportados"""
         options_text = "\n".join([
             f"*{i+1}* - {btn.get('buttonText', {}).get('displayText', btn.get('text', ''))}"
             for i, btn in enumerate(buttons)
         ])
         
-        message = f"*{title}*\n\n{description}\n\n{options_text}\n\n_Responda com o número da opção desejada_"
-        
-        return self.send_text_message(phone, message)
+        return f"*{title}*\n\n{description}\n\n{options_text}\n\n_Responda com o número da opção desejada_"
     
     # =========================================================================
     # Confirmação de Agendamento
     # =========================================================================
     
-    def send_appointment_confirmation_request(self, appointment: Appointment) -> Dict[str, Any]:
+    def send_appointment_confirmation_request(
+        self,
+        appointment: Appointment,
+        on_sent: Optional[Callable[[], None]] = None
+    ) -> Dict[str, Any]:
         """
         Envia solicitação de confirmação de agendamento via WhatsApp
+        
+        on_sent é chamado (na thread do sender) só se a mensagem for aceita
+        pela Evolution API; o retorno imediato é apenas "queued".
         """
         # Buscar dados relacionados
         client = self.db.query(Client).filter(Client.id == appointment.client_crm_id).first()
@@ -295,29 +290,26 @@ class EvolutionAPIService:
         
         footer = f"Agendamento #{appointment.id}"
         
-        result = self.send_button_message(
+        # Log (e on_sent) só quando a Evolution API responder
+        return self.send_button_message(
             phone=client.cellphone,
             title=title,
             description=description,
             buttons=buttons,
-            footer=footer
+            footer=footer,
+            on_done=self._delivery_logger(appointment.id, "confirmation_request", client.cellphone, on_sent)
         )
-        
-        # Registrar envio
-        if result.get("success"):
-            self._log_whatsapp_message(
-                appointment_id=appointment.id,
-                message_type="confirmation_request",
-                phone=client.cellphone,
-                status="sent",
-                message_id=result.get("message_id")
-            )
-        
-        return result
     
-    def send_appointment_reminder(self, appointment: Appointment, hours_before: int = 24) -> Dict[str, Any]:
+    def send_appointment_reminder(
+        self,
+        appointment: Appointment,
+        hours_before: int = 24,
+        on_sent: Optional[Callable[[], None]] = None
+    ) -> Dict[str, Any]:
         """
         Envia lembrete de agendamento via WhatsApp
+        
+        on_sent: como em send_appointment_confirmation_request
         """
         client = self.db.query(Client).filter(Client.id == appointment.client_crm_id).first()
         service = self.db.query(Service).filter(Service.id == appointment.service_id).first()
@@ -353,18 +345,8 @@ class EvolutionAPIService:
             f"_Agendamento #{appointment.id}_"
         )
         
-        result = self.send_text_message(client.cellphone, message)
-        
-        if result.get("success"):
-            self._log_whatsapp_message(
-                appointment_id=appointment.id,
-                message_type=f"reminder_{hours_before}h",
-                phone=client.cellphone,
-                status="sent",
-                message_id=result.get("message_id")
-            )
-        
-        return result
+        # Log (e on_sent) só quando a Evolution API responder
+        return self.send_text_message(client.cellphone, message, on_done=self._delivery_logger(appointment.id, f"reminder_{hours_before}h", client.cellphone, on_sent))
     
     # =========================================================================
     # Reagendamento
@@ -418,22 +400,15 @@ class EvolutionAPIService:
             description=description,
             button_text="Ver Horários",
             sections=sections,
-            footer=f"Agendamento #{appointment.id}"
+            footer=f"Agendamento #{appointment.id}",
+            # Fallback para texto se lista não funcionar
+            fallback_text=self._reschedule_fallback_text(available_slots)
         )
         
-        # Fallback para texto se lista não funcionar
-        if not result.get("success"):
-            return self._send_reschedule_text_fallback(client.cellphone, appointment, available_slots)
-        
         return result
     
-    def _send_reschedule_text_fallback(
-        self, 
-        phone: str, 
-        appointment: Appointment, 
-        available_slots: List[Dict]
-    ) -> Dict[str, Any]:
-        """Fallback para texto quando lista não é suportada"""
+    def _reschedule_fallback_text(self, available_slots: List[Dict]) -> str:
+        """Texto usado quando lista não é suportada"""
         slots_text = ""
         for i, slot in enumerate(available_slots[:10], 1):
             date_str = slot["datetime"].strftime("%d/%m/%Y")
@@ -448,7 +423,7 @@ class EvolutionAPIService:
             f"_Responda com o número da opção_"
         )
         
-        return self.send_text_message(phone, message)
+        return message
     
     # =========================================================================
     # Cancelamento
@@ -478,18 +453,8 @@ class EvolutionAPIService:
             f"_Agendamento #{appointment.id}_"
         )
         
-        result = self.send_text_message(client.cellphone, message)
-        
-        if result.get("success"):
-            self._log_whatsapp_message(
-                appointment_id=appointment.id,
-                message_type="cancellation_confirmation",
-                phone=client.cellphone,
-                status="sent",
-                message_id=result.get("message_id")
-            )
-        
-        return result
+        # Log (e on_sent) só quando a Evolution API responder
+        return self.send_text_message(client.cellphone, message, on_done=self._delivery_logger(appointment.id, "cancellation_confirmation", client.cellphone))
     
     def send_cancellation_request(self, appointment: Appointment) -> Dict[str, Any]:
         """
@@ -568,18 +533,8 @@ class EvolutionAPIService:
         
         message += f"\nAguardamos você! 😊\n\n_Agendamento #{appointment.id}_"
         
-        result = self.send_text_message(client.cellphone, message)
-        
-        if result.get("success"):
-            self._log_whatsapp_message(
-                appointment_id=appointment.id,
-                message_type="appointment_confirmed",
-                phone=client.cellphone,
-                status="sent",
-                message_id=result.get("message_id")
-            )
-        
-        return result
+        # Log (e on_sent) só quando a Evolution API responder
+        return self.send_text_message(client.cellphone, message, on_done=self._delivery_logger(appointment.id, "appointment_confirmed", client.cellphone))
     
     def send_appointment_rescheduled(
         self, 
@@ -609,18 +564,8 @@ class EvolutionAPIService:
             f"_Agendamento #{appointment.id}_"
         )
         
-        result = self.send_text_message(client.cellphone, message)
-        
-        if result.get("success"):
-            self._log_whatsapp_message(
-                appointment_id=appointment.id,
-                message_type="appointment_rescheduled",
-                phone=client.cellphone,
-                status="sent",
-                message_id=result.get("message_id")
-            )
-        
-        return result
+        # Log (e on_sent) só quando a Evolution API responder
+        return self.send_text_message(client.cellphone, message, on_done=self._delivery_logger(appointment.id, "appointment_rescheduled", client.cellphone))
     
     # =========================================================================
     # Webhook Handler
@@ -655,7 +600,7 @@ class EvolutionAPIService:
             elif "conversation" in message or "extendedTextMessage" in message:
                 # Mensagem de texto
                 text = message.get("conversation") or message.get("extendedTextMessage", {}).get("text", "")
-                phone = data.get("key", {}).get("remoteJid", "").replace("@s.whatsapp.net", "")
+                phone = data.get("key", {}).get("remoteJid", "")
                 return self._process_text_response(text, phone, payload)
             
             return {"action": "unknown", "message": "Tipo de mensagem não reconhecido"}
@@ -715,20 +660,15 @@ class EvolutionAPIService:
         """Processa resposta de texto (fallback para quando botões não funcionam)"""
         text = text.strip().lower()
         
-        # Buscar último agendamento pendente de confirmação para este telefone
-        client = self.db.query(Client).filter(
-            Client.cellphone.contains(phone[-9:])  # Últimos 9 dígitos
-        ).first()
+        # Remetente -> cliente (E.164 indexado, escopo da empresa dona da instância)
+        company_id = company_id_for_instance(self.db, payload.get("instance"))
+        client = find_client_by_phone(self.db, phone, company_id)
         
         if not client:
             return {"action": "client_not_found", "message": "Cliente não encontrado"}
         
         # Buscar agendamento pendente
-        appointment = self.db.query(Appointment).filter(
-            Appointment.client_crm_id == client.id,
-            Appointment.status.in_([AppointmentStatus.PENDING, AppointmentStatus.CONFIRMED]),
-            Appointment.start_time > datetime.utcnow()
-        ).order_by(Appointment.start_time).first()
+        appointment = next_appointment(self.db, client)
         
         if not appointment:
             return {"action": "no_appointment", "message": "Nenhum agendamento pendente encontrado"}
@@ -821,11 +761,29 @@ class EvolutionAPIService:
         duration = (appointment.end_time - appointment.start_time).total_seconds() / 60
         new_end_time = new_datetime + timedelta(minutes=duration)
         
+        # O horário pode ter sido ocupado depois do envio das opções
+        try:
+            ensure_no_conflict(
+                self.db, appointment.company_id, appointment.professional_id,
+                new_datetime, new_end_time, exclude_appointment_id=appointment.id
+            )
+        except HTTPException:
+            return self._slot_unavailable(appointment)
+        
         # Atualizar agendamento
+        previous_occupancy = availability_cache.snapshot(appointment)
         appointment.start_time = new_datetime
         appointment.end_time = new_end_time
         appointment.status = AppointmentStatus.CONFIRMED
-        self.db.commit()
+        tickets = availability_cache.begin_change_sync(previous_occupancy, availability_cache.snapshot(appointment))
+        try:
+            self.db.commit()
+        except IntegrityError as e:
+            self.db.rollback()
+            if not is_overlap_violation(e):
+                raise
+            return self._slot_unavailable(appointment)
+        availability_cache.record_change_sync(previous_occupancy, availability_cache.snapshot(appointment), tickets)
         
         # Enviar confirmação
         self.send_appointment_rescheduled(appointment, old_datetime)
@@ -837,6 +795,22 @@ class EvolutionAPIService:
             "new_datetime": new_datetime.isoformat()
         }
     
+    def _slot_unavailable(self, appointment: Appointment) -> Dict[str, Any]:
+        """Avisa o cliente que o horário escolhido foi ocupado (agendamento inalterado)"""
+        client = self.db.query(Client).filter(Client.id == appointment.client_crm_id).first()
+        if client and client.cellphone:
+            self.send_text_message(
+                client.cellphone,
+                "😔 Esse horário não está mais disponível. "
+                "Responda *REAGENDAR* para ver novas opções ou entre em contato conosco."
+            )
+        
+        return {
+            "action": "slot_unavailable",
+            "appointment_id": appointment.id,
+            "message": "Horário não está mais disponível"
+        }
+    
     def _handle_cancel_request(self, appointment: Appointment) -> Dict[str, Any]:
         """Processa solicitação de cancelamento"""
         self.send_cancellation_request(appointment)
@@ -848,9 +822,12 @@ class EvolutionAPIService:
     
     def _handle_cancel_confirmation(self, appointment: Appointment) -> Dict[str, Any]:
         """Processa confirmação de cancelamento"""
+        previous_occupancy = availability_cache.snapshot(appointment)
         appointment.status = AppointmentStatus.CANCELLED
         appointment.internal_notes = (appointment.internal_notes or "") + f"\nCancelado via WhatsApp em {datetime.utcnow()}"
+        tickets = availability_cache.begin_change_sync(previous_occupancy)
         self.db.commit()
+        availability_cache.record_change_sync(previous_occupancy, None, tickets)
         
         # Enviar confirmação
         self.send_cancellation_confirmation(appointment)
@@ -881,6 +858,26 @@ class EvolutionAPIService:
     # Logging
     # =========================================================================
     
+    def _delivery_logger(
+        self,
+        appointment_id: int,
+        message_type: str,
+        phone: str,
+        on_sent: Optional[Callable[[], None]] = None
+    ) -> DeliveryCallback:
+        """on_done que registra o resultado real do envio e chama on_sent se deu certo"""
+        def finalize(result: Dict[str, Any]) -> None:
+            self._log_whatsapp_message(
+                appointment_id=appointment_id,
+                message_type=message_type,
+                phone=phone,
+                status="sent" if result.get("success") else "failed",
+                message_id=result.get("message_id")
+            )
+            if result.get("success") and on_sent is not None:
+                on_sent()
+        return finalize
+    
     def _log_whatsapp_message(
         self,
         appointment_id: int,
@@ -889,10 +886,19 @@ class EvolutionAPIService:
         status: str,
         message_id: str = None
     ):
-        """Registra mensagem enviada no banco de dados"""
+        """
+        Registra mensagem enviada no banco de dados
+        
+        Chamado pelo on_done, fora da requisição: usa uma sessão própria.
+        """
         try:
             from app.models.whatsapp_marketing import WhatsAppMessage
-            
+        except ImportError as e:
+            logger.warning(f"Could not log WhatsApp message: {e}")
+            return
+        
+        db = SessionLocal()
+        try:
             log = WhatsAppMessage(
                 appointment_id=appointment_id,
                 message_type=message_type,
@@ -901,28 +907,29 @@ class EvolutionAPIService:
                 external_id=message_id,
                 sent_at=datetime.utcnow()
             )
-            self.db.add(log)
-            self.db.commit()
+            db.add(log)
+            db.commit()
         except Exception as e:
             logger.warning(f"Could not log WhatsApp message: {e}")
+        finally:
+            db.close()
     
     # =========================================================================
     # Utilitários
     # =========================================================================
     
-    def check_connection(self) -> Dict[str, Any]:
+    async def check_connection(self) -> Dict[str, Any]:
         """Verifica conexão com Evolution API"""
-        endpoint = f"{self.api_url}/instance/connectionState/{self.instance_name}"
+        if not self.api_url:
+            return {"connected": False, "status": "error", "message": "Evolution API não configurada"}
+        
+        message = self._message(f"/instance/connectionState/{self.instance_name}", method="GET")
         
         try:
-            response = requests.get(
-                endpoint,
-                headers=self._get_headers(),
-                timeout=10
-            )
+            result = await asyncio.wrap_future(get_whatsapp_sender().submit(message))
             
-            if response.status_code == 200:
-                data = response.json()
+            if result.get("status_code") == 200:
+                data = result["response"]
                 state = data.get("instance", {}).get("state", "unknown")
                 
                 return {
@@ -935,7 +942,7 @@ class EvolutionAPIService:
                 return {
                     "connected": False,
                     "status": "error",
-                    "message": f"HTTP {response.status_code}"
+                    "message": result.get("error")
                 }
                 
         except Exception as e:
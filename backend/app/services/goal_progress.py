@@ -0,0 +1,168 @@
+"""
+Goal Progress - Progresso das metas calculado no banco
+
+O valor atual de cada meta é agregado em SQL (SUM/COUNT) com join na própria
+tabela goals, agrupado por meta: qualquer quantidade de metas custa no máximo
+uma consulta por tipo de fonte (comandas, transações, agendamentos, itens de
+produto), em vez de carregar as linhas no Python meta a meta.
+
+O resultado fica persistido em Goal.current_value/progress_percentage; as
+listagens só leem. Atualização:
+1. Criação/edição da meta e o endpoint /goals/progress/all recalculam na hora
+2. A task refresh_dirty_tenant_metrics recalcula as metas ativas que cobrem
+   os dias sujos (escritas em comandas, transações e agendamentos; estes
+   marcam o dia de criação e também o do atendimento, antigo e novo)
+3. A task reconcile_tenant_metrics recalcula as metas ativas diariamente
+"""
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+import logging
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Session
+
+from app.models.appointment import Appointment, AppointmentStatus
+from app.models.command import Command, CommandItem, CommandItemType, CommandStatus
+from app.models.financial import FinancialTransaction, TransactionStatus, TransactionType
+from app.models.goal import Goal, GoalType
+
+logger = logging.getLogger(__name__)
+
+
+def _in_period(column):
+    return and_(column >= Goal.period_start, column <= Goal.period_end)
+
+
+def _same_professional_or_company(column):
+    # Meta sem profissional = meta da empresa inteira
+    return or_(Goal.professional_id.is_(None), column == Goal.professional_id)
+
+
+def _revenue_by_professional(goal_ids: List[int]):
+    return select(Goal.id, func.sum(Command.net_value)).join(
+        Command,
+        and_(
+            Command.company_id == Goal.company_id,
+            Command.professional_id == Goal.professional_id,
+            Command.status == CommandStatus.FINISHED,
+            _in_period(Command.date),
+        )
+    ).where(Goal.id.in_(goal_ids)).group_by(Goal.id)
+
+
+def _revenue_by_company(goal_ids: List[int]):
+    return select(Goal.id, func.sum(FinancialTransaction.value)).join(
+        FinancialTransaction,
+        and_(
+            FinancialTransaction.company_id == Goal.company_id,
+            FinancialTransaction.type == TransactionType.INCOME,
+            FinancialTransaction.status == TransactionStatus.LIQUIDATED,
+            _in_period(FinancialTransaction.date),
+        )
+    ).where(Goal.id.in_(goal_ids)).group_by(Goal.id)
+
+
+def _completed_appointments(goal_ids: List[int]):
+    return select(Goal.id, func.count(Appointment.id)).join(
+        Appointment,
+        and_(
+            Appointment.company_id == Goal.company_id,
+            _same_professional_or_company(Appointment.professional_id),
+            Appointment.status == AppointmentStatus.COMPLETED,
+            _in_period(Appointment.start_time),
+        )
+    ).where(Goal.id.in_(goal_ids)).group_by(Goal.id)
+
+
+def _product_quantity(goal_ids: List[int]):
+    return select(Goal.id, func.sum(CommandItem.quantity)).join(
+        Command,
+        and_(
+            Command.company_id == Goal.company_id,
+            _same_professional_or_company(Command.professional_id),
+            Command.status == CommandStatus.FINISHED,
+            _in_period(Command.date),
+        )
+    ).join(
+        CommandItem,
+        and_(
+            CommandItem.command_id == Command.id,
+            CommandItem.item_type == CommandItemType.PRODUCT,
+        )
+    ).where(Goal.id.in_(goal_ids)).group_by(Goal.id)
+
+
+def compute_goal_values(db: Session, goals: Iterable[Goal]) -> Dict[int, Decimal]:
+    """
+    Valor atual de cada meta (id -> valor), em consultas agrupadas.
+
+    As metas precisam estar gravadas (o join é feito na tabela goals);
+    tipos sem fonte de dados (SERVICES, OTHER) ficam em 0.
+    """
+    groups: Dict[str, List[int]] = defaultdict(list)
+    values: Dict[int, Decimal] = {}
+
+    for goal in goals:
+        values[goal.id] = Decimal("0")
+        if goal.type == GoalType.REVENUE:
+            groups["revenue_professional" if goal.professional_id else "revenue_company"].append(goal.id)
+        elif goal.type == GoalType.APPOINTMENTS:
+            groups["appointments"].append(goal.id)
+        elif goal.type == GoalType.PRODUCT_SALES:
+            groups["product_sales"].append(goal.id)
+
+    builders = {
+        "revenue_professional": _revenue_by_professional,
+        "revenue_company": _revenue_by_company,
+        "appointments": _completed_appointments,
+        "product_sales": _product_quantity,
+    }
+    for name, goal_ids in groups.items():
+        for goal_id, value in db.execute(builders[name](goal_ids)).all():
+            values[goal_id] = Decimal(str(value or 0))
+
+    return values
+
+
+def progress_percentage(current_value: Decimal, target_value) -> int:
+    """Percentual da meta (0-100)"""
+    target = Decimal(str(target_value or 0))
+    if target <= 0:
+        return 0
+    return min(int(current_value / target * 100), 100)
+
+
+def refresh_goals(db: Session, goals: List[Goal]) -> List[Goal]:
+    """Recalcula e atribui o progresso das metas (o commit fica com o chamador)"""
+    if not goals:
+        return goals
+
+    db.flush()  # Edições pendentes das metas (período, profissional) valem no join
+    values = compute_goal_values(db, goals)
+    for goal in goals:
+        goal.current_value = values[goal.id]
+        goal.progress_percentage = progress_percentage(values[goal.id], goal.target_value)
+    return goals
+
+
+def refresh_company_goals(db: Session, company_id: int, days: Optional[Iterable[date]] = None) -> int:
+    """
+    Recalcula as metas ativas da empresa; com `days`, só as que cobrem algum
+    desses dias (escritas incrementais). Retorna quantas metas foram atualizadas.
+    """
+    query = db.query(Goal).filter(Goal.company_id == company_id, Goal.is_active == True)
+
+    days = sorted(days) if days is not None else None
+    if days is not None:
+        if not days:
+            return 0
+        query = query.filter(
+            Goal.period_start < datetime.combine(days[-1] + timedelta(days=1), time.min),
+            Goal.period_end >= datetime.combine(days[0], time.min)
+        )
+
+    goals = query.all()
+    refresh_goals(db, goals)
+    return len(goals)
@@ -0,0 +1,107 @@
+"""
+Occupancy Service - Ocupação por profissional para o dashboard
+
+Capacidade real de cada profissional no período, a partir do horário da
+empresa, do expediente do profissional e das exceções de agenda
+(working_minutes_for_day), comparada aos minutos agendados.
+
+Custo fixo de quatro consultas por período, independente do número de
+profissionais: empresa, profissionais, exceções e agendamentos.
+"""
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List
+import logging
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.appointment import Appointment, AppointmentStatus
+from app.models.company import Company
+from app.models.professional_schedule_override import ProfessionalScheduleOverride
+from app.models.user import User, UserRole
+from app.services.availability_service import working_minutes_for_day
+
+logger = logging.getLogger(__name__)
+
+# Agendamentos que contam como ocupação no dashboard
+OCCUPANCY_STATUSES = [AppointmentStatus.CONFIRMED, AppointmentStatus.COMPLETED]
+
+
+def occupancy_level(rate: float) -> str:
+    return "high" if rate >= 70 else "moderate" if rate >= 40 else "low"
+
+
+async def get_professional_occupancy(
+    db: AsyncSession,
+    company_id: int,
+    start_day: date,
+    end_day: date,
+) -> List[Dict[str, Any]]:
+    """
+    Ocupação dos profissionais ativos em [start_day, end_day], ordenada pela taxa.
+
+    Minutos agendados são recortados ao período; a capacidade desconta pausas
+    e dias sem atendimento.
+    """
+    range_start = datetime.combine(start_day, time.min)
+    range_end = datetime.combine(end_day + timedelta(days=1), time.min)
+    days = [start_day + timedelta(days=offset) for offset in range((end_day - start_day).days + 1)]
+
+    business_hours = await db.scalar(select(Company.business_hours).filter(Company.id == company_id))
+
+    professionals = (await db.execute(select(User.id, User.full_name, User.working_hours).filter(
+        User.company_id == company_id,
+        User.role == UserRole.PROFESSIONAL,
+        User.is_active == True
+    ))).all()
+    if not professionals:
+        return []
+
+    overrides_by_professional: Dict[int, List[ProfessionalScheduleOverride]] = defaultdict(list)
+    for override in (await db.scalars(select(ProfessionalScheduleOverride).filter(
+        ProfessionalScheduleOverride.company_id == company_id,
+        ProfessionalScheduleOverride.is_active == True,
+        ProfessionalScheduleOverride.start_date <= end_day,
+        ProfessionalScheduleOverride.end_date >= start_day,
+    ))).all():
+        overrides_by_professional[override.professional_id].append(override)
+
+    appointments: Dict[int, int] = defaultdict(int)
+    booked_minutes: Dict[int, int] = defaultdict(int)
+    for row in (await db.execute(select(
+        Appointment.professional_id, Appointment.start_time, Appointment.end_time
+    ).filter(
+        Appointment.company_id == company_id,
+        Appointment.professional_id.isnot(None),
+        Appointment.status.in_(OCCUPANCY_STATUSES),
+        Appointment.start_time < range_end,
+        Appointment.end_time > range_start,
+    ))).all():
+        appointments[row.professional_id] += 1
+        booked = min(row.end_time, range_end) - max(row.start_time, range_start)
+        booked_minutes[row.professional_id] += max(booked // timedelta(minutes=1), 0)
+
+    result = []
+    for professional in professionals:
+        overrides = overrides_by_professional.get(professional.id, [])
+        capacity = sum(
+            working_minutes_for_day(day, business_hours, professional.working_hours, overrides)
+            for day in days
+        )
+        booked = booked_minutes.get(professional.id, 0)
+        occupancy = (booked / capacity * 100) if capacity > 0 else 0
+
+        result.append({
+            "professional_id": professional.id,
+            "professional_name": professional.full_name,
+            "appointments": appointments.get(professional.id, 0),
+            "booked_hours": round(booked / 60, 2),
+            "available_hours": round(capacity / 60, 2),
+            "available_slots": round(capacity / 60, 2),  # compatibilidade: horas disponíveis
+            "occupancy_rate": occupancy,
+            "status": occupancy_level(occupancy)
+        })
+
+    result.sort(key=lambda x: x["occupancy_rate"], reverse=True)
+    return result
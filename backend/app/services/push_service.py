@@ -8,12 +8,22 @@ Funcionalidades:
 - Enviar notificações push para usuários
 - Gerenciar subscriptions
 - Logging completo
+- Fan-out em lotes paralelos (sessão HTTP e cabeçalhos VAPID reaproveitados)
 """
 import json
 import base64
-from typing import Optional, List, Dict, Any
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional, List, Dict, Any, Tuple
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import update
 from sqlalchemy.orm import Session
-from pywebpush import webpush, WebPushException
+from pywebpush import WebPusher
+from py_vapid import Vapid
 from cryptography.hazmat.primitives.asymmetric import ec
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.backends import default_backend
@@ -25,6 +35,44 @@ from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Fan-out: envios simultâneos por processo e tamanho do lote (um commit por lote)
+PUSH_FANOUT_WORKERS = 16
+PUSH_CHUNK_SIZE = 500
+PUSH_TIMEOUT = 10  # segundos por envio
+
+# Cabeçalhos VAPID valem 12h (limite dos push services é 24h); renovados 1h antes
+VAPID_HEADER_TTL = 12 * 3600
+VAPID_RENEW_MARGIN = 3600
+
+# Push services respondem 404/410 para subscriptions que não existem mais
+EXPIRED_STATUS = (404, 410)
+
+_http_session: Optional[requests.Session] = None
+_executor: Optional[ThreadPoolExecutor] = None
+_vapid_caches: Dict[Tuple[str, str], "VAPIDHeaderCache"] = {}
+_lock = threading.Lock()
+
+
+def _get_http_session() -> requests.Session:
+    """Sessão HTTP do processo: keep-alive com cada push service (FCM, Mozilla, Apple)"""
+    global _http_session
+    with _lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=10, pool_maxsize=PUSH_FANOUT_WORKERS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_session = session
+        return _http_session
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PUSH_FANOUT_WORKERS, thread_name_prefix="push-fanout")
+        return _executor
+
 
 class VAPIDKeyManager:
     """
@@ -119,6 +167,49 @@ class VAPIDKeyManager:
         }
 
 
+class VAPIDHeaderCache:
+    """
+    Cabeçalhos VAPID assinados por audiência (origem do push service).
+    
+    A assinatura ES256 é feita uma vez por audiência e reaproveitada até
+    perto do exp, em vez de a cada envio.
+    """
+    
+    def __init__(self, private_key: str, mailto: str, ttl: int = VAPID_HEADER_TTL):
+        self.private_key = private_key
+        self.mailto = mailto
+        self.ttl = ttl
+        self._vapid = None
+        self._headers: Dict[str, Tuple[int, Dict[str, str]]] = {}
+        self._lock = threading.Lock()
+    
+    def headers_for(self, endpoint: str) -> Dict[str, str]:
+        url = urlparse(endpoint)
+        audience = f"{url.scheme}://{url.netloc}"
+        now = time.time()
+        
+        with self._lock:
+            cached = self._headers.get(audience)
+            if cached and cached[0] - VAPID_RENEW_MARGIN > now:
+                return cached[1]
+            
+            if self._vapid is None:
+                self._vapid = Vapid.from_string(private_key=self.private_key)
+            expires_at = int(now) + self.ttl
+            headers = self._vapid.sign({"sub": self.mailto, "aud": audience, "exp": expires_at})
+            self._headers[audience] = (expires_at, headers)
+            return headers
+
+
+def get_vapid_header_cache(vapid_keys: Dict[str, str]) -> VAPIDHeaderCache:
+    """Cache de cabeçalhos compartilhado pelo processo para o par de chaves"""
+    key = (vapid_keys['private_key'], vapid_keys['mailto'])
+    with _lock:
+        if key not in _vapid_caches:
+            _vapid_caches[key] = VAPIDHeaderCache(*key)
+        return _vapid_caches[key]
+
+
 class PushNotificationService:
     """
     Service principal para envio de Web Push Notifications.
@@ -127,6 +218,7 @@ class PushNotificationService:
     def __init__(self, db: Session):
         self.db = db
         self.vapid_keys = VAPIDKeyManager.get_vapid_keys()
+        self.vapid_headers = get_vapid_header_cache(self.vapid_keys)
     
     def get_vapid_public_key(self) -> str:
         """
@@ -247,77 +339,12 @@ class PushNotificationService:
         Returns:
             PushNotificationLog: Log do envio
         """
-        # Preparar payload da notificação
-        notification_payload = {
-            "title": title,
-            "body": body,
-            "url": url or "/",
-            "icon": icon or "/logo.png",
-            "badge": badge,
-            "image": image,
-            "tag": tag,
-            "data": data or {}
-        }
-        
-        # Criar log (antes de enviar)
-        log = PushNotificationLog(
-            company_id=subscription.company_id,
-            user_id=subscription.user_id,
-            subscription_id=subscription.id,
-            title=title,
-            body=body,
-            url=url,
-            icon=icon,
-            badge=badge,
-            image=image,
-            tag=tag,
-            notification_type=notification_type,
-            reference_id=reference_id,
-            reference_type=reference_type,
-            status="sending"
-        )
-        
-        try:
-            # Enviar push notification
-            response = webpush(
-                subscription_info=subscription.subscription_info,
-                data=json.dumps(notification_payload),
-                vapid_private_key=self.vapid_keys['private_key'],
-                vapid_claims={
-                    "sub": self.vapid_keys['mailto']
-                }
-            )
-            
-            # Atualizar log com sucesso
-            log.status = "sent"
-            log.response_status = response.status_code
-            log.response_body = response.text if hasattr(response, 'text') else None
-            
-            # Atualizar last_used_at da subscription
-            subscription.last_used_at = log.sent_at
-            
-            logger.info(f"Push sent successfully to user {subscription.user_id}")
-            
-        except WebPushException as e:
-            # Erro ao enviar
-            log.status = "failed"
-            log.error_message = str(e)
-            log.response_status = e.response.status_code if hasattr(e, 'response') else None
-            
-            # Se subscription expirou (410 Gone), desativar
-            if hasattr(e, 'response') and e.response.status_code == 410:
-                subscription.is_active = False
-                log.status = "expired"
-                logger.warning(f"Push subscription expired for user {subscription.user_id}")
-            
-            logger.error(f"Failed to send push to user {subscription.user_id}: {str(e)}")
-        
-        # Salvar log
-        self.db.add(log)
-        self.db.commit()
-        self.db.refresh(log)
-        
-        return log
+        return self._fan_out(
+            [subscription], title, body,
+            url=url, icon=icon, badge=badge, image=image, tag=tag,
+            notification_type=notification_type, reference_id=reference_id,
+            reference_type=reference_type, data=data
+        )[0]
     
     def send_to_user(
         self,
@@ -340,10 +367,7 @@ class PushNotificationService:
             logger.warning(f"No active subscriptions found for user {user_id}")
             return []
         
-        logs = []
-        for subscription in subscriptions:
-            log = self.send_push(subscription, title, body, **kwargs)
-            logs.append(log)
+        logs = self._fan_out(subscriptions, title, body, **kwargs)
         
         logger.info(f"Sent push to {len(logs)} subscriptions for user {user_id}")
         return logs
@@ -356,13 +380,17 @@ class PushNotificationService:
         **kwargs
     ) -> List[PushNotificationLog]:
         """
-        Envia notificação para múltiplos usuários.
+        Envia notificação para múltiplos usuários (uma consulta, envio em paralelo).
         """
-        all_logs = []
+        if not user_ids:
+            return []
+        
+        subscriptions = self.db.query(UserPushSubscription).filter(
+            UserPushSubscription.user_id.in_(user_ids),
+            UserPushSubscription.is_active == True
+        ).all()
         
-        for user_id in user_ids:
-            logs = self.send_to_user(user_id, title, body, **kwargs)
-            all_logs.extend(logs)
+        all_logs = self._fan_out(subscriptions, title, body, **kwargs)
         
         logger.info(f"Sent push to {len(user_ids)} users, total {len(all_logs)} notifications")
         return all_logs
@@ -403,10 +431,155 @@ class PushNotificationService:
             logger.warning(f"No active subscriptions found for company {company_id}")
             return []
         
-        logs = []
-        for subscription in subscriptions:
-            log = self.send_push(subscription, title, body, **kwargs)
-            logs.append(log)
+        logs = self._fan_out(subscriptions, title, body, **kwargs)
         
         logger.info(f"Sent push to {len(logs)} subscriptions in company {company_id}")
         return logs
+    
+    # =========================================================================
+    # Fan-out
+    # =========================================================================
+    
+    def _deliver(self, subscription_info: Dict[str, Any], data: str) -> Dict[str, Any]:
+        """
+        Envia um push e devolve os campos de resultado do log.
+        
+        Não acessa o banco: roda nas threads do fan-out.
+        """
+        try:
+            headers = self.vapid_headers.headers_for(subscription_info["endpoint"])
+            response = WebPusher(subscription_info, requests_session=_get_http_session()).send(
+                data, dict(headers), timeout=PUSH_TIMEOUT
+            )
+        except Exception as e:
+            return {"status": "failed", "response_status": None, "response_body": None, "error_message": str(e)}
+        
+        if response.status_code <= 202:
+            return {
+                "status": "sent",
+                "response_status": response.status_code,
+                "response_body": response.text or None,
+                "error_message": None
+            }
+        
+        # Subscription que não existe mais no push service: desativar
+        status = "expired" if response.status_code in EXPIRED_STATUS else "failed"
+        return {
+            "status": status,
+            "response_status": response.status_code,
+            "response_body": response.text or None,
+            "error_message": f"Push failed: {response.status_code} {response.reason}"
+        }
+    
+    def _fan_out(
+        self,
+        subscriptions: List[UserPushSubscription],
+        title: str,
+        body: Optional[str] = None,
+        url: Optional[str] = None,
+        icon: Optional[str] = None,
+        badge: Optional[str] = None,
+        image: Optional[str] = None,
+        tag: Optional[str] = None,
+        notification_type: Optional[str] = None,
+        reference_id: Optional[int] = None,
+        reference_type: Optional[str] = None,
+        data: Optional[Dict[str, Any]] = None
+    ) -> List[PushNotificationLog]:
+        """
+        Envia para várias subscriptions em lotes de PUSH_CHUNK_SIZE.
+        
+        Cada lote sai em paralelo (sessão HTTP e cabeçalhos VAPID
+        compartilhados) e é gravado com um commit: logs inseridos juntos,
+        subscriptions expiradas (404/410) desativadas em um único UPDATE.
+        """
+        payload = json.dumps({
+            "title": title,
+            "body": body,
+            "url": url or "/",
+            "icon": icon or "/logo.png",
+            "badge": badge,
+            "image": image,
+            "tag": tag,
+            "data": data or {}
+        })
+        log_fields = {
+            "title": title, "body": body, "url": url, "icon": icon, "badge": badge,
+            "image": image, "tag": tag, "notification_type": notification_type,
+            "reference_id": reference_id, "reference_type": reference_type,
+        }
+        
+        # Cópia dos dados antes do primeiro commit (que expira os objetos da sessão)
+        targets = [
+            (subscription.id, subscription.user_id, subscription.company_id, subscription.subscription_info)
+            for subscription in subscriptions
+        ]
+        
+        logs = []
+        for start in range(0, len(targets), PUSH_CHUNK_SIZE):
+            chunk = targets[start:start + PUSH_CHUNK_SIZE]
+            deliveries = list(_get_executor().map(lambda target: self._deliver(target[3], payload), chunk))
+            logs.extend(self._record_deliveries(chunk, deliveries, log_fields))
+        
+        expired = sum(1 for log in logs if log.status == "expired")
+        failed = sum(1 for log in logs if log.status == "failed")
+        if expired or failed:
+            logger.warning(f"⚠️ Push: {failed} falhas e {expired} subscriptions expiradas desativadas")
+        return logs
+    
+    def _record_deliveries(
+        self,
+        targets: List[Tuple[int, int, int, Dict[str, Any]]],
+        deliveries: List[Dict[str, Any]],
+        log_fields: Dict[str, Any]
+    ) -> List[PushNotificationLog]:
+        """Grava os logs de um lote e atualiza as subscriptions com um commit"""
+        now = datetime.utcnow()
+        rows = [
+            {
+                "company_id": company_id,
+                "user_id": user_id,
+                "subscription_id": subscription_id,
+                "sent_at": now,
+                "created_at": now,
+                "updated_at": now,
+                **log_fields,
+                **delivery
+            }
+            for (subscription_id, user_id, company_id, _), delivery in zip(targets, deliveries)
+        ]
+        # Um INSERT em lote (mesmas colunas em todas as linhas); cada subscription aparece
+        # uma vez por envio, então o id do log é casado pela subscription
+        table = PushNotificationLog.__table__
+        ids = dict(
+            (subscription_id, log_id)
+            for log_id, subscription_id in self.db.execute(
+                table.insert().returning(table.c.id, table.c.subscription_id), rows
+            )
+        )
+        logs = [PushNotificationLog(id=ids[row["subscription_id"]], **row) for row in rows]
+        
+        by_status: Dict[str, List[int]] = {"sent": [], "expired": []}
+        for (subscription_id, *_), delivery in zip(targets, deliveries):
+            if delivery["status"] in by_status:
+                by_status[delivery["status"]].append(subscription_id)
+        
+        if by_status["expired"]:
+            self.db.execute(
+                update(UserPushSubscription)
+                .where(UserPushSubscription.id.in_(by_status["expired"]))
+                .values(is_active=False)
+                .execution_options(synchronize_session=False)
+            )
+        if by_status["sent"]:
+            self.db.execute(
+                update(UserPushSubscription)
+                .where(UserPushSubscription.id.in_(by_status["sent"]))
+                .values(last_used_at=now)
+                .execution_options(synchronize_session=False)
+            )
+        
+        self.db.commit()
+        
+        return logs
+
@@ -0,0 +1,239 @@
+"""
+Revenue Forecast - Projeção de faturamento (/reports/revenue-forecast)
+
+- Histórico dos últimos 6 meses em uma única consulta agrupada por mês
+  (date_trunc no PostgreSQL)
+- Tendência linear ajustada por mínimos quadrados sobre os meses fechados do
+  histórico, no lugar do crescimento fixo de 5% ao mês
+- Resultado em cache por empresa até a próxima escrita financeira
+  (transação, comanda ou assinatura), com TTL de segurança
+"""
+from collections import defaultdict
+from datetime import date, datetime, time
+from typing import Any, Dict, List, Set, Tuple, Union
+import logging
+
+from sqlalchemy import func, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.cache import get_cache, get_redis, get_sync_redis, set_cache
+from app.core.post_commit import register_post_commit
+from app.models.command import Command, CommandStatus
+from app.models.financial import FinancialTransaction
+from app.models.subscription_sale import SubscriptionSale, SubscriptionSaleModel, SubscriptionSaleStatus
+
+logger = logging.getLogger(__name__)
+
+HISTORY_MONTHS = 6
+CACHE_TTL = 3600  # segurança: a invalidação normal vem das escritas financeiras
+
+# Escritas nesses modelos mudam histórico, MRR ou comandas em aberto
+FINANCIAL_SOURCES = (FinancialTransaction, Command, SubscriptionSale)
+
+_SESSION_INFO_KEY = "revenue_forecast_dirty"
+
+
+def cache_key(company_id: int) -> str:
+    return f"reports:revenue-forecast:{company_id}"
+
+
+def _as_date(value: Union[date, datetime, str]) -> date:
+    # date_trunc devolve datetime no PostgreSQL; strftime devolve string no SQLite
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _month_start(day: date, months_back: int = 0) -> date:
+    index = day.year * 12 + day.month - 1 - months_back
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def history_months(today: date, months: int = HISTORY_MONTHS) -> List[date]:
+    """Primeiro dia de cada um dos últimos `months` meses (inclui o atual), do mais antigo ao atual"""
+    return [_month_start(today, offset) for offset in reversed(range(months))]
+
+
+def month_bucket(db: Union[Session, AsyncSession], column):
+    """Início do mês de `column` (date_trunc no PostgreSQL, strftime nos demais)"""
+    if db.get_bind().dialect.name == "postgresql":
+        return func.date_trunc("month", column)
+    return func.strftime("%Y-%m-01", column)
+
+
+def fit_trend(values: List[float]) -> Tuple[float, float]:
+    """
+    Reta de mínimos quadrados (intercepto, inclinação) sobre x = 0..n-1.
+
+    Forma fechada a partir das somas, em uma única passada pelo histórico.
+    """
+    n = len(values)
+    if n == 0:
+        return 0.0, 0.0
+    if n == 1:
+        return float(values[0]), 0.0
+
+    sum_x = n * (n - 1) / 2
+    sum_xx = (n - 1) * n * (2 * n - 1) / 6
+    sum_y = sum(values)
+    sum_xy = sum(x * y for x, y in enumerate(values))
+
+    slope = (n * sum_xy - sum_x * sum_y) / (n * sum_xx - sum_x ** 2)
+    intercept = (sum_y - slope * sum_x) / n
+    return intercept, slope
+
+
+def build_revenue_forecast(
+    historical_months: List[Dict[str, Any]],
+    mrr: float,
+    subscription_count: int,
+    commands_open: float,
+    months_ahead: int,
+    today: date,
+) -> Dict[str, Any]:
+    """Projeção = tendência do histórico + MRR (formato de /reports/revenue-forecast)"""
+    revenues = [m["revenue"] for m in historical_months]
+    avg_historical = sum(revenues) / len(revenues) if revenues else 0
+    # O mês corrente ainda está em andamento: fora do ajuste, para que um
+    # início de mês não puxe a tendência para baixo como se fosse um mês fechado
+    current = today.strftime("%Y-%m")
+    closed = [m["revenue"] for m in historical_months if m["month"] != current]
+    intercept, slope = fit_trend(closed)
+
+    forecast_months = []
+    for i in range(1, months_ahead + 1):
+        # Receita variável não fica negativa mesmo com tendência de queda
+        projected_variable = max(intercept + slope * (len(revenues) - 1 + i), 0.0)
+        forecast_months.append({
+            "month": _month_start(today, -i).strftime("%Y-%m"),
+            "projected_variable": float(projected_variable),
+            "projected_recurring": float(mrr),
+            "projected_total": float(projected_variable + mrr),
+            "type": "forecast"
+        })
+
+    return {
+        "historical": historical_months,
+        "forecast": forecast_months,
+        "metrics": {
+            "avg_historical_revenue": float(avg_historical),
+            "mrr": float(mrr),
+            "active_subscriptions": subscription_count,
+            "commands_open_value": float(commands_open or 0),
+            # Inclinação mensal da tendência em relação à média, em percentual
+            "growth_rate": float(slope / avg_historical * 100) if avg_historical > 0 else 0.0
+        }
+    }
+
+
+async def load_forecast_inputs(db: AsyncSession, company_id: int, today: date) -> Dict[str, Any]:
+    """Histórico mensal, MRR e comandas em aberto: três consultas"""
+    months = history_months(today)
+    month = month_bucket(db, FinancialTransaction.date)
+
+    revenue_by_month: Dict[date, float] = defaultdict(float)
+    for row in (await db.execute(select(
+        month.label("month"),
+        func.sum(FinancialTransaction.value).label("revenue")
+    ).filter(
+        FinancialTransaction.company_id == company_id,
+        FinancialTransaction.type == "income",
+        FinancialTransaction.date >= datetime.combine(months[0], time.min),
+        FinancialTransaction.date < datetime.combine(_month_start(today, -1), time.min)
+    ).group_by(month))).all():
+        revenue_by_month[_as_date(row.month)] += float(row.revenue or 0)
+
+    subscriptions = (await db.execute(select(
+        func.count(SubscriptionSale.id).label("count"),
+        func.sum(SubscriptionSaleModel.monthly_value).label("mrr")
+    ).join(
+        SubscriptionSaleModel, SubscriptionSaleModel.id == SubscriptionSale.model_id
+    ).filter(
+        SubscriptionSale.company_id == company_id,
+        SubscriptionSale.status == SubscriptionSaleStatus.ACTIVE
+    ))).first()
+
+    commands_open = await db.scalar(select(func.sum(Command.total_value)).filter(
+        Command.company_id == company_id,
+        Command.status.in_([CommandStatus.OPEN, CommandStatus.IN_PROGRESS])
+    ))
+
+    return {
+        "historical": [
+            {"month": m.strftime("%Y-%m"), "revenue": revenue_by_month.get(m, 0.0), "type": "historical"}
+            for m in months
+        ],
+        "mrr": float(subscriptions.mrr or 0) if subscriptions else 0.0,
+        "active_subscriptions": subscriptions.count if subscriptions else 0,
+        "commands_open": float(commands_open or 0),
+    }
+
+
+async def get_revenue_forecast(db: AsyncSession, company_id: int, months_ahead: int = 3) -> Dict[str, Any]:
+    """
+    Projeção de faturamento da empresa.
+
+    O cache guarda as entradas do mês corrente; a projeção para qualquer
+    `months_ahead` é montada a partir delas sem novas consultas.
+    """
+    today = datetime.now().date()
+    key = cache_key(company_id)
+
+    inputs = await get_cache(key)
+    if inputs is None or inputs.get("month") != today.strftime("%Y-%m"):
+        inputs = await load_forecast_inputs(db, company_id, today)
+        inputs["month"] = today.strftime("%Y-%m")
+        await set_cache(key, inputs, ttl=CACHE_TTL)
+
+    return build_revenue_forecast(
+        inputs["historical"],
+        inputs["mrr"],
+        inputs["active_subscriptions"],
+        inputs["commands_open"],
+        months_ahead,
+        today,
+    )
+
+
+# ========== INVALIDAÇÃO ==========
+
+async def _invalidate_remote(company_ids: Set[int]) -> None:
+    redis = await get_redis()
+    if redis is None:
+        return
+
+    try:
+        await redis.delete(*(cache_key(company_id) for company_id in company_ids))
+    except Exception as e:
+        logger.error(f"❌ Erro ao invalidar projeção de faturamento: {e}")
+
+
+def invalidate(company_ids: Set[int]) -> None:
+    """Descarta a projeção em cache das empresas (fora do event loop)"""
+    if not company_ids:
+        return
+
+    redis = get_sync_redis()
+    if redis is None:
+        return
+
+    try:
+        redis.delete(*(cache_key(company_id) for company_id in company_ids))
+    except Exception as e:
+        logger.error(f"❌ Erro ao invalidar projeção de faturamento: {e}")
+
+
+def _changed_companies(session: Session) -> Set[int]:
+    companies: Set[int] = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, FINANCIAL_SOURCES):
+            company_id = inspect(obj).dict.get("company_id")
+            if company_id is not None:
+                companies.add(company_id)
+    return companies
+
+
+register_post_commit(_SESSION_INFO_KEY, _changed_companies, _invalidate_remote, invalidate)
@@ -0,0 +1,362 @@
+"""
+Tenant Metrics - Rollup diário por empresa (tenant_daily_metrics)
+
+Os cards do dashboard leem uma linha por dia em vez de agregar as tabelas
+brutas a cada chamada: qualquer período custa O(dias).
+
+Manutenção:
+1. Escritas em Appointment, Command, FinancialTransaction, Payment e Review
+   marcam (empresa, dia) como sujo no Redis após o commit (eventos da Session
+   via app.core.post_commit; dentro do event loop a marcação é agendada no
+   cliente assíncrono)
+2. A task refresh_dirty_tenant_metrics (Celery beat, a cada minuto) recalcula
+   apenas os dias sujos a partir das tabelas brutas
+3. A task reconcile_tenant_metrics recalcula os últimos dias de todas as
+   empresas (cobre escritas feitas com o Redis indisponível) e serve de backfill
+
+O recálculo é idempotente: o dia inteiro é reagregado, nunca incrementado.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Set, Tuple, Union
+import logging
+
+from sqlalchemy import case, delete, event, func, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.cache import get_redis, get_sync_redis
+from app.core.post_commit import register_post_commit
+from app.models.appointment import Appointment, AppointmentStatus
+from app.models.command import Command, CommandStatus
+from app.models.financial import FinancialTransaction
+from app.models.payment import Payment, PaymentStatus
+from app.models.review import Review
+from app.models.tenant_daily_metrics import TenantDailyMetrics
+
+logger = logging.getLogger(__name__)
+
+DIRTY_SET_KEY = "metrics:dirty"
+
+# Modelo -> colunas de data cujos dias uma escrita marca como sujos: a usada
+# pelo dashboard para agrupar por dia e, nos agendamentos, também start_time,
+# que define o período das metas de atendimentos (goal_progress)
+TRACKED_SOURCES = {
+    Appointment: ("created_at", "start_time"),
+    Command: ("date",),
+    FinancialTransaction: ("date",),
+    Payment: ("created_at",),
+    Review: ("created_at",),
+}
+
+METRIC_FIELDS = (
+    "appointments_total",
+    "appointments_completed",
+    "appointments_cancelled",
+    "distinct_clients",
+    "revenue_transactions",
+    "income_transactions",
+    "commands_total",
+    "commands_finished",
+    "revenue_commands",
+    "payments_completed",
+    "payments_pending",
+    "rating_sum",
+    "rating_count",
+)
+
+_SESSION_INFO_KEY = "tenant_metrics_dirty"
+
+
+def _as_date(value: Union[date, datetime, str]) -> date:
+    # func.date() devolve date no PostgreSQL e string no SQLite
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _day_runs(days: Iterable[date]) -> List[Tuple[date, date]]:
+    """Agrupa dias em intervalos contíguos [início, fim]"""
+    runs: List[Tuple[date, date]] = []
+    for day in sorted(set(days)):
+        if runs and day - runs[-1][1] == timedelta(days=1):
+            runs[-1] = (runs[-1][0], day)
+        else:
+            runs.append((day, day))
+    return runs
+
+
+def day_range_bounds(start_day: date, end_day: date) -> Tuple[datetime, datetime]:
+    """Limites [início, fim) em datetime dos dias [start_day, end_day]"""
+    return datetime.combine(start_day, datetime.min.time()), datetime.combine(end_day + timedelta(days=1), datetime.min.time())
+
+
+# ========== RECÁLCULO ==========
+
+def _aggregate_run(db: Session, company_id: int, start_day: date, end_day: date) -> Dict[date, Dict[str, object]]:
+    start, end = day_range_bounds(start_day, end_day)
+    metrics: Dict[date, Dict[str, object]] = defaultdict(dict)
+
+    appointment_day = func.date(Appointment.created_at)
+    for row in db.execute(select(
+        appointment_day.label("day"),
+        func.count(Appointment.id).label("total"),
+        func.sum(case((Appointment.status == AppointmentStatus.COMPLETED, 1), else_=0)).label("completed"),
+        func.sum(case((Appointment.status == AppointmentStatus.CANCELLED, 1), else_=0)).label("cancelled"),
+        func.count(func.distinct(Appointment.client_crm_id)).label("clients"),
+    ).filter(
+        Appointment.company_id == company_id,
+        Appointment.created_at >= start,
+        Appointment.created_at < end,
+    ).group_by(appointment_day)):
+        metrics[_as_date(row.day)].update(
+            appointments_total=row.total,
+            appointments_completed=row.completed or 0,
+            appointments_cancelled=row.cancelled or 0,
+            distinct_clients=row.clients,
+        )
+
+    transaction_day = func.date(FinancialTransaction.date)
+    for row in db.execute(select(
+        transaction_day.label("day"),
+        func.sum(case((FinancialTransaction.status == "liquidated", FinancialTransaction.value), else_=0)).label("revenue"),
+        func.count(FinancialTransaction.id).label("count"),
+    ).filter(
+        FinancialTransaction.company_id == company_id,
+        FinancialTransaction.type == "income",
+        FinancialTransaction.date >= start,
+        FinancialTransaction.date < end,
+    ).group_by(transaction_day)):
+        metrics[_as_date(row.day)].update(
+            revenue_transactions=row.revenue or 0,
+            income_transactions=row.count,
+        )
+
+    command_day = func.date(Command.date)
+    for row in db.execute(select(
+        command_day.label("day"),
+        func.count(Command.id).label("total"),
+        func.sum(case((Command.status == CommandStatus.FINISHED, 1), else_=0)).label("finished"),
+        func.sum(case((Command.status == CommandStatus.FINISHED, Command.net_value), else_=0)).label("revenue"),
+    ).filter(
+        Command.company_id == company_id,
+        Command.date >= start,
+        Command.date < end,
+    ).group_by(command_day)):
+        metrics[_as_date(row.day)].update(
+            commands_total=row.total,
+            commands_finished=row.finished or 0,
+            revenue_commands=row.revenue or 0,
+        )
+
+    payment_day = func.date(Payment.created_at)
+    for row in db.execute(select(
+        payment_day.label("day"),
+        func.sum(case((Payment.status == PaymentStatus.COMPLETED, Payment.amount), else_=0)).label("completed"),
+        func.sum(case((Payment.status == PaymentStatus.PENDING, Payment.amount), else_=0)).label("pending"),
+    ).filter(
+        Payment.company_id == company_id,
+        Payment.created_at >= start,
+        Payment.created_at < end,
+    ).group_by(payment_day)):
+        metrics[_as_date(row.day)].update(
+            payments_completed=row.completed or 0,
+            payments_pending=row.pending or 0,
+        )
+
+    review_day = func.date(Review.created_at)
+    for row in db.execute(select(
+        review_day.label("day"),
+        func.sum(Review.rating).label("rating_sum"),
+        func.count(Review.id).label("rating_count"),
+    ).filter(
+        Review.company_id == company_id,
+        Review.created_at >= start,
+        Review.created_at < end,
+    ).group_by(review_day)):
+        metrics[_as_date(row.day)].update(
+            rating_sum=row.rating_sum or 0,
+            rating_count=row.rating_count,
+        )
+
+    return metrics
+
+
+def recompute_days(db: Session, company_id: int, days: Iterable[date]) -> int:
+    """
+    Reagrega os dias informados da empresa e regrava suas linhas no rollup.
+
+    Dias sem nenhum dado ficam sem linha (lidos como zero). O commit fica a
+    cargo de quem chama.
+
+    Returns:
+        Número de linhas gravadas
+    """
+    written = 0
+
+    for start_day, end_day in _day_runs(days):
+        metrics = _aggregate_run(db, company_id, start_day, end_day)
+
+        db.execute(delete(TenantDailyMetrics).where(
+            TenantDailyMetrics.company_id == company_id,
+            TenantDailyMetrics.day >= start_day,
+            TenantDailyMetrics.day <= end_day,
+        ))
+        for day, values in metrics.items():
+            if start_day <= day <= end_day:
+                db.add(TenantDailyMetrics(company_id=company_id, day=day, **{
+                    name: values.get(name, 0) for name in METRIC_FIELDS
+                }))
+                written += 1
+
+    db.flush()
+    return written
+
+
+def rebuild_range(db: Session, company_id: int, start_day: date, end_day: date) -> int:
+    """Recalcula todos os dias de [start_day, end_day] (backfill/reconciliação)"""
+    return recompute_days(db, company_id, (
+        start_day + timedelta(days=offset) for offset in range((end_day - start_day).days + 1)
+    ))
+
+
+# ========== LEITURA ==========
+
+async def load_daily_metrics(
+    db: AsyncSession,
+    company_id: int,
+    start_day: date,
+    end_day: date,
+) -> Dict[date, TenantDailyMetrics]:
+    """Linhas do rollup no período (inclusive), indexadas por dia"""
+    rows = (await db.scalars(select(TenantDailyMetrics).filter(
+        TenantDailyMetrics.company_id == company_id,
+        TenantDailyMetrics.day >= start_day,
+        TenantDailyMetrics.day <= end_day,
+    ))).all()
+    return {row.day: row for row in rows}
+
+
+def sum_metrics(rows: Iterable[TenantDailyMetrics]) -> Dict[str, Union[int, Decimal]]:
+    """Soma das métricas de várias linhas (zeros quando não há linhas)"""
+    totals: Dict[str, Union[int, Decimal]] = {name: 0 for name in METRIC_FIELDS}
+    for row in rows:
+        for name in METRIC_FIELDS:
+            totals[name] += getattr(row, name) or 0
+    return totals
+
+
+# ========== DIAS SUJOS ==========
+
+def _members(entries: Iterable[Tuple[int, date]]) -> Set[str]:
+    return {f"{company_id}:{day.isoformat()}" for company_id, day in entries}
+
+
+def mark_dirty(entries: Iterable[Tuple[int, date]]) -> None:
+    """Marca (empresa, dia) para recálculo pela task refresh_dirty_tenant_metrics"""
+    members = _members(entries)
+    if not members:
+        return
+
+    redis = get_sync_redis()
+    if redis is None:
+        logger.warning(f"⚠️ Redis indisponível: {len(members)} dia(s) do rollup aguardam a reconciliação")
+        return
+
+    try:
+        redis.sadd(DIRTY_SET_KEY, *members)
+    except Exception as e:
+        logger.error(f"❌ Erro ao marcar dias do rollup como sujos: {e}")
+
+
+async def _mark_dirty_remote(entries: Set[Tuple[int, date]]) -> None:
+    members = _members(entries)
+    redis = await get_redis()
+    if redis is None:
+        logger.warning(f"⚠️ Redis indisponível: {len(members)} dia(s) do rollup aguardam a reconciliação")
+        return
+
+    try:
+        await redis.sadd(DIRTY_SET_KEY, *members)
+    except Exception as e:
+        logger.error(f"❌ Erro ao marcar dias do rollup como sujos: {e}")
+
+
+def pop_dirty_days(limit: int = 500) -> Dict[int, Set[date]]:
+    """Remove até `limit` dias sujos do Redis, agrupados por empresa"""
+    redis = get_sync_redis()
+    if redis is None:
+        return {}
+
+    try:
+        members = redis.spop(DIRTY_SET_KEY, limit) or []
+    except Exception as e:
+        logger.error(f"❌ Erro ao ler dias sujos do rollup: {e}")
+        return {}
+
+    dirty: Dict[int, Set[date]] = defaultdict(set)
+    for member in members:
+        company_id, day = member.split(":", 1)
+        dirty[int(company_id)].add(date.fromisoformat(day))
+    return dirty
+
+
+def _tracked_days(obj, attr: str) -> Set[date]:
+    state = inspect(obj)
+    days: Set[date] = set()
+
+    current = state.dict.get(attr)
+    history = state.attrs[attr].history
+    for value in (current, *history.deleted):
+        if isinstance(value, (date, datetime)):
+            days.add(_as_date(value))
+    return days
+
+
+def _changed_entries(session: Session) -> Set[Tuple[int, date]]:
+    entries: Set[Tuple[int, date]] = set()
+
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        attrs = TRACKED_SOURCES.get(type(obj))
+        if attrs is None:
+            continue
+        company_id = inspect(obj).dict.get("company_id")
+        if company_id is None:
+            continue
+        for attr in attrs:
+            for day in _tracked_days(obj, attr):
+                entries.add((company_id, day))
+
+    return entries
+
+
+def _keep_previous_value(target, value, oldvalue, initiator):
+    return value
+
+
+# active_history carrega o valor antigo da data mesmo com o atributo expirado,
+# para que uma mudança de data marque também o dia de origem
+for _model, _attrs in TRACKED_SOURCES.items():
+    for _attr in _attrs:
+        event.listen(getattr(_model, _attr), "set", _keep_previous_value, retval=True, active_history=True)
+
+
+@event.listens_for(Session, "before_flush")
+def _load_tracked_attributes(session, flush_context, instances):
+    # Instância carregada parcialmente (load_only) ou com atributos expirados:
+    # uma escrita que não toca a data (ex.: só o status) precisa do dia e da
+    # empresa carregados antes do flush, senão after_flush não saberia o dia
+    for obj in (*session.dirty, *session.deleted):
+        attrs = TRACKED_SOURCES.get(type(obj))
+        if attrs is None:
+            continue
+        if inspect(obj).key is None:
+            continue
+        for name in (*attrs, "company_id"):
+            getattr(obj, name)
+
+
+register_post_commit(_SESSION_INFO_KEY, _changed_entries, _mark_dirty_remote, mark_dirty)
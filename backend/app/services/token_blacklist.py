@@ -21,6 +21,15 @@ BLACKLIST_PREFIX = "token:blacklist:"
 LOGIN_ATTEMPTS_PREFIX = "login:attempts:"
 LOGIN_LOCKOUT_PREFIX = "login:lockout:"
 RESET_TOKEN_PREFIX = "password:reset:"
+USER_REVOKED_PREFIX = "user:revoked_at:"
+
+# Revogação global dura mais que qualquer token emitido antes dela
+USER_REVOKED_TTL = 86400 * 30
+
+
+def user_revoked_key(user_id: int) -> str:
+    """Chave com o instante da revogação global (também lida pelo auth cache)"""
+    return f"{USER_REVOKED_PREFIX}{user_id}"
 
 
 async def blacklist_token(token_jti: str, ttl: int = 3600) -> bool:
@@ -66,15 +75,22 @@ async def blacklist_all_user_tokens(user_id: int) -> bool:
     Revoga TODOS os tokens de um usuário.
     Usa um marcador de 'revogação global' com timestamp.
     """
+    import time
+    revoked_at = int(time.time())
+    
+    # Auth cache: get_current_user/get_current_user_context passam a rejeitar
+    # tokens emitidos antes de revoked_at e recarregam a projeção do usuário
+    from app.core import auth_cache
+    await auth_cache.invalidate_user(user_id, revoked_at=revoked_at)
+    
     try:
         redis = await _get_redis_safe()
         if redis is None:
             return False
         
-        import time
-        key = f"user:revoked_at:{user_id}"
+        key = user_revoked_key(user_id)
         # Marca o timestamp atual - qualquer token emitido ANTES disso é inválido
-        await redis.setex(key, 86400 * 30, str(int(time.time())))
+        await redis.setex(key, USER_REVOKED_TTL, str(revoked_at))
         logger.info(f"🔒 Todos os tokens do usuário {user_id} foram revogados")
         return True
     except Exception as e:
@@ -91,7 +107,7 @@ async def is_user_token_revoked(user_id: int, token_iat: int) -> bool:
         if redis is None:
             return False
         
-        key = f"user:revoked_at:{user_id}"
+        key = user_revoked_key(user_id)
         revoked_at = await redis.get(key)
         
         if revoked_at is None:
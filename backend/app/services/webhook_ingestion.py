@@ -0,0 +1,132 @@
+"""
+Webhook Ingestion - Recebimento rápido de webhooks (Evolution API e Calendly)
+
+O endpoint só identifica o evento, descarta repetições e enfileira o payload
+bruto na fila "webhooks" do Celery; consultas, mudanças de status e respostas
+ao cliente acontecem em app.tasks.webhook_tasks. Assim a resposta ao provedor
+sai em poucos milissegundos, independente do trabalho a jusante.
+
+- Dedup: SET NX por id do evento do provedor (id da mensagem, URI do invitee)
+- Ordem: cada conversa (instância + remetente, evento do Calendly) recebe uma
+  sequência no Redis; o worker só processa o evento N depois do N-1, com
+  espera limitada para não travar a conversa se um evento se perder; a
+  sequência de um evento que não chegou a ser enfileirado é registrada como
+  pulada, e o worker não espera por ela
+- Sem Redis o evento é enfileirado mesmo assim, sem dedup e sem ordem
+"""
+import hashlib
+import json
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.core.cache import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Provedores reenviam por até algumas horas; 1 dia cobre com folga
+DEDUP_TTL = 24 * 3600
+
+
+def _payload_hash(payload: Dict[str, Any]) -> str:
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _evolution_keys(payload: Dict[str, Any]) -> Tuple[str, str]:
+    data = payload.get("data") or {}
+    key = data.get("key") or {}
+    instance = payload.get("instance") or ""
+    message_id = key.get("id")
+    event_id = f"{instance}:{message_id}" if message_id else _payload_hash(payload)
+    return event_id, f"{instance}:{key.get('remoteJid') or ''}"
+
+
+def _calendly_keys(payload: Dict[str, Any]) -> Tuple[str, str]:
+    event = payload.get("event") or ""
+    data = payload.get("payload") or {}
+    invitee_uri = data.get("uri")
+    event_id = f"{event}:{invitee_uri}" if invitee_uri else _payload_hash(payload)
+    scheduled_uri = (data.get("scheduled_event") or {}).get("uri")
+    return event_id, scheduled_uri or invitee_uri or event_id
+
+
+# provedor -> (id do evento, chave da conversa)
+PROVIDER_KEYS: Dict[str, Callable[[Dict[str, Any]], Tuple[str, str]]] = {
+    "evolution": _evolution_keys,
+    "whatsapp": _evolution_keys,
+    "calendly": _calendly_keys,
+}
+
+
+def dedup_key(provider: str, event_id: str) -> str:
+    return f"webhook:dedup:{provider}:{event_id}"
+
+
+def sequence_key(provider: str, conversation: str) -> str:
+    return f"webhook:seq:{provider}:{conversation}"
+
+
+def done_key(provider: str, conversation: str) -> str:
+    return f"webhook:done:{provider}:{conversation}"
+
+
+def skipped_key(provider: str, conversation: str) -> str:
+    return f"webhook:skipped:{provider}:{conversation}"
+
+
+async def _reserve(provider: str, event_id: str, conversation: str) -> Tuple[bool, Optional[int]]:
+    """(é novo?, sequência na conversa); sem Redis: (True, None)"""
+    redis = await get_redis()
+    if redis is None:
+        return True, None
+
+    try:
+        if not await redis.set(dedup_key(provider, event_id), 1, nx=True, ex=DEDUP_TTL):
+            return False, None
+        key = sequence_key(provider, conversation)
+        sequence = await redis.incr(key)
+        await redis.expire(key, DEDUP_TTL)
+        return True, sequence
+    except Exception as e:
+        logger.warning(f"⚠️ Redis indisponível no dedup de webhook {provider}: {e}")
+        return True, None
+
+
+async def _release(provider: str, event_id: str, conversation: str, sequence: Optional[int]) -> None:
+    redis = await get_redis()
+    if redis is None:
+        return
+    try:
+        await redis.delete(dedup_key(provider, event_id))
+        if sequence is not None:
+            # A sequência já foi consumida: o reenvio do provedor recebe outra,
+            # e os eventos seguintes da conversa não devem esperar por esta
+            key = skipped_key(provider, conversation)
+            await redis.sadd(key, sequence)
+            await redis.expire(key, DEDUP_TTL)
+    except Exception:
+        pass
+
+
+async def ingest_webhook(provider: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Registra o evento para processamento assíncrono e retorna imediatamente.
+
+    Se o enfileiramento falhar, libera o dedup, marca a sequência como
+    pulada e propaga o erro para o provedor reenviar o webhook.
+    """
+    from app.tasks.webhook_tasks import process_webhook_event
+
+    event_id, conversation = PROVIDER_KEYS[provider](payload)
+    is_new, sequence = await _reserve(provider, event_id, conversation)
+    if not is_new:
+        logger.info(f"Webhook {provider} duplicado ignorado: {event_id}")
+        return {"status": "duplicate", "event_id": event_id}
+
+    try:
+        process_webhook_event.delay(provider, payload, conversation, sequence)
+    except Exception:
+        await _release(provider, event_id, conversation, sequence)
+        raise
+
+    return {"status": "queued", "event_id": event_id}
@@ -0,0 +1,67 @@
+"""
+WhatsApp Routing - Resolve o remetente de mensagens recebidas
+
+Instância -> empresa -> cliente -> próximo agendamento, sempre por igualdade
+em colunas indexadas:
+- whatsapp_providers.instance_id
+- clients (company_id, phone_e164), único por empresa
+- appointments.client_crm_id
+"""
+from datetime import datetime
+from typing import Optional
+import logging
+
+from sqlalchemy.orm import Session
+
+from app.models.appointment import Appointment, AppointmentStatus
+from app.models.client import Client
+from app.models.whatsapp_marketing import WhatsAppProvider
+from app.utils.whatsapp_sanitizer import phone_to_e164
+
+logger = logging.getLogger(__name__)
+
+# Agendamentos que ainda aceitam confirmação, reagendamento ou cancelamento
+ACTIONABLE_STATUSES = (AppointmentStatus.PENDING, AppointmentStatus.CONFIRMED)
+
+
+def company_id_for_instance(db: Session, instance: Optional[str]) -> Optional[int]:
+    """Empresa dona da instância da Evolution API que recebeu a mensagem"""
+    if not instance:
+        return None
+
+    row = db.query(WhatsAppProvider.company_id).filter(
+        WhatsAppProvider.instance_id == instance
+    ).first()
+    return row.company_id if row else None
+
+
+def find_client_by_phone(db: Session, phone: Optional[str], company_id: Optional[int] = None) -> Optional[Client]:
+    """
+    Cliente pelo número do remetente (JID ou telefone em qualquer formato).
+
+    Sem empresa (instância não vinculada), só aceita o número se ele pertencer
+    a um único cliente entre todas as empresas.
+    """
+    phone_e164 = phone_to_e164(phone)
+    if phone_e164 is None:
+        return None
+
+    query = db.query(Client).filter(Client.phone_e164 == phone_e164)
+    if company_id is not None:
+        return query.filter(Client.company_id == company_id).first()
+
+    clients = query.limit(2).all()
+    if len(clients) > 1:
+        logger.warning(f"⚠️ Telefone {phone_e164} pertence a clientes de mais de uma empresa; informe a instância")
+        return None
+    return clients[0] if clients else None
+
+
+def next_appointment(db: Session, client: Client) -> Optional[Appointment]:
+    """Próximo agendamento pendente ou confirmado do cliente"""
+    return db.query(Appointment).filter(
+        Appointment.client_crm_id == client.id,
+        Appointment.company_id == client.company_id,
+        Appointment.status.in_(ACTIONABLE_STATUSES),
+        Appointment.start_time > datetime.utcnow()
+    ).order_by(Appointment.start_time).first()
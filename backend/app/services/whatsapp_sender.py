@@ -0,0 +1,361 @@
+"""
+WhatsApp Sender - Envio assíncrono de mensagens para a Evolution API
+
+Subsistema de saída compartilhado pelo processo (worker Celery ou API):
+- Um httpx.AsyncClient com keep-alive por instância da Evolution API
+- Fila limitada consumida por WHATSAPP_SEND_CONCURRENCY envios simultâneos
+- Limite de taxa por instância (token bucket) para não derrubar o número
+- Retry com backoff exponencial (respeita Retry-After); envios (POST) não são
+  idempotentes, então só repetem quando a mensagem certamente não foi
+  entregue: falha de conexão, 429 ou 503 com Retry-After. Consultas (GET)
+  repetem também em timeouts e 5xx
+
+Os envios são "fire-and-track": submit() devolve na hora um
+concurrent.futures.Future com o resultado, então loops de lembrete e
+handlers de webhook não esperam a rede. O event loop roda em uma thread
+daemon própria, criada no primeiro envio de cada processo.
+
+    sender = get_whatsapp_sender()
+    future = sender.submit(OutboundMessage(api_url, api_key, instance, "/message/sendText/x", payload))
+    result = await asyncio.wrap_future(future)  # só se quiser o resultado
+"""
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Respostas que valem nova tentativa em consultas (limite de taxa e falhas do servidor)
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+# Erros em que a requisição não chegou ao servidor: seguros para repetir um envio
+UNDELIVERED_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+@dataclass
+class OutboundMessage:
+    """Uma chamada à Evolution API (envio de mensagem ou consulta)"""
+    api_url: str
+    api_key: Optional[str]
+    instance: str
+    path: str
+    payload: Optional[Dict[str, Any]] = None
+    method: str = "POST"
+    # Enviada se a principal falhar de vez (ex.: texto no lugar de botões)
+    fallback: Optional["OutboundMessage"] = None
+    attempts: int = field(default=0, compare=False)
+
+
+class TokenBucket:
+    """Limite de taxa de uma instância: `rate` envios/s com rajadas de até `burst`"""
+
+    def __init__(self, rate: float, burst: int, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.clock = clock
+        self.updated_at = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self) -> float:
+        """Segundos até haver uma ficha; consome a ficha se houver"""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self) -> None:
+        while True:
+            delay = self.wait_time()
+            if not delay:
+                return
+            await asyncio.sleep(delay)
+
+
+def _result_from_response(response: httpx.Response, attempts: int) -> Dict[str, Any]:
+    try:
+        data = response.json()
+    except ValueError:
+        data = {"raw": response.text}
+
+    if response.status_code in (200, 201):
+        key = data.get("key", {}) if isinstance(data, dict) else {}
+        return {
+            "success": True,
+            "status": "sent",
+            "status_code": response.status_code,
+            "message_id": key.get("id") if isinstance(key, dict) else None,
+            "response": data,
+            "attempts": attempts,
+        }
+
+    return {
+        "success": False,
+        "status": "failed",
+        "status_code": response.status_code,
+        "error": f"HTTP {response.status_code}: {response.text[:500]}",
+        "attempts": attempts,
+    }
+
+
+def _retry_after(response: Optional[httpx.Response]) -> Optional[float]:
+    if response is None:
+        return None
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _is_retryable(message: "OutboundMessage", response: Optional[httpx.Response], error: Optional[Exception]) -> bool:
+    if message.method == "GET":
+        return error is not None or response.status_code in RETRYABLE_STATUS
+
+    # Timeout de leitura ou 5xx genérico podem ter entregado a mensagem: repetir duplicaria
+    if error is not None:
+        return isinstance(error, UNDELIVERED_ERRORS)
+    if response.status_code == 429:
+        return True
+    return response.status_code == 503 and _retry_after(response) is not None
+
+
+class WhatsAppSender:
+    """Fila de envio com clientes HTTP por instância, limite de taxa e retry"""
+
+    def __init__(
+        self,
+        concurrency: int = 20,
+        rate_per_second: float = 5.0,
+        burst: int = 10,
+        max_retries: int = 3,
+        timeout: float = 15.0,
+        queue_size: int = 5000,
+        backoff_base: float = 1.0,
+        backoff_max: float = 30.0,
+        connections_per_instance: int = 10,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.concurrency = concurrency
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.queue_size = queue_size
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.connections_per_instance = connections_per_instance
+        self.transport = transport
+
+        self.stats = {"queued": 0, "sent": 0, "failed": 0, "retried": 0, "rejected": 0}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._clients: Dict[Tuple[str, str, Optional[str]], httpx.AsyncClient] = {}
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+
+    # ------------------------------------------------------------------
+    # Event loop em background
+    # ------------------------------------------------------------------
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is not None:
+                return self._loop
+
+            loop = asyncio.new_event_loop()
+            started = threading.Event()
+
+            def run() -> None:
+                asyncio.set_event_loop(loop)
+                self._queue = asyncio.Queue()
+                self._workers = [loop.create_task(self._worker()) for _ in range(self.concurrency)]
+                started.set()
+                loop.run_forever()
+
+            self._thread = threading.Thread(target=run, name="whatsapp-sender", daemon=True)
+            self._thread.start()
+            started.wait()
+            self._loop = loop
+            return loop
+
+    def submit(self, message: OutboundMessage) -> concurrent.futures.Future:
+        """Enfileira o envio e devolve um Future com o resultado (não bloqueia)"""
+        future: concurrent.futures.Future = concurrent.futures.Future()
+
+        with self._lock:
+            if self._pending >= self.queue_size:
+                self.stats["rejected"] += 1
+                logger.warning(f"⚠️ Fila de envio WhatsApp cheia ({self.queue_size}); mensagem para {message.instance} descartada")
+                future.set_result({"success": False, "status": "rejected", "error": "Fila de envio cheia"})
+                return future
+            self._pending += 1
+            self.stats["queued"] += 1
+
+        future.add_done_callback(self._release)
+        loop = self._ensure_started()
+        loop.call_soon_threadsafe(self._queue.put_nowait, (message, future))
+        return future
+
+    def submit_many(self, messages: List[OutboundMessage]) -> List[concurrent.futures.Future]:
+        """Enfileira um lote; os envios saem em paralelo respeitando o limite de cada instância"""
+        return [self.submit(message) for message in messages]
+
+    def _release(self, future: concurrent.futures.Future) -> None:
+        with self._lock:
+            self._pending -= 1
+            result = future.result() if not future.cancelled() else {}
+            self.stats["sent" if result.get("success") else "failed"] += 1
+
+    def pending(self) -> int:
+        return self._pending
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Espera a fila esvaziar (usado no desligamento do processo)"""
+        deadline = time.monotonic() + timeout
+        while self._pending and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return not self._pending
+
+    def shutdown(self, timeout: float = 30.0) -> None:
+        """Drena a fila, fecha os clientes HTTP e para o event loop"""
+        if self._loop is None:
+            return
+
+        if not self.flush(timeout):
+            logger.warning(f"⚠️ {self._pending} mensagens WhatsApp não enviadas no desligamento")
+
+        asyncio.run_coroutine_threadsafe(self._close(), self._loop).result(timeout=10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=10)
+        self._loop = None
+
+    async def _close(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+    # ------------------------------------------------------------------
+    # Envio
+    # ------------------------------------------------------------------
+
+    def _client(self, message: OutboundMessage) -> httpx.AsyncClient:
+        key = (message.api_url, message.instance, message.api_key)
+        client = self._clients.get(key)
+        if client is None:
+            client = httpx.AsyncClient(
+                base_url=message.api_url,
+                headers={"Content-Type": "application/json", "apikey": message.api_key or ""},
+                timeout=httpx.Timeout(self.timeout, connect=5.0),
+                limits=httpx.Limits(
+                    max_connections=self.connections_per_instance,
+                    max_keepalive_connections=self.connections_per_instance,
+                    keepalive_expiry=60.0,
+                ),
+                transport=self.transport,
+            )
+            self._clients[key] = client
+        return client
+
+    def _bucket(self, message: OutboundMessage) -> TokenBucket:
+        key = (message.api_url, message.instance)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate_per_second, self.burst)
+        return bucket
+
+    async def _worker(self) -> None:
+        while True:
+            message, future = await self._queue.get()
+            try:
+                await self._process(message, future)
+            except Exception as e:
+                logger.error(f"❌ Erro inesperado no envio WhatsApp para {message.instance}: {e}")
+                if not future.done():
+                    future.set_result({"success": False, "status": "error", "error": str(e)})
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, message: OutboundMessage, future: concurrent.futures.Future) -> None:
+        await self._bucket(message).acquire()
+        message.attempts += 1
+
+        response: Optional[httpx.Response] = None
+        try:
+            response = await self._client(message).request(message.method, message.path, json=message.payload)
+            result = _result_from_response(response, message.attempts)
+            retryable = _is_retryable(message, response, None)
+        except httpx.HTTPError as e:
+            result = {"success": False, "status": "error", "error": str(e), "attempts": message.attempts}
+            retryable = _is_retryable(message, None, e)
+
+        if not result["success"] and retryable and message.attempts <= self.max_retries:
+            delay = _retry_after(response)
+            if delay is None:
+                delay = min(self.backoff_base * 2 ** (message.attempts - 1), self.backoff_max)
+            self.stats["retried"] += 1
+            logger.warning(
+                f"⚠️ Envio WhatsApp para {message.instance} falhou ({result['error'][:120]}); "
+                f"tentativa {message.attempts + 1} em {delay:.1f}s"
+            )
+            asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, (message, future))
+            return
+
+        if not result["success"] and message.fallback is not None:
+            logger.warning(f"⚠️ {message.path} recusado pela instância {message.instance}; usando fallback")
+            self._queue.put_nowait((message.fallback, future))
+            return
+
+        if not result["success"]:
+            logger.error(f"❌ Envio WhatsApp para {message.instance} falhou: {result['error'][:200]}")
+        future.set_result(result)
+
+
+_sender: Optional[WhatsAppSender] = None
+_sender_pid: Optional[int] = None
+_sender_lock = threading.Lock()
+
+
+def get_whatsapp_sender() -> WhatsAppSender:
+    """Sender do processo atual (recriado após fork, ex.: workers prefork do Celery)"""
+    global _sender, _sender_pid
+    with _sender_lock:
+        if _sender is None or _sender_pid != os.getpid():
+            _sender = WhatsAppSender(
+                concurrency=settings.WHATSAPP_SEND_CONCURRENCY,
+                rate_per_second=settings.WHATSAPP_SEND_RATE_PER_SECOND,
+                burst=settings.WHATSAPP_SEND_BURST,
+                max_retries=settings.WHATSAPP_SEND_MAX_RETRIES,
+                timeout=settings.WHATSAPP_SEND_TIMEOUT,
+                queue_size=settings.WHATSAPP_SEND_QUEUE_SIZE,
+            )
+            _sender_pid = os.getpid()
+        return _sender
+
+
+def shutdown_whatsapp_sender(timeout: float = 30.0) -> None:
+    """Drena e fecha o sender do processo, se tiver sido usado"""
+    global _sender
+    with _sender_lock:
+        sender, _sender = _sender, None
+    if sender is not None and _sender_pid == os.getpid():
+        sender.shutdown(timeout)
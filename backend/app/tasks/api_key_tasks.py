@@ -0,0 +1,27 @@
+"""
+API key usage Celery tasks
+"""
+import logging
+
+from app.tasks.celery_app import celery_app
+from app.core.api_key_cache import flush_usage
+from app.core.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task(name="app.tasks.api_key_tasks.flush_api_key_usage")
+def flush_api_key_usage():
+    """
+    Write the usage counters accumulated in Redis by APIKeyAuth to api_keys
+    """
+    db = SessionLocal()
+
+    try:
+        updated = flush_usage(db)
+        if updated:
+            logger.info(f"✅ Uso de {updated} API key(s) gravado")
+        return {"status": "success", "keys": updated}
+
+    finally:
+        db.close()
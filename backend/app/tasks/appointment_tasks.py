@@ -1,13 +1,20 @@
 """
 Appointment-related Celery tasks
 """
+from collections import defaultdict
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
-from typing import Dict, List, Any
+import logging
+from sqlalchemy import delete, exists, literal, select, union_all, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, joinedload
+from typing import Dict, List, Set, Tuple
 
 from app.tasks.celery_app import celery_app
 from app.core.database import SessionLocal
+from app.core.tenant_context import bind_tenant_context
 from app.models.appointment import Appointment, AppointmentStatus
+from app.models.appointment_reminder_log import AppointmentReminderLog
 from app.models.client import Client
 from app.models.user import User
 from app.models.service import Service
@@ -18,92 +25,214 @@ from app.services.notification_service import NotificationService
 from app.services.push_service import PushNotificationService
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
+DEFAULT_REMINDER_HOURS = [24, 2]
+REMINDER_WINDOW = timedelta(minutes=15)  # tolerância em torno de start_time - hours_before
+REMINDER_CHUNK_SIZE = 100
+REMINDER_STATUSES = [AppointmentStatus.PENDING, AppointmentStatus.CONFIRMED]
+
+# Colunas antigas de Appointment ainda atualizadas para quem as lê
+LEGACY_REMINDER_FLAGS = {24: "reminder_sent_24h", 2: "reminder_sent_2h"}
+
 
 @celery_app.task(name="app.tasks.appointment_tasks.send_appointment_reminders")
-def send_appointment_reminders():
+def send_appointment_reminders(chunk_size: int = REMINDER_CHUNK_SIZE):
     """
-    Send reminders for upcoming appointments using dynamic company settings
+    Dispatch due appointment reminders of every company as per-company chunks
+
+    The chunks run in send_reminder_chunk on the notifications queue, so
+    throughput grows with the number of workers.
     """
     db = SessionLocal()
     
     try:
-        now = datetime.utcnow()
-        sent_count = 0
+        due = _find_due_reminders(db, datetime.utcnow())
         
-        # Get all companies with active scheduling settings
-        companies = db.query(Company).join(SchedulingSettings).filter(
-            Company.is_active == True
-        ).all()
+        chunks = 0
+        for company_id, items in due.items():
+            for start in range(0, len(items), chunk_size):
+                send_reminder_chunk.delay(company_id, items[start:start + chunk_size])
+                chunks += 1
         
-        for company in companies:
-            scheduling_settings = company.scheduling_settings
-            if not scheduling_settings:
-                continue
-            
-            # Use company-specific reminder hours
-            reminder_hours = scheduling_settings.reminder_hours_before or [24, 2]
-            
-            for hours_before in reminder_hours:
-                reminder_time = now + timedelta(hours=hours_before)
-                
-                # Find appointments for this company that need reminders
-                appointments = db.query(Appointment).filter(
-                    Appointment.company_id == company.id,
-                    Appointment.start_time >= reminder_time - timedelta(minutes=15),
-                    Appointment.start_time <= reminder_time + timedelta(minutes=15),
-                    Appointment.status.in_([AppointmentStatus.PENDING, AppointmentStatus.CONFIRMED])
-                ).all()
-                
-                for appointment in appointments:
-                    # Check if reminder already sent (dynamic check based on hours)
-                    if _is_reminder_already_sent(appointment, hours_before):
-                        continue
-                    
-                    # Send reminder using company settings
-                    if _send_dynamic_appointment_reminder(db, appointment, hours_before, scheduling_settings):
-                        # Mark reminder as sent
-                        _mark_reminder_as_sent(appointment, hours_before)
-                        db.commit()
-                        sent_count += 1
+        total = sum(len(items) for items in due.values())
+        logger.info(f"✅ Lembretes despachados: {total} em {chunks} lote(s) de {len(due)} empresa(s)")
+        return {"status": "success", "message": f"Dispatched {total} reminders in {chunks} chunks"}
+    
+    except Exception as e:
+        logger.error(f"❌ Erro ao despachar lembretes: {e}")
+        return {"status": "error", "message": str(e)}
+    
+    finally:
+        db.close()
+
+
+@celery_app.task(name="app.tasks.appointment_tasks.send_reminder_chunk")
+def send_reminder_chunk(company_id: int, items: List[List[int]]):
+    """
+    Send one chunk of reminders of a company
+
+    items: [appointment_id, hours_before] pairs selected by the dispatcher
+    """
+    db = SessionLocal()
+    
+    try:
+        bind_tenant_context(db, company_id)
+        
+        scheduling_settings = db.query(SchedulingSettings).filter(
+            SchedulingSettings.company_id == company_id
+        ).first()
+        if not scheduling_settings:
+            return {"status": "skipped", "message": "No scheduling settings"}
+        
+        # Reivindica antes de enviar: outro worker com o mesmo lote não reenvia
+        claimed = _claim_reminders(db, company_id, [tuple(item) for item in items])
+        if not claimed:
+            db.commit()
+            return {"status": "success", "sent": 0, "failed": 0}
+        
+        # Agendamentos do lote com cliente, profissional, serviço e empresa em uma consulta
+        appointments = {
+            appointment.id: appointment
+            for appointment in db.query(Appointment).options(
+                joinedload(Appointment.client_crm),
+                joinedload(Appointment.professional),
+                joinedload(Appointment.service),
+                joinedload(Appointment.company),
+            ).filter(
+                Appointment.id.in_({appointment_id for appointment_id, _ in claimed}),
+                Appointment.company_id == company_id,
+                Appointment.status.in_(REMINDER_STATUSES)
+            ).all()
+        }
+        
+        push_service = PushNotificationService(db)
+        sent, failed = [], []
+        for appointment_id, hours_before in sorted(claimed):
+            appointment = appointments.get(appointment_id)
+            if appointment and _send_dynamic_appointment_reminder(
+                appointment, hours_before, scheduling_settings, push_service
+            ):
+                sent.append((appointment_id, hours_before))
+            else:
+                failed.append((appointment_id, hours_before))
+        
+        # Falhas liberam a reivindicação para a próxima execução dentro da janela
+        for hours_before, appointment_ids in _group_by_hours(failed).items():
+            db.execute(delete(AppointmentReminderLog).where(
+                AppointmentReminderLog.appointment_id.in_(appointment_ids),
+                AppointmentReminderLog.hours_before == hours_before
+            ))
         
-        return {"status": "success", "message": f"Sent {sent_count} reminders"}
+        # Flags legadas (24h/2h) em UPDATE em massa
+        for hours_before, appointment_ids in _group_by_hours(sent).items():
+            flag = LEGACY_REMINDER_FLAGS.get(hours_before)
+            if flag:
+                db.execute(
+                    update(Appointment).where(Appointment.id.in_(appointment_ids)).values({flag: True}),
+                    execution_options={"synchronize_session": False}
+                )
+        
+        db.commit()
+        return {"status": "success", "sent": len(sent), "failed": len(failed)}
     
     except Exception as e:
-        print(f"Error sending reminders: {e}")
+        db.rollback()
+        logger.error(f"❌ Erro ao enviar lembretes da empresa {company_id}: {e}")
         return {"status": "error", "message": str(e)}
     
     finally:
         db.close()
 
 
-def _is_reminder_already_sent(appointment: Appointment, hours_before: int) -> bool:
-    """Check if reminder was already sent for this time period"""
-    if hours_before == 24:
-        return appointment.reminder_sent_24h
-    elif hours_before == 2:
-        return appointment.reminder_sent_2h
-    # For other hours, we don't have specific fields, so assume not sent
-    return False
+def _find_due_reminders(db: Session, now: datetime) -> Dict[int, List[Tuple[int, int]]]:
+    """
+    Due (appointment_id, hours_before) reminders of all companies in one query
 
+    One UNION ALL branch per distinct reminder_hours_before value, skipping
+    reminders already present in appointment_reminder_logs.
+    """
+    companies_by_hours: Dict[int, Set[int]] = defaultdict(set)
+    for row in db.query(SchedulingSettings.company_id, SchedulingSettings.reminder_hours_before).join(
+        Company, Company.id == SchedulingSettings.company_id
+    ).filter(Company.is_active == True).all():
+        for hours_before in row.reminder_hours_before or DEFAULT_REMINDER_HOURS:
+            companies_by_hours[int(hours_before)].add(row.company_id)
+    
+    if not companies_by_hours:
+        return {}
+    
+    branches = []
+    for hours_before, company_ids in sorted(companies_by_hours.items()):
+        reminder_time = now + timedelta(hours=hours_before)
+        already_sent = exists().where(
+            AppointmentReminderLog.appointment_id == Appointment.id,
+            AppointmentReminderLog.hours_before == hours_before
+        )
+        branches.append(select(
+            Appointment.company_id,
+            Appointment.id.label("appointment_id"),
+            literal(hours_before).label("hours_before")
+        ).where(
+            Appointment.company_id.in_(company_ids),
+            Appointment.start_time >= reminder_time - REMINDER_WINDOW,
+            Appointment.start_time <= reminder_time + REMINDER_WINDOW,
+            Appointment.status.in_(REMINDER_STATUSES),
+            ~already_sent
+        ))
+    
+    due: Dict[int, List[Tuple[int, int]]] = defaultdict(list)
+    for row in db.execute(union_all(*branches)).all():
+        due[row.company_id].append((row.appointment_id, row.hours_before))
+    return dict(due)
 
-def _mark_reminder_as_sent(appointment: Appointment, hours_before: int):
-    """Mark reminder as sent for this time period"""
-    if hours_before == 24:
-        appointment.reminder_sent_24h = True
-    elif hours_before == 2:
-        appointment.reminder_sent_2h = True
-    # For other hours, we could extend the model or use a JSON field
 
+def _claim_reminders(db: Session, company_id: int, items: List[Tuple[int, int]]) -> Set[Tuple[int, int]]:
+    """Insert the sent-log rows, ignoring ones already there; returns the pairs claimed now"""
+    if not items:
+        return set()
+    
+    now = datetime.utcnow()
+    insert = postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    statement = insert(AppointmentReminderLog).values([
+        {
+            "company_id": company_id,
+            "appointment_id": appointment_id,
+            "hours_before": hours_before,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for appointment_id, hours_before in items
+    ]).on_conflict_do_nothing(
+        index_elements=["appointment_id", "hours_before"]
+    ).returning(AppointmentReminderLog.appointment_id, AppointmentReminderLog.hours_before)
+    
+    return {(row.appointment_id, row.hours_before) for row in db.execute(statement)}
+
+
+def _group_by_hours(items: List[Tuple[int, int]]) -> Dict[int, List[int]]:
+    grouped: Dict[int, List[int]] = defaultdict(list)
+    for appointment_id, hours_before in items:
+        grouped[hours_before].append(appointment_id)
+    return grouped
 
-def _send_dynamic_appointment_reminder(db: Session, appointment: Appointment, hours_before: int, scheduling_settings: SchedulingSettings) -> bool:
+
+def _send_dynamic_appointment_reminder(
+    appointment: Appointment,
+    hours_before: int,
+    scheduling_settings: SchedulingSettings,
+    push_service: PushNotificationService,
+) -> bool:
     """
     Send appointment reminder using dynamic company settings and templates
+
+    Client, professional, service and company must already be loaded.
     """
     try:
         # Get appointment details
-        client_crm = db.query(Client).filter(Client.id == appointment.client_crm_id).first() if appointment.client_crm_id else None
-        professional = db.query(User).filter(User.id == appointment.professional_id).first()
-        service = db.query(Service).filter(Service.id == appointment.service_id).first()
+        client_crm = appointment.client_crm
+        professional = appointment.professional
+        service = appointment.service
         
         if not client_crm or not service:
             return False
@@ -155,7 +284,6 @@ def _send_dynamic_appointment_reminder(db: Session, appointment: Appointment, ho
                     elif notification_type == "push":
                         client_user_id = client_crm.user_id
                         if client_user_id:
-                            push_service = PushNotificationService(db)
                             push_service.send_to_user(
                                 user_id=client_user_id,
                                 title=message.get("title") if isinstance(message, dict) else "Lembrete de Agendamento",
@@ -0,0 +1,31 @@
+"""
+Audit log Celery tasks
+"""
+import logging
+
+from app.tasks.celery_app import celery_app
+from app.core.audit import flush_audit_events
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Lotes por execução: limita a duração da task quando o stream acumula
+MAX_BATCHES_PER_RUN = 20
+
+
+@celery_app.task(name="app.tasks.audit_tasks.flush_audit_log")
+def flush_audit_log():
+    """
+    Bulk-insert the audit events queued in the Redis stream into audit_logs
+    """
+    written = 0
+
+    for _ in range(MAX_BATCHES_PER_RUN):
+        flushed = flush_audit_events(settings.AUDIT_FLUSH_BATCH_SIZE)
+        written += flushed
+        if flushed < settings.AUDIT_FLUSH_BATCH_SIZE:
+            break
+
+    if written:
+        logger.info(f"✅ {written} evento(s) de audit log gravado(s)")
+    return {"status": "success", "events": written}
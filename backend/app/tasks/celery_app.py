@@ -15,6 +15,10 @@ celery_app = Celery(
         "app.tasks.appointment_tasks",
         "app.tasks.notification_tasks",
         "app.tasks.payment_tasks",
+        "app.tasks.metrics_tasks",
+        "app.tasks.webhook_tasks",
+        "app.tasks.api_key_tasks",
+        "app.tasks.audit_tasks",
     ]
 )
 
@@ -63,19 +67,26 @@ celery_app.conf.update(
     # Retry policies (crítico para SaaS)
     task_default_retry_delay=60,  # 1 minuto entre tentativas
     task_max_retries=3,  # Máximo 3 tentativas
-    task_reject_on_worker_lost=True,  # Rejeitar se worker morrer
     
-    # Dead-letter handling
-    task_reject_on_worker_lost=True,
+    # Dead-letter handling (task_reject_on_worker_lost já definido acima)
     task_ignore_result=False,  # Guardar resultados para auditoria
     
     # Task routing (separado por domínio para evitar bloqueio em cascata)
     task_routes={
+        # Lotes de lembretes por empresa: fila de notificações, escala com os workers
+        'app.tasks.appointment_tasks.send_reminder_chunk': {'queue': 'notifications'},
         'app.tasks.appointment_tasks.*': {'queue': 'appointments'},
         'app.tasks.notification_tasks.*': {'queue': 'notifications'},
         'app.tasks.payment_tasks.*': {'queue': 'payments'},
         'app.tasks.report_tasks.*': {'queue': 'reports'},
+        'app.tasks.metrics_tasks.*': {'queue': 'reports'},
+        # Flush do audit log (stream Redis -> audit_logs): manutenção, junto dos relatórios
+        'app.tasks.audit_tasks.*': {'queue': 'reports'},
+        # Flush do uso de API keys (Redis -> api_keys)
+        'app.tasks.api_key_tasks.*': {'queue': 'reports'},
         'app.tasks.backup_tasks.*': {'queue': 'backups'},
+        # Webhooks de provedores: fila própria para rajadas não atrasarem lembretes
+        'app.tasks.webhook_tasks.*': {'queue': 'webhooks'},
     },
     
     # Queue definitions com DLQ (Dead-Letter Queue)
@@ -120,6 +131,14 @@ celery_app.conf.update(
                 'x-message-ttl': 14400000,  # 4 horas
             }
         },
+        'webhooks': {
+            'exchange': 'webhooks',
+            'routing_key': 'webhooks',
+            'queue_arguments': {
+                'x-dead-letter-exchange': 'webhooks.dlq',
+                'x-message-ttl': 3600000,  # 1 hora
+            }
+        },
     },
     
     # Task compression (para tarefas grandes)
@@ -170,6 +189,25 @@ celery_app.conf.beat_schedule = {
         "task": "app.tasks.whatsapp_calendar_tasks.send_whatsapp_reminders",
         "schedule": crontab(minute="*/15"),  # Every 15 minutes
     },
+    # Dashboard rollup (tenant_daily_metrics)
+    "refresh-dirty-tenant-metrics": {
+        "task": "app.tasks.metrics_tasks.refresh_dirty_tenant_metrics",
+        "schedule": crontab(minute="*"),  # Every minute
+    },
+    "reconcile-tenant-metrics": {
+        "task": "app.tasks.metrics_tasks.reconcile_tenant_metrics",
+        "schedule": crontab(hour=3, minute=30),  # Daily at 3:30 AM
+    },
+    # API key usage counters (Redis -> api_keys)
+    "flush-api-key-usage": {
+        "task": "app.tasks.api_key_tasks.flush_api_key_usage",
+        "schedule": crontab(minute="*"),  # Every minute
+    },
+    # Audit log stream (Redis -> audit_logs)
+    "flush-audit-log": {
+        "task": "app.tasks.audit_tasks.flush_audit_log",
+        "schedule": 15.0,  # Every 15 seconds
+    },
 }
 
 if __name__ == "__main__":
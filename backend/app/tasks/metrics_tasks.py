@@ -0,0 +1,85 @@
+"""
+Dashboard metrics rollup Celery tasks
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+import logging
+
+from app.tasks.celery_app import celery_app
+from app.core.database import SessionLocal
+from app.models.company import Company
+import app.services.revenue_forecast  # noqa: F401 - invalida a projeção em escritas feitas pelas tasks
+from app.services.goal_progress import refresh_company_goals
+from app.services.tenant_metrics import mark_dirty, pop_dirty_days, rebuild_range, recompute_days
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task(name="app.tasks.metrics_tasks.refresh_dirty_tenant_metrics")
+def refresh_dirty_tenant_metrics(batch_size: int = 500):
+    """
+    Recompute the rollup days marked dirty by write paths
+    (and the progress of the active goals covering those days)
+    """
+    dirty = pop_dirty_days(batch_size)
+    if not dirty:
+        return {"status": "success", "days": 0}
+
+    db = SessionLocal()
+    refreshed = 0
+
+    try:
+        for company_id, days in dirty.items():
+            try:
+                recompute_days(db, company_id, days)
+                refresh_company_goals(db, company_id, days)
+                db.commit()
+                refreshed += len(days)
+            except Exception as e:
+                db.rollback()
+                # Devolve os dias ao conjunto para a próxima execução
+                mark_dirty((company_id, day) for day in days)
+                logger.error(f"❌ Erro ao recalcular rollup da empresa {company_id}: {e}")
+
+        return {"status": "success", "days": refreshed}
+
+    finally:
+        db.close()
+
+
+@celery_app.task(name="app.tasks.metrics_tasks.reconcile_tenant_metrics")
+def reconcile_tenant_metrics(days_back: int = 2, company_id: Optional[int] = None):
+    """
+    Recompute the last `days_back` days for every company (or a single one),
+    plus the progress of every active goal.
+
+    Also used as backfill after deploying the rollup table:
+    reconcile_tenant_metrics.delay(days_back=365)
+    """
+    db = SessionLocal()
+
+    try:
+        end_day = datetime.utcnow().date()
+        start_day = end_day - timedelta(days=days_back)
+
+        query = db.query(Company.id)
+        if company_id:
+            query = query.filter(Company.id == company_id)
+        company_ids = [row.id for row in query.all()]
+
+        written = 0
+        for current_company_id in company_ids:
+            written += rebuild_range(db, current_company_id, start_day, end_day)
+            refresh_company_goals(db, current_company_id)
+            db.commit()
+
+        logger.info(f"✅ Rollup reconciliado: {len(company_ids)} empresa(s), {written} linha(s)")
+        return {"status": "success", "companies": len(company_ids), "rows": written}
+
+    except Exception as e:
+        db.rollback()
+        logger.error(f"❌ Erro ao reconciliar rollup: {e}")
+        return {"status": "error", "message": str(e)}
+
+    finally:
+        db.close()
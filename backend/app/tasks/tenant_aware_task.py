@@ -7,7 +7,7 @@ import logging
 from sqlalchemy.orm import Session
 
 from app.core.database import SessionLocal
-from app.core.tenant_context import set_tenant_context
+from app.core.tenant_context import bind_tenant_context
 
 logger = logging.getLogger(__name__)
 
@@ -56,7 +56,7 @@ def tenant_task(func: Callable) -> Callable:
         # Create database session and set tenant context
         db = SessionLocal()
         try:
-            set_tenant_context(db, company_id)
+            bind_tenant_context(db, company_id)
             logger.debug(f"🔒 Tenant context set for task {func.__name__}: company_id={company_id}")
             
             # Execute the task
@@ -142,7 +142,7 @@ class TenantTaskSession:
     
     def __enter__(self) -> Session:
         self.db = SessionLocal()
-        set_tenant_context(self.db, self.company_id)
+        bind_tenant_context(self.db, self.company_id)
         logger.debug(f"🔒 Tenant session opened: company_id={self.company_id}")
         return self.db
     
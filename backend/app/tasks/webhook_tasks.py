@@ -0,0 +1,109 @@
+"""
+Webhook tasks - Processamento assíncrono dos webhooks recebidos
+
+Os endpoints só enfileiram o payload (app.services.webhook_ingestion); aqui
+acontecem as consultas, mudanças de agendamento e respostas ao cliente.
+Eventos da mesma conversa são processados na ordem de chegada.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+from app.tasks.celery_app import celery_app
+from app.core.cache import get_sync_redis
+from app.core.database import SessionLocal
+from app.services.webhook_ingestion import DEDUP_TTL, done_key, skipped_key
+
+logger = logging.getLogger(__name__)
+
+# Espera pelo evento anterior da conversa: ORDER_MAX_WAITS x ORDER_WAIT_SECONDS
+ORDER_WAIT_SECONDS = 1
+ORDER_MAX_WAITS = 60
+
+
+def _last_done(redis, provider: str, conversation: str) -> int:
+    try:
+        last_done = int(redis.get(done_key(provider, conversation)) or 0)
+        # Sequências de eventos que não chegaram à fila contam como concluídas
+        skipped = redis.smembers(skipped_key(provider, conversation))
+        while str(last_done + 1) in skipped:
+            last_done += 1
+        return last_done
+    except Exception as e:
+        logger.warning(f"⚠️ Redis indisponível na ordenação de webhooks: {e}")
+        return -1
+
+
+def _mark_done(redis, provider: str, conversation: str, sequence: int) -> None:
+    # Nunca volta: um evento atrasado processado depois do seguinte não reabre a fila
+    try:
+        if sequence > _last_done(redis, provider, conversation):
+            redis.set(done_key(provider, conversation), sequence, ex=DEDUP_TTL)
+    except Exception as e:
+        logger.warning(f"⚠️ Não foi possível registrar webhook processado: {e}")
+
+
+def _process_evolution(db, payload: Dict[str, Any]) -> Dict[str, Any]:
+    from app.services.evolution_api_service import get_evolution_api_service
+    return get_evolution_api_service(db).process_webhook_message(payload)
+
+
+def _process_whatsapp(db, payload: Dict[str, Any]) -> Dict[str, Any]:
+    from app.api.v1.endpoints.whatsapp_webhook_handler import handle_message_received
+    return asyncio.run(handle_message_received(payload, db))
+
+
+def _process_calendly(db, payload: Dict[str, Any]) -> Dict[str, Any]:
+    from app.services.calendly_service import get_calendly_service
+    return asyncio.run(get_calendly_service(db).process_webhook_event(payload.get("event"), payload))
+
+
+PROCESSORS = {
+    "evolution": _process_evolution,
+    "whatsapp": _process_whatsapp,
+    "calendly": _process_calendly,
+}
+
+
+@celery_app.task(bind=True, name="app.tasks.webhook_tasks.process_webhook_event")
+def process_webhook_event(
+    self,
+    provider: str,
+    payload: Dict[str, Any],
+    conversation: str,
+    sequence: Optional[int] = None
+):
+    """
+    Processa um webhook enfileirado pelo endpoint do provedor
+
+    Args:
+        provider: evolution, whatsapp ou calendly
+        payload: Payload bruto recebido
+        conversation: Chave da conversa (ordem de processamento)
+        sequence: Posição do evento na conversa (None sem Redis)
+    """
+    redis = get_sync_redis() if sequence else None
+
+    if redis is not None:
+        last_done = _last_done(redis, provider, conversation)
+        if 0 <= last_done < sequence - 1 and self.request.retries < ORDER_MAX_WAITS:
+            # Evento anterior da conversa ainda não terminou
+            raise self.retry(countdown=ORDER_WAIT_SECONDS, max_retries=ORDER_MAX_WAITS)
+        if 0 <= last_done < sequence - 1:
+            logger.warning(
+                f"⚠️ Webhook {provider} #{sequence} de {conversation} processado sem o anterior "
+                f"(último concluído: #{last_done})"
+            )
+
+    db = SessionLocal()
+    try:
+        result = PROCESSORS[provider](db, payload)
+        return {"status": "processed", "provider": provider, "result": result}
+    except Exception as e:
+        # O provedor já recebeu 200: registrar e seguir para não travar a conversa
+        logger.error(f"❌ Erro ao processar webhook {provider} de {conversation}: {e}")
+        return {"status": "error", "provider": provider, "error": str(e)}
+    finally:
+        db.close()
+        if redis is not None:
+            _mark_done(redis, provider, conversation, sequence)
@@ -3,7 +3,7 @@ WhatsApp Calendar Tasks - Tasks automáticas para confirmação de agendamentos
 Integração Evolution API com sistema de calendário
 """
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from functools import partial
 from typing import List
 
 from app.tasks.celery_app import celery_app
@@ -13,6 +13,14 @@ from app.models.client import Client
 from app.models.company import Company
 from app.models.company_scheduling_settings import SchedulingSettings
 from app.services.evolution_api_service import get_evolution_api_service
+from app.services.whatsapp_sender import shutdown_whatsapp_sender
+from celery.signals import worker_process_shutdown
+
+
+@worker_process_shutdown.connect
+def _flush_whatsapp_sender(**kwargs):
+    """Os envios são enfileirados em background: drena a fila antes do processo sair"""
+    shutdown_whatsapp_sender()
 
 
 @celery_app.task(name="app.tasks.whatsapp_calendar_tasks.send_whatsapp_confirmation_requests")
@@ -70,14 +78,15 @@ def send_whatsapp_confirmation_requests():
                             if _confirmation_already_sent(appointment, hours_before):
                                 continue
                             
-                            # Enviar solicitação de confirmação
+                            # Enviar solicitação de confirmação (enfileirada: a marcação
+                            # só é gravada quando a Evolution API aceitar o envio)
+                            on_sent = partial(_mark_confirmation_sent, appointment.id, hours_before)
                             if hours_before >= 24:
-                                result = service.send_appointment_confirmation_request(appointment)
+                                result = service.send_appointment_confirmation_request(appointment, on_sent=on_sent)
                             else:
-                                result = service.send_appointment_reminder(appointment, hours_before)
+                                result = service.send_appointment_reminder(appointment, hours_before, on_sent=on_sent)
                             
                             if result.get("success"):
-                                _mark_confirmation_sent(db, appointment, hours_before)
                                 total_sent += 1
                             else:
                                 total_errors += 1
@@ -91,7 +100,7 @@ def send_whatsapp_confirmation_requests():
         
         return {
             "status": "success",
-            "message": f"Enviadas {total_sent} solicitações de confirmação",
+            "message": f"Enfileiradas {total_sent} solicitações de confirmação",
             "total_sent": total_sent,
             "total_errors": total_errors
         }
@@ -136,10 +145,11 @@ def send_whatsapp_reminders():
                 if _reminder_already_sent(appointment, 2):
                     continue
                 
-                result = service.send_appointment_reminder(appointment, 2)
+                result = service.send_appointment_reminder(
+                    appointment, 2, on_sent=partial(_mark_reminder_sent, appointment.id, 2)
+                )
                 
                 if result.get("success"):
-                    _mark_reminder_sent(db, appointment, 2)
                     sent_count += 1
                     
             except Exception as e:
@@ -147,7 +157,7 @@ def send_whatsapp_reminders():
         
         return {
             "status": "success",
-            "message": f"Enviados {sent_count} lembretes",
+            "message": f"Enfileirados {sent_count} lembretes",
             "sent_count": sent_count
         }
     
@@ -217,11 +227,21 @@ def _confirmation_already_sent(appointment: Appointment, hours_before: int) -> b
     return marker in sent_confirmations
 
 
-def _mark_confirmation_sent(db: Session, appointment: Appointment, hours_before: int):
-    """Marca confirmação como enviada"""
-    marker = f"[WHATSAPP_CONF_{hours_before}H]"
-    appointment.internal_notes = (appointment.internal_notes or "") + f" {marker}"
-    db.commit()
+def _append_marker(appointment_id: int, marker: str):
+    # on_sent roda na thread do WhatsAppSender, depois da task: sessão própria
+    db = SessionLocal()
+    try:
+        appointment = db.get(Appointment, appointment_id)
+        if appointment and marker not in (appointment.internal_notes or ""):
+            appointment.internal_notes = (appointment.internal_notes or "") + f" {marker}"
+            db.commit()
+    finally:
+        db.close()
+
+
+def _mark_confirmation_sent(appointment_id: int, hours_before: int):
+    """Marca confirmação como enviada (on_sent do envio)"""
+    _append_marker(appointment_id, f"[WHATSAPP_CONF_{hours_before}H]")
 
 
 def _reminder_already_sent(appointment: Appointment, hours_before: int) -> bool:
@@ -231,11 +251,9 @@ def _reminder_already_sent(appointment: Appointment, hours_before: int) -> bool:
     return marker in sent_reminders
 
 
-def _mark_reminder_sent(db: Session, appointment: Appointment, hours_before: int):
-    """Marca lembrete como enviado"""
-    marker = f"[WHATSAPP_REM_{hours_before}H]"
-    appointment.internal_notes = (appointment.internal_notes or "") + f" {marker}"
-    db.commit()
+def _mark_reminder_sent(appointment_id: int, hours_before: int):
+    """Marca lembrete como enviado (on_sent do envio)"""
+    _append_marker(appointment_id, f"[WHATSAPP_REM_{hours_before}H]")
 
 
 # Funções para disparo manual
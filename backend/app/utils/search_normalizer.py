@@ -0,0 +1,33 @@
+"""
+Search Normalizer - Normalização de textos e documentos para busca
+
+- Nomes sem acento, em minúsculas e com espaços simples ("José  Ávila" -> "jose avila")
+- Telefones e documentos apenas com dígitos ("(11) 98765-4321" -> "11987654321")
+
+Os valores normalizados ficam em colunas próprias (ex.: Client.search_name),
+indexadas para busca por trigramas e por prefixo.
+"""
+
+import re
+import unicodedata
+from typing import Optional
+
+
+def normalize_search_text(value: Optional[str]) -> Optional[str]:
+    """Remove acentos, converte para minúsculas e colapsa espaços"""
+    if not value:
+        return None
+
+    decomposed = unicodedata.normalize("NFKD", value)
+    without_accents = "".join(char for char in decomposed if not unicodedata.combining(char))
+    normalized = re.sub(r"\s+", " ", without_accents).strip().lower()
+    return normalized or None
+
+
+def only_digits(value: Optional[str]) -> Optional[str]:
+    """Mantém apenas os dígitos (None se não houver nenhum)"""
+    if not value:
+        return None
+
+    digits = re.sub(r"\D", "", value)
+    return digits or None
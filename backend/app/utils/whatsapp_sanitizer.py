@@ -65,6 +65,54 @@ def sanitize_phone_number(phone: Optional[str]) -> Optional[str]:
     return None
 
 
+def phone_to_e164(phone: Optional[str], default_country: str = '55') -> Optional[str]:
+    """
+    Converte um telefone para o formato E.164 canônico usado nos índices de busca.
+    
+    Exemplos:
+    - "(11) 98765-4321" -> "+5511987654321"
+    - "5511987654321@s.whatsapp.net" (JID) -> "+5511987654321"
+    - "551187654321" (JID de celular sem 9º dígito) -> "+5511987654321"
+    - "(11) 3456-7890" (fixo) -> "+551134567890"
+    - "+1 415 555 0100" -> "+14155550100"
+    
+    Args:
+        phone: Número de telefone em qualquer formato
+        default_country: DDI assumido para números nacionais
+        
+    Returns:
+        Número em E.164 ou None se não for possível normalizar
+    """
+    if not phone:
+        return None
+    
+    phone = phone.split('@')[0].strip()
+    international = phone.startswith('+')
+    digits = re.sub(r'\D', '', phone)
+    if not international:
+        # Prefixo de longa distância ("0 11 ...")
+        digits = digits.lstrip('0')
+    
+    if digits.startswith(default_country) and len(digits) in (12, 13):
+        national = digits[len(default_country):]
+    elif international or len(digits) > 11:
+        # Número estrangeiro já com DDI
+        return f"+{digits}" if 8 <= len(digits) <= 15 else None
+    else:
+        national = digits
+    
+    if len(national) not in (10, 11) or national[0] == '0':
+        return None
+    
+    area_code, number = national[:2], national[2:]
+    
+    # Celular sem o 9º dígito (fixos começam com 2-5)
+    if len(number) == 8 and number[0] in '6789':
+        number = f"9{number}"
+    
+    return f"+{default_country}{area_code}{number}"
+
+
 def sanitize_name(name: Optional[str]) -> Optional[str]:
     """
     Sanitiza um nome removendo espaços extras e caracteres especiais.
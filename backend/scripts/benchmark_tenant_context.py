@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark do contexto de tenant por requisição
+
+Compara, contra o PostgreSQL de settings.DATABASE_URL:
+1. Antes: SET app.current_company_id + SELECT current_setting(...) (validação)
+   + primeira consulta do endpoint
+2. Depois: bind_tenant_context() -> set_config(..., true) no after_begin
+   + primeira consulta do endpoint
+
+Executar: python scripts/benchmark_tenant_context.py [iteracoes]
+"""
+import statistics
+import sys
+import time
+
+from sqlalchemy import text
+
+sys.path.insert(0, ".")
+
+from app.core.database import SessionLocal  # noqa: E402
+from app.core.tenant_context import (  # noqa: E402
+    bind_tenant_context,
+    set_tenant_context,
+    validate_tenant_context,
+)
+
+COMPANY_ID = 1
+FIRST_QUERY = text("SELECT count(*) FROM companies WHERE id = :company_id")
+
+
+def legacy_request():
+    db = SessionLocal()
+    try:
+        set_tenant_context(db, COMPANY_ID)
+        if not validate_tenant_context(db, COMPANY_ID):
+            raise RuntimeError("Contexto de tenant inválido")
+        db.execute(FIRST_QUERY, {"company_id": COMPANY_ID}).scalar()
+    finally:
+        db.close()
+
+
+def lazy_request():
+    db = SessionLocal()
+    try:
+        bind_tenant_context(db, COMPANY_ID)
+        db.execute(FIRST_QUERY, {"company_id": COMPANY_ID}).scalar()
+    finally:
+        db.close()
+
+
+def measure(fn, iterations):
+    # Aquecimento do pool de conexões
+    for _ in range(20):
+        fn()
+
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+
+    samples.sort()
+    return {
+        "media": statistics.mean(samples),
+        "p50": samples[len(samples) // 2],
+        "p95": samples[int(len(samples) * 0.95) - 1],
+    }
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    print(f"🔧 Executando {iterations} requisições simuladas por cenário...")
+    legacy = measure(legacy_request, iterations)
+    lazy = measure(lazy_request, iterations)
+
+    print(f"{'cenário':<28}{'média (ms)':>12}{'p50 (ms)':>12}{'p95 (ms)':>12}")
+    for name, result in (("SET + validação", legacy), ("set_config no after_begin", lazy)):
+        print(f"{name:<28}{result['media']:>12.3f}{result['p50']:>12.3f}{result['p95']:>12.3f}")
+
+    saved = legacy["media"] - lazy["media"]
+    print(f"✅ Economia por requisição: {saved:.3f} ms ({saved / legacy['media'] * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -45,6 +45,8 @@ if [ "$ENVIRONMENT" = "prod" ]; then
     start_worker "appointments" "appointments"
     start_worker "notifications" "notifications"
     start_worker "payments" "payments"
+    start_worker "reports" "reports"    # rollup do dashboard, metas, uso de API keys, auditoria
+    start_worker "webhooks" "webhooks"  # webhooks da Evolution API e do Calendly
     
     echo "✅ Workers iniciados em background"
     echo "📊 Para monitorar: celery -A app.tasks.celery_app inspect active"
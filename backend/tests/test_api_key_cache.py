@@ -0,0 +1,183 @@
+"""
+Testes da autenticação por API key em cache e do flush de uso em lote
+"""
+import asyncio
+import time
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.main  # noqa: F401 - registra todos os mappers
+from app.core import api_key_auth, api_key_cache
+from app.core.api_key_auth import APIKeyAuth
+from app.core.database import Base
+from app.models.api_key import APIKey
+from app.models.company import Company
+
+
+class FakeRedisPipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(*args):
+            self.calls.append((name, args))
+            return self
+        return call
+
+    def execute(self):
+        return [getattr(self.redis, name)(*args) for name, args in self.calls]
+
+
+class FakeSyncRedis:
+    def __init__(self):
+        self.hashes = {}
+
+    def pipeline(self, transaction=True):
+        return FakeRedisPipeline(self)
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hincrby(self, key, field, amount):
+        data = self.hashes.setdefault(key, {})
+        data[str(field)] = str(int(data.get(str(field), 0)) + amount)
+
+    def hsetnx(self, key, field, value):
+        self.hashes.setdefault(key, {}).setdefault(str(field), value)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.hashes.pop(key, None)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    async def no_redis():
+        return None
+
+    monkeypatch.setattr(api_key_cache, "get_redis", no_redis)
+    monkeypatch.setattr(api_key_cache, "get_sync_redis", lambda: None)
+    api_key_cache._local.clear()
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine, expire_on_commit=False)()
+    session.add(Company(id=1, name="c", slug="c", email="c@c.com", is_active=True))
+    session.commit()
+    yield session
+    session.close()
+    api_key_cache._local.clear()
+
+
+def create_key(db, scopes='["leads:write"]'):
+    full_key, key_hash = APIKey.generate_key()
+    db.add(APIKey(
+        company_id=1, name="extensão", key_prefix=full_key[:9], key_hash=key_hash,
+        scopes=scopes, is_active=True, usage_count=0,
+    ))
+    db.commit()
+    return full_key
+
+
+def authenticate(db, full_key, scope="leads:write"):
+    result = []
+
+    async def run():
+        # Resultado fora da Task: o repr da Task carregaria os atributos lazy
+        result.append(await APIKeyAuth(required_scope=scope)(x_api_key=full_key, db=db))
+
+    asyncio.run(run())
+    return result[0]
+
+
+def test_cached_auth_is_read_only(db, monkeypatch):
+    used = []
+    monkeypatch.setattr(api_key_auth, "record_usage", used.append)
+    full_key = create_key(db)
+
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    api_key, company = authenticate(db, full_key)
+    assert (api_key.company_id, company.id) == (1, 1)
+    assert len(statements) == 1  # APIKey + Company em uma consulta
+
+    db.expunge_all()
+    api_key, _ = authenticate(db, full_key)
+    assert len(statements) == 1  # LRU local: nenhuma consulta
+    assert not any(sql.lstrip().upper().startswith("UPDATE") for sql in statements)
+    assert used == [api_key.id, api_key.id]
+
+    with pytest.raises(HTTPException) as error:
+        authenticate(db, full_key, scope="clients:write")
+    assert error.value.status_code == 403
+
+
+def test_revoking_key_or_company_invalidates_cache(db, monkeypatch):
+    monkeypatch.setattr(api_key_auth, "record_usage", lambda key_id: None)
+    full_key = create_key(db)
+    authenticate(db, full_key)
+
+    company = db.get(Company, 1)
+    company.is_active = False
+    db.commit()
+    with pytest.raises(HTTPException) as error:
+        authenticate(db, full_key)
+    assert error.value.status_code == 403
+
+    company.is_active = True
+    db.commit()
+    authenticate(db, full_key)
+
+    key = db.query(APIKey).one()
+    key.is_active = False
+    db.commit()
+    with pytest.raises(HTTPException) as error:
+        authenticate(db, full_key)
+    assert error.value.status_code == 401
+
+
+def test_flush_usage_writes_counters_in_one_batch(db, monkeypatch):
+    redis = FakeSyncRedis()
+    monkeypatch.setattr(api_key_cache, "get_sync_redis", lambda: redis)
+    create_key(db)
+    create_key(db)
+    first, second = db.query(APIKey).order_by(APIKey.id).all()
+    previous_use = datetime(2026, 1, 1, 12)
+    second.last_used_at = previous_use
+    db.commit()
+
+    used_at = time.time()
+    redis.hincrby(api_key_cache.USAGE_COUNT_KEY, first.id, 3)
+    redis.hincrby(api_key_cache.USAGE_COUNT_KEY, second.id, 1)
+    redis.hsetnx(api_key_cache.USAGE_LAST_USED_KEY, first.id, repr(used_at))
+
+    assert api_key_cache.flush_usage(db) == 2
+    db.expire_all()
+
+    assert (first.usage_count, second.usage_count) == (3, 1)
+    assert first.last_used_at == datetime.utcfromtimestamp(used_at)
+    assert second.last_used_at == previous_use  # Sem last_used no lote: não zera a coluna
+    assert redis.hashes == {}
+    assert api_key_cache.flush_usage(db) == 0
+
+
+def test_projection_scopes_and_flush_route():
+    projection = api_key_cache.APIKeyProjection(
+        key_id=1, key_hash="h", company_id=1, user_id=None, scopes='["leads:*", "clients:read"]',
+        is_active=True, expires_at=None, company_active=True,
+    )
+    assert projection.has_scope("leads:write")
+    assert projection.has_scope("clients:read")
+    assert not projection.has_scope("clients:write")
+
+    from app.tasks.celery_app import celery_app
+
+    queue = celery_app.amqp.router.route({}, "app.tasks.api_key_tasks.flush_api_key_usage")["queue"].name
+    assert queue in celery_app.conf.task_queues
@@ -0,0 +1,52 @@
+"""
+Testes da detecção de sobreposição de agendamentos (app.services.appointment_conflicts)
+"""
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.main  # noqa: F401 - registra todos os mappers
+from app.core.database import Base
+from app.models.appointment import Appointment, AppointmentStatus
+from app.models.company import Company
+from app.services import appointment_conflicts
+from app.services.appointment_conflicts import ensure_no_conflict
+
+
+@pytest.fixture
+def db(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine, expire_on_commit=False)()
+    session.add(Company(id=1, name="c", slug="c", email="c@c.com"))
+    session.commit()
+    # Como no PostgreSQL com a migration: a constraint cobre as linhas comuns
+    monkeypatch.setattr(appointment_conflicts, "_constraint_enforced", True)
+    yield session
+    session.close()
+
+
+def appointment(start_hour, end_hour, overlap_allowed=False):
+    return Appointment(
+        company_id=1, professional_id=1, status=AppointmentStatus.CONFIRMED, overlap_allowed=overlap_allowed,
+        start_time=datetime(2026, 3, 2, start_hour), end_time=datetime(2026, 3, 2, end_hour),
+    )
+
+
+def test_booking_over_forced_overlap_is_rejected_even_with_constraint(db):
+    db.add_all([appointment(9, 10), appointment(10, 11, overlap_allowed=True)])
+    db.commit()
+
+    # Sobre a linha comum: fica para a constraint no commit (sem consulta prévia)
+    ensure_no_conflict(db, 1, 1, datetime(2026, 3, 2, 8), datetime(2026, 3, 2, 9, 30))
+
+    # Sobre o encaixe forçado a constraint não olha: o check prévio barra
+    with pytest.raises(HTTPException) as error:
+        ensure_no_conflict(db, 1, 1, datetime(2026, 3, 2, 10), datetime(2026, 3, 2, 10, 30))
+    assert error.value.status_code == 409
+
+    ensure_no_conflict(db, 1, 1, datetime(2026, 3, 2, 11), datetime(2026, 3, 2, 12))
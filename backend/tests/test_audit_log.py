@@ -0,0 +1,154 @@
+"""
+Testes do audit log assíncrono (stream Redis + flush em lote)
+"""
+import itertools
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.main  # noqa: F401 - registra todos os mappers
+from app.core import audit
+from app.core.config import settings
+from app.core.database import Base
+from app.core.rbac import CurrentUserContext
+from app.models.audit_log import AuditLog
+from app.models.company import Company
+
+
+class FakeRedisPipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return call
+
+    def execute(self):
+        return [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+class FakeStreamRedis:
+    """Stream com um consumer group: entregues e não confirmados ficam pendentes"""
+
+    def __init__(self):
+        self.entries = {}
+        self.delivered = set()
+        self.acked = set()
+        self._ids = itertools.count(1)
+
+    def pipeline(self, transaction=True):
+        return FakeRedisPipeline(self)
+
+    def xlen(self, key):
+        return len(self.entries)
+
+    def xadd(self, key, fields):
+        entry_id = f"{next(self._ids)}-0"
+        self.entries[entry_id] = fields
+        return entry_id
+
+    def xgroup_create(self, key, group, id="0", mkstream=False):
+        return True
+
+    def xautoclaim(self, key, group, consumer, min_idle_time, start_id="0-0", count=None):
+        pending = [(i, self.entries.get(i)) for i in self.delivered - self.acked]
+        return ["0-0", pending[:count], []]
+
+    def xreadgroup(self, group, consumer, streams, count=None):
+        new = [(i, fields) for i, fields in self.entries.items() if i not in self.delivered][:count]
+        self.delivered.update(i for i, _ in new)
+        return [[audit.AUDIT_STREAM_KEY, new]] if new else []
+
+    def xack(self, key, group, *ids):
+        self.acked.update(ids)
+
+    def xdel(self, key, *ids):
+        for entry_id in ids:
+            self.entries.pop(entry_id, None)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine, expire_on_commit=False)
+    monkeypatch.setattr(audit, "SessionLocal", factory)
+    monkeypatch.setattr(audit, "_backpressure_until", 0.0)
+    monkeypatch.setattr(settings, "AUDIT_ASYNC_ENABLED", True)
+    session = factory()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeStreamRedis()
+    monkeypatch.setattr(audit, "get_sync_redis", lambda: fake)
+    return fake
+
+
+CONTEXT = CurrentUserContext(user_id=1, email="admin@saas.com")
+
+
+def log(db, action="update_company", **kwargs):
+    return audit.log_action(db, action, "company", CONTEXT, resource_id=7, details={"field": "name"}, **kwargs)
+
+
+def test_events_are_queued_without_touching_the_caller_session(db, redis):
+    db.add(Company(name="pendente", slug="pendente", email="p@p.com"))
+
+    log(db)
+    log(db)
+
+    assert len(redis.entries) == 2
+    assert len(db.new) == 1  # Trabalho pendente de quem chamou continua sem commit
+    db.rollback()
+    assert db.query(AuditLog).count() == 0
+
+    assert audit.flush_audit_events() == 2
+    rows = db.query(AuditLog).all()
+    assert [(row.action, row.resource_id, row.details) for row in rows] == [("update_company", 7, {"field": "name"})] * 2
+    assert redis.entries == {}
+
+
+def test_durable_actions_and_backpressure_write_immediately(db, redis, monkeypatch):
+    log(db, action="delete_company")
+    assert db.query(AuditLog).count() == 1
+    assert redis.entries == {}
+
+    monkeypatch.setattr(settings, "AUDIT_STREAM_MAX_PENDING", 1)
+    log(db)
+    log(db)  # Vê o stream cheio: enfileirado, e liga o backpressure
+    log(db)  # Gravado na hora
+    assert len(redis.entries) == 2
+    assert db.query(AuditLog).count() == 2
+
+
+def test_failed_flush_keeps_events_for_the_next_run(db, redis, monkeypatch):
+    log(db)
+
+    def database_down(rows):
+        raise RuntimeError("database down")
+
+    original = audit._write_now
+    monkeypatch.setattr(audit, "_write_now", database_down)
+    with pytest.raises(RuntimeError):
+        audit.flush_audit_events()
+    assert len(redis.entries) == 1 and not redis.acked
+
+    monkeypatch.setattr(audit, "_write_now", original)
+    assert audit.flush_audit_events() == 1  # Reclamado do consumer que falhou
+    assert db.query(AuditLog).count() == 1
+    assert redis.entries == {}
+
+
+def test_flush_task_is_routed_to_a_declared_queue():
+    from app.tasks.celery_app import celery_app
+
+    queue = celery_app.amqp.router.route({}, "app.tasks.audit_tasks.flush_audit_log")["queue"].name
+    assert queue in celery_app.conf.task_queues
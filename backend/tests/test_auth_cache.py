@@ -0,0 +1,121 @@
+"""
+Testes do cache de autenticação (funções puras e Redis em memória, sem banco)
+"""
+import asyncio
+import time
+
+from app.core import auth_cache
+from app.core.auth_cache import AuthProjection
+from app.core.cache import ProjectionLRU
+from app.services.token_blacklist import user_revoked_key
+
+
+def make_projection(user_id=1, **overrides):
+    data = dict(
+        user_id=user_id,
+        email=f"user{user_id}@example.com",
+        is_active=True,
+        role="manager",
+        saas_role=None,
+        company_id=10,
+        company_roles={10: "COMPANY_MANAGER", 20: "COMPANY_PROFESSIONAL"},
+        loaded_at=time.time(),
+    )
+    data.update(overrides)
+    return AuthProjection(**data)
+
+
+def test_projection_json_roundtrip_keeps_int_company_keys():
+    projection = make_projection()
+    restored = AuthProjection.from_json(projection.to_json(), revoked_at=123)
+
+    assert restored.company_roles == {10: "COMPANY_MANAGER", 20: "COMPANY_PROFESSIONAL"}
+    assert restored.revoked_at == 123
+    assert restored.email == projection.email
+    assert restored.loaded_at == projection.loaded_at
+
+
+def test_revoked_at_is_not_serialized():
+    projection = make_projection(revoked_at=999)
+    assert "revoked_at" not in projection.to_json()
+
+
+def test_token_revocation_uses_issued_at():
+    projection = make_projection(revoked_at=1_000)
+
+    assert projection.is_token_revoked(999)
+    assert projection.is_token_revoked(None)
+    assert not projection.is_token_revoked(1_000)
+    assert not make_projection().is_token_revoked(None)
+
+
+def test_local_lru_evicts_least_recently_used():
+    lru = ProjectionLRU(max_entries=2, ttl=60)
+    lru.put(make_projection(1))
+    lru.put(make_projection(2))
+    assert lru.get(1) is not None  # 1 passa a ser o mais recente
+
+    lru.put(make_projection(3))
+
+    assert lru.get(2) is None
+    assert lru.get(1) is not None
+    assert lru.get(3) is not None
+
+
+def test_local_lru_expires_entries():
+    lru = ProjectionLRU(max_entries=10, ttl=0)
+    lru.put(make_projection(1))
+    assert lru.get(1) is None
+
+
+def test_local_lru_pop():
+    lru = ProjectionLRU(max_entries=10, ttl=60)
+    lru.put(make_projection(1))
+    lru.pop(1)
+    lru.pop(42)
+    assert lru.get(1) is None
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.commands = []
+
+    def pipeline(self, transaction=False):
+        return self
+
+    def setex(self, key, ttl, value):
+        self.commands.append((key, value))
+
+    def delete(self, key):
+        self.commands.append((key, None))
+
+    async def execute(self):
+        for key, value in self.commands:
+            if value is None:
+                self.data.pop(key, None)
+            else:
+                self.data[key] = value
+        self.commands = []
+
+    async def mget(self, *keys):
+        return [self.data.get(key) for key in keys]
+
+
+def test_revocation_shares_the_token_blacklist_key(monkeypatch):
+    redis = FakeRedis()
+
+    async def get_redis():
+        return redis
+
+    monkeypatch.setattr(auth_cache, "get_redis", get_redis)
+
+    async def scenario():
+        await auth_cache.invalidate_user(1, revoked_at=1_000)
+        redis.data[auth_cache._key(1)] = make_projection(loaded_at=time.time() + 1).to_json()
+        return await auth_cache.get_auth_projection(None, 1)
+
+    projection = asyncio.run(scenario())
+    assert redis.data[user_revoked_key(1)] == "1000"
+    assert projection.revoked_at == 1_000
+    auth_cache._local.pop(1)
@@ -0,0 +1,171 @@
+"""
+Testes do cache de ocupação com escrita em duas fases (app.services.availability_cache)
+"""
+import asyncio
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.main  # noqa: F401 - registra todos os mappers
+from app.core.database import Base
+from app.models.appointment import Appointment, AppointmentStatus
+from app.models.company import Company
+from app.services import availability_cache
+
+DAY = date(2026, 3, 2)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(*args):
+            self.calls.append((name, args))
+            return self
+        return call
+
+    async def execute(self):
+        return [getattr(self.redis, f"_{name}")(*args) for name, args in self.calls]
+
+
+class FakeOccupancyRedis:
+    """Strings + os dois scripts Lua do availability_cache, em Python"""
+
+    def __init__(self):
+        self.data = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def register_script(self, script):
+        handler = {
+            availability_cache._STORE_SCRIPT: self._store,
+            availability_cache._PATCH_SCRIPT: self._patch,
+        }[script]
+
+        async def run(keys, args):
+            return handler(keys, args)
+        return run
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def _exists(self, key):
+        return int(key in self.data)
+
+    def _get(self, key):
+        return self.data.get(key)
+
+    def _incr(self, key):
+        self.data[key] = str(int(self.data.get(key) or 0) + 1)
+        return int(self.data[key])
+
+    def _expire(self, key, ttl):
+        return True
+
+    def _execute_command(self, command, key, *args):
+        assert command == "BITFIELD"
+        counters = self.data.get(key, b"")
+        chunks = []
+        for offset in args[2::3]:
+            index = int(offset[1:]) * 4
+            chunks.append(int.from_bytes(counters[index:index + 4].ljust(4, b"\0"), "big"))
+        return chunks
+
+    def _store(self, keys, args):
+        if (self.data.get(keys[1]) or "") != args[0]:
+            return 0
+        self.data[keys[0]] = bytes(args[1])
+        self.data[keys[2]] = args[0]
+        return 1
+
+    def _patch(self, keys, args):
+        self._incr(keys[1])
+        if keys[0] not in self.data:
+            return 0
+        built = int(self.data.get(keys[2]) or 0)
+        if args[4] == "" or built >= int(args[4]):
+            self.data.pop(keys[0], None)
+            self.data.pop(keys[2], None)
+            return -1
+        counters = bytearray(self.data[keys[0]])
+        for tick in range(args[1], args[2]):
+            counters[tick] = max(0, min(255, counters[tick] + args[0]))
+        self.data[keys[0]] = bytes(counters)
+        return 1
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeOccupancyRedis()
+
+    async def get_redis():
+        return fake
+
+    monkeypatch.setattr(availability_cache, "get_redis", get_redis)
+    return fake
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine, expire_on_commit=False)()
+    session.add(Company(id=1, name="c", slug="c", email="c@c.com"))
+    session.commit()
+    yield session
+    session.close()
+
+
+def appointment(db, start_hour, end_hour):
+    item = Appointment(
+        company_id=1, professional_id=1, status=AppointmentStatus.CONFIRMED,
+        start_time=datetime(2026, 3, 2, start_hour), end_time=datetime(2026, 3, 2, end_hour),
+    )
+    db.add(item)
+    db.commit()
+    return item
+
+
+def is_free(db, start_hour, end_hour):
+    return asyncio.run(availability_cache.is_interval_free(
+        db, 1, 1, datetime(2026, 3, 2, start_hour), datetime(2026, 3, 2, end_hour)
+    ))
+
+
+def cancel(db, item, rebuild_between_commit_and_patch=False):
+    before = availability_cache.snapshot(item)
+    tickets = asyncio.run(availability_cache.begin_change(before))
+    item.status = AppointmentStatus.CANCELLED
+    db.commit()
+    if rebuild_between_commit_and_patch:
+        # Miss concorrente: monta a ocupação já sem o agendamento cancelado
+        assert not is_free(db, 9, 10)
+    asyncio.run(availability_cache.record_change(before, None, tickets))
+
+
+def test_release_is_not_applied_twice_after_concurrent_rebuild(db, redis):
+    appointment(db, 9, 10)
+    overlapping = appointment(db, 9, 10)
+
+    cancel(db, overlapping, rebuild_between_commit_and_patch=True)
+
+    # Sem o ticket, o -1 cairia sobre a ocupação já recalculada e liberaria 9h-10h
+    assert not is_free(db, 9, 10)
+
+
+def test_change_after_cached_rebuild_is_applied_as_delta(db, redis):
+    first = appointment(db, 9, 10)
+    assert not is_free(db, 9, 10)  # Ocupação em cache, montada antes da escrita
+
+    cancel(db, first)
+
+    key = availability_cache._key(1, 1, DAY)
+    assert key in redis.data  # Patch aplicado, sem descartar o dia
+    assert is_free(db, 9, 10)
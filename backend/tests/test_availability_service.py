@@ -0,0 +1,164 @@
+"""
+Testes do motor de disponibilidade (funções puras, sem banco)
+"""
+from datetime import date, datetime, time
+from types import SimpleNamespace
+
+from app.services.availability_service import (
+    compute_free_slots,
+    compute_free_slots_from_mask,
+    counters_to_mask,
+    days_touched,
+    intervals_to_mask,
+    merge_intervals,
+    tick_counters,
+    tick_range,
+    working_minutes_for_day,
+    working_windows_for_day,
+)
+
+# 2026-03-02 é uma segunda-feira
+MONDAY = date(2026, 3, 2)
+
+
+def dt(hour, minute=0, day=MONDAY):
+    return datetime.combine(day, time(hour, minute))
+
+
+def test_merge_intervals_fuses_overlapping_and_adjacent():
+    merged = merge_intervals([
+        (dt(11), dt(12)),
+        (dt(9), dt(10)),
+        (dt(9, 30), dt(10, 30)),
+        (dt(10, 30), dt(10, 45)),
+    ])
+    assert merged == [(dt(9), dt(10, 45)), (dt(11), dt(12))]
+
+
+def test_free_slots_skip_busy_intervals():
+    slots = compute_free_slots(
+        windows=[(dt(9), dt(12))],
+        busy=merge_intervals([(dt(10), dt(10, 45))]),
+        duration_minutes=30,
+        step_minutes=15,
+    )
+    assert [s.strftime("%H:%M") for s in slots] == [
+        "09:00", "09:15", "09:30",
+        "10:45", "11:00", "11:15", "11:30",
+    ]
+
+
+def test_free_slots_respect_not_before_and_grid():
+    slots = compute_free_slots(
+        windows=[(dt(9), dt(10))],
+        busy=[],
+        duration_minutes=15,
+        step_minutes=15,
+        not_before=dt(9, 7),
+    )
+    assert [s.strftime("%H:%M") for s in slots] == ["09:15", "09:30", "09:45"]
+
+
+def test_busy_block_spanning_window_start():
+    slots = compute_free_slots(
+        windows=[(dt(9), dt(11))],
+        busy=[(dt(8), dt(10))],
+        duration_minutes=60,
+        step_minutes=30,
+    )
+    assert slots == [dt(10)]
+
+
+def test_company_closed_day_has_no_window():
+    windows, _ = working_windows_for_day(
+        MONDAY,
+        business_hours={"monday": {"closed": True}},
+        working_hours=None,
+    )
+    assert windows == []
+
+
+def test_company_and_professional_hours_intersect_with_break():
+    windows, breaks = working_windows_for_day(
+        MONDAY,
+        business_hours={"monday": {"start": "08:00", "end": "18:00"}},
+        working_hours={"monday": {"start": "10:00", "end": "19:00", "breakStart": "12:00", "breakEnd": "13:00"}},
+    )
+    assert windows == [(dt(10), dt(18))]
+    assert breaks == [(dt(12), dt(13))]
+
+
+def test_override_replaces_regular_hours():
+    override = SimpleNamespace(
+        id=1,
+        is_active=True,
+        start_date=MONDAY,
+        end_date=MONDAY,
+        week_days='["monday"]',
+        start_time=time(14, 0),
+        end_time=time(16, 0),
+        break_start_time=None,
+        break_end_time=None,
+    )
+    windows, _ = working_windows_for_day(
+        MONDAY,
+        business_hours=None,
+        working_hours={"monday": {"start": "09:00", "end": "18:00"}},
+        overrides=[override],
+    )
+    assert windows == [(dt(14), dt(16))]
+
+
+def test_override_day_off():
+    override = SimpleNamespace(
+        id=1,
+        is_active=True,
+        start_date=MONDAY,
+        end_date=MONDAY,
+        week_days="{monday,tuesday}",
+        start_time=None,
+        end_time=None,
+        break_start_time=None,
+        break_end_time=None,
+    )
+    windows, _ = working_windows_for_day(MONDAY, None, None, overrides=[override])
+    assert windows == []
+
+
+def test_working_minutes_discount_breaks_inside_window():
+    minutes = working_minutes_for_day(
+        MONDAY,
+        business_hours={"monday": {"start": "08:00", "end": "18:00", "breakStart": "17:30", "breakEnd": "19:00"}},
+        working_hours={"monday": {"start": "10:00", "end": "19:00", "breakStart": "12:00", "breakEnd": "13:00"}},
+    )
+    # 10:00-18:00, menos 12:00-13:00 e 17:30-18:00
+    assert minutes == 8 * 60 - 60 - 30
+
+
+def test_working_minutes_zero_on_day_off():
+    assert working_minutes_for_day(MONDAY, {"monday": {"closed": True}}, None) == 0
+
+
+def test_tick_range_rounds_conservatively():
+    assert tick_range(MONDAY, dt(9, 2), dt(9, 11)) == (108, 111)
+
+
+def test_counters_keep_overlaps():
+    counters = tick_counters(MONDAY, [(dt(9), dt(10)), (dt(9, 30), dt(10))])
+    assert counters[114] == 2
+    assert counters_to_mask(counters) == intervals_to_mask(MONDAY, [(dt(9), dt(10))])
+
+
+def test_interval_across_midnight_touches_both_days():
+    sunday_night = datetime(2026, 3, 1, 23, 30)
+    assert days_touched(sunday_night, dt(0, 30)) == [date(2026, 3, 1), MONDAY]
+
+
+def test_mask_slots_match_interval_sweep():
+    windows = [(dt(8), dt(18))]
+    busy = [(dt(9, 10), dt(9, 50)), (dt(12), dt(13)), (dt(16, 45), dt(17, 5))]
+    expected = compute_free_slots(windows, merge_intervals(busy), 45, step_minutes=15, not_before=dt(8, 20))
+    from_mask = compute_free_slots_from_mask(
+        MONDAY, windows, intervals_to_mask(MONDAY, busy), 45, step_minutes=15, not_before=dt(8, 20)
+    )
+    assert from_mask == expected
@@ -0,0 +1,216 @@
+"""
+Testes do cache: camada local, single-flight, stale-while-revalidate e
+namespaces versionados (invalidação por INCR)
+"""
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.core import cache, performance
+
+
+class FakeRedis:
+    """Subconjunto em memória dos comandos usados pelo cache"""
+
+    def __init__(self):
+        self.data = {}
+        self.gets = 0
+
+    async def get(self, key):
+        self.gets += 1
+        return self.data.get(key)
+
+    async def setex(self, key, ttl, value):
+        self.data[key] = value
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    async def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1)
+        return int(self.data[key])
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeRedis()
+
+    async def get_redis():
+        return fake
+
+    monkeypatch.setattr(cache, "get_redis", get_redis)
+    cache.local_cache.clear()
+    yield fake
+    cache.local_cache.clear()
+
+
+def test_local_tier_serves_hot_reads_without_redis(redis):
+    async def run():
+        await cache.set_cache("dashboard:overview:1", {"total": 1})
+        redis.data["dashboard:overview:1"] = json.dumps({"total": 2})
+        return await cache.get_cache("dashboard:overview:1")
+
+    assert asyncio.run(run()) == {"total": 1}
+    assert redis.gets == 0
+
+
+def test_local_cache_is_bounded_lru():
+    local = cache.LocalCache(max_entries=2)
+    local.put("a", 1, 60)
+    local.put("b", 2, 60)
+    local.get("a")
+    local.put("c", 3, 60)
+    assert local.get("b") == (False, None)
+    assert local.get("a") == (True, 1)
+    local.put("d", 4, -1)
+    assert local.get("d") == (False, None)
+
+
+def test_concurrent_misses_compute_once(redis):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"value": len(calls)}
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_compute("dashboard:overview:1", compute) for _ in range(20)))
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(result == {"value": 1} for result in results)
+
+
+def test_stale_value_is_served_while_one_request_revalidates(redis):
+    key = "dashboard:overview:1"
+    redis.data[key] = json.dumps({"fresh_until": time.time() - 1, "value": "old"})
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def compute():
+        started.set()
+        await release.wait()
+        return "new"
+
+    async def failing():
+        raise RuntimeError("db down")
+
+    async def refreshed():
+        await asyncio.gather(*cache._refresh_tasks)
+
+    async def run():
+        redis.data[f"{key}:refresh"] = "1"  # outro worker está recalculando
+        served = [await cache.get_or_compute(key, compute)]
+        del redis.data[f"{key}:refresh"]
+
+        # Falha no refresh em background: segue servindo o valor antigo
+        served.append(await cache.get_or_compute(key, failing))
+        await refreshed()
+        del redis.data[f"{key}:refresh"]
+
+        # Quem ganha o lock também recebe o valor antigo, sem esperar o cálculo
+        served.append(await cache.get_or_compute(key, compute))
+        await started.wait()
+        served.append(await cache.get_or_compute(key, compute))
+        release.set()
+        await refreshed()
+        return served
+
+    assert asyncio.run(run()) == ["old", "old", "old", "old"]
+    assert json.loads(redis.data[key])["value"] == "new"
+
+
+def test_waiters_take_over_when_the_computing_request_is_cancelled(redis):
+    key = "dashboard:overview:1"
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def run():
+        owner = asyncio.ensure_future(cache.get_or_compute(key, compute))
+        await asyncio.sleep(0)
+        waiters = [asyncio.ensure_future(cache.get_or_compute(key, compute)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        owner.cancel()  # Cliente desconectou no meio do cálculo
+        results = await asyncio.gather(*waiters)
+        return owner.cancelled(), results
+
+    owner_cancelled, results = asyncio.run(run())
+    assert owner_cancelled
+    assert results == [2, 2, 2]  # Um único novo cálculo, assumido por um dos que aguardavam
+    assert cache._inflight == {}
+
+
+def test_invalidate_moves_namespace_to_next_generation(redis):
+    async def run():
+        before = await cache.namespaced_key("clients", 1, "list", 0, 100)
+        other_company = await cache.namespaced_key("clients", 2, "list", 0, 100)
+        await cache.invalidate_namespace("clients", 1)
+        after = await cache.namespaced_key("clients", 1, "list", 0, 100)
+        return before, other_company, after
+
+    before, other_company, after = asyncio.run(run())
+    assert before == "clients:1:v0:list:0:100"
+    assert after == "clients:1:v1:list:0:100"
+    assert other_company == "clients:2:v0:list:0:100"
+    assert redis.data == {"ns:clients:1": "1"}
+
+
+def test_namespace_generation_is_read_from_redis_once_per_local_ttl(redis):
+    async def run():
+        keys = [await cache.namespaced_key("clients", 1, "list", page) for page in range(5)]
+        await cache.invalidate_namespace("clients", 1)  # o próprio worker vê a nova geração na hora
+        return keys, await cache.namespaced_key("clients", 1, "list", 0)
+
+    keys, after = asyncio.run(run())
+    assert keys[0] == "clients:1:v0:list:0"
+    assert after == "clients:1:v1:list:0"
+    assert redis.gets == 1
+
+
+def test_namespace_falls_back_to_generation_zero_without_redis(monkeypatch):
+    async def no_redis():
+        return None
+
+    monkeypatch.setattr(cache, "get_redis", no_redis)
+    assert asyncio.run(cache.namespaced_key("clients", 1, "list")) == "clients:1:v0:list"
+    assert asyncio.run(cache.invalidate_namespace("clients", 1)) == 0
+
+
+def test_list_decorators_share_namespace(redis):
+    calls = []
+    user = SimpleNamespace(company_id=7)
+
+    @performance.cache_list_result(key_prefix="products")
+    async def list_products(skip=0, limit=100, current_user=None):
+        calls.append(skip)
+        return [{"id": len(calls)}]
+
+    @performance.invalidate_cache_pattern("products")
+    async def create_product(current_user=None):
+        return "created"
+
+    async def run():
+        first = await list_products(current_user=user)
+        cached = await list_products(current_user=user)
+        await create_product(current_user=user)
+        refreshed = await list_products(current_user=user)
+        return first, cached, refreshed
+
+    first, cached, refreshed = asyncio.run(run())
+    assert first == cached == [{"id": 1}]
+    assert refreshed == [{"id": 2}]
+    assert json.loads(redis.data["products:7:v1:list_products:0:100"]) == [{"id": 2}]
@@ -0,0 +1,49 @@
+"""
+Testes da sincronização de agendamentos do Calendly (ocupação em cache acompanha as escritas)
+"""
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.main  # noqa: F401 - registra todos os mappers
+from app.core.database import Base
+from app.models.appointment import Appointment, AppointmentStatus
+from app.models.calendly_integration import CalendlySyncLog, CalendlyWebhookEvent
+from app.models.company import Company
+from app.services import availability_cache
+from app.services.calendly_service import CalendlyService
+
+EVENT_URI = "https://api.calendly.com/scheduled_events/abc"
+
+
+def test_invitee_cancel_releases_cached_occupancy(monkeypatch):
+    changes = []
+    monkeypatch.setattr(availability_cache, "begin_change_sync", lambda *occupancies: {"ticket": 1})
+    monkeypatch.setattr(availability_cache, "record_change_sync",
+                        lambda before, after, tickets: changes.append((before, after, tickets)))
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add(Company(id=1, name="c", slug="c", email="c@c.com"))
+    start = datetime(2026, 3, 2, 14)
+    appointment = Appointment(company_id=1, professional_id=1, status=AppointmentStatus.CONFIRMED,
+                              start_time=start, end_time=start.replace(hour=15))
+    db.add(appointment)
+    db.flush()
+    db.add(CalendlySyncLog(integration_id=1, appointment_id=appointment.id, sync_direction="from_calendly",
+                           action="create", status="success", calendly_event_uri=EVENT_URI))
+    webhook_event = CalendlyWebhookEvent(integration_id=1, event_type="invitee.canceled",
+                                         payload={"payload": {"scheduled_event": {"uri": EVENT_URI}}})
+    db.add(webhook_event)
+    db.commit()
+
+    result = asyncio.run(CalendlyService(db)._handle_invitee_canceled(webhook_event))
+
+    assert result["action"] == "cancelled"
+    before, after, tickets = changes.pop()
+    assert (before.start_time, after, tickets) == (start, None, {"ticket": 1})
+    db.close()
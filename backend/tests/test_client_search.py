@@ -0,0 +1,84 @@
+"""
+Testes da busca de clientes (colunas normalizadas, filtros por tipo de termo e ranking)
+"""
+import asyncio
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+import app.main  # noqa: F401 - registra todos os mappers
+from app.core.database import Base
+from app.models.client import Client
+from app.models.company import Company
+from app.services.client_search import search_clients
+from app.utils.search_normalizer import normalize_search_text, only_digits
+
+
+def test_normalizers():
+    assert normalize_search_text("  José   ÁVILA ") == "jose avila"
+    assert normalize_search_text("   ") is None
+    assert only_digits("(11) 98765-4321") == "11987654321"
+    assert only_digits("sem número") is None
+
+
+def _search(*terms, include_inactive=False):
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        statements = []
+
+        @event.listens_for(engine.sync_engine, "before_cursor_execute")
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            async with async_sessionmaker(engine)() as db:
+                db.add_all([Company(id=1, name="a", slug="a", email="a@a.com"),
+                            Company(id=2, name="b", slug="b", email="b@b.com")])
+                db.add_all([
+                    Client(company_id=1, full_name="Mariana Souza", cellphone="(11) 98765-4321"),
+                    Client(company_id=1, full_name="Ana Mária", nickname="Aninha", email="Ana@Mail.com",
+                           cpf="123.456.789-00"),
+                    Client(company_id=1, full_name="Joana Maria", is_active=False),
+                    Client(company_id=2, full_name="Maria de Outra Empresa"),
+                ])
+                await db.commit()
+
+                client = await db.scalar(select(Client).where(Client.full_name == "Ana Mária"))
+                assert client.search_name == "ana maria aninha"
+                assert client.cpf_digits == "12345678900"
+
+                statements.clear()
+                results = [
+                    [row["full_name"] for row in await search_clients(db, 1, term, include_inactive=include_inactive)]
+                    for term in terms
+                ]
+                return results, statements
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+
+def test_name_search_ignores_accents_and_ranks_prefix_first():
+    (maria,), statements = _search("MARIA")
+    assert maria == ["Mariana Souza", "Ana Mária"]
+    # projeção enxuta, sem colunas de endereço
+    assert "address" not in statements[0]
+
+    (with_inactive,), _ = _search("maria", include_inactive=True)
+    assert with_inactive == ["Mariana Souza", "Ana Mária", "Joana Maria"]
+
+
+def test_digit_email_and_short_terms():
+    results, _ = _search("11987", "(11) 9876", "123.456", "ana@mail", "an", "so", "5%")
+    assert results == [
+        ["Mariana Souza"], ["Mariana Souza"], ["Ana Mária"], ["Ana Mária"], ["Ana Mária"], ["Mariana Souza"], [],
+    ]
+
+
+def test_partial_email_and_accent_only_terms():
+    results, _ = _search("mail.com", "@mail", "na@ma", "\u0301", "\u0301\u0301\u0301")
+    assert results == [["Ana Mária"], ["Ana Mária"], ["Ana Mária"], [], []]
@@ -0,0 +1,143 @@
+"""
+Testes do relatório consolidado (aiosqlite em arquivo temporário, uma conexão por seção)
+"""
+import asyncio
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import app.main  # noqa: F401 - registra todos os mappers
+from app.core.database import Base
+from app.models.command import Command, CommandItem, CommandItemType, CommandStatus
+from app.models.commission import Commission
+from app.models.company import Company
+from app.models.financial import FinancialCategory, FinancialTransaction
+from app.models.review import Review
+from app.models.service import Service
+from app.models.user import User, UserRole
+from app.services import consolidated_report, revenue_forecast
+from app.services.consolidated_report import SECTIONS, ConsolidatedReport
+
+START = date(2026, 3, 1)
+END = date(2026, 3, 31)
+
+
+def at(day, hour=10):
+    return datetime.combine(day, time(hour))
+
+
+def transaction(type_, origin, value, day, net_value=None, category_id=None):
+    return FinancialTransaction(
+        company_id=1, type=type_, origin=origin, value=Decimal(value), net_value=Decimal(net_value or value),
+        date=at(day), category_id=category_id, description=f"{origin} {value}",
+    )
+
+
+async def _seed(db):
+    db.add(Company(id=1, name="c", slug="c", email="c@c.com"))
+    db.add(User(id=1, company_id=1, email="p@p.com", password_hash="x", full_name="P", role=UserRole.PROFESSIONAL))
+    db.add(FinancialCategory(id=1, company_id=1, name="Aluguel", type="expense"))
+    db.add(Service(id=1, company_id=1, name="Corte", price=Decimal("50")))
+    db.add_all([
+        transaction("income", "command", "100", START, net_value="95"),
+        transaction("income", "command", "200", END, net_value="190"),
+        transaction("expense", "manual", "300", date(2026, 3, 10), category_id=1),
+        transaction("expense", "commission", "40", date(2026, 3, 11)),
+        transaction("expense", "purchase", "60", date(2026, 3, 12)),
+        transaction("expense", "manual", "999", date(2026, 4, 1)),  # fora do período
+        Command(id=1, company_id=1, client_crm_id=1, professional_id=1, number="1", date=at(START),
+                status=CommandStatus.FINISHED, total_value=Decimal("80")),
+        Command(id=2, company_id=1, client_crm_id=1, professional_id=1, number="2", date=at(END),
+                status=CommandStatus.FINISHED, total_value=Decimal("20")),
+        CommandItem(command_id=1, item_type=CommandItemType.SERVICE, reference_id=1, service_id=1,
+                    unit_value=Decimal("80"), total_value=Decimal("80")),
+        Commission(company_id=1, command_id=1, professional_id=1, base_value=Decimal("80"),
+                   commission_percentage=10, commission_value=Decimal("8"), created_at=at(START)),
+        # Duas avaliações não podem multiplicar o faturamento do profissional
+        Review(company_id=1, appointment_id=1, client_crm_id=1, professional_id=1, rating=4, created_at=at(START)),
+        Review(company_id=1, appointment_id=2, client_crm_id=1, professional_id=1, rating=5, created_at=at(START)),
+    ])
+    await db.commit()
+
+
+async def _no_cache(*args, **kwargs):
+    return None
+
+
+async def _run(tmp_path, monkeypatch, stream=False, section=None):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'reports.db'}")
+    statements = []
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        async with session_factory() as db:
+            await _seed(db)
+
+        monkeypatch.setattr(consolidated_report, "AsyncSessionLocal", session_factory)
+        monkeypatch.setattr(revenue_forecast, "get_cache", _no_cache)
+        monkeypatch.setattr(revenue_forecast, "set_cache", _no_cache)
+        statements.clear()
+
+        report = ConsolidatedReport(1, START, END)
+        if section:
+            return await report.section(section), statements
+        if stream:
+            return [name async for name, _ in report.iter_sections()], statements
+        return await report.build(), statements
+    finally:
+        await engine.dispose()
+
+
+def test_consolidated_report_sections(tmp_path, monkeypatch):
+    result, statements = asyncio.run(_run(tmp_path, monkeypatch))
+
+    expenses = result["expenses"]
+    assert expenses["total_expenses"] == 400
+    assert expenses["by_category"] == [{"category": "Aluguel", "total": 300, "count": 1, "percentage": 75}]
+    assert {item["origin"]: item["total"] for item in expenses["by_origin"]} == {
+        "manual": 300, "commission": 40, "purchase": 60
+    }
+    assert [item["value"] for item in expenses["top_expenses"]] == [300, 60, 40]
+
+    dre = result["financial_results"]["dre"]
+    assert (dre["receita_bruta"], dre["receita_liquida"], dre["taxas_gateway"]) == (300, 285, 15)
+    assert (dre["comissoes"], dre["compras"], dre["outras_despesas"]) == (40, 60, 300)
+    assert dre["lucro_operacional"] == 285 - 40 - 60 - 300
+    assert result["financial_results"]["by_month"] == [
+        {"month": "2026-03", "income": 285, "expense": 400, "profit": -115}
+    ]
+
+    assert result["by_service"]["services"][0]["total_revenue"] == 80
+    professional = result["by_professional"]["professionals"][0]
+    assert (professional["command_count"], professional["total_revenue"]) == (2, 100)
+    assert (professional["total_commission"], professional["avg_rating"]) == (8, 4.5)
+
+    assert len(result["revenue_forecast"]["historical"]) == 6
+
+    # Uma única varredura do período alimenta despesas e DRE; a outra é o histórico da projeção
+    grouped_scans = [s for s in statements if "financial_transactions" in s and "GROUP BY" in s]
+    assert len(grouped_scans) == 2
+
+
+def test_iter_sections_yields_every_section_once(tmp_path, monkeypatch):
+    names, _ = asyncio.run(_run(tmp_path, monkeypatch, stream=True))
+    assert sorted(names) == sorted(SECTIONS)
+
+
+def test_standalone_section_matches_consolidated_document(tmp_path, monkeypatch):
+    # Os endpoints avulsos (/reports/financial-results etc.) usam a mesma seção
+    consolidated, _ = asyncio.run(_run(tmp_path, monkeypatch))
+    for name in ("expenses", "financial_results", "by_service", "by_professional"):
+        (tmp_path / name).mkdir()
+        section, _ = asyncio.run(_run(tmp_path / name, monkeypatch, section=name))
+        assert section == consolidated[name]
@@ -235,3 +235,18 @@ class TestDataIntegrity:
         # Verify all were created
         assert db_session.query(User).filter(User.role.in_(valid_roles)).count() == len(valid_roles)
 
+
+
+class TestAsyncDatabaseUrl:
+    """Test async driver selection for the AsyncSession engine"""
+    
+    def test_postgres_url_uses_asyncpg(self):
+        """PostgreSQL URLs (with or without explicit driver) map to asyncpg"""
+        from app.core.database import get_async_database_url
+        assert get_async_database_url("postgresql://u:p@db:5432/app") == "postgresql+asyncpg://u:p@db:5432/app"
+        assert get_async_database_url("postgresql+psycopg2://u:p@db/app") == "postgresql+asyncpg://u:p@db/app"
+    
+    def test_sqlite_url_uses_aiosqlite(self):
+        """SQLite URLs map to aiosqlite"""
+        from app.core.database import get_async_database_url
+        assert get_async_database_url("sqlite:///:memory:") == "sqlite+aiosqlite:///:memory:"
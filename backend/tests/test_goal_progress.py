@@ -0,0 +1,108 @@
+"""
+Testes do progresso das metas agregado em SQL (app.services.goal_progress)
+"""
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.main  # noqa: F401 - registra todos os mappers
+from app.core.database import Base
+from app.models.appointment import Appointment, AppointmentStatus
+from app.models.command import Command, CommandItem, CommandItemType, CommandStatus
+from app.models.company import Company
+from app.models.financial import FinancialTransaction
+from app.models.goal import Goal, GoalType
+from app.services.goal_progress import refresh_company_goals, refresh_goals
+
+DAY = date(2026, 3, 2)
+
+
+def at(day, hour=10):
+    return datetime.combine(day, datetime.min.time()) + timedelta(hours=hour)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine, expire_on_commit=False)()  # como SessionLocal
+    session.add(Company(id=1, name="c", slug="c", email="c@c.com"))
+    session.commit()
+    yield session
+    session.close()
+
+
+def goal(goal_type, target, professional_id=None, start=DAY, end=DAY + timedelta(days=30)):
+    return Goal(
+        company_id=1, professional_id=professional_id, type=goal_type, target_value=Decimal(target),
+        period_start=at(start, 0), period_end=at(end, 23),
+    )
+
+
+def command(professional_id, value, status=CommandStatus.FINISHED, day=DAY, products=0):
+    items = []
+    if products:
+        items.append(CommandItem(
+            item_type=CommandItemType.PRODUCT, reference_id=1, quantity=products,
+            unit_value=Decimal("1"), total_value=Decimal(products),
+        ))
+    return Command(
+        company_id=1, client_crm_id=1, professional_id=professional_id, number=f"{professional_id}-{value}",
+        date=at(day), status=status, net_value=Decimal(value), items=items,
+    )
+
+
+def test_refresh_goals_aggregates_each_type_in_grouped_queries(db):
+    goals = [
+        goal(GoalType.REVENUE, "200", professional_id=1),
+        goal(GoalType.REVENUE, "200", professional_id=2),
+        goal(GoalType.REVENUE, "100"),
+        goal(GoalType.APPOINTMENTS, "4"),
+        goal(GoalType.APPOINTMENTS, "4", professional_id=1),
+        goal(GoalType.PRODUCT_SALES, "10"),
+        goal(GoalType.SERVICES, "10"),
+    ]
+    db.add_all(goals)
+    db.add_all([
+        command(1, "80", products=3),
+        command(1, "40", status=CommandStatus.OPEN, products=5),
+        command(1, "70", day=DAY - timedelta(days=1)),
+        command(2, "50", products=2),
+        FinancialTransaction(company_id=1, origin="manual", type="income", status="liquidated", value=Decimal("150"), date=at(DAY)),
+        FinancialTransaction(company_id=1, origin="manual", type="income", status="planned", value=Decimal("30"), date=at(DAY)),
+        Appointment(company_id=1, professional_id=1, status=AppointmentStatus.COMPLETED, start_time=at(DAY), end_time=at(DAY, 11)),
+        Appointment(company_id=1, professional_id=2, status=AppointmentStatus.COMPLETED, start_time=at(DAY), end_time=at(DAY, 11)),
+        Appointment(company_id=1, professional_id=2, status=AppointmentStatus.CANCELLED, start_time=at(DAY), end_time=at(DAY, 11)),
+    ])
+    db.commit()
+
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    refresh_goals(db, goals)
+    db.commit()
+
+    assert len([sql for sql in statements if sql.lstrip().upper().startswith("SELECT")]) == 4
+    assert [g.current_value for g in goals] == [
+        Decimal("80"), Decimal("50"), Decimal("150"), Decimal("2"), Decimal("1"), Decimal("5"), Decimal("0")
+    ]
+    assert [g.progress_percentage for g in goals] == [40, 25, 100, 50, 25, 50, 0]
+
+
+def test_refresh_company_goals_only_touches_goals_covering_the_days(db):
+    current = goal(GoalType.REVENUE, "100")
+    past = goal(GoalType.REVENUE, "100", start=DAY - timedelta(days=60), end=DAY - timedelta(days=31))
+    db.add_all([current, past, FinancialTransaction(
+        company_id=1, origin="manual", type="income", status="liquidated", value=Decimal("25"), date=at(DAY)
+    )])
+    db.commit()
+
+    assert refresh_company_goals(db, 1, [DAY]) == 1
+    db.commit()
+
+    assert current.current_value == Decimal("25")
+    assert current.progress_percentage == 25
+    assert past.progress_percentage in (0, None)
@@ -0,0 +1,74 @@
+"""
+Prometheus instrumentation: route template labels, per-request query counts,
+per-statement latency and pool checkout wait.
+"""
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, text
+
+from app.core.database import InstrumentedQueuePool, instrument_engine
+from app.core.metrics import PrometheusMiddleware, UNMATCHED_ROUTE
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def _build_app():
+    engine = create_engine(
+        "sqlite://", poolclass=InstrumentedQueuePool, connect_args={"check_same_thread": False}
+    )
+    instrument_engine(engine, InstrumentedQueuePool.metrics_name)
+
+    app = FastAPI()
+    app.add_middleware(PrometheusMiddleware)
+
+    @app.get("/metrics-test/items/{item_id}")
+    def read_item(item_id: int):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            conn.execute(text("SELECT :id"), {"id": item_id})
+        return {"id": item_id}
+
+    @app.get("/metrics-test/boom")
+    def boom():
+        raise RuntimeError("boom")
+
+    return app
+
+
+def test_requests_are_labeled_by_route_template_with_query_counts():
+    client = TestClient(_build_app())
+    endpoint = "/metrics-test/items/{item_id}"
+    labels = {"method": "GET", "endpoint": endpoint}
+
+    requests_before = _sample("http_requests_total", status_code="200", **labels)
+    queries_before = _sample("http_request_db_queries_sum", **labels)
+    selects_before = _sample("db_query_duration_seconds_count", query_type="SELECT")
+    waits_before = _sample("db_pool_checkout_wait_seconds_count", pool="sync")
+
+    assert client.get("/metrics-test/items/1").status_code == 200
+    assert client.get("/metrics-test/items/2").status_code == 200
+
+    # Um único label para os dois ids (cardinalidade limitada)
+    assert _sample("http_requests_total", status_code="200", **labels) == requests_before + 2
+    assert REGISTRY.get_sample_value(
+        "http_requests_total", {"method": "GET", "endpoint": "/metrics-test/items/1", "status_code": "200"}
+    ) is None
+    assert _sample("http_request_db_queries_sum", **labels) == queries_before + 4
+    assert _sample("db_query_duration_seconds_count", query_type="SELECT") == selects_before + 4
+    assert _sample("db_pool_checkout_wait_seconds_count", pool="sync") >= waits_before + 2
+
+
+def test_unmatched_and_failing_requests():
+    client = TestClient(_build_app(), raise_server_exceptions=False)
+
+    unmatched_before = _sample("http_requests_total", method="GET", endpoint=UNMATCHED_ROUTE, status_code="404")
+    errors_before = _sample("http_requests_total", method="GET", endpoint="/metrics-test/boom", status_code="500")
+
+    assert client.get("/metrics-test/nope/123").status_code == 404
+    assert client.get("/metrics-test/boom").status_code == 500
+
+    assert _sample("http_requests_total", method="GET", endpoint=UNMATCHED_ROUTE, status_code="404") == unmatched_before + 1
+    assert _sample("http_requests_total", method="GET", endpoint="/metrics-test/boom", status_code="500") == errors_before + 1
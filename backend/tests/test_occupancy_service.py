@@ -0,0 +1,107 @@
+"""
+Testes da ocupação por profissional do dashboard (aiosqlite em memória)
+"""
+import asyncio
+from datetime import date, datetime, time, timedelta
+
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+import app.main  # noqa: F401 - registra todos os mappers
+from app.api.v1.endpoints.dashboard import get_occupancy_rate
+from app.core.database import Base
+from app.models.appointment import Appointment, AppointmentStatus
+from app.models.company import Company
+from app.models.professional_schedule_override import ProfessionalScheduleOverride
+from app.models.user import User, UserRole
+from app.services.occupancy_service import get_professional_occupancy
+
+# 2026-03-02 é uma segunda-feira
+MONDAY = date(2026, 3, 2)
+HOURS = {"start": "09:00", "end": "17:00"}
+
+
+def at(day, hour):
+    return datetime.combine(day, time(hour))
+
+
+async def _run(professional_count, query=None):
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    statements = []
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        async with session_factory() as db:
+            db.add(Company(id=1, name="c", slug="c", email="c@c.com", business_hours={
+                day: HOURS for day in ("monday", "tuesday", "wednesday", "thursday", "friday")
+            }))
+            for index in range(professional_count):
+                db.add(User(
+                    id=index + 1, company_id=1, email=f"p{index}@p.com", password_hash="x",
+                    full_name=f"P{index}", role=UserRole.PROFESSIONAL, is_active=True,
+                ))
+            # P0: 4h confirmadas na segunda; o cancelado não conta
+            db.add_all([
+                Appointment(company_id=1, professional_id=1, status=AppointmentStatus.CONFIRMED,
+                            start_time=at(MONDAY, 9), end_time=at(MONDAY, 13)),
+                Appointment(company_id=1, professional_id=1, status=AppointmentStatus.CANCELLED,
+                            start_time=at(MONDAY, 14), end_time=at(MONDAY, 15)),
+            ])
+            # P1: folga na terça
+            db.add(ProfessionalScheduleOverride(
+                company_id=1, professional_id=2, description="folga", is_active=True,
+                start_date=MONDAY + timedelta(days=1), end_date=MONDAY + timedelta(days=1),
+                week_days='["tuesday"]',
+            ))
+            await db.commit()
+
+            statements.clear()
+            if query is not None:
+                return await query(db), len(statements)
+            result = await get_professional_occupancy(db, 1, MONDAY, MONDAY + timedelta(days=1))
+            return result, len(statements)
+    finally:
+        await engine.dispose()
+
+
+def test_occupancy_uses_real_capacity():
+    result, _ = asyncio.run(_run(2))
+    by_id = {row["professional_id"]: row for row in result}
+
+    assert by_id[1]["appointments"] == 1
+    assert by_id[1]["available_hours"] == 16
+    assert by_id[1]["occupancy_rate"] == 25
+    assert by_id[2]["available_hours"] == 8
+    assert result[0]["professional_id"] == 1
+
+
+def test_query_count_does_not_grow_with_professionals():
+    _, few = asyncio.run(_run(2))
+    _, many = asyncio.run(_run(40))
+    assert few == many == 4
+
+
+def test_dashboard_occupancy_rate_uses_working_capacity():
+    def query(db):
+        return get_occupancy_rate(
+            start_date=at(MONDAY, 0), end_date=at(MONDAY + timedelta(days=1), 0),
+            current_user=SimpleNamespace(company_id=1), db=db,
+        )
+
+    result, _ = asyncio.run(_run(2, query))
+
+    # 4h agendadas sobre 16h (P0) + 8h (P1, folga na terça), não 2 * 8 * dias
+    assert result["total_appointments"] == 1
+    assert result["available_hours"] == 24
+    assert result["occupancy_rate"] == 4 / 24 * 100
@@ -0,0 +1,74 @@
+"""
+Testes da paginação por cursor (keyset sobre (sort_key, id))
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException, Response
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.main  # noqa: F401 - registra todos os mappers
+from app.core.database import Base
+from app.core.pagination import NEXT_CURSOR_HEADER, KeysetPage, decode_cursor, encode_cursor
+from app.models.company import Company
+
+BASE_TIME = datetime(2026, 3, 1, 12, 0)
+
+
+def test_cursor_round_trip_and_invalid_cursor():
+    assert decode_cursor(encode_cursor(BASE_TIME, 7)) == (BASE_TIME, 7)
+    assert decode_cursor(encode_cursor("Ana", 3)) == ("Ana", 3)
+
+    for cursor in ("nao-e-cursor", encode_cursor(BASE_TIME, 7)[:-3]):
+        with pytest.raises(HTTPException) as exc:
+            decode_cursor(cursor)
+        assert exc.value.status_code == 400
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    # Pares com o mesmo created_at: o id desempata
+    session.add_all([
+        Company(id=i, name=f"c{i}", slug=f"c{i}", email=f"c{i}@c.com", created_at=BASE_TIME + timedelta(hours=i // 2))
+        for i in range(1, 8)
+    ])
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def _page(db, cursor=None, skip=0, limit=3):
+    response = Response()
+    page = KeysetPage(Company.created_at, Company.id, cursor=cursor, limit=limit, skip=skip)
+    rows = page.finish(page.apply(db.query(Company)).all(), response)
+    return [c.id for c in rows], response.headers.get(NEXT_CURSOR_HEADER)
+
+
+def test_cursor_pages_walk_every_row_once(db):
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    ids, cursor = _page(db)
+    assert ids == [7, 6, 5]
+
+    # Linha nova entre páginas não desloca a próxima
+    db.add(Company(id=8, name="c8", slug="c8", email="c8@c.com", created_at=BASE_TIME + timedelta(days=1)))
+    db.commit()
+
+    second, cursor = _page(db, cursor)
+    third, last_cursor = _page(db, cursor)
+    assert (second, third, last_cursor) == ([4, 3, 2], [1], None)
+    # Próximas páginas filtram pela posição do cursor em vez de pular linhas
+    assert "(companies.created_at, companies.id) < (?, ?)" in statements[-1]
+
+
+def test_skip_still_works_and_emits_cursor(db):
+    ids, cursor = _page(db, skip=2, limit=2)
+    assert ids == [5, 4]
+    assert _page(db, cursor, limit=2)[0] == [3, 2]
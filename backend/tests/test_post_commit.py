@@ -0,0 +1,67 @@
+"""
+Testes dos efeitos pós-commit (coleta no flush, aplicação no commit, descarte no rollback)
+"""
+import asyncio
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.main  # noqa: F401 - registra todos os mappers
+from app.core import post_commit
+from app.core.database import Base
+from app.models.company import Company
+
+applied = []
+
+
+def _new_companies(session):
+    # Tupla de conjuntos: cada um chega como um argumento na aplicação
+    companies = [obj for obj in session.new if isinstance(obj, Company) and obj.slug.startswith("post-commit")]
+    return {company.slug for company in companies}, {company.id for company in companies}
+
+
+async def _apply_async(slugs, ids):
+    applied.append(("async", slugs, ids))
+
+
+post_commit.register_post_commit(
+    "test_post_commit",
+    _new_companies,
+    _apply_async,
+    lambda slugs, ids: applied.append(("sync", slugs, ids)),
+    apply_local=lambda slugs, ids: applied.append(("local", slugs, ids)),
+)
+
+
+def company(id_):
+    return Company(id=id_, name="c", slug=f"post-commit-{id_}", email=f"c{id_}@c.com")
+
+
+def test_changes_from_every_flush_are_applied_once_after_commit():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    applied.clear()
+
+    db.add(company(1))
+    db.flush()
+    db.rollback()
+    assert applied == []
+
+    db.add(company(2))
+    db.flush()
+    db.add(company(3))
+    db.commit()
+    expected = ({"post-commit-2", "post-commit-3"}, {2, 3})
+    assert applied == [("local", *expected), ("sync", *expected)]
+
+    async def commit_in_loop():
+        db.add(company(4))
+        db.commit()
+        await asyncio.gather(*post_commit._pending_tasks)
+
+    applied.clear()
+    asyncio.run(commit_in_loop())
+    assert applied == [("local", {"post-commit-4"}, {4}), ("async", {"post-commit-4"}, {4})]
+    db.close()
@@ -0,0 +1,117 @@
+"""
+Testes do fan-out de push: envio paralelo em lotes, cabeçalhos VAPID em cache,
+logs gravados por lote e subscriptions expiradas desativadas em bloco
+"""
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.main  # noqa: F401 - registra todos os mappers
+from app.core.database import Base
+from app.models.company import Company
+from app.models.push_notification import UserPushSubscription
+from app.models.user import User, UserRole
+from app.services import push_service
+from app.services.push_service import PushNotificationService
+
+# endpoint -> status devolvido pelo push service
+RESPONSES = {
+    "https://fcm.googleapis.com/a": 201,
+    "https://fcm.googleapis.com/b": 410,
+    "https://updates.push.services.mozilla.com/c": 201,
+    "https://updates.push.services.mozilla.com/d": 404,
+    "https://fcm.googleapis.com/e": 500,
+}
+
+
+class FakeVapid:
+    signed = []
+
+    @classmethod
+    def from_string(cls, private_key):
+        return cls()
+
+    def sign(self, claims):
+        FakeVapid.signed.append(claims["aud"])
+        return {"Authorization": f"vapid t={claims['aud']}"}
+
+
+class FakeWebPusher:
+    sessions = set()
+
+    def __init__(self, subscription_info, requests_session=None):
+        self.endpoint = subscription_info["endpoint"]
+        FakeWebPusher.sessions.add(id(requests_session))
+
+    def send(self, data, headers, timeout=None):
+        assert headers["Authorization"].startswith("vapid")
+        return SimpleNamespace(status_code=RESPONSES[self.endpoint], text="", reason="Gone")
+
+
+@pytest.fixture
+def db(monkeypatch):
+    FakeVapid.signed, FakeWebPusher.sessions = [], set()
+    monkeypatch.setattr(push_service, "Vapid", FakeVapid)
+    monkeypatch.setattr(push_service, "WebPusher", FakeWebPusher)
+    monkeypatch.setattr(push_service, "PUSH_CHUNK_SIZE", 2)
+    monkeypatch.setattr(push_service, "_vapid_caches", {})
+    monkeypatch.setattr(push_service.VAPIDKeyManager, "get_vapid_keys", staticmethod(
+        lambda: {"public_key": "pub", "private_key": "priv", "mailto": "mailto:a@a.com"}
+    ))
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+
+    session.add(Company(id=1, name="c", slug="c", email="c@c.com"))
+    for user_id in (1, 2):
+        session.add(User(id=user_id, company_id=1, email=f"u{user_id}@u.com", password_hash="x",
+                         full_name=f"U{user_id}", role=UserRole.MANAGER))
+    for index, endpoint in enumerate(RESPONSES):
+        session.add(UserPushSubscription(user_id=1 + index % 2, company_id=1, endpoint=endpoint,
+                                         p256dh="k", auth="a", is_active=True))
+    session.commit()
+
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def test_company_fan_out_records_in_batches_and_prunes_expired(db):
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    logs = PushNotificationService(db).send_to_company(company_id=1, title="Aviso", body="Oi")
+
+    assert sorted(log.status for log in logs) == ["expired", "expired", "failed", "sent", "sent"]
+    assert all(log.id for log in logs)
+
+    # Um cabeçalho VAPID por push service e uma única sessão HTTP
+    assert sorted(FakeVapid.signed) == ["https://fcm.googleapis.com", "https://updates.push.services.mozilla.com"]
+    assert len(FakeWebPusher.sessions) == 1
+
+    # 3 lotes de até 2: 1 INSERT de logs e até 2 UPDATEs por lote, nenhum SELECT por log
+    assert len([s for s in statements if s.startswith("INSERT INTO push_notification_logs")]) == 3
+    assert len([s for s in statements if s.startswith("UPDATE user_push_subscriptions")]) <= 6
+    assert not [s for s in statements if s.startswith("SELECT push_notification_logs")]
+
+    active = {s.endpoint for s in db.query(UserPushSubscription).filter(UserPushSubscription.is_active == True)}
+    assert active == {"https://fcm.googleapis.com/a", "https://updates.push.services.mozilla.com/c",
+                      "https://fcm.googleapis.com/e"}
+    assert db.query(UserPushSubscription).filter_by(endpoint="https://fcm.googleapis.com/a").one().last_used_at
+
+
+def test_send_to_users_loads_subscriptions_once(db):
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    logs = PushNotificationService(db).send_to_users([1, 2], title="Aviso")
+
+    assert len(logs) == 5
+    assert len([s for s in statements if s.startswith("SELECT user_push_subscriptions")]) == 1
+    # Cabeçalhos reaproveitados entre instâncias do serviço
+    PushNotificationService(db).send_to_user(1, title="De novo")
+    assert len(FakeVapid.signed) == 2
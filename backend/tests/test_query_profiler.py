@@ -0,0 +1,68 @@
+"""
+Query profiler: fingerprints, N+1 detection and per-request header toggle.
+"""
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from app.core.config import settings
+from app.core.database import InstrumentedQueuePool, instrument_engine
+from app.core.query_profiler import QueryProfile, QueryProfilerMiddleware, fingerprint
+
+
+def _build_app():
+    engine = create_engine(
+        "sqlite://", poolclass=InstrumentedQueuePool, connect_args={"check_same_thread": False}
+    )
+    instrument_engine(engine, InstrumentedQueuePool.metrics_name)
+
+    app = FastAPI()
+    app.add_middleware(QueryProfilerMiddleware)
+
+    @app.get("/profiler-test/goals")
+    def list_goals():
+        # Uma query por item: o padrão que o profiler deve apontar
+        with engine.connect() as conn:
+            return [conn.execute(text("SELECT :id + 1"), {"id": goal_id}).scalar() for goal_id in range(6)]
+
+    return app
+
+
+def test_fingerprint_ignores_literals_and_parameters():
+    assert fingerprint("SELECT * FROM goals WHERE id = 1 AND name = 'a'") == \
+        fingerprint("SELECT *  FROM goals\n WHERE id = 42 AND name = 'it''s'")
+    assert fingerprint("SELECT * FROM x WHERE id IN (?, ?, ?)") == fingerprint("SELECT * FROM x WHERE id IN (?)")
+    assert fingerprint("SELECT * FROM x WHERE id = %(id_1)s") == fingerprint("SELECT * FROM x WHERE id = $1")
+
+    profile = QueryProfile()
+    for goal_id in range(5):
+        profile.record(f"SELECT * FROM goals WHERE id = {goal_id}", 0.001)
+    profile.record("SELECT * FROM users WHERE id = 1", 0.5)
+
+    assert profile.n_plus_one(threshold=5) == [("SELECT * FROM goals WHERE id = ?", 5)]
+    assert profile.slowest(min_ms=100) == [(0.5, "SELECT * FROM users WHERE id = 1")]
+
+
+def test_profiled_request_flags_n_plus_one(monkeypatch):
+    monkeypatch.setattr(settings, "ENVIRONMENT", "staging")
+    monkeypatch.setattr(settings, "QUERY_PROFILER_ALWAYS_ON", False)
+    monkeypatch.setattr(settings, "QUERY_PROFILER_N_PLUS_ONE_THRESHOLD", 5)
+    client = TestClient(_build_app())
+
+    response = client.get("/profiler-test/goals", headers={"X-Query-Profile": "1"})
+    assert response.status_code == 200
+    assert response.headers["X-Query-Count"] == "6"
+    assert response.headers["X-Query-N-Plus-One"] == "1"
+
+    # Sem o header a requisição não é perfilada
+    assert "X-Query-Count" not in client.get("/profiler-test/goals").headers
+
+
+def test_production_requires_token(monkeypatch):
+    monkeypatch.setattr(settings, "ENVIRONMENT", "production")
+    monkeypatch.setattr(settings, "QUERY_PROFILER_ALWAYS_ON", False)
+    monkeypatch.setattr(settings, "QUERY_PROFILER_TOKEN", "s3cret")
+    client = TestClient(_build_app())
+
+    assert "X-Query-Count" not in client.get("/profiler-test/goals", headers={"X-Query-Profile": "1"}).headers
+    assert client.get("/profiler-test/goals", headers={"X-Query-Profile": "s3cret"}).headers["X-Query-Count"] == "6"
@@ -0,0 +1,242 @@
+"""
+Testes do rate limiting distribuído (token bucket no Redis, quotas por plano)
+"""
+import asyncio
+import math
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.main  # noqa: F401 - registra todos os mappers
+from app.core import rate_limiting
+from app.core.config import settings
+from app.core.database import Base
+from app.core.cache_service import RateLimitCache
+from app.core.rate_limiting import RateLimitMiddleware
+from app.core.security import create_access_token
+from app.models.company import Company
+
+QUOTAS = {
+    "ESSENCIAL": {"api": 3, "api_key": 1, "public": 2},
+    "PRO": {"api": 6, "api_key": 2, "public": 4},
+}
+
+
+class FakeScriptRedis:
+    """Executa TOKEN_BUCKET_SCRIPT em Python, com relógio controlado"""
+
+    def __init__(self, sync=False):
+        self.buckets = {}
+        self.now = 1000.0
+        self.sync = sync
+
+    def register_script(self, script):
+        assert script == rate_limiting.TOKEN_BUCKET_SCRIPT
+
+        if self.sync:
+            return lambda keys, args: self.evaluate(keys, args)
+
+        async def run(keys, args):
+            return self.evaluate(keys, args)
+        return run
+
+    def evaluate(self, keys, args):
+        limits = [(float(args[2 * i]), float(args[2 * i + 1])) for i in range(len(keys))]
+        tokens = []
+        for key, (capacity, window) in zip(keys, limits):
+            available, ts = self.buckets.get(key, (capacity, self.now))
+            tokens.append(min(capacity, available + max(0.0, self.now - ts) * capacity / window))
+        allowed = all(value >= 1 for value in tokens)
+
+        result = [int(allowed)]
+        for key, (capacity, window), value in zip(keys, limits, tokens):
+            rate = capacity / window
+            value = value - 1 if allowed else value
+            self.buckets[key] = (value, self.now)
+            result += [
+                math.floor(value),
+                math.ceil(max(0.0, 1 - value) / rate * 1000),
+                math.ceil((capacity - value) / rate * 1000),
+            ]
+        return result
+
+
+async def ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+def call(path, ip="10.0.0.1", method="GET", headers=None, query=""):
+    scope = {
+        "type": "http", "method": method, "path": path, "query_string": query.encode(),
+        "client": (ip, 50000),
+        "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(RateLimitMiddleware(ok_app)(scope, receive, send))
+    start = messages[0]
+    return start["status"], {name.decode(): value.decode() for name, value in start["headers"]}
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeScriptRedis()
+
+    async def get_redis():
+        return fake
+
+    monkeypatch.setattr(rate_limiting, "get_redis", get_redis)
+    monkeypatch.setattr(rate_limiting, "get_plan_rate_limits", lambda plan: QUOTAS.get((plan or "ESSENCIAL").upper(), QUOTAS["ESSENCIAL"]))
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(settings, "RATE_LIMIT_AUTH_PER_MINUTE", 2)
+    monkeypatch.setattr(settings, "RATE_LIMIT_PUBLIC_PER_MINUTE", 100)
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(rate_limiting, "SessionLocal", factory)
+    db = factory()
+    db.add_all([
+        Company(id=1, name="a", slug="salao-a", email="a@a.com", subscription_plan="ESSENCIAL"),
+        Company(id=2, name="b", slug="salao-b", email="b@b.com", subscription_plan="PRO"),
+    ])
+    db.commit()
+    db.close()
+
+    rate_limiting._plan_cache.clear()
+    rate_limiting._unknown_api_keys.clear()
+    yield fake
+    rate_limiting._plan_cache.clear()
+    rate_limiting._unknown_api_keys.clear()
+
+
+def test_public_booking_quota_is_per_company_and_plan(redis):
+    # Visitantes diferentes somam na quota da empresa (ESSENCIAL: 2/min)
+    assert call("/api/v1/public/services", ip="1.1.1.1", query="companyId=1")[0] == 200
+    status_code, headers = call("/api/v1/public/companies/salao-a", ip="2.2.2.2")
+    assert status_code == 200
+    assert (headers["x-ratelimit-limit"], headers["x-ratelimit-remaining"]) == ("2", "0")
+
+    status_code, headers = call("/api/v1/public/services", ip="3.3.3.3", query="companyId=1")
+    assert status_code == 429
+    assert headers["retry-after"] == "30"
+
+    # Rajada em uma empresa não afeta a outra (PRO: 4/min)
+    for _ in range(4):
+        assert call("/api/v1/public/services", ip="3.3.3.3", query="companyId=2")[0] == 200
+    assert call("/api/v1/public/services", query="companyId=2")[0] == 429
+
+    redis.now += 30  # Um token recarregado
+    assert call("/api/v1/public/services", query="companyId=1")[0] == 200
+
+
+def test_authenticated_api_key_and_auth_buckets(redis, monkeypatch):
+    token = create_access_token({"sub": "5"}, company_id=2)
+    for _ in range(6):
+        assert call("/api/v1/clients", headers={"Authorization": f"Bearer {token}"})[0] == 200
+    assert call("/api/v1/clients", headers={"Authorization": f"Bearer {token}"})[0] == 429
+    assert call("/api/v1/clients", headers={"Authorization": f"Bearer {create_access_token({'sub': '6'}, company_id=1)}"})[0] == 200
+
+    # Login: por IP, sem tenant
+    assert [call("/api/v1/auth/login", ip="9.9.9.9", method="POST")[0] for _ in range(3)] == [200, 200, 429]
+    assert call("/api/v1/auth/login", ip="8.8.8.8", method="POST")[0] == 200
+
+    # API key: quota da chave (ESSENCIAL: 1/min) e também a agregada da empresa
+    async def projection(db, key_hash):
+        return SimpleNamespace(key_id=10, company_id=1)
+
+    monkeypatch.setattr(rate_limiting, "get_api_key_projection", projection)
+    assert call("/api/v1/leads", headers={"X-API-Key": "ak_x"})[0] == 200
+    assert call("/api/v1/leads", headers={"X-API-Key": "ak_x"})[0] == 429
+    assert redis.buckets["ratelimit:api:1"][0] == 1  # Token da empresa não foi debitado na recusa
+
+    # Webhooks de provedores não entram no limite
+    assert call("/api/v1/evolution/webhook", ip="7.7.7.7", method="POST") == (200, {})
+
+
+def test_without_redis_requests_pass_without_headers(redis, monkeypatch):
+    async def no_redis():
+        return None
+
+    monkeypatch.setattr(rate_limiting, "get_redis", no_redis)
+    assert call("/api/v1/auth/login", method="POST") == (200, {})
+
+
+def test_jwt_quota_is_shared_by_the_company_users(redis):
+    # Usuários diferentes da mesma empresa somam na quota do plano (ESSENCIAL: 3/min)
+    tokens = [create_access_token({"sub": str(user_id)}, company_id=1) for user_id in (5, 6, 7)]
+    for token in tokens:
+        assert call("/api/v1/clients", headers={"Authorization": f"Bearer {token}"})[0] == 200
+
+    status_code, headers = call("/api/v1/clients", headers={"Authorization": f"Bearer {tokens[0]}"})
+    assert status_code == 429
+    assert headers["retry-after"] == "20"
+    assert headers["x-ratelimit-remaining"] == "0"
+    assert list(redis.buckets) == ["ratelimit:api:1"]
+
+    # Token sem empresa (SaaS admin): bucket próprio do usuário
+    admin = create_access_token({"sub": "1"})
+    assert call("/api/v1/clients", headers={"Authorization": f"Bearer {admin}"})[0] == 200
+    assert "ratelimit:user:1" in redis.buckets
+
+
+def test_webhooks_and_token_refresh_skip_the_login_bucket(redis):
+    for _ in range(5):
+        assert call("/api/v1/payments/webhook/stripe", method="POST") == (200, {})
+
+    # Renovação e troca de senha não consomem as tentativas de login do IP
+    for path in ("/api/v1/auth/refresh", "/api/v1/auth/refresh/json", "/api/v1/auth/change-password"):
+        assert call(path, ip="9.9.9.9", method="POST")[0] == 200
+    assert [call("/api/v1/auth/login", ip="9.9.9.9", method="POST")[0] for _ in range(3)] == [200, 200, 429]
+
+
+def test_client_ip_comes_from_forwarded_for_only_behind_trusted_proxy(redis):
+    def login(peer, forwarded):
+        return call("/api/v1/auth/login", ip=peer, method="POST", headers={"X-Forwarded-For": forwarded})[0]
+
+    # Atrás do nginx (rede Docker) cada cliente tem o próprio bucket
+    assert [login("172.18.0.5", "1.1.1.1") for _ in range(3)] == [200, 200, 429]
+    assert login("172.18.0.5", "2.2.2.2") == 200
+
+    # Entradas forjadas à esquerda do hop adicionado pelo proxy são ignoradas
+    assert login("172.18.0.5", "5.5.5.5, 1.1.1.1") == 429
+
+    # Conexão direta de fora: X-Forwarded-For não é confiável
+    assert [login("3.3.3.3", f"6.6.6.{i}") for i in range(3)] == [200, 200, 429]
+
+
+def test_unknown_api_key_is_cached_negatively(redis, monkeypatch):
+    lookups = []
+
+    async def projection(db, key_hash):
+        lookups.append(key_hash)
+        return None
+
+    monkeypatch.setattr(rate_limiting, "get_api_key_projection", projection)
+    for _ in range(3):
+        assert call("/api/v1/leads", headers={"X-API-Key": "ak_inventada"})[0] == 200
+    assert len(lookups) == 1
+    assert "ratelimit:anonymous:10.0.0.1" in redis.buckets
+
+
+def test_rate_limit_cache_uses_token_bucket_script():
+    redis = FakeScriptRedis(sync=True)
+    limiter = RateLimitCache.__new__(RateLimitCache)
+    limiter.cache = SimpleNamespace(redis_client=redis)
+
+    assert limiter.is_allowed("ratelimit:custom", 2, 60) == (True, {"remaining": 1, "reset_time": 30})
+    assert limiter.is_allowed("ratelimit:custom", 2, 60)[0] is True
+    assert limiter.is_allowed("ratelimit:custom", 2, 60) == (False, {"remaining": 0, "reset_time": 60})
+
+    redis.now += 30
+    assert limiter.is_allowed("ratelimit:custom", 2, 60)[0] is True
@@ -0,0 +1,115 @@
+"""
+Testes do pipeline de lembretes (seleção em uma consulta, lotes por empresa e log de envio)
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.main  # noqa: F401 - registra todos os mappers
+from app.core.database import Base
+from app.models.appointment import Appointment, AppointmentStatus
+from app.models.appointment_reminder_log import AppointmentReminderLog
+from app.models.client import Client
+from app.models.company import Company
+from app.models.company_scheduling_settings import SchedulingSettings
+from app.models.service import Service
+from app.tasks import appointment_tasks
+
+NOW = datetime.utcnow().replace(microsecond=0)
+
+TEMPLATES = {
+    name: {"email": {"subject": "Lembrete", "body": "Olá {client_name}, {service_name} às {appointment_time}"}}
+    for name in ("appointment_reminder_24h", "appointment_reminder_2h", "appointment_reminder_generic")
+}
+
+
+@pytest.fixture
+def session_factory(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(appointment_tasks, "SessionLocal", factory)
+
+    db = factory()
+    for company_id, hours in ((1, [24, 2]), (2, [5])):
+        db.add(Company(id=company_id, name=f"c{company_id}", slug=f"c{company_id}", email=f"c{company_id}@c.com"))
+        db.add(SchedulingSettings(company_id=company_id, reminder_hours_before=hours,
+                                  enabled_reminder_types=["email"], notification_templates=TEMPLATES))
+        db.add(Service(id=company_id, company_id=company_id, name="Corte", price=50, duration_minutes=30))
+        db.add(Client(id=company_id, company_id=company_id, full_name=f"Cliente {company_id}", email=f"x{company_id}@x.com"))
+
+    def appointment(id_, company_id, hours, status=AppointmentStatus.CONFIRMED, client_id=None):
+        start = NOW + timedelta(hours=hours, minutes=5)
+        return Appointment(id=id_, company_id=company_id, service_id=company_id, client_crm_id=client_id or company_id,
+                           start_time=start, end_time=start + timedelta(minutes=30), status=status)
+
+    db.add_all([
+        appointment(1, 1, 24),
+        appointment(2, 1, 2),
+        appointment(3, 1, 24),  # já enviado
+        appointment(4, 1, 24, status=AppointmentStatus.CANCELLED),
+        appointment(5, 1, 12),  # fora das janelas da empresa 1
+        appointment(6, 2, 5),
+        appointment(7, 2, 24),  # empresa 2 não usa 24h
+    ])
+    db.add(AppointmentReminderLog(company_id=1, appointment_id=3, hours_before=24))
+    db.commit()
+    db.close()
+
+    yield factory
+    engine.dispose()
+
+
+def test_due_reminders_of_all_companies_in_one_query(session_factory):
+    db = session_factory()
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    due = appointment_tasks._find_due_reminders(db, NOW)
+
+    assert {company: sorted(items) for company, items in due.items()} == {1: [(1, 24), (2, 2)], 2: [(6, 5)]}
+    assert len([s for s in statements if "FROM appointments" in s]) == 1
+    db.close()
+
+
+def test_dispatcher_fans_out_per_company_chunks(session_factory, monkeypatch):
+    dispatched = []
+    monkeypatch.setattr(appointment_tasks.send_reminder_chunk, "delay", lambda *args: dispatched.append(args))
+
+    result = appointment_tasks.send_appointment_reminders(chunk_size=1)
+
+    assert result["status"] == "success"
+    assert sorted((company, tuple(items)) for company, items in dispatched) == [
+        (1, ((1, 24),)), (1, ((2, 2),)), (2, ((6, 5),)),
+    ]
+
+
+def test_chunk_sends_once_logs_and_bulk_updates_flags(session_factory, monkeypatch):
+    emails = []
+    monkeypatch.setattr(appointment_tasks.NotificationService, "send_email",
+                        staticmethod(lambda to, subject, body: emails.append((to, body))))
+
+    statements = []
+    event.listen(session_factory.kw["bind"], "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    # [8, 24] não existe: a reivindicação é desfeita
+    result = appointment_tasks.send_reminder_chunk(1, [[1, 24], [2, 2], [8, 24]])
+    assert (result["sent"], result["failed"]) == (2, 1)
+    assert [to for to, _ in emails] == ["x1@x.com", "x1@x.com"]
+    # Cliente, profissional e serviço vêm na consulta dos agendamentos, sem buscas por item
+    assert not [s for s in statements if s.startswith(("SELECT clients", "SELECT services", "SELECT users"))]
+
+    # Reexecução do mesmo lote (retry, worker duplicado) não reenvia
+    assert appointment_tasks.send_reminder_chunk(1, [[1, 24], [2, 2]])["sent"] == 0
+    assert len(emails) == 2
+
+    db = session_factory()
+    logged = {(log.appointment_id, log.hours_before) for log in db.query(AppointmentReminderLog).all()}
+    assert logged == {(1, 24), (2, 2), (3, 24)}
+    assert db.get(Appointment, 1).reminder_sent_24h is True
+    assert db.get(Appointment, 2).reminder_sent_2h is True
+    assert not db.get(Appointment, 2).reminder_sent_24h
+    db.close()
@@ -0,0 +1,124 @@
+"""
+Testes da projeção de faturamento (tendência, histórico mensal e invalidação do cache)
+"""
+import asyncio
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.main  # noqa: F401 - registra todos os mappers
+from app.core.database import Base
+from app.models.company import Company
+from app.models.financial import FinancialTransaction
+from app.services import revenue_forecast
+from app.services.revenue_forecast import build_revenue_forecast, fit_trend, history_months, load_forecast_inputs
+
+TODAY = date(2026, 3, 31)
+
+
+def income(value, day):
+    return FinancialTransaction(
+        company_id=1, type="income", origin="manual", value=Decimal(value), date=datetime.combine(day, time(10)),
+    )
+
+
+def test_history_months_are_calendar_months():
+    # timedelta(days=30) a partir de 31/03 pularia fevereiro
+    assert history_months(TODAY) == [
+        date(2025, 10, 1), date(2025, 11, 1), date(2025, 12, 1),
+        date(2026, 1, 1), date(2026, 2, 1), date(2026, 3, 1),
+    ]
+
+
+def test_fit_trend_recovers_linear_series():
+    assert fit_trend([100, 110, 120, 130]) == (100, 10)
+    assert fit_trend([50]) == (50, 0)
+    assert fit_trend([]) == (0, 0)
+
+
+def test_forecast_extends_trend_and_never_goes_negative():
+    historical = [{"month": str(i), "revenue": revenue} for i, revenue in enumerate([100, 110, 120, 130])]
+    result = build_revenue_forecast(historical, 20, 2, 0, 2, TODAY)
+
+    assert [m["month"] for m in result["forecast"]] == ["2026-04", "2026-05"]
+    assert [m["projected_total"] for m in result["forecast"]] == [160, 170]
+    assert result["metrics"]["growth_rate"] == 10 / 115 * 100
+
+    falling = [{"month": str(i), "revenue": revenue} for i, revenue in enumerate([300, 200, 100])]
+    assert build_revenue_forecast(falling, 0, 0, 0, 3, TODAY)["forecast"][-1]["projected_variable"] == 0
+
+
+def test_history_is_one_grouped_query():
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        statements = []
+
+        @event.listens_for(engine.sync_engine, "before_cursor_execute")
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            async with async_sessionmaker(engine)() as db:
+                db.add(Company(id=1, name="c", slug="c", email="c@c.com"))
+                db.add_all([
+                    income("100", date(2026, 1, 31)),
+                    income("50", date(2026, 3, 1)),
+                    income("25", date(2026, 3, 31)),
+                    income("999", date(2025, 9, 30)),  # fora da janela
+                ])
+                await db.commit()
+
+                statements.clear()
+                return await load_forecast_inputs(db, 1, TODAY), statements
+        finally:
+            await engine.dispose()
+
+    inputs, statements = asyncio.run(run())
+    assert [m["revenue"] for m in inputs["historical"]] == [0, 0, 0, 100, 0, 75]
+    assert len([s for s in statements if "financial_transactions" in s]) == 1
+
+
+def test_financial_commit_invalidates_company_forecast(monkeypatch):
+    invalidated = []
+
+    class FakeRedis:
+        def delete(self, *keys):
+            invalidated.append(set(keys))
+
+    monkeypatch.setattr(revenue_forecast, "get_sync_redis", lambda: FakeRedis())
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add(Company(id=1, name="c", slug="c", email="c@c.com"))
+    db.commit()
+    assert invalidated == []
+
+    db.add(income("10", TODAY))
+    db.flush()
+    db.rollback()
+    assert invalidated == []
+
+    db.add(income("10", TODAY))
+    db.commit()
+    assert invalidated == [{revenue_forecast.cache_key(1)}]
+    db.close()
+
+
+def test_partial_current_month_does_not_drag_trend():
+    # Dia 2: o mês corrente tem só 500 e não pode ser ajustado como mês fechado
+    today = date(2026, 3, 2)
+    historical = [
+        {"month": m.strftime("%Y-%m"), "revenue": revenue}
+        for m, revenue in zip(history_months(today), [10000, 10000, 10000, 10000, 10000, 500])
+    ]
+    result = build_revenue_forecast(historical, 0, 0, 0, 2, today)
+
+    assert [m["projected_variable"] for m in result["forecast"]] == [10000, 10000]
+    assert result["metrics"]["growth_rate"] == 0
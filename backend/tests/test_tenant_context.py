@@ -0,0 +1,95 @@
+"""
+Tests for lazy tenant context binding (after_begin hook)
+
+SQLite stands in for PostgreSQL: set_config() is registered as a SQLite
+function so the statements issued by the hook can be counted.
+"""
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from app.core import tenant_context
+from app.core.tenant_context import TENANT_INFO_KEY, bind_tenant_context
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    monkeypatch.setattr(tenant_context, "TENANT_CONTEXT_DIALECTS", {"sqlite"})
+
+    engine = create_engine("sqlite://")
+    settings = {}
+
+    @event.listens_for(engine, "connect")
+    def register_set_config(dbapi_connection, connection_record):
+        def set_config(name, value, is_local):
+            settings[name] = value
+            return settings.get("force_value", value)
+        dbapi_connection.create_function("set_config", 3, set_config)
+
+    statements = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine.statements = statements
+    engine.settings = settings
+    return engine
+
+
+def test_bind_does_not_hit_the_database(engine):
+    db = sessionmaker(bind=engine)()
+    bind_tenant_context(db, 7)
+
+    assert engine.statements == []
+    assert db.info[TENANT_INFO_KEY] == 7
+    db.close()
+
+
+def test_context_is_set_once_in_the_first_transaction(engine):
+    db = sessionmaker(bind=engine)()
+    bind_tenant_context(db, 7)
+
+    db.execute(text("SELECT 1"))
+    db.execute(text("SELECT 2"))
+
+    assert [s for s in engine.statements if "set_config" in s] == [engine.statements[0]]
+    assert len(engine.statements) == 3
+    assert engine.settings["app.current_company_id"] == "7"
+    db.close()
+
+
+def test_context_is_reapplied_after_commit(engine):
+    db = sessionmaker(bind=engine)()
+    bind_tenant_context(db, 7)
+
+    db.execute(text("SELECT 1"))
+    db.commit()
+    db.execute(text("SELECT 1"))
+
+    assert sum("set_config" in s for s in engine.statements) == 2
+    db.close()
+
+
+def test_unbound_session_is_untouched(engine):
+    db = sessionmaker(bind=engine)()
+    db.execute(text("SELECT 1"))
+
+    assert engine.statements == ["SELECT 1"]
+    db.close()
+
+
+def test_mismatch_fails_the_first_query(engine):
+    engine.settings["force_value"] = "999"
+    db = sessionmaker(bind=engine)()
+    bind_tenant_context(db, 7)
+
+    with pytest.raises(RuntimeError):
+        db.execute(text("SELECT 1"))
+    db.close()
+
+
+@pytest.mark.parametrize("company_id", [0, -1, "7", None])
+def test_invalid_company_id(company_id):
+    with pytest.raises(ValueError):
+        bind_tenant_context(sessionmaker()(), company_id)
@@ -0,0 +1,197 @@
+"""
+Testes do rollup diário do dashboard (tenant_daily_metrics) em SQLite
+"""
+import asyncio
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import load_only, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.main  # noqa: F401 - registra todos os mappers
+from app.core import post_commit
+from app.core.database import Base
+from app.models.appointment import Appointment, AppointmentStatus
+from app.models.command import Command, CommandStatus
+from app.models.company import Company
+from app.models.financial import FinancialTransaction
+from app.models.tenant_daily_metrics import TenantDailyMetrics
+from app.services import tenant_metrics
+from app.services.tenant_metrics import _changed_entries, _day_runs, rebuild_range, recompute_days, sum_metrics
+
+DAY = date(2026, 3, 2)
+
+
+def at(day, hour=10):
+    return datetime.combine(day, datetime.min.time()) + timedelta(hours=hour)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add(Company(id=1, name="c", slug="c", email="c@c.com"))
+    session.commit()
+    yield session
+    session.close()
+
+
+def appointment(day, status, client_id):
+    return Appointment(
+        company_id=1, professional_id=1, client_crm_id=client_id, status=status,
+        start_time=at(day), end_time=at(day, 11), created_at=at(day),
+    )
+
+
+def record_dirty(monkeypatch):
+    """Conjuntos de (empresa, dia) marcados como sujos pelo caminho síncrono"""
+    marked = []
+
+    class FakeRedis:
+        def sadd(self, key, *members):
+            marked.append({(int(company_id), date.fromisoformat(day)) for company_id, day in
+                           (member.split(":", 1) for member in members)})
+
+    monkeypatch.setattr(tenant_metrics, "get_sync_redis", lambda: FakeRedis())
+    return marked
+
+
+def test_day_runs_merge_consecutive_days():
+    days = [DAY + timedelta(days=2), DAY, DAY + timedelta(days=1), DAY + timedelta(days=5)]
+    assert _day_runs(days) == [
+        (DAY, DAY + timedelta(days=2)),
+        (DAY + timedelta(days=5), DAY + timedelta(days=5)),
+    ]
+
+
+def test_recompute_aggregates_each_source(db):
+    db.add_all([
+        appointment(DAY, AppointmentStatus.COMPLETED, 1),
+        appointment(DAY, AppointmentStatus.CANCELLED, 1),
+        appointment(DAY, AppointmentStatus.PENDING, 2),
+        appointment(DAY + timedelta(days=1), AppointmentStatus.COMPLETED, 3),
+        Command(company_id=1, client_crm_id=1, number="1", date=at(DAY), status=CommandStatus.FINISHED, net_value=Decimal("80")),
+        Command(company_id=1, client_crm_id=1, number="2", date=at(DAY), status=CommandStatus.OPEN, net_value=Decimal("20")),
+        FinancialTransaction(company_id=1, origin="manual", type="income", status="liquidated", value=Decimal("50"), date=at(DAY)),
+        FinancialTransaction(company_id=1, origin="manual", type="income", status="planned", value=Decimal("30"), date=at(DAY)),
+        FinancialTransaction(company_id=1, origin="manual", type="expense", status="liquidated", value=Decimal("99"), date=at(DAY)),
+    ])
+    db.commit()
+
+    assert recompute_days(db, 1, [DAY, DAY + timedelta(days=1)]) == 2
+    db.commit()
+
+    row = db.query(TenantDailyMetrics).filter_by(company_id=1, day=DAY).one()
+    assert (row.appointments_total, row.appointments_completed, row.appointments_cancelled) == (3, 1, 1)
+    assert row.distinct_clients == 2
+    assert (row.commands_total, row.commands_finished, row.revenue_commands) == (2, 1, Decimal("80"))
+    assert (row.revenue_transactions, row.income_transactions) == (Decimal("50"), 2)
+
+    totals = sum_metrics(db.query(TenantDailyMetrics).all())
+    assert totals["appointments_total"] == 4
+    assert totals["appointments_completed"] == 2
+
+
+def test_recompute_is_idempotent_and_drops_empty_days(db):
+    item = appointment(DAY, AppointmentStatus.PENDING, 1)
+    db.add(item)
+    db.commit()
+
+    rebuild_range(db, 1, DAY - timedelta(days=3), DAY)
+    rebuild_range(db, 1, DAY - timedelta(days=3), DAY)
+    db.commit()
+    assert db.query(TenantDailyMetrics).count() == 1
+
+    db.delete(item)
+    db.commit()
+    recompute_days(db, 1, [DAY])
+    db.commit()
+    assert db.query(TenantDailyMetrics).count() == 0
+
+
+def test_write_paths_mark_old_and_new_days_dirty(db, monkeypatch):
+    marked = record_dirty(monkeypatch)
+
+    command = Command(company_id=1, client_crm_id=1, number="1", date=at(DAY), status=CommandStatus.OPEN)
+    db.add(command)
+    db.commit()
+    assert marked.pop() == {(1, DAY)}
+
+    command.date = at(DAY + timedelta(days=1))
+    db.commit()
+    assert marked.pop() == {(1, DAY), (1, DAY + timedelta(days=1))}
+
+
+def test_write_to_partially_loaded_instance_marks_its_own_day(db, monkeypatch):
+    marked = record_dirty(monkeypatch)
+
+    db.add(Command(company_id=1, client_crm_id=1, number="1", date=at(DAY), status=CommandStatus.OPEN))
+    db.commit()
+    db.expunge_all()
+    marked.clear()
+
+    # A data não foi carregada; só o status muda
+    command = db.query(Command).options(load_only(Command.company_id, Command.status)).one()
+    command.status = CommandStatus.FINISHED
+    db.commit()
+    assert marked == [{(1, DAY)}]
+
+
+def test_appointment_writes_mark_the_appointment_day_for_goals(db, monkeypatch):
+    marked = record_dirty(monkeypatch)
+
+    booked = DAY - timedelta(days=30)
+    item = appointment(DAY, AppointmentStatus.CONFIRMED, 1)
+    item.created_at = at(booked)
+    db.add(item)
+    db.commit()
+    marked.clear()
+
+    # Concluir um agendamento antigo precisa chegar às metas do dia do atendimento
+    item.status = AppointmentStatus.COMPLETED
+    db.commit()
+    assert marked.pop() == {(1, booked), (1, DAY)}
+
+    item.start_time = at(DAY + timedelta(days=1))
+    db.commit()
+    assert marked.pop() == {(1, booked), (1, DAY), (1, DAY + timedelta(days=1))}
+
+
+def test_rollback_discards_dirty_days(db, monkeypatch):
+    marked = record_dirty(monkeypatch)
+
+    db.add(appointment(DAY, AppointmentStatus.PENDING, 1))
+    db.flush()
+    assert _changed_entries(db) == set()  # já descarregado no flush
+    db.rollback()
+
+    db.commit()
+    assert marked == []
+
+
+def test_commit_inside_event_loop_marks_dirty_on_async_client(db, monkeypatch):
+    added = []
+
+    class FakeRedis:
+        async def sadd(self, key, *members):
+            added.append((key, set(members)))
+
+    async def get_redis():
+        return FakeRedis()
+
+    def blocking_redis():
+        raise AssertionError("cliente síncrono usado dentro do event loop")
+
+    monkeypatch.setattr(tenant_metrics, "get_redis", get_redis)
+    monkeypatch.setattr(tenant_metrics, "get_sync_redis", blocking_redis)
+
+    async def write():
+        db.add(appointment(DAY, AppointmentStatus.PENDING, 1))
+        db.commit()
+        await asyncio.gather(*post_commit._pending_tasks)
+
+    asyncio.run(write())
+    assert added == [(tenant_metrics.DIRTY_SET_KEY, {f"1:{DAY.isoformat()}"})]
@@ -0,0 +1,164 @@
+"""
+Testes da ingestão de webhooks: dedup por id do evento, fila e ordem por conversa
+"""
+import asyncio
+
+import pytest
+from celery.exceptions import Retry
+
+from app.services import webhook_ingestion
+from app.tasks import webhook_tasks
+
+
+class FakeRedis:
+    """Subconjunto em memória dos comandos usados na ingestão (async) e no worker (sync)"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = str(value)
+        return True
+
+    def sadd(self, key, *members):
+        self.data.setdefault(key, set()).update(str(member) for member in members)
+        return len(members)
+
+    def smembers(self, key):
+        return set(self.data.get(key, set()))
+
+
+class FakeAsyncRedis(FakeRedis):
+    async def set(self, key, value, nx=False, ex=None):
+        return FakeRedis.set(self, key, value, nx=nx, ex=ex)
+
+    async def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1)
+        return int(self.data[key])
+
+    async def sadd(self, key, *members):
+        return FakeRedis.sadd(self, key, *members)
+
+    async def expire(self, key, ttl):
+        return True
+
+    async def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+
+def evolution_message(message_id, jid="5511987654321@s.whatsapp.net"):
+    return {
+        "event": "messages.upsert",
+        "instance": "loja",
+        "data": {"key": {"id": message_id, "remoteJid": jid}, "message": {"conversation": "1"}},
+    }
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeAsyncRedis()
+
+    async def get_redis():
+        return fake
+
+    monkeypatch.setattr(webhook_ingestion, "get_redis", get_redis)
+    return fake
+
+
+@pytest.fixture
+def enqueued(monkeypatch):
+    calls = []
+    monkeypatch.setattr(webhook_tasks.process_webhook_event, "delay", lambda *args: calls.append(args))
+    return calls
+
+
+def test_duplicates_are_dropped_and_conversations_get_sequences(redis, enqueued):
+    async def deliver():
+        return [
+            await webhook_ingestion.ingest_webhook("evolution", evolution_message("A"))
+            for _ in range(3)
+        ] + [
+            await webhook_ingestion.ingest_webhook("evolution", evolution_message("B")),
+            await webhook_ingestion.ingest_webhook("evolution", evolution_message("C", jid="5511900000000@s.whatsapp.net")),
+        ]
+
+    results = asyncio.run(deliver())
+
+    assert [r["status"] for r in results] == ["queued", "duplicate", "duplicate", "queued", "queued"]
+    assert [(conversation, sequence) for _, _, conversation, sequence in enqueued] == [
+        ("loja:5511987654321@s.whatsapp.net", 1),
+        ("loja:5511987654321@s.whatsapp.net", 2),
+        ("loja:5511900000000@s.whatsapp.net", 1),
+    ]
+
+
+def test_failed_enqueue_releases_dedup_for_provider_retry(redis, monkeypatch):
+    def broker_down(*args):
+        raise ConnectionError("broker")
+
+    monkeypatch.setattr(webhook_tasks.process_webhook_event, "delay", broker_down)
+    with pytest.raises(ConnectionError):
+        asyncio.run(webhook_ingestion.ingest_webhook("calendly", {"event": "invitee.created", "payload": {"uri": "u1"}}))
+
+    assert webhook_ingestion.dedup_key("calendly", "invitee.created:u1") not in redis.data
+
+
+def test_worker_processes_each_conversation_in_order(monkeypatch):
+    redis = FakeRedis()
+    processed = []
+    monkeypatch.setattr(webhook_tasks, "get_sync_redis", lambda: redis)
+    monkeypatch.setattr(webhook_tasks, "SessionLocal", lambda: type("Db", (), {"close": lambda self: None})())
+
+    def processor(db, payload):
+        processed.append(payload["data"]["key"]["id"])
+        if payload["data"]["key"]["id"] == "A":
+            raise RuntimeError("falha no processamento")
+        return {"action": "confirmed"}
+
+    monkeypatch.setattr(webhook_tasks, "PROCESSORS", {"evolution": processor})
+
+    # O segundo evento chegou ao worker antes do primeiro: aguarda
+    with pytest.raises(Retry):
+        webhook_tasks.process_webhook_event("evolution", evolution_message("B"), "conversa", 2)
+    assert processed == []
+
+    # Falha no primeiro não trava a conversa
+    assert webhook_tasks.process_webhook_event("evolution", evolution_message("A"), "conversa", 1)["status"] == "error"
+    assert webhook_tasks.process_webhook_event("evolution", evolution_message("B"), "conversa", 2)["status"] == "processed"
+    assert processed == ["A", "B"]
+    assert redis.get(webhook_ingestion.done_key("evolution", "conversa")) == "2"
+
+
+def test_sequence_burned_by_failed_enqueue_does_not_block_the_conversation(redis, monkeypatch):
+    enqueued = []
+    failures = iter([True, False])
+
+    def flaky_delay(*args):
+        if next(failures):
+            raise ConnectionError("broker")
+        enqueued.append(args)
+
+    monkeypatch.setattr(webhook_tasks.process_webhook_event, "delay", flaky_delay)
+
+    async def deliver():
+        with pytest.raises(ConnectionError):
+            await webhook_ingestion.ingest_webhook("evolution", evolution_message("A"))
+        await webhook_ingestion.ingest_webhook("evolution", evolution_message("A"))  # reenvio do provedor
+
+    asyncio.run(deliver())
+    _, payload, conversation, sequence = enqueued[0]
+    assert sequence == 2
+
+    # O worker não espera pela sequência 1, que nunca chegou à fila
+    worker_redis = FakeRedis()
+    worker_redis.data = redis.data
+    monkeypatch.setattr(webhook_tasks, "get_sync_redis", lambda: worker_redis)
+    monkeypatch.setattr(webhook_tasks, "SessionLocal", lambda: type("Db", (), {"close": lambda self: None})())
+    monkeypatch.setattr(webhook_tasks, "PROCESSORS", {"evolution": lambda db, payload: {"action": "confirmed"}})
+    assert webhook_tasks.process_webhook_event("evolution", payload, conversation, sequence)["status"] == "processed"
+    assert worker_redis.get(webhook_ingestion.done_key("evolution", conversation)) == "2"
@@ -0,0 +1,151 @@
+"""
+Testes do roteamento de mensagens do WhatsApp (telefone E.164 indexado por empresa)
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.main  # noqa: F401 - registra todos os mappers
+from app.core.database import Base
+from app.models.appointment import Appointment, AppointmentStatus
+from app.models.client import Client
+from app.models.company import Company
+from app.models.whatsapp_marketing import WhatsAppProvider
+from app.services.evolution_api_service import EvolutionAPIService
+from app.services.whatsapp_routing import find_client_by_phone
+from app.utils.whatsapp_sanitizer import phone_to_e164
+
+
+@pytest.mark.parametrize("phone,expected", [
+    ("(11) 98765-4321", "+5511987654321"),
+    ("5511987654321@s.whatsapp.net", "+5511987654321"),
+    ("551187654321", "+5511987654321"),  # JID antigo, sem o 9º dígito
+    ("011 98765-4321", "+5511987654321"),
+    ("(11) 3456-7890", "+551134567890"),
+    ("+1 415 555 0100", "+14155550100"),
+    ("8765-4321", None),
+    (None, None),
+])
+def test_phone_to_e164(phone, expected):
+    assert phone_to_e164(phone) == expected
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all([Company(id=1, name="a", slug="a", email="a@a.com"),
+                     Company(id=2, name="b", slug="b", email="b@b.com")])
+    session.add(WhatsAppProvider(company_id=2, provider_name="evolution", api_url="http://x", instance_id="salao-b"))
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def test_phone_e164_is_kept_in_sync_and_unique_per_company(db):
+    first = Client(company_id=1, full_name="Ana", cellphone="(11) 98765-4321")
+    db.add(first)
+    db.commit()
+    assert first.phone_e164 == "+5511987654321"
+
+    # Mesmo número na mesma empresa: o primeiro cadastro continua dono do E.164
+    duplicate = Client(company_id=1, full_name="Ana 2", phone="11987654321")
+    other_company = Client(company_id=2, full_name="Ana B", cellphone="11 98765 4321")
+    db.add_all([duplicate, other_company])
+    db.commit()
+    assert duplicate.phone_e164 is None
+    assert other_company.phone_e164 == "+5511987654321"
+
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    first.notes = "sem mudança de telefone"
+    db.commit()
+    assert not [s for s in statements if s.startswith("SELECT clients.id")]
+
+    first.cellphone = "(21) 2345-6789"
+    db.commit()
+    assert first.phone_e164 == "+552123456789"
+
+
+def test_find_client_by_phone_is_scoped_by_company(db):
+    db.add_all([
+        Client(company_id=1, full_name="Ana A", cellphone="11987654321"),
+        Client(company_id=2, full_name="Ana B", cellphone="11987654321"),
+        Client(company_id=1, full_name="Bia", cellphone="11911112222"),
+    ])
+    db.commit()
+
+    assert find_client_by_phone(db, "5511987654321@s.whatsapp.net", 2).full_name == "Ana B"
+    # Sem empresa, número de duas empresas é ambíguo; número único é aceito
+    assert find_client_by_phone(db, "5511987654321", None) is None
+    assert find_client_by_phone(db, "5511911112222", None).full_name == "Bia"
+
+
+def test_text_reply_confirms_next_appointment_of_instance_company(db, monkeypatch):
+    db.add_all([
+        Client(id=1, company_id=1, full_name="Ana A", cellphone="11987654321"),
+        Client(id=2, company_id=2, full_name="Ana B", cellphone="11987654321"),
+    ])
+    start = datetime.utcnow() + timedelta(days=1)
+    db.add_all([
+        Appointment(id=10, company_id=1, client_crm_id=1, start_time=start, end_time=start + timedelta(hours=1)),
+        Appointment(id=20, company_id=2, client_crm_id=2, start_time=start, end_time=start + timedelta(hours=1)),
+    ])
+    db.commit()
+
+    service = EvolutionAPIService(db, instance_name="salao-b", api_url="http://x", api_key="k")
+    monkeypatch.setattr(service, "send_appointment_confirmed", lambda appointment: None)
+
+    result = service.process_webhook_message({
+        "instance": "salao-b",
+        "data": {"key": {"remoteJid": "551187654321@s.whatsapp.net"}, "message": {"conversation": "Sim"}},
+    })
+
+    assert result == {"action": "confirmed", "appointment_id": 20, "message": "Agendamento confirmado com sucesso"}
+    assert db.get(Appointment, 20).status == AppointmentStatus.CONFIRMED
+    assert db.get(Appointment, 10).status == AppointmentStatus.PENDING
+
+
+def test_reschedule_to_taken_slot_replies_and_patches_cache_on_success(db, monkeypatch):
+    from app.services import availability_cache
+
+    changes = []
+    monkeypatch.setattr(availability_cache, "begin_change_sync", lambda *occupancies: {"ticket": 1})
+    monkeypatch.setattr(availability_cache, "record_change_sync",
+                        lambda before, after, tickets: changes.append((before, after, tickets)))
+
+    client = Client(company_id=1, full_name="Ana", cellphone="11987654321")
+    db.add(client)
+    db.flush()
+    day = datetime(2026, 3, 2)
+    taken = Appointment(company_id=1, professional_id=1, status=AppointmentStatus.CONFIRMED,
+                        start_time=day.replace(hour=10), end_time=day.replace(hour=11))
+    mine = Appointment(company_id=1, professional_id=1, client_crm_id=client.id, status=AppointmentStatus.PENDING,
+                       start_time=day.replace(hour=14), end_time=day.replace(hour=15))
+    db.add_all([taken, mine])
+    db.commit()
+
+    service = EvolutionAPIService(db)
+    sent = []
+    monkeypatch.setattr(service, "send_text_message", lambda phone, text, **kwargs: sent.append(text))
+
+    result = service._handle_reschedule_slot_selection(mine.id, day.replace(hour=10, minute=30))
+    assert result["action"] == "slot_unavailable"
+    assert "não está mais disponível" in sent.pop()
+    db.refresh(mine)
+    assert mine.start_time == day.replace(hour=14)
+    assert changes == []
+
+    result = service._handle_reschedule_slot_selection(mine.id, day.replace(hour=16))
+    assert result["action"] == "rescheduled"
+    before, after, tickets = changes.pop()
+    assert (before.start_time, after.start_time, tickets) == (day.replace(hour=14), day.replace(hour=16), {"ticket": 1})
+
+    service._handle_cancel_confirmation(mine)
+    before, after, _ = changes.pop()
+    assert (before.start_time, after) == (day.replace(hour=16), None)
@@ -0,0 +1,172 @@
+"""
+Testes do envio assíncrono de WhatsApp (fila, retry, fallback e limite de taxa)
+"""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.services import evolution_api_service
+from app.services.evolution_api_service import EvolutionAPIService
+from app.services.whatsapp_sender import OutboundMessage, TokenBucket, WhatsAppSender
+
+
+def make_sender(handler, **kwargs):
+    options = dict(concurrency=4, rate_per_second=1000, burst=100, backoff_base=0.01)
+    options.update(kwargs)
+    return WhatsAppSender(transport=httpx.MockTransport(handler), **options)
+
+
+def text_message(instance="loja"):
+    return OutboundMessage("http://evolution", "key", instance, f"/message/sendText/{instance}", {"number": "1", "text": "oi"})
+
+
+def test_retries_transient_errors_with_pooled_client():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.ConnectError("connection refused", request=request)
+        if len(calls) == 2:
+            return httpx.Response(503, headers={"Retry-After": "0"}, text="busy")
+        return httpx.Response(201, json={"key": {"id": "abc"}})
+
+    sender = make_sender(handler)
+    try:
+        result = sender.submit(text_message()).result(timeout=5)
+    finally:
+        sender.shutdown(timeout=5)
+
+    assert result["success"] is True
+    assert (result["message_id"], result["attempts"]) == ("abc", 3)
+    assert all(request.headers["apikey"] == "key" for request in calls)
+    assert sender.stats["retried"] == 2
+
+
+def read_timeout(request):
+    raise httpx.ReadTimeout("sem resposta", request=request)
+
+
+@pytest.mark.parametrize("failure", [
+    lambda request: httpx.Response(500, text="erro depois de enviar"),
+    lambda request: httpx.Response(503, text="busy"),
+    read_timeout,
+])
+def test_send_is_not_retried_when_it_may_have_been_delivered(failure):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return failure(request)
+
+    sender = make_sender(handler)
+    try:
+        result = sender.submit(text_message()).result(timeout=5)
+    finally:
+        sender.shutdown(timeout=5)
+
+    assert result["success"] is False
+    assert (len(calls), result["attempts"], sender.stats["retried"]) == (1, 1, 0)
+
+
+def test_queries_are_retried_on_timeouts():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            return read_timeout(request)
+        return httpx.Response(200, json={"state": "open"})
+
+    sender = make_sender(handler)
+    query = OutboundMessage("http://evolution", "key", "loja", "/instance/connectionState/loja", method="GET")
+    try:
+        result = sender.submit(query).result(timeout=5)
+    finally:
+        sender.shutdown(timeout=5)
+
+    assert (result["success"], result["attempts"]) == (True, 2)
+
+
+def test_service_enqueues_without_waiting_and_falls_back_to_text(monkeypatch):
+    paths = []
+
+    def handler(request):
+        paths.append(request.url.path)
+        time.sleep(0.2)
+        if "sendButtons" in request.url.path:
+            return httpx.Response(400, text="buttons not supported")
+        return httpx.Response(201, json={"key": {"id": "txt"}})
+
+    sender = make_sender(handler)
+    monkeypatch.setattr(evolution_api_service, "get_whatsapp_sender", lambda: sender)
+    service = EvolutionAPIService(db=None, instance_name="loja", api_url="http://evolution", api_key="key")
+
+    try:
+        started = time.monotonic()
+        queued = service.send_button_message("11987654321", "Título", "Corpo", [
+            {"buttonId": "confirm_1", "buttonText": {"displayText": "✅ Confirmar"}},
+        ])
+        assert time.monotonic() - started < 0.1
+        assert queued == {"success": True, "status": "queued"}
+
+        [result] = asyncio.run(service.wait_pending())
+    finally:
+        sender.shutdown(timeout=5)
+
+    assert paths == ["/message/sendButtons/loja", "/message/sendText/loja"]
+    assert result["message_id"] == "txt"
+
+
+def test_bounded_queue_rejects_overflow():
+    sender = make_sender(lambda request: (time.sleep(0.2), httpx.Response(200, json={}))[1], queue_size=1)
+    try:
+        first = sender.submit(text_message())
+        second = sender.submit(text_message())
+        assert second.result(timeout=1)["status"] == "rejected"
+        assert first.result(timeout=5)["success"] is True
+    finally:
+        sender.shutdown(timeout=5)
+
+
+def test_token_bucket_limits_rate_per_instance():
+    now = [0.0]
+    bucket = TokenBucket(rate=2, burst=2, clock=lambda: now[0])
+
+    assert bucket.wait_time() == 0 and bucket.wait_time() == 0
+    assert bucket.wait_time() == pytest.approx(0.5)
+
+    now[0] += 0.5
+    assert bucket.wait_time() == 0
+
+
+def test_delivery_is_logged_and_flagged_only_after_the_real_result(monkeypatch):
+    def handler(request):
+        if request.url.path.endswith("/fail"):
+            return httpx.Response(400, text="invalid number")
+        return httpx.Response(201, json={"key": {"id": "ok"}})
+
+    sender = make_sender(handler)
+    monkeypatch.setattr(evolution_api_service, "get_whatsapp_sender", lambda: sender)
+    logged, flagged = [], []
+    monkeypatch.setattr(EvolutionAPIService, "_log_whatsapp_message", lambda self, **kwargs: logged.append(kwargs))
+    service = EvolutionAPIService(db=None, instance_name="loja", api_url="http://evolution", api_key="key")
+
+    def on_done(appointment_id):
+        return service._delivery_logger(appointment_id, "reminder_2h", "11987654321", lambda: flagged.append(appointment_id))
+
+    try:
+        queued = service.send_text_message("11987654321", "oi", on_done=on_done(1))
+        service._dispatch(service._message("/message/sendText/fail", {"number": "1"}), on_done(2))
+        assert queued == {"success": True, "status": "queued"}
+        asyncio.run(service.wait_pending())
+        deadline = time.monotonic() + 5
+        while len(logged) < 2 and time.monotonic() < deadline:  # Callbacks rodam logo após o resultado
+            time.sleep(0.01)
+    finally:
+        sender.shutdown(timeout=5)
+
+    assert sorted((entry["appointment_id"], entry["status"]) for entry in logged) == [(1, "sent"), (2, "failed")]
+    assert flagged == [1]  # O envio recusado não marca o agendamento: a task tenta de novo